@@ -30,6 +30,13 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
     ALGORITHM: str = "HS256"
+    # 已登录用户缓存 (秒 / 条数)；TOKEN_CLAIMS 开启时 token 自带用户名、邮箱等，多数请求不查库
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "60"))
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "4096"))
+    # 注意: token 中的用户信息只由本进程内存中的失效记录否决 (重启即丢失，多 worker 之间不共享)，
+    # 在其他 worker 修改资料 / 密码或重启后，旧 token 携带的信息在过期前 (ACCESS_TOKEN_EXPIRE_MINUTES) 仍被采用；
+    # 仅适用于单进程部署，或可以接受这段延迟的场景
+    AUTH_TOKEN_CLAIMS: bool = os.getenv("AUTH_TOKEN_CLAIMS", "false").lower() == "true"
 
     # CORS
     CORS_ORIGINS: list = os.getenv("CORS_ORIGINS", "*").split(",")
@@ -37,12 +44,70 @@ class Settings:
     # Exchange defaults
     DEFAULT_CRYPTO_EXCHANGE: str = os.getenv("DEFAULT_CRYPTO_EXCHANGE", "binance")
 
+    # 阻塞 IO (yfinance / 磁盘) 线程池大小
+    IO_POOL_WORKERS: int = int(os.getenv("IO_POOL_WORKERS", "32"))
+
+    # 本地 K 线存储
+    BAR_STORE_ENABLED: bool = os.getenv("BAR_STORE_ENABLED", "true").lower() == "true"
+    BAR_STORE_DIR: str = os.getenv("BAR_STORE_DIR", str(BASE_DIR / "data" / "bars"))
+    BAR_STORE_MAX_AGE: int = int(os.getenv("BAR_STORE_MAX_AGE", "300"))  # 秒, 超过后刷新尾部
+
+    # 实时报价缓存
+    QUOTE_CACHE_SIZE: int = int(os.getenv("QUOTE_CACHE_SIZE", "1024"))
+    QUOTE_TTL_STOCK: float = float(os.getenv("QUOTE_TTL_STOCK", "30"))
+    QUOTE_TTL_CRYPTO: float = float(os.getenv("QUOTE_TTL_CRYPTO", "5"))
+    QUOTE_STALE_SECONDS: float = float(os.getenv("QUOTE_STALE_SECONDS", "60"))  # 0 关闭过期后台刷新
+    QUOTE_BATCH_CONCURRENCY: int = int(os.getenv("QUOTE_BATCH_CONCURRENCY", "8"))
+    QUOTE_SYMBOL_TIMEOUT: float = float(os.getenv("QUOTE_SYMBOL_TIMEOUT", "5"))  # 批量报价中单个标的超时 (秒)
+    INDICATOR_CACHE_SIZE: int = int(os.getenv("INDICATOR_CACHE_SIZE", "128"))  # 缓存指标的 K 线份数
+
+    # AI Agent 定时调度 (多 worker 部署时各进程通过数据库认领会话，不会重复运行)
+    AGENT_SCHEDULER_ENABLED: bool = os.getenv("AGENT_SCHEDULER_ENABLED", "true").lower() == "true"
+    AGENT_SCHEDULER_TICK: float = float(os.getenv("AGENT_SCHEDULER_TICK", "30"))  # 扫描间隔 (秒)
+    AGENT_SCHEDULER_CONCURRENCY: int = int(os.getenv("AGENT_SCHEDULER_CONCURRENCY", "4"))  # 同时运行的检查数
+    AGENT_SCHEDULER_JITTER: float = float(os.getenv("AGENT_SCHEDULER_JITTER", "0.1"))  # 随机延后, 占检查间隔的比例
+    AGENT_SYMBOL_CONCURRENCY: int = int(os.getenv("AGENT_SYMBOL_CONCURRENCY", "4"))  # 单个 Agent 同时分析的标的数
+    AGENT_BATCH_DECISIONS: bool = os.getenv("AGENT_BATCH_DECISIONS", "true").lower() == "true"  # 多标的合并为一次模型调用
+    AGENT_BATCH_SIZE: int = int(os.getenv("AGENT_BATCH_SIZE", "10"))  # 每次合并调用的最多标的数
+
+    # 告警引擎 (间隔均为秒)
+    ALERT_ENGINE_ENABLED: bool = os.getenv("ALERT_ENGINE_ENABLED", "true").lower() == "true"
+    ALERT_POLL_INTERVAL: float = float(os.getenv("ALERT_POLL_INTERVAL", "10"))  # 拉取报价
+    ALERT_BAR_INTERVAL: float = float(os.getenv("ALERT_BAR_INTERVAL", "300"))  # 读取日线 (成交量 / 回撤告警)
+    ALERT_FLUSH_INTERVAL: float = float(os.getenv("ALERT_FLUSH_INTERVAL", "2"))  # 批量写回触发结果
+    ALERT_REFRESH_INTERVAL: float = float(os.getenv("ALERT_REFRESH_INTERVAL", "300"))  # 重新载入全部告警
+
+    # 加密货币实时行情流 (交易所 WebSocket)
+    MARKET_STREAM_ENABLED: bool = os.getenv("MARKET_STREAM_ENABLED", "false").lower() == "true"
+    MARKET_STREAM_EXCHANGE: str = os.getenv("MARKET_STREAM_EXCHANGE", "binance")
+    MARKET_STREAM_SYMBOLS: list = [s for s in os.getenv("MARKET_STREAM_SYMBOLS", "").split(",") if s]  # 为空时订阅主流币种
+    MARKET_STREAM_TIMEFRAMES: list = os.getenv("MARKET_STREAM_TIMEFRAMES", "1m,5m").split(",")
+    MARKET_STREAM_BARS: int = int(os.getenv("MARKET_STREAM_BARS", "1000"))  # 每个标的每个周期保留的 K 线数
+    MARKET_STREAM_STALE: float = float(os.getenv("MARKET_STREAM_STALE", "30"))  # 多久没有推送视为断流 (秒)
+
+    # WebSocket 行情推送 (间隔均为秒)
+    QUOTE_HUB_POLL_INTERVAL: float = float(os.getenv("QUOTE_HUB_POLL_INTERVAL", "5"))  # 拉取不在行情流上的标的
+    QUOTE_HUB_BAR_INTERVAL: float = float(os.getenv("QUOTE_HUB_BAR_INTERVAL", "300"))  # 重算日线指标
+    QUOTE_HUB_SEND_TIMEOUT: float = float(os.getenv("QUOTE_HUB_SEND_TIMEOUT", "10"))  # 单次发送超时即断开
+
+    # 实盘 Broker 连接池
+    BROKER_POOL_IDLE_TTL: float = float(os.getenv("BROKER_POOL_IDLE_TTL", "600"))  # 空闲多久关闭 (秒)
+    BROKER_POOL_CHECK_INTERVAL: float = float(os.getenv("BROKER_POOL_CHECK_INTERVAL", "60"))  # 健康检查间隔 (秒)
+    BROKER_POOL_SIZE: int = int(os.getenv("BROKER_POOL_SIZE", "256"))
+
     # DeepSeek LLM
     DEEPSEEK_API_KEY: str = os.getenv("DEEPSEEK_API_KEY", "")
     DEEPSEEK_BASE_URL: str = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     DEEPSEEK_MODEL: str = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
     DEEPSEEK_MAX_TOKENS: int = int(os.getenv("DEEPSEEK_MAX_TOKENS", "4096"))
     DEEPSEEK_TEMPERATURE: float = float(os.getenv("DEEPSEEK_TEMPERATURE", "0.3"))
+    DEEPSEEK_TIMEOUT: float = float(os.getenv("DEEPSEEK_TIMEOUT", "120"))  # 读超时 (秒)
+    DEEPSEEK_MAX_CONNECTIONS: int = int(os.getenv("DEEPSEEK_MAX_CONNECTIONS", "20"))  # 连接池上限
+    # 报告 / 回测解读 / 策略推荐的回复缓存
+    DEEPSEEK_CACHE_ENABLED: bool = os.getenv("DEEPSEEK_CACHE_ENABLED", "true").lower() == "true"
+    DEEPSEEK_CACHE_SIZE: int = int(os.getenv("DEEPSEEK_CACHE_SIZE", "256"))
+    DEEPSEEK_CACHE_TTL: float = float(os.getenv("DEEPSEEK_CACHE_TTL", "86400"))  # 最长有效期 (秒)
+    DEEPSEEK_CACHE_DIR: str = os.getenv("DEEPSEEK_CACHE_DIR", "")  # 为空时只缓存在内存
 
     # AI Model (local)
     MODEL_DIR: str = str(BASE_DIR / "models" / "saved")
@@ -0,0 +1,128 @@
+"""
+响应编码 - orjson 直接序列化 NumPy 数组，按 Accept 头协商 msgpack / Arrow
+
+- application/json (默认): NaN 编码为 null
+- application/x-msgpack: 需安装 msgpack，NaN 编码为 nil (1 字节)
+- application/vnd.apache.arrow.stream: 需安装 pyarrow，列式数据写成一个 Arrow IPC 记录批，NaN 记入空值位图
+未安装对应依赖时退回 JSON。
+
+另提供 Server-Sent Events 流式响应 (text/event-stream)，用于逐段推送大模型输出。
+"""
+from typing import Any, AsyncIterator, Dict, Optional
+
+import numpy as np
+import orjson
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from core.logger import logger
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # 可选依赖
+    pa = None
+
+JSON = "application/json"
+MSGPACK = "application/x-msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+EVENT_STREAM = "text/event-stream"
+
+
+class ORJSONResponse(Response):
+    """orjson 序列化 (含 NumPy 数组，NaN/Inf 输出为 null)"""
+    media_type = JSON
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def negotiate(request: Request) -> str:
+    """按 Accept 头中出现的先后选择编码，未识别或依赖缺失时为 JSON"""
+    for part in request.headers.get("accept", "").split(","):
+        mime = part.split(";")[0].strip().lower()
+        if mime in (MSGPACK, "application/msgpack") and msgpack is not None:
+            return MSGPACK
+        if mime == ARROW and pa is not None:
+            return ARROW
+        if mime in (JSON, "*/*", "application/*"):
+            return JSON
+    return JSON
+
+
+def _plain(obj: Any) -> Any:
+    """NumPy 数组转为 msgpack 可编码的列表 (NaN 转 None)"""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "f":
+            return np.where(np.isnan(obj), None, obj).tolist()
+        return obj.tolist()
+    if isinstance(obj, dict):
+        return {k: _plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _arrow_stream(columns: Dict[str, Any], metadata: Dict[str, Any]) -> bytes:
+    arrays = {name: pa.array(values, from_pandas=True) for name, values in columns.items()}
+    table = pa.table(arrays).replace_schema_metadata({k: orjson.dumps(v) for k, v in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def columnar_response(request: Request, data: Dict[str, Any], columns: Optional[Dict[str, Any]] = None) -> Response:
+    """
+    按协商结果编码 APIResponse 结构的数据:
+    Arrow 只编码 columns (等长列)，data 中其余字段写入 schema 元数据
+    """
+    encoding = negotiate(request)
+    if encoding == ARROW and columns is not None:
+        meta = {k: v for k, v in data.items() if not isinstance(v, dict)}
+        return Response(_arrow_stream(columns, meta), media_type=ARROW)
+    body = {"success": True, "data": data, "message": ""}
+    if encoding == MSGPACK:
+        return Response(msgpack.packb(_plain(body), use_bin_type=True), media_type=MSGPACK)
+    return ORJSONResponse(body)
+
+
+def wants_event_stream(request: Request, stream: bool = False) -> bool:
+    """stream=true 或 Accept 中带 text/event-stream 时使用 SSE"""
+    return stream or EVENT_STREAM in request.headers.get("accept", "")
+
+
+def _sse(event: str, data: Any) -> bytes:
+    payload = orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return b"event: " + event.encode() + b"\ndata: " + payload + b"\n\n"
+
+
+def event_stream_response(chunks: AsyncIterator[str], meta: Optional[Dict[str, Any]] = None) -> StreamingResponse:
+    """
+    文本片段编码为 SSE:
+    meta (可选, 先于首个片段) -> delta {"text": ...} * N -> done {"length": 总字符数}
+    上游出错时发送 error {"message": ...} 后结束
+    """
+    async def body():
+        if meta is not None:
+            yield _sse("meta", meta)
+        length = 0
+        try:
+            async for text in chunks:
+                length += len(text)
+                yield _sse("delta", {"text": text})
+        except Exception as e:
+            logger.error(f"流式响应中断: {e}")
+            yield _sse("error", {"message": str(e)})
+            return
+        yield _sse("done", {"length": length})
+
+    # 关闭反向代理缓冲，片段到达即转发
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(body(), media_type=EVENT_STREAM, headers=headers)
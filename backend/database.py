@@ -1,6 +1,15 @@
 """
 Supabase 数据库客户端
+
+PostgREST 的 httpx 会话挂上事件钩子，按请求统计查询次数和耗时:
+main 中的中间件为每个 HTTP 请求创建 QueryStats，run_io 把它带进线程池
 """
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import httpx
 from supabase import create_client, Client
 from config import get_settings
 
@@ -9,8 +18,68 @@ settings = get_settings()
 _client: Client = None
 
 
+class QueryStats:
+    """一次 HTTP 请求内的数据库查询次数与耗时 (毫秒)"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, ms: float):
+        with self._lock:
+            self.queries += 1
+            self.db_ms += ms
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_totals = {"queries": 0, "db_ms": 0.0}
+_totals_lock = threading.Lock()
+
+
+def start_query_stats() -> QueryStats:
+    """为当前上下文 (一次 HTTP 请求) 开始统计"""
+    stats = QueryStats()
+    _query_stats.set(stats)
+    return stats
+
+
+def _on_request(request: httpx.Request):
+    request.extensions["query_started"] = time.perf_counter()
+
+
+def _on_response(response: httpx.Response):
+    response.read()  # 计入响应体传输时间
+    started = response.request.extensions.get("query_started")
+    if started is None:
+        return
+    ms = (time.perf_counter() - started) * 1000
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.record(ms)
+    with _totals_lock:
+        _totals["queries"] += 1
+        _totals["db_ms"] += ms
+
+
+def instrument(session: httpx.Client):
+    """给 httpx 会话挂上查询统计钩子 (重复调用无副作用)"""
+    hooks = session.event_hooks
+    if _on_request not in hooks["request"]:
+        session.event_hooks = {
+            "request": [*hooks["request"], _on_request],
+            "response": [*hooks["response"], _on_response],
+        }
+
+
+def get_db_stats() -> Dict[str, Any]:
+    with _totals_lock:
+        return {"queries": _totals["queries"], "db_ms": round(_totals["db_ms"], 1)}
+
+
 def get_supabase() -> Client:
     global _client
     if _client is None:
         _client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    instrument(_client.postgrest.session)  # 认证状态变化时 postgrest 客户端会重建
     return _client
@@ -9,8 +9,23 @@ import time
 import uvicorn
 
 from config import get_settings
+from database import get_db_stats, start_query_stats
 from core.logger import logger
-from routers import stocks, crypto, analysis, backtest, strategies, portfolio, alerts, auth, watchlist, agent, broker
+from routers import stocks, crypto, analysis, backtest, strategies, portfolio, alerts, auth, watchlist, agent, broker, stream
+from services.optimizer import shutdown_process_pool
+from services.bar_store import get_bar_store
+from services.quote_cache import get_quote_cache
+from services.indicators import get_indicator_cache
+from services.llm_cache import get_llm_cache
+from services.user_cache import get_user_cache
+from services.brokers.pool import get_broker_pool
+from services.alert_engine import get_alert_engine
+from services.market_data import close_async_exchanges, TOP_CRYPTO
+from services.market_stream import get_market_stream
+from services.quote_hub import get_quote_hub
+from services.agent_scheduler import get_agent_scheduler
+from services.agent_service import get_llm_stats
+from services import deepseek_service
 
 settings = get_settings()
 
@@ -19,7 +34,31 @@ settings = get_settings()
 async def lifespan(app: FastAPI):
     logger.info(f"🚀 {settings.APP_NAME} v{settings.APP_VERSION} 启动中...")
     logger.info(f"Supabase: {settings.SUPABASE_URL}")
+    await deepseek_service.open_client()
+    scheduler = get_agent_scheduler()
+    if settings.AGENT_SCHEDULER_ENABLED:
+        scheduler.start()
+    broker_pool = get_broker_pool()
+    broker_pool.start()
+    alert_engine = get_alert_engine()
+    if settings.ALERT_ENGINE_ENABLED:
+        alert_engine.start()
+    market_stream = get_market_stream()
+    if settings.MARKET_STREAM_ENABLED:
+        if settings.ALERT_ENGINE_ENABLED:
+            market_stream.add_quote_listener(alert_engine.on_quote)
+        market_stream.start(settings.MARKET_STREAM_SYMBOLS or TOP_CRYPTO)
+    quote_hub = get_quote_hub()
+    quote_hub.start()
     yield
+    await quote_hub.stop()
+    await market_stream.stop()
+    await scheduler.stop()
+    await alert_engine.stop()
+    await broker_pool.stop()
+    shutdown_process_pool()
+    await close_async_exchanges()
+    await deepseek_service.close_client()
     logger.info("👋 服务关闭")
 
 
@@ -42,10 +81,17 @@ app.add_middleware(
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start = time.time()
+    db = start_query_stats()
     response = await call_next(request)
     duration = (time.time() - start) * 1000
+    if db.queries:
+        # 流式响应在返回后才继续查询的部分不计入
+        response.headers["Server-Timing"] = f'db;dur={db.db_ms:.1f};desc="{db.queries} queries"'
     if request.url.path not in ("/health", "/favicon.ico"):
-        logger.debug(f"{request.method} {request.url.path} -> {response.status_code} ({duration:.0f}ms)")
+        logger.debug(
+            f"{request.method} {request.url.path} -> {response.status_code} ({duration:.0f}ms, "
+            f"db {db.queries}次/{db.db_ms:.0f}ms)"
+        )
     return response
 
 
@@ -68,6 +114,7 @@ app.include_router(alerts.router, prefix=f"{prefix}/alerts", tags=["智能告警
 app.include_router(watchlist.router, prefix=f"{prefix}/watchlist", tags=["自选管理"])
 app.include_router(agent.router, prefix=f"{prefix}/agent", tags=["AI Agent"])
 app.include_router(broker.router, prefix=f"{prefix}/broker", tags=["实盘交易"])
+app.include_router(stream.router, prefix=f"{prefix}/stream", tags=["实时推送"])
 
 
 @app.get("/")
@@ -94,5 +141,42 @@ async def health():
     return {"status": "healthy", "version": settings.APP_VERSION}
 
 
+@app.get("/stats/cache")
+async def cache_stats():
+    """本地缓存命中统计"""
+    return {
+        "bar_store": get_bar_store().get_stats(),
+        "quote_cache": get_quote_cache().get_stats(),
+        "indicators": get_indicator_cache().get_stats(),
+        "deepseek": get_llm_cache().get_stats(),
+        "users": get_user_cache().get_stats(),
+        "brokers": get_broker_pool().get_stats(),
+    }
+
+
+@app.get("/stats/scheduler")
+async def scheduler_stats():
+    """Agent 定时调度统计 (llm: 单标的 / 合并决策各自累计的模型调用、token 与耗时)"""
+    return {**get_agent_scheduler().get_stats(), "llm": get_llm_stats()}
+
+
+@app.get("/stats/alerts")
+async def alert_stats():
+    """告警引擎: 生效告警数、触发与写回次数、最近一次报价的评估耗时 (微秒)"""
+    return get_alert_engine().get_stats()
+
+
+@app.get("/stats/stream")
+async def stream_stats():
+    """实时行情流: 订阅 / 在线标的数、收到的推送数、从内存返回的报价与 K 线次数；push 为 WebSocket 推送统计"""
+    return {**get_market_stream().get_stats(), "push": get_quote_hub().get_stats()}
+
+
+@app.get("/stats/db")
+async def db_stats():
+    """进程累计的 Supabase 查询次数与耗时 (单个请求的统计见响应头 Server-Timing)"""
+    return get_db_stats()
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
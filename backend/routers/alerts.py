@@ -6,6 +6,7 @@ from schemas.common import APIResponse
 from schemas.portfolio import AlertCreate
 from database import get_supabase
 from routers.auth import get_current_user
+from services.alert_engine import get_alert_engine
 
 router = APIRouter()
 
@@ -29,6 +30,7 @@ async def create_alert(body: AlertCreate, user: dict = Depends(get_current_user)
         "condition_value": body.condition_value,
         "message": body.message,
     }).execute()
+    get_alert_engine().add(result.data[0])
     return APIResponse(data=result.data[0], message="告警创建成功")
 
 
@@ -36,7 +38,9 @@ async def create_alert(body: AlertCreate, user: dict = Depends(get_current_user)
 async def delete_alert(alert_id: int, user: dict = Depends(get_current_user)):
     """删除告警"""
     sb = get_supabase()
-    sb.table("alerts").delete().eq("id", alert_id).eq("user_id", user["id"]).execute()
+    result = sb.table("alerts").delete().eq("id", alert_id).eq("user_id", user["id"]).execute()
+    if result.data:
+        get_alert_engine().remove(alert_id)
     return APIResponse(message="告警已删除")
 
 
@@ -44,10 +48,14 @@ async def delete_alert(alert_id: int, user: dict = Depends(get_current_user)):
 async def toggle_alert(alert_id: int, user: dict = Depends(get_current_user)):
     """启用/停用告警"""
     sb = get_supabase()
-    current = sb.table("alerts").select("is_active").eq("id", alert_id).eq("user_id", user["id"]).single().execute()
+    current = sb.table("alerts").select("*").eq("id", alert_id).eq("user_id", user["id"]).single().execute()
     if not current.data:
         return APIResponse(success=False, message="告警不存在")
 
     new_status = not current.data["is_active"]
     sb.table("alerts").update({"is_active": new_status}).eq("id", alert_id).execute()
+    if new_status:
+        get_alert_engine().add({**current.data, "is_active": True})
+    else:
+        get_alert_engine().remove(alert_id)
     return APIResponse(message=f"告警已{'启用' if new_status else '停用'}")
@@ -6,22 +6,30 @@ AI 分析路由
 - DeepSeek 回测解读
 - DeepSeek 策略推荐
 """
-from fastapi import APIRouter, Query
+import asyncio
+
+import numpy as np
+from fastapi import APIRouter, Query, Request
 from pydantic import BaseModel
 from typing import Optional
 from schemas.common import APIResponse
-from services.market_data import (
-    get_stock_quote, get_stock_history,
-    get_crypto_price, get_crypto_history,
-    calculate_indicators,
-)
+from core.responses import event_stream_response, wants_event_stream
+from services.market_data import calculate_indicators
+from services.market_service import fetch_quote, fetch_stock_history, fetch_crypto_history
+from services.executors import run_io
+from services.indicators import get_indicator_cache
 from services.ai_service import predict_trend, generate_smart_recommendation
-from services.risk_manager import calculate_risk_metrics, score_risk
+from services.risk_manager import (
+    calculate_risk_metrics, score_risk, returns_matrix, batch_risk_metrics, horizon_risk_metrics, risk_summary,
+    rolling_risk_metrics,
+)
 from services import deepseek_service
 from core.logger import logger
 
 router = APIRouter()
 
+MAX_RISK_SYMBOLS = 500  # 批量风险筛选单次最多的标的数
+
 
 # ---------- 技术面分析（无需 DeepSeek key） ----------
 
@@ -32,11 +40,11 @@ async def predict(
     asset_type: str = Query("stock", description="stock 或 crypto"),
 ):
     """AI 综合趋势预测（规则引擎）"""
-    df = _get_df(symbol, asset_type, period)
+    df = await _get_df(symbol, asset_type, period)
     if df is None:
         return APIResponse(success=False, message="数据不足，无法分析")
 
-    result = predict_trend(df)
+    result = await run_io(predict_trend, df, cache=_indicator_cache(symbol, asset_type, df))
     if "error" in result:
         return APIResponse(success=False, message=result["error"])
     return APIResponse(data=result)
@@ -49,13 +57,11 @@ async def recommend(
     asset_type: str = Query("stock"),
 ):
     """智能投资推荐（规则引擎）"""
-    df = _get_df(symbol, asset_type, period)
+    df = await _get_df(symbol, asset_type, period)
     if df is None:
         return APIResponse(success=False, message="数据不足")
 
-    close_col = "close" if "close" in df.columns else "Close"
-    trend = predict_trend(df)
-    risk = calculate_risk_metrics(df[close_col].tolist())
+    trend, risk = await run_io(_trend_and_risk, df, _indicator_cache(symbol, asset_type, df))
     rec = generate_smart_recommendation(symbol, trend, risk)
     return APIResponse(data=rec)
 
@@ -65,16 +71,36 @@ async def risk_analysis(
     symbol: str,
     period: str = Query("1y"),
     asset_type: str = Query("stock"),
+    rolling: Optional[int] = Query(None, ge=5, le=252, description="滚动窗口 (K 线数)，指定时附带滚动波动率 / 夏普 / 索提诺序列"),
 ):
     """风险分析"""
-    df = _get_df(symbol, asset_type, period, min_rows=30, long_period=True)
+    df = await _get_df(symbol, asset_type, period, min_rows=30, long_period=True)
     if df is None:
         return APIResponse(success=False, message="数据不足")
 
-    close_col = "close" if "close" in df.columns else "Close"
-    metrics = calculate_risk_metrics(df[close_col].tolist())
-    risk_score = score_risk(metrics)
-    return APIResponse(data={"symbol": symbol, "metrics": metrics, "risk_score": risk_score})
+    report = await run_io(_risk_report, {symbol: df["close"]})
+    data = {"symbol": symbol, **report[symbol]}
+    if rolling:
+        data["rolling"] = await run_io(_rolling_report, df["close"], rolling)
+    return APIResponse(data=data)
+
+
+@router.get("/risk")
+async def risk_screen(
+    symbols: str = Query(..., description="逗号分隔的标的代码"),
+    asset_type: str = Query("stock"),
+):
+    """批量风险筛选: 各标的收益率对齐成矩阵后一次计算全部指标 (含 20 / 60 / 252 日窗口)"""
+    sym_list = list(dict.fromkeys(s.strip() for s in symbols.split(",") if s.strip()))
+    if len(sym_list) > MAX_RISK_SYMBOLS:
+        return APIResponse(success=False, message=f"标的数量过多: {len(sym_list)} > {MAX_RISK_SYMBOLS}")
+
+    frames = await asyncio.gather(*(_get_df(s, asset_type, long_period=True) for s in sym_list))
+    closes = {s: df["close"] for s, df in zip(sym_list, frames) if df is not None}
+    if not closes:
+        return APIResponse(success=False, message="数据不足")
+    report = await run_io(_risk_report, closes)
+    return APIResponse(data={"results": report, "skipped": [s for s in sym_list if s not in closes]})
 
 
 @router.get("/indicators/{symbol}")
@@ -84,10 +110,10 @@ async def indicators(
     asset_type: str = Query("stock"),
 ):
     """全量技术指标"""
-    df = _get_df(symbol, asset_type, period, min_rows=5)
+    df = await _get_df(symbol, asset_type, period, min_rows=5)
     if df is None:
         return APIResponse(success=False, message="无数据")
-    result = calculate_indicators(df)
+    result = await run_io(calculate_indicators, df, _indicator_cache(symbol, asset_type, df))
     return APIResponse(data={"symbol": symbol, **result})
 
 
@@ -112,24 +138,26 @@ class ChatRequest(BaseModel):
 
 
 @router.post("/deepseek/chat")
-async def deepseek_chat(body: ChatRequest):
-    """与 DeepSeek 对话 - 询问任何投资问题"""
+async def deepseek_chat(body: ChatRequest, request: Request, stream: bool = Query(False)):
+    """与 DeepSeek 对话 - 询问任何投资问题 (stream=true 或 Accept: text/event-stream 时以 SSE 逐段返回)"""
     if not deepseek_service.is_deepseek_configured():
         return APIResponse(success=False, message="未配置 DEEPSEEK_API_KEY，请在 .env 中设置")
 
     context = None
     if body.symbol:
         try:
-            df = _get_df(body.symbol, body.asset_type, "3mo")
+            df = await _get_df(body.symbol, body.asset_type, "3mo")
             if df is not None:
-                trend = predict_trend(df)
-                indicators = calculate_indicators(df)
+                cache = _indicator_cache(body.symbol, body.asset_type, df)
+                trend, indicators = await run_io(_trend_and_indicators, df, cache)
                 context = deepseek_service._build_data_summary(
                     body.symbol, {}, indicators, trend, None
                 )
         except Exception:
             pass
 
+    if wants_event_stream(request, stream):
+        return event_stream_response(deepseek_service.chat_stream(body.message, context))
     try:
         reply = await deepseek_service.chat(body.message, context)
         return APIResponse(data={"reply": reply})
@@ -141,29 +169,31 @@ async def deepseek_chat(body: ChatRequest):
 @router.get("/deepseek/report/{symbol}")
 async def deepseek_report(
     symbol: str,
+    request: Request,
     period: str = Query("6mo"),
     asset_type: str = Query("stock"),
+    stream: bool = Query(False),
 ):
-    """DeepSeek 生成专业分析报告"""
+    """DeepSeek 生成专业分析报告 (stream=true 或 Accept: text/event-stream 时以 SSE 逐段返回)"""
     if not deepseek_service.is_deepseek_configured():
         return APIResponse(success=False, message="未配置 DEEPSEEK_API_KEY，请在 .env 中设置")
 
-    df = _get_df(symbol, asset_type, period)
+    df = await _get_df(symbol, asset_type, period)
     if df is None:
         return APIResponse(success=False, message="数据不足")
 
-    # 收集全量数据
-    close_col = "close" if "close" in df.columns else "Close"
-    market_data = {}
-    if asset_type == "crypto":
-        market_data = get_crypto_price(symbol)
-    else:
-        market_data = get_stock_quote(symbol)
-
-    indicators = calculate_indicators(df)
-    trend = predict_trend(df)
-    risk = calculate_risk_metrics(df[close_col].tolist())
-
+    # 收集全量数据: 报价下载与指标计算并行
+    market_data, (trend, indicators), risk = await asyncio.gather(
+        fetch_quote(symbol, asset_type),
+        run_io(_trend_and_indicators, df, _indicator_cache(symbol, asset_type, df)),
+        run_io(_risk_metrics, df),
+    )
+
+    risk_data = {"metrics": risk, "risk_score": score_risk(risk)}
+    if wants_event_stream(request, stream):
+        # 趋势与风险数据先于报告正文推送，前端可立即渲染
+        chunks = deepseek_service.generate_analysis_report_stream(symbol, market_data, indicators, trend, risk)
+        return event_stream_response(chunks, meta={"symbol": symbol, "trend_data": trend, "risk_data": risk_data})
     try:
         report = await deepseek_service.generate_analysis_report(
             symbol, market_data, indicators, trend, risk
@@ -172,7 +202,7 @@ async def deepseek_report(
             "symbol": symbol,
             "report": report,
             "trend_data": trend,
-            "risk_data": {"metrics": risk, "risk_score": score_risk(risk)},
+            "risk_data": risk_data,
         })
     except Exception as e:
         logger.error(f"DeepSeek report 失败: {e}")
@@ -212,12 +242,11 @@ async def deepseek_strategy_suggest(
     if not deepseek_service.is_deepseek_configured():
         return APIResponse(success=False, message="未配置 DEEPSEEK_API_KEY")
 
-    df = _get_df(symbol, asset_type, "6mo")
+    df = await _get_df(symbol, asset_type, "6mo")
     if df is None:
         return APIResponse(success=False, message="数据不足")
 
-    trend = predict_trend(df)
-    indicators = calculate_indicators(df)
+    trend, indicators = await run_io(_trend_and_indicators, df, _indicator_cache(symbol, asset_type, df))
     market_data = {
         "trend": trend,
         "indicators_summary": {
@@ -239,13 +268,63 @@ async def deepseek_strategy_suggest(
 
 # ---------- 辅助函数 ----------
 
-def _get_df(symbol, asset_type, period="6mo", min_rows=30, long_period=False):
+async def _get_df(symbol, asset_type, period="6mo", min_rows=30, long_period=False):
     if asset_type == "crypto":
         limit = 365 if long_period else 200
-        df = get_crypto_history(symbol, "1d", limit)
+        df = await fetch_crypto_history(symbol, "1d", limit)
     else:
         p = "1y" if long_period else period
-        df = get_stock_history(symbol, p)
+        df = await fetch_stock_history(symbol, p)
     if df.empty or len(df) < min_rows:
         return None
     return df
+
+
+# 以下为同步计算函数，在线程池中执行
+
+def _risk_metrics(df):
+    return calculate_risk_metrics(df["close"].tolist())
+
+
+def _risk_report(closes):
+    """{标的: 收盘价} -> {标的: 全样本指标、评分和各窗口指标}，所有标的一次向量化计算"""
+    returns = returns_matrix(closes)
+    full = batch_risk_metrics(returns)
+    horizons = horizon_risk_metrics(returns)
+    report = {}
+    for i, symbol in enumerate(returns.columns):
+        metrics = risk_summary(full, i)
+        report[symbol] = {
+            "metrics": metrics,
+            "risk_score": score_risk(metrics),
+            "horizons": {
+                str(h): {**risk_summary(m, i), "observations": int(m["observations"][i])}
+                for h, m in horizons.items() if m["observations"][i] >= 2
+            },
+        }
+    return report
+
+
+def _rolling_report(close, window):
+    """单个标的的滚动风险指标序列 (日期与收益率对齐，窗口不足处为 None)"""
+    returns = returns_matrix({"close": close})
+    series = rolling_risk_metrics(returns, window=window)
+    data = {"window": window, "dates": returns.index.strftime("%Y-%m-%d").tolist()}
+    for key, values in series.items():
+        column = np.round(values[:, 0], 4)
+        data[key] = np.where(np.isnan(column), None, column).tolist()
+    return data
+
+
+def _indicator_cache(symbol, asset_type, df):
+    """同一份 K 线在各接口间共享指标 (键与行情路由一致，见 services.indicators)"""
+    key = f"crypto:binance:{symbol}" if asset_type == "crypto" else f"stock:{symbol}"
+    return get_indicator_cache().get(key, "1d", df)
+
+
+def _trend_and_risk(df, cache=None):
+    return predict_trend(df, cache=cache), _risk_metrics(df)
+
+
+def _trend_and_indicators(df, cache=None):
+    return predict_trend(df, cache=cache), calculate_indicators(df, cache)
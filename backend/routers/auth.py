@@ -1,22 +1,38 @@
 """
 认证路由 - 注册/登录/用户信息
 """
-from fastapi import APIRouter, HTTPException, Depends, Request
-from schemas.user import UserRegister, UserLogin, UserResponse, TokenResponse
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Request, WebSocket
+from schemas.user import UserRegister, UserLogin, UserUpdate, PasswordChange, UserResponse, TokenResponse
 from schemas.common import APIResponse
 from core.security import hash_password, verify_password, create_access_token, decode_access_token
 from database import get_supabase
+from services.executors import run_io
+from services.user_cache import get_user_cache
+from config import get_settings
 from core.logger import logger
 
 router = APIRouter()
+settings = get_settings()
 
+# AUTH_TOKEN_CLAIMS 开启时写入 token 的用户字段
+TOKEN_CLAIMS = ("username", "email", "is_active")
 
-async def get_current_user(request: Request) -> dict:
-    """从 Authorization header 解析当前用户"""
+
+def _load_user(user_id: int) -> Optional[dict]:
+    result = get_supabase().table("users").select("*").eq("id", user_id).execute()
+    return result.data[0] if result.data else None
+
+
+async def _authenticate(request: Request, use_claims: bool) -> dict:
     auth = request.headers.get("Authorization", "")
     if not auth.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="未登录")
-    token = auth.split(" ", 1)[1]
+    return await _user_from_token(auth.split(" ", 1)[1], use_claims)
+
+
+async def _user_from_token(token: str, use_claims: bool) -> dict:
     payload = decode_access_token(token)
     if payload is None:
         raise HTTPException(status_code=401, detail="Token 无效或已过期")
@@ -24,11 +40,67 @@ async def get_current_user(request: Request) -> dict:
     if not user_id:
         raise HTTPException(status_code=401, detail="Token 无效")
 
-    sb = get_supabase()
-    result = sb.table("users").select("*").eq("id", int(user_id)).single().execute()
-    if not result.data:
-        raise HTTPException(status_code=401, detail="用户不存在")
-    return result.data
+    user_id, iat = int(user_id), int(payload.get("iat", 0))
+    cache = get_user_cache()
+    claims = payload.get("usr")
+    if use_claims and claims and cache.claims_valid(user_id, iat):
+        return {"id": user_id, **claims}
+
+    user = cache.get(user_id, iat)
+    if user is None:
+        user = await run_io(_load_user, user_id)
+        if user is None:
+            raise HTTPException(status_code=401, detail="用户不存在")
+        cache.put(user_id, iat, user)
+    return user
+
+
+async def get_current_user(request: Request) -> dict:
+    """
+    从 Authorization header 解析当前用户
+    token 携带用户信息时直接采用 (只有 id / username / email / is_active)，否则读缓存或查库
+    """
+    return await _authenticate(request, settings.AUTH_TOKEN_CLAIMS)
+
+
+async def get_current_user_record(request: Request) -> dict:
+    """当前用户的完整 users 记录 (不采用 token 中的用户信息)"""
+    return await _authenticate(request, False)
+
+
+async def get_websocket_user(ws: WebSocket) -> Optional[dict]:
+    """
+    WebSocket 连接的当前用户，未登录或 token 无效时返回 None
+    浏览器建立 WebSocket 时无法设置请求头，token 也可放在 ?token= 查询参数中
+    """
+    auth = ws.headers.get("Authorization", "")
+    token = auth.split(" ", 1)[1] if auth.startswith("Bearer ") else ws.query_params.get("token")
+    if not token:
+        return None
+    try:
+        return await _user_from_token(token, settings.AUTH_TOKEN_CLAIMS)
+    except HTTPException:
+        return None
+
+
+def _user_info(user: dict) -> dict:
+    return {
+        "id": user["id"],
+        "username": user["username"],
+        "email": user["email"],
+        "is_active": user["is_active"],
+    }
+
+
+def _token_data(user: dict) -> dict:
+    data = {"sub": str(user["id"])}
+    if settings.AUTH_TOKEN_CLAIMS:
+        data["usr"] = {k: user.get(k) for k in TOKEN_CLAIMS}
+    return {
+        "access_token": create_access_token(data),
+        "token_type": "bearer",
+        "user": _user_info(user),
+    }
 
 
 @router.post("/register", response_model=APIResponse)
@@ -70,20 +142,7 @@ async def register(body: UserRegister):
         "symbols": ["000300.SS", "600519.SS", "BTC/USDT", "ETH/USDT"],
     }).execute()
 
-    token = create_access_token({"sub": str(user["id"])})
-    return APIResponse(
-        data={
-            "access_token": token,
-            "token_type": "bearer",
-            "user": {
-                "id": user["id"],
-                "username": user["username"],
-                "email": user["email"],
-                "is_active": user["is_active"],
-            },
-        },
-        message="注册成功",
-    )
+    return APIResponse(data=_token_data(user), message="注册成功")
 
 
 @router.post("/login", response_model=APIResponse)
@@ -97,30 +156,45 @@ async def login(body: UserLogin):
     if not verify_password(body.password, user["hashed_password"]):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
 
-    token = create_access_token({"sub": str(user["id"])})
     logger.info(f"用户登录: {body.username}")
-    return APIResponse(
-        data={
-            "access_token": token,
-            "token_type": "bearer",
-            "user": {
-                "id": user["id"],
-                "username": user["username"],
-                "email": user["email"],
-                "is_active": user["is_active"],
-            },
-        },
-        message="登录成功",
-    )
+    return APIResponse(data=_token_data(user), message="登录成功")
 
 
 @router.get("/me", response_model=APIResponse)
-async def get_me(user: dict = Depends(get_current_user)):
+async def get_me(user: dict = Depends(get_current_user_record)):
     return APIResponse(data={
-        "id": user["id"],
-        "username": user["username"],
-        "email": user["email"],
-        "is_active": user["is_active"],
+        **_user_info(user),
         "preferences": user.get("preferences", {}),
         "created_at": user.get("created_at"),
     })
+
+
+@router.put("/me", response_model=APIResponse)
+async def update_me(body: UserUpdate, user: dict = Depends(get_current_user_record)):
+    """修改邮箱 / 偏好设置，返回携带新信息的 token"""
+    data = {k: v for k, v in body.model_dump().items() if v is not None}
+    if not data:
+        return APIResponse(success=False, message="没有需要更新的字段")
+
+    sb = get_supabase()
+    if data.get("email", user["email"]) != user["email"]:
+        existing_email = sb.table("users").select("id").eq("email", data["email"]).execute()
+        if existing_email.data:
+            raise HTTPException(status_code=400, detail="邮箱已注册")
+
+    sb.table("users").update(data).eq("id", user["id"]).execute()
+    get_user_cache().invalidate(user["id"])
+    return APIResponse(data=_token_data({**user, **data}), message="资料已更新")
+
+
+@router.put("/password", response_model=APIResponse)
+async def change_password(body: PasswordChange, user: dict = Depends(get_current_user_record)):
+    if not verify_password(body.old_password, user["hashed_password"]):
+        raise HTTPException(status_code=400, detail="原密码错误")
+
+    get_supabase().table("users").update({
+        "hashed_password": hash_password(body.new_password),
+    }).eq("id", user["id"]).execute()
+    get_user_cache().invalidate(user["id"])
+    logger.info(f"用户修改密码: {user['username']}")
+    return APIResponse(data=_token_data(user), message="密码已修改")
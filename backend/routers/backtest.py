@@ -1,11 +1,21 @@
 """
-回测路由 - 策略回测
+回测路由 - 策略回测 / 组合回测 / 参数寻优 / 滚动窗口回测
 """
-from fastapi import APIRouter, Depends
+import asyncio
+import json
+
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from schemas.common import APIResponse
-from schemas.strategy import BacktestRequest
-from services.market_data import get_stock_history, get_crypto_history
+from schemas.strategy import BacktestRequest, OptimizeRequest, PortfolioBacktestRequest, WalkForwardRequest
+from services.market_data import STOCK_SYMBOLS, TOP_CRYPTO
+from services.market_service import fetch_daily_history
+from services.executors import run_cpu
 from services.backtest_engine import run_backtest
+from services.portfolio_backtest import run_portfolio_backtest, MAX_SYMBOLS
+from services import optimizer
+from services.walk_forward import run_walk_forward
 from database import get_supabase
 from routers.auth import get_current_user
 from core.logger import logger
@@ -13,31 +23,35 @@ from core.logger import logger
 router = APIRouter()
 
 
-@router.post("/run")
-async def run(req: BacktestRequest, user: dict = Depends(get_current_user)):
-    """执行策略回测"""
-    if "/" in req.symbol:
-        df = get_crypto_history(req.symbol, "1d", 1000)
-    else:
-        df = get_stock_history(req.symbol, "5y")
+async def _fetch_history(symbol: str) -> pd.DataFrame:
+    """下载回测用的日线历史"""
+    return await fetch_daily_history(symbol, days=1000, period="5y")
 
-    if df.empty or len(df) < 30:
-        return APIResponse(success=False, message="数据不足")
 
-    # 按日期范围过滤
+def _filter_range(df: pd.DataFrame, start_date: str, end_date: str) -> pd.DataFrame:
+    """按日期范围过滤"""
     df.index = df.index.tz_localize(None) if hasattr(df.index, "tz_localize") and df.index.tz else df.index
     try:
-        start = req.start_date
-        end = req.end_date
-        mask = (df.index >= start) & (df.index <= end)
+        mask = (df.index >= start_date) & (df.index <= end_date)
         df = df.loc[mask]
     except Exception:
         pass
+    return df
+
 
+@router.post("/run")
+async def run(req: BacktestRequest, user: dict = Depends(get_current_user)):
+    """执行策略回测"""
+    df = await _fetch_history(req.symbol)
+    if df.empty or len(df) < 30:
+        return APIResponse(success=False, message="数据不足")
+
+    df = _filter_range(df, req.start_date, req.end_date)
     if len(df) < 30:
         return APIResponse(success=False, message=f"选定时间范围内数据不足(仅{len(df)}条)")
 
-    result = run_backtest(
+    result = await run_cpu(
+        run_backtest,
         df,
         strategy_type=req.strategy_type,
         params=req.params,
@@ -56,25 +70,16 @@ async def run(req: BacktestRequest, user: dict = Depends(get_current_user)):
 @router.post("/run/guest")
 async def run_guest(req: BacktestRequest):
     """游客模式回测（无需登录）"""
-    if "/" in req.symbol:
-        df = get_crypto_history(req.symbol, "1d", 1000)
-    else:
-        df = get_stock_history(req.symbol, "5y")
-
+    df = await _fetch_history(req.symbol)
     if df.empty or len(df) < 30:
         return APIResponse(success=False, message="数据不足")
 
-    df.index = df.index.tz_localize(None) if hasattr(df.index, "tz_localize") and df.index.tz else df.index
-    try:
-        mask = (df.index >= req.start_date) & (df.index <= req.end_date)
-        df = df.loc[mask]
-    except Exception:
-        pass
-
+    df = _filter_range(df, req.start_date, req.end_date)
     if len(df) < 30:
         return APIResponse(success=False, message=f"数据不足(仅{len(df)}条)")
 
-    result = run_backtest(
+    result = await run_cpu(
+        run_backtest,
         df,
         strategy_type=req.strategy_type,
         params=req.params,
@@ -85,3 +90,167 @@ async def run_guest(req: BacktestRequest):
     if "error" in result:
         return APIResponse(success=False, message=result["error"])
     return APIResponse(data=result)
+
+
+# ---------- 组合回测 ----------
+
+UNIVERSES = {"stock": list(STOCK_SYMBOLS.values()), "crypto": TOP_CRYPTO}
+
+
+async def _fetch_histories(symbols, start_date: str, end_date: str) -> dict:
+    """并发下载多个标的的日线历史并按日期范围过滤"""
+    async def load(symbol):
+        df = await _fetch_history(symbol)
+        return _filter_range(df, start_date, end_date) if not df.empty else df
+
+    frames = dict(zip(symbols, await asyncio.gather(*(load(s) for s in symbols))))
+    return {s: df for s, df in frames.items() if len(df) >= 30}
+
+
+@router.post("/portfolio")
+async def run_portfolio(req: PortfolioBacktestRequest, user: dict = Depends(get_current_user)):
+    """多标的组合回测 (统一日历对齐，整列计算信号和权益，支持权重分配和再平衡)"""
+    symbols = list(dict.fromkeys(req.symbols or UNIVERSES.get(req.universe or "", [])))
+    if not symbols:
+        return APIResponse(success=False, message="请指定 symbols 或 universe (stock / crypto)")
+    if len(symbols) > MAX_SYMBOLS:
+        return APIResponse(success=False, message=f"标的数量过多: {len(symbols)} > {MAX_SYMBOLS}")
+
+    frames = await _fetch_histories(symbols, req.start_date, req.end_date)
+    if not frames:
+        return APIResponse(success=False, message="选定时间范围内数据不足")
+    skipped = [s for s in symbols if s not in frames]
+
+    result = await run_cpu(
+        run_portfolio_backtest,
+        frames,
+        strategy_type=req.strategy_type,
+        params=req.params,
+        initial_capital=req.initial_capital,
+        commission_rate=req.commission_rate,
+        slippage=req.slippage,
+        weights=req.weights or None,
+        rebalance=req.rebalance,
+        position_pct=req.position_pct,
+        include_symbol_curves=req.include_symbol_curves,
+    )
+    if "error" in result:
+        return APIResponse(success=False, message=result["error"])
+    result["skipped_symbols"] = skipped
+    return APIResponse(data=result)
+
+
+# ---------- 参数寻优 ----------
+
+@router.post("/optimize")
+async def optimize(req: OptimizeRequest, user: dict = Depends(get_current_user)):
+    """启动参数网格寻优 (后台进程池执行, 返回任务 ID)"""
+    df = await _fetch_history(req.symbol)
+    if df.empty or len(df) < 30:
+        return APIResponse(success=False, message="数据不足")
+
+    df = _filter_range(df, req.start_date, req.end_date)
+    if len(df) < 30:
+        return APIResponse(success=False, message=f"选定时间范围内数据不足(仅{len(df)}条)")
+
+    try:
+        job = optimizer.start_optimization(
+            user_id=user["id"],
+            df=df,
+            strategy_type=req.strategy_type,
+            symbol=req.symbol,
+            param_grid=req.param_grid,
+            fixed_params=req.fixed_params,
+            initial_capital=req.initial_capital,
+            commission_rate=req.commission_rate,
+            slippage=req.slippage,
+            sort_by=req.sort_by,
+        )
+    except ValueError as e:
+        return APIResponse(success=False, message=str(e))
+
+    return APIResponse(data=job.summary(top_n=0), message=f"寻优任务已启动，共 {job.total} 组参数")
+
+
+@router.get("/optimize/{job_id}")
+async def optimize_status(
+    job_id: str,
+    top_n: int = Query(50, ge=1, le=optimizer.MAX_COMBINATIONS),
+    user: dict = Depends(get_current_user),
+):
+    """查询寻优进度和当前排名 (运行中返回部分结果)"""
+    job = optimizer.get_job(job_id, user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="寻优任务不存在")
+    return APIResponse(data=job.summary(top_n))
+
+
+@router.post("/optimize/{job_id}/cancel")
+async def optimize_cancel(job_id: str, user: dict = Depends(get_current_user)):
+    """取消寻优任务 (已完成的部分结果保留)"""
+    job = optimizer.get_job(job_id, user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="寻优任务不存在")
+    if not job.cancel():
+        return APIResponse(success=False, message=f"任务已结束 ({job.status})")
+    return APIResponse(data=job.summary(top_n=0), message="寻优任务已取消")
+
+
+@router.get("/optimize/{job_id}/stream")
+async def optimize_stream(
+    job_id: str,
+    request: Request,
+    top_n: int = Query(50, ge=1, le=optimizer.MAX_COMBINATIONS),
+    user: dict = Depends(get_current_user),
+):
+    """以 SSE 推送寻优进度: progress 事件携带新完成的组合，结束时推送最终排名"""
+    job = optimizer.get_job(job_id, user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="寻优任务不存在")
+
+    async def events():
+        seen = 0
+        while True:
+            await job.wait_for_update(seen)
+            if await request.is_disconnected():
+                break
+            rows = job.results[seen:]
+            seen += len(rows)
+            progress = {"status": job.status, "completed": seen, "total": job.total, "rows": rows}
+            yield f"event: progress\ndata: {json.dumps(progress, ensure_ascii=False)}\n\n"
+            if job.finished and seen >= job.completed:
+                yield f"event: {job.status}\ndata: {json.dumps(job.summary(top_n), ensure_ascii=False)}\n\n"
+                break
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# ---------- 滚动窗口回测 ----------
+
+@router.post("/walk-forward")
+async def walk_forward(req: WalkForwardRequest, user: dict = Depends(get_current_user)):
+    """滚动窗口回测: 训练窗口寻优、紧随其后的测试窗口验证，返回各窗口指标和样本外权益曲线"""
+    df = await _fetch_history(req.symbol)
+    if df.empty or len(df) < 30:
+        return APIResponse(success=False, message="数据不足")
+
+    df = _filter_range(df, req.start_date, req.end_date)
+    try:
+        result = await run_walk_forward(
+            df,
+            strategy_type=req.strategy_type,
+            param_grid=req.param_grid,
+            train_size=req.train_size,
+            test_size=req.test_size,
+            fixed_params=req.fixed_params,
+            anchored=req.anchored,
+            initial_capital=req.initial_capital,
+            commission_rate=req.commission_rate,
+            slippage=req.slippage,
+            sort_by=req.sort_by,
+        )
+    except ValueError as e:
+        return APIResponse(success=False, message=str(e))
+
+    result["symbol"] = req.symbol
+    return APIResponse(data=result)
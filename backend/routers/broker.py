@@ -9,7 +9,8 @@ from datetime import datetime, timezone
 from schemas.common import APIResponse
 from database import get_supabase
 from routers.auth import get_current_user
-from services.brokers.factory import get_broker, create_broker, get_supported_brokers
+from services.brokers.factory import create_broker, get_supported_brokers
+from services.brokers.pool import get_broker_pool
 from core.logger import logger
 
 router = APIRouter()
@@ -37,6 +38,13 @@ class LiveOrderRequest(BaseModel):
     confirm_real_trade: bool = False
 
 
+def _load_account(sb, account_id: int, user_id: int) -> dict:
+    acc = sb.table("broker_accounts").select("*").eq("id", account_id).eq("user_id", user_id).execute()
+    if not acc.data:
+        raise HTTPException(status_code=404, detail="交易账户不存在")
+    return acc.data[0]
+
+
 # ---------- 交易所/券商列表 ----------
 
 @router.get("/supported")
@@ -84,7 +92,9 @@ async def create_account(body: BrokerAccountCreate, user: dict = Depends(get_cur
 async def delete_account(account_id: int, user: dict = Depends(get_current_user)):
     """删除交易账户"""
     sb = get_supabase()
-    sb.table("broker_accounts").delete().eq("id", account_id).eq("user_id", user["id"]).execute()
+    result = sb.table("broker_accounts").delete().eq("id", account_id).eq("user_id", user["id"]).execute()
+    if result.data:
+        get_broker_pool().invalidate(account_id)
     return APIResponse(message="账户已删除")
 
 
@@ -122,12 +132,12 @@ async def test_connection(account_id: int, user: dict = Depends(get_current_user
 @router.get("/accounts/{account_id}/balance")
 async def get_balance(account_id: int, user: dict = Depends(get_current_user)):
     """查询账户余额和持仓"""
+    sb = get_supabase()
+    acc = _load_account(sb, account_id, user["id"])
     try:
-        broker = await get_broker(account_id)
-        balance = await broker.get_balance()
-        await broker.close()
+        async with get_broker_pool().lease(acc) as broker:
+            balance = await broker.get_balance()
 
-        sb = get_supabase()
         sb.table("broker_accounts").update({
             "balance_cache": {
                 "total_equity": balance.total_equity,
@@ -160,9 +170,7 @@ async def place_live_order(body: LiveOrderRequest, user: dict = Depends(get_curr
         )
 
     sb = get_supabase()
-    acc = sb.table("broker_accounts").select("*").eq("id", body.broker_account_id).eq("user_id", user["id"]).single().execute()
-    if not acc.data:
-        raise HTTPException(status_code=404, detail="交易账户不存在")
+    acc = _load_account(sb, body.broker_account_id, user["id"])
 
     # 创建订单记录
     order_record = sb.table("live_orders").insert({
@@ -179,15 +187,14 @@ async def place_live_order(body: LiveOrderRequest, user: dict = Depends(get_curr
     order_id = order_record.data[0]["id"]
 
     try:
-        broker = await get_broker(body.broker_account_id)
-        result = await broker.place_order(
-            symbol=body.symbol,
-            side=body.side,
-            quantity=body.quantity,
-            order_type=body.order_type,
-            price=body.price,
-        )
-        await broker.close()
+        async with get_broker_pool().lease(acc) as broker:
+            result = await broker.place_order(
+                symbol=body.symbol,
+                side=body.side,
+                quantity=body.quantity,
+                order_type=body.order_type,
+                price=body.price,
+            )
 
         sb.table("live_orders").update({
             "exchange_order_id": result.order_id,
@@ -237,10 +244,10 @@ async def cancel_live_order(order_id: int, user: dict = Depends(get_current_user
     if not o.get("exchange_order_id"):
         return APIResponse(success=False, message="无交易所订单号，无法撤单")
 
+    acc = _load_account(sb, o["broker_account_id"], user["id"])
     try:
-        broker = await get_broker(o["broker_account_id"])
-        ok = await broker.cancel_order(o["exchange_order_id"], o["symbol"])
-        await broker.close()
+        async with get_broker_pool().lease(acc) as broker:
+            ok = await broker.cancel_order(o["exchange_order_id"], o["symbol"])
 
         if ok:
             sb.table("live_orders").update({"status": "cancelled"}).eq("id", order_id).execute()
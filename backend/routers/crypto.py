@@ -1,16 +1,24 @@
 """
 加密货币数据路由
 """
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
 from schemas.common import APIResponse
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
 from services.market_data import (
-    get_crypto_price,
-    get_crypto_history,
     get_multiple_crypto_quotes,
     calculate_indicators,
+    indicator_arrays,
+    candle_columns,
+    candle_rows,
     TOP_CRYPTO,
 )
+from services.market_service import fetch_crypto_price, fetch_crypto_history
+from services.executors import run_io
+from services.indicators import get_indicator_cache
 from core.logger import logger
+from core.responses import columnar_response
 
 router = APIRouter()
 
@@ -18,7 +26,7 @@ router = APIRouter()
 @router.get("/price/{symbol:path}")
 async def price(symbol: str, exchange: str = Query("binance")):
     """获取加密货币实时价格"""
-    data = get_crypto_price(symbol, exchange)
+    data = await fetch_crypto_price(symbol, exchange)
     if "error" in data:
         return APIResponse(success=False, message=data["error"])
     return APIResponse(data=data)
@@ -26,40 +34,46 @@ async def price(symbol: str, exchange: str = Query("binance")):
 
 @router.get("/history/{symbol:path}")
 async def history(
+    request: Request,
     symbol: str,
     timeframe: str = Query("1d", description="K线周期: 1m,5m,15m,1h,4h,1d"),
     limit: int = Query(200, ge=10, le=1000),
     exchange: str = Query("binance"),
+    layout: str = Query("rows", description="rows: 逐根K线对象; columns: 按字段输出数组 (体积更小)"),
 ):
-    """获取加密货币历史 K 线和技术指标"""
-    df = get_crypto_history(symbol, timeframe, limit, exchange)
+    """获取加密货币历史 K 线和技术指标 (Accept 可选 msgpack / Arrow，见 core.responses)"""
+    df = await fetch_crypto_history(symbol, timeframe, limit, exchange)
     if df.empty:
         return APIResponse(success=False, message="无数据")
 
-    candles = []
-    for idx, row in df.iterrows():
-        candles.append({
-            "date": str(idx)[:19],
-            "open": round(float(row["open"]), 2),
-            "high": round(float(row["high"]), 2),
-            "low": round(float(row["low"]), 2),
-            "close": round(float(row["close"]), 2),
-            "volume": round(float(row["volume"]), 2),
-        })
+    cache = get_indicator_cache().get(f"crypto:{exchange}:{symbol}", timeframe, df)
+    meta = {"symbol": symbol, "timeframe": timeframe}
+    if layout == "columns":
+        columns, indicators = await run_io(_history_columns, df, cache)
+        data = {**meta, "layout": "columns", "columns": columns, "indicators": indicators}
+        return columnar_response(request, data, columns={**columns, **indicators})
 
-    indicators = calculate_indicators(df)
-    return APIResponse(data={
-        "symbol": symbol,
-        "timeframe": timeframe,
-        "candles": candles,
-        "indicators": indicators,
-    })
+    candles, indicators = await run_io(_history_payload, df, cache)
+    return columnar_response(request, {**meta, "candles": candles, "indicators": indicators})
+
+
+def _history_columns(df: pd.DataFrame, cache: Optional[Dict] = None):
+    """列式 K 线和指标 (指标保留 4 位小数，在线程池中执行)"""
+    indicators = {}
+    if len(df) >= 20:
+        indicators = {k: np.round(v, 4) for k, v in indicator_arrays(df, cache).items()}
+    return candle_columns(df, cache, date_chars=19, volume_decimals=2), indicators
+
+
+def _history_payload(df: pd.DataFrame, cache: Optional[Dict] = None):
+    """K 线列表和技术指标 (在线程池中执行)"""
+    return candle_rows(candle_columns(df, cache, date_chars=19, volume_decimals=2)), calculate_indicators(df, cache)
 
 
 @router.get("/batch")
 async def batch_prices():
     """批量获取主流加密货币价格"""
-    data = get_multiple_crypto_quotes()
+    data = await get_multiple_crypto_quotes()
     return APIResponse(data=data)
 
 
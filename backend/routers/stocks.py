@@ -1,16 +1,24 @@
 """
 A股数据路由 - 行情/历史/搜索
 """
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
 from schemas.common import APIResponse
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
 from services.market_data import (
-    get_stock_quote,
-    get_stock_history,
     get_multiple_quotes,
     calculate_indicators,
+    indicator_arrays,
+    candle_columns,
+    candle_rows,
     STOCK_SYMBOLS,
 )
+from services.market_service import fetch_stock_quote, fetch_stock_history
+from services.executors import run_io
+from services.indicators import get_indicator_cache
 from core.logger import logger
+from core.responses import columnar_response
 
 router = APIRouter()
 
@@ -18,43 +26,52 @@ router = APIRouter()
 @router.get("/quote/{symbol}")
 async def quote(symbol: str):
     """获取股票实时报价"""
-    data = get_stock_quote(symbol)
+    data = await fetch_stock_quote(symbol)
     if "error" in data:
         return APIResponse(success=False, message=data["error"])
     return APIResponse(data=data)
 
 
 @router.get("/history/{symbol}")
-async def history(symbol: str, period: str = Query("6mo", description="数据周期: 1mo,3mo,6mo,1y,2y,5y")):
-    """获取股票历史 K 线数据和技术指标"""
-    df = get_stock_history(symbol, period)
+async def history(
+    request: Request,
+    symbol: str,
+    period: str = Query("6mo", description="数据周期: 1mo,3mo,6mo,1y,2y,5y"),
+    layout: str = Query("rows", description="rows: 逐根K线对象; columns: 按字段输出数组 (体积更小)"),
+):
+    """获取股票历史 K 线数据和技术指标 (Accept 可选 msgpack / Arrow，见 core.responses)"""
+    df = await fetch_stock_history(symbol, period)
     if df.empty:
         return APIResponse(success=False, message="无数据")
 
-    candles = []
-    for idx, row in df.iterrows():
-        candles.append({
-            "date": str(idx)[:10],
-            "open": round(float(row["Open"]), 2),
-            "high": round(float(row["High"]), 2),
-            "low": round(float(row["Low"]), 2),
-            "close": round(float(row["Close"]), 2),
-            "volume": int(row["Volume"]),
-        })
+    cache = get_indicator_cache().get(f"stock:{symbol}", "1d", df)
+    if layout == "columns":
+        columns, indicators = await run_io(_history_columns, df, cache)
+        data = {"symbol": symbol, "layout": "columns", "columns": columns, "indicators": indicators}
+        return columnar_response(request, data, columns={**columns, **indicators})
 
-    indicators = calculate_indicators(df)
-    return APIResponse(data={
-        "symbol": symbol,
-        "candles": candles,
-        "indicators": indicators,
-    })
+    candles, indicators = await run_io(_history_payload, df, cache)
+    return columnar_response(request, {"symbol": symbol, "candles": candles, "indicators": indicators})
+
+
+def _history_columns(df: pd.DataFrame, cache: Optional[Dict] = None):
+    """列式 K 线和指标 (指标保留 4 位小数，在线程池中执行)"""
+    indicators = {}
+    if len(df) >= 20:
+        indicators = {k: np.round(v, 4) for k, v in indicator_arrays(df, cache).items()}
+    return candle_columns(df, cache), indicators
+
+
+def _history_payload(df: pd.DataFrame, cache: Optional[Dict] = None):
+    """K 线列表和技术指标 (在线程池中执行)"""
+    return candle_rows(candle_columns(df, cache)), calculate_indicators(df, cache)
 
 
 @router.get("/batch")
 async def batch_quotes(symbols: str = Query(None, description="逗号分隔的股票代码")):
     """批量获取多只股票报价"""
     sym_list = symbols.split(",") if symbols else None
-    data = get_multiple_quotes(sym_list)
+    data = await get_multiple_quotes(sym_list)
     return APIResponse(data=data)
 
 
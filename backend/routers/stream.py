@@ -0,0 +1,87 @@
+"""
+实时推送路由 - WebSocket 订阅报价与指标
+
+连接: /api/v1/stream/quotes?symbols=BTC/USDT,600519.SS&token=<access_token> (也可用 Authorization 头)
+客户端消息: {"action": "subscribe" | "unsubscribe", "symbols": [...]}
+服务端消息: {"type": "update", "quotes": {标的: 变化的字段}}，订阅后第一条为该标的的完整快照
+"""
+import asyncio
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+
+from core.logger import logger
+from routers.auth import get_websocket_user
+from services.quote_hub import Subscriber, get_quote_hub
+
+router = APIRouter()
+
+MAX_SYMBOLS = 100  # 单个连接最多订阅的标的数
+
+
+def _symbols(raw) -> list:
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    return [s.strip() for s in raw or [] if isinstance(s, str) and s.strip()]
+
+
+async def _subscribe(ws: WebSocket, sub: Subscriber, symbols: list):
+    """校验后订阅，未知标的和超出上限的部分回复错误"""
+    hub = sub.hub
+    valid, invalid = await hub.validate(s for s in symbols if s not in sub.symbols)
+    room = max(MAX_SYMBOLS - len(sub.symbols), 0)
+    hub.subscribe(sub, valid[:room])
+    if invalid:
+        await ws.send_json({"type": "error", "message": f"未知标的: {', '.join(invalid[:10])}"})
+    if len(valid) > room:
+        await ws.send_json({"type": "error", "message": f"单个连接最多订阅 {MAX_SYMBOLS} 个标的"})
+
+
+async def _receive(ws: WebSocket, sub: Subscriber):
+    hub = sub.hub
+    while True:
+        msg = await ws.receive_json()
+        action, symbols = msg.get("action"), _symbols(msg.get("symbols"))
+        if action == "subscribe":
+            await _subscribe(ws, sub, symbols)
+        elif action == "unsubscribe":
+            hub.unsubscribe(sub, symbols)
+        else:
+            await ws.send_json({"type": "error", "message": f"未知操作: {action}"})
+
+
+async def _send(ws: WebSocket, sub: Subscriber):
+    hub = sub.hub
+    while True:
+        batch = await sub.next_batch()
+        try:
+            await asyncio.wait_for(ws.send_json({"type": "update", "quotes": batch}), hub.send_timeout)
+        except asyncio.TimeoutError:
+            hub.stats["slow_disconnects"] += 1
+            logger.warning(f"推送连接发送超时 ({hub.send_timeout}s)，断开")
+            await ws.close(code=1013)
+            return
+
+
+@router.websocket("/quotes")
+async def quotes(ws: WebSocket, symbols: str = Query("")):
+    """订阅实时报价与最新指标 (需登录)，服务端只推送变化的字段"""
+    if await get_websocket_user(ws) is None:
+        await ws.close(code=1008)
+        return
+    await ws.accept()
+    hub = get_quote_hub()
+    sub = hub.connect()
+    tasks = []
+    try:
+        await _subscribe(ws, sub, _symbols(symbols))
+        tasks = [asyncio.create_task(_receive(ws, sub)), asyncio.create_task(_send(ws, sub))]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            exc = None if task.cancelled() else task.exception()
+            if exc is not None and not isinstance(exc, WebSocketDisconnect):
+                logger.warning(f"推送连接异常: {exc!r}")
+    finally:
+        # 不在这里等待任务结束: 连接关闭时所在任务可能正被取消，再 await 会把取消传出去
+        for task in tasks:
+            task.cancel()
+        hub.disconnect(sub)
@@ -50,6 +50,54 @@ class BacktestRequest(BaseModel):
     slippage: float = 0.001
 
 
+class OptimizeRequest(BaseModel):
+    strategy_type: str
+    symbol: str
+    # 参数名 -> 取值列表 或 {"start": 5, "stop": 30, "step": 5}
+    param_grid: Dict[str, Any]
+    fixed_params: Dict[str, Any] = {}
+    start_date: str = "2024-01-01"
+    end_date: str = "2025-12-31"
+    initial_capital: float = 1000000.0
+    commission_rate: float = 0.001
+    slippage: float = 0.001
+    sort_by: str = "sharpe_ratio"
+
+
+class WalkForwardRequest(BaseModel):
+    strategy_type: str
+    symbol: str
+    param_grid: Dict[str, Any]
+    fixed_params: Dict[str, Any] = {}
+    train_size: int = 250  # 训练窗口 K 线数
+    test_size: int = 60  # 测试窗口 K 线数 (窗口按此步长滚动)
+    anchored: bool = False  # True: 训练窗口起点固定 (扩张窗口)
+    start_date: str = "2020-01-01"
+    end_date: str = "2025-12-31"
+    initial_capital: float = 1000000.0
+    commission_rate: float = 0.001
+    slippage: float = 0.001
+    sort_by: str = "sharpe_ratio"
+
+
+class PortfolioBacktestRequest(BaseModel):
+    strategy_type: str
+    params: Dict[str, Any] = {}
+    # 标的列表；为空时使用 universe 对应的内置标的池 (stock / crypto)
+    symbols: List[str] = []
+    universe: Optional[str] = None
+    # 标的 -> 权重 (自动归一化)；为空时等权
+    weights: Dict[str, float] = {}
+    rebalance: str = "none"  # none, weekly, monthly, quarterly
+    position_pct: float = 0.95
+    start_date: str = "2024-01-01"
+    end_date: str = "2025-12-31"
+    initial_capital: float = 1000000.0
+    commission_rate: float = 0.001
+    slippage: float = 0.001
+    include_symbol_curves: bool = True
+
+
 class BacktestTradeRecord(BaseModel):
     date: str
     direction: str
@@ -0,0 +1,177 @@
+"""
+Agent 定时调度 - 按 check_interval_minutes 自动运行状态为 running 的 Agent 会话
+
+- 每个 tick 读取运行中的会话，last_check_at + 检查间隔 + 随机延后 到期即运行
+- 调度进度以数据库中的 last_check_at 为准: 重启后沿用原节奏，停机期间错过的检查只补跑一次
+- 运行前以 last_check_at 做条件更新认领会话，多个进程同时调度也不会重复运行
+- 同一 tick 到期的会话按标的合并行情: 每个标的只获取一次报价和 K 线，所有会话共用
+- 同时运行的检查数有上限；上一次检查尚未结束的会话不会再次启动
+"""
+import asyncio
+import random
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config import get_settings
+from core.logger import logger
+from database import get_supabase
+from services.agent_service import fetch_market, run_agent_check
+from services.executors import run_io
+
+PAGE_SIZE = 1000  # Supabase 单次查询的行数上限
+
+
+def _load_running_sessions() -> List[Dict[str, Any]]:
+    sb = get_supabase()
+    sessions, start = [], 0
+    while True:
+        page = (
+            sb.table("agent_sessions")
+            .select("id, symbols, check_interval_minutes, last_check_at")
+            .eq("status", "running")
+            .order("id")
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        ).data or []
+        sessions.extend(page)
+        if len(page) < PAGE_SIZE:
+            return sessions
+        start += PAGE_SIZE
+
+
+def _claim(session: Dict[str, Any], now: datetime) -> bool:
+    """last_check_at 未被其他进程改动时写入本次时间，成功即认领"""
+    query = (
+        get_supabase().table("agent_sessions")
+        .update({"last_check_at": now.isoformat()})
+        .eq("id", session["id"])
+        .eq("status", "running")
+    )
+    prev = session.get("last_check_at")
+    query = query.eq("last_check_at", prev) if prev else query.is_("last_check_at", "null")
+    return bool(query.execute().data)
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    t = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+
+
+class AgentScheduler:
+    """进程内 asyncio 调度器，由 main.lifespan 启停"""
+
+    def __init__(self, tick_seconds: float = 30, concurrency: int = 4, jitter: float = 0.1):
+        self.tick_seconds = tick_seconds
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self.stats = {"ticks": 0, "checks": 0, "errors": 0, "lost_claims": 0, "symbols_fetched": 0}
+        self._task: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._running: Dict[int, asyncio.Task] = {}
+        self._delays: Dict[int, float] = {}  # 会话 id -> 本轮随机延后秒数
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"Agent 调度器已启动 (tick={self.tick_seconds}s, 并发={self.concurrency})")
+
+    async def stop(self):
+        tasks = list(self._running.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running.clear()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Agent 调度失败: {e}")
+            await asyncio.sleep(self.tick_seconds)
+
+    def _is_due(self, session: Dict[str, Any], now: datetime) -> bool:
+        last = _parse_time(session.get("last_check_at"))
+        if last is None:
+            return True
+        interval = max(1, session.get("check_interval_minutes") or 30) * 60
+        delay = self._delays.setdefault(session["id"], random.uniform(0, self.jitter * interval))
+        return (now - last).total_seconds() >= interval + delay
+
+    async def tick(self, now: Optional[datetime] = None) -> List[int]:
+        """运行一轮调度，返回本轮启动的会话 id"""
+        now = now or datetime.now(timezone.utc)
+        self.stats["ticks"] += 1
+        sessions = await run_io(_load_running_sessions)
+        due = [s for s in sessions if s["id"] not in self._running and self._is_due(s, now)]
+        if not due:
+            return []
+
+        claims = await asyncio.gather(*(run_io(_claim, s, now) for s in due))
+        claimed = [s for s, ok in zip(due, claims) if ok]
+        self.stats["lost_claims"] += len(due) - len(claimed)
+        if not claimed:
+            return []
+
+        market = await self._fetch_market({sym for s in claimed for sym in (s.get("symbols") or [])})
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        for s in claimed:
+            self._running[s["id"]] = asyncio.create_task(self._run(s["id"], market))
+        return [s["id"] for s in claimed]
+
+    async def _fetch_market(self, symbols) -> Dict[str, Any]:
+        """本轮所有会话用到的标的各取一次行情 (并发数同批量报价)，失败的标的留给会话自行获取"""
+        symbols = sorted(symbols)
+        semaphore = asyncio.Semaphore(get_settings().QUOTE_BATCH_CONCURRENCY)
+
+        async def fetch(sym: str):
+            async with semaphore:
+                return await fetch_market(sym)
+
+        results = await asyncio.gather(*(fetch(sym) for sym in symbols), return_exceptions=True)
+        self.stats["symbols_fetched"] += len(symbols)
+        market = {}
+        for sym, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Agent 调度行情获取失败 {sym}: {result}")
+            else:
+                market[sym] = result
+        return market
+
+    async def _run(self, session_id: int, market: Dict[str, Any]):
+        try:
+            async with self._semaphore:
+                await run_agent_check(session_id, market=market)
+            self.stats["checks"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Agent {session_id} 定时检查失败: {e}")
+        finally:
+            self._running.pop(session_id, None)
+            self._delays.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "active": len(self._running), "started": self._task is not None}
+
+
+_scheduler: Optional[AgentScheduler] = None
+
+
+def get_agent_scheduler() -> AgentScheduler:
+    global _scheduler
+    if _scheduler is None:
+        settings = get_settings()
+        _scheduler = AgentScheduler(
+            tick_seconds=settings.AGENT_SCHEDULER_TICK,
+            concurrency=settings.AGENT_SCHEDULER_CONCURRENCY,
+            jitter=settings.AGENT_SCHEDULER_JITTER,
+        )
+    return _scheduler
@@ -4,6 +4,7 @@ AI Agent 自主交易服务
 核心流程:
 1. 获取市场数据 + 技术指标
 2. 调用 DeepSeek 进行分析并生成交易决策
+   (AGENT_BATCH_DECISIONS 开启时多个标的合并为一次调用，解析失败的标的逐个重试)
 3. 风控检查
 4. 根据模式执行:
    - autonomous: 自动执行
@@ -11,24 +12,33 @@ AI Agent 自主交易服务
    - observe: 仅记录不执行
 5. 记录决策日志
 """
+import asyncio
 import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+
+import pandas as pd
 
 from config import get_settings
 from core.logger import logger
 from database import get_supabase
-from services.market_data import (
-    get_stock_quote, get_crypto_price,
-    get_stock_history, get_crypto_history,
-    calculate_indicators,
-)
+from services.market_data import calculate_indicators
+from services.market_service import fetch_quote, fetch_stock_history, fetch_crypto_history
+from services.executors import run_io
 from services.ai_service import predict_trend
+from services.indicators import get_indicator_cache
 from services.risk_manager import check_position_size, calculate_stop_loss, calculate_take_profit
+from services.portfolio_store import TradeRejected, apply_trade
 from services import deepseek_service
 
 settings = get_settings()
 
+# 组合 id -> 成交锁 (同一组合的自动成交串行执行)
+_portfolio_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
 AGENT_DECISION_PROMPT = """你是一个 AI 量化交易 Agent。你正在管理用户的投资组合，需要基于当前市场数据做出交易决策。
 
 ## 当前持仓
@@ -68,7 +78,9 @@ AGENT_DECISION_PROMPT = """你是一个 AI 量化交易 Agent。你正在管理
 }}
 ```
 
-决策原则:
+{principles}"""
+
+DECISION_PRINCIPLES = """决策原则:
 1. 没有明确信号时，选择 hold
 2. 置信度低于 0.6 时，优先 hold
 3. 买入数量不超过现金余额的 {max_position_pct}%
@@ -77,94 +89,259 @@ AGENT_DECISION_PROMPT = """你是一个 AI 量化交易 Agent。你正在管理
 6. 单日交易次数不超过限额
 7. 风险偏好 conservative: 少交易多观望; aggressive: 积极交易; balanced: 均衡"""
 
+# 多标的合并决策: 组合、持仓、风控参数只出现一次
+AGENT_BATCH_PROMPT = """你是一个 AI 量化交易 Agent。你正在管理用户的投资组合，需要对以下 {count} 个标的分别做出交易决策。
+
+## 当前持仓
+{positions}
 
-async def run_agent_check(session_id: int) -> List[Dict[str, Any]]:
+## 组合概况
+- 总资产: {portfolio_value}
+- 现金余额: {cash_balance}
+- 总收益: {total_pnl} ({total_pnl_pct}%)
+
+## 风控参数
+- 单笔最大仓位: {max_position_pct}%
+- 止损线: {stop_loss_pct}%
+- 止盈线: {take_profit_pct}%
+- 风险偏好: {risk_tolerance}
+- 策略倾向: {strategy_preference}
+
+## 今日已交易次数: {trades_today}/{max_trades_per_day}
+
+{sections}
+
+请对每个标的做出决策。你 **必须** 以如下 JSON 数组格式回复，每个标的一个元素，顺序与上文一致（不要输出其他内容）:
+
+```json
+[
+  {{
+    "action": "buy" | "sell" | "hold",
+    "symbol": "标的代码",
+    "confidence": 0.0-1.0,
+    "quantity": 数量(hold时为0),
+    "reason": "中文决策理由，2-3句话",
+    "risk_note": "风险提示，1句话"
+  }}
+]
+```
+
+{principles}"""
+
+AGENT_BATCH_SECTION = """### 标的: {symbol}
+行情: {market_data}
+技术指标: {tech_analysis}"""
+
+AGENT_SYSTEM_PROMPT = "你是一个专业的 AI 量化交易 Agent。严格按要求的 JSON 格式输出决策。"
+
+# 模型调用统计，按决策方式 (single / batch) 累计，用于比较两种方式的 token 与耗时
+_llm_stats: Dict[str, Dict[str, float]] = defaultdict(lambda: {
+    "checks": 0, "symbols": 0, "calls": 0, "fallbacks": 0,
+    "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "llm_ms": 0.0,
+})
+
+
+async def fetch_market(symbol: str) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """单个标的的报价和日 K 线"""
+    if "/" in symbol:
+        history = fetch_crypto_history(symbol, "1d", 100)
+    else:
+        history = fetch_stock_history(symbol, "6mo")
+    return await asyncio.gather(fetch_quote(symbol, "crypto" if "/" in symbol else "stock"), history)
+
+
+async def run_agent_check(session_id: int, market: Optional[Dict[str, Tuple[Dict, pd.DataFrame]]] = None) -> List[Dict[str, Any]]:
     """
     执行一次 Agent 检查循环，返回所有决策
+    market: 调度器按标的预取的 {symbol: (报价, K线)}，多个会话共用；缺失的标的自行获取
     """
     sb = get_supabase()
+    state = await run_io(_load_check_state, session_id)
 
-    session = sb.table("agent_sessions").select("*").eq("id", session_id).single().execute()
-    if not session.data:
+    s = state["session"]
+    if not s:
         return [{"error": "会话不存在"}]
-
-    s = session.data
     if s["status"] != "running":
         return [{"error": f"会话状态为 {s['status']}，非运行中"}]
 
     if not deepseek_service.is_deepseek_configured():
         return [{"error": "未配置 DEEPSEEK_API_KEY"}]
 
-    # 获取组合信息
-    portfolio = sb.table("portfolios").select("*").eq("id", s["portfolio_id"]).single().execute()
-    if not portfolio.data:
+    pf = state["portfolio"]
+    if not pf:
         return [{"error": "组合不存在"}]
-    pf = portfolio.data
-
-    positions = sb.table("positions").select("*").eq("portfolio_id", pf["id"]).execute()
-    pos_list = positions.data or []
-
-    # 今日交易数
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    today_trades = sb.table("agent_decisions").select("id", count="exact").eq("session_id", session_id).gte("created_at", today).neq("action", "hold").execute()
-    trades_today = len(today_trades.data) if today_trades.data else 0
+    pos_list = state["positions"]
+    trades_today = state["trades_today"]
 
     symbols = s.get("symbols") or []
     if not symbols:
         return [{"error": "未配置监控标的"}]
 
-    decisions = []
+    # 各标的并行分析，交易次数额度共享
+    budget = TradeBudget(trades_today, s.get("max_trades_per_day", 5))
+    semaphore = asyncio.Semaphore(settings.AGENT_SYMBOL_CONCURRENCY)
+    batch = settings.AGENT_BATCH_DECISIONS and len(symbols) > 1
+    usage = _llm_stats["batch" if batch else "single"]
+    usage["checks"] += 1
+    usage["symbols"] += len(symbols)
 
-    for symbol in symbols:
+    async def guarded(symbol: str, coro) -> Optional[Dict[str, Any]]:
         try:
-            decision = await _analyze_and_decide(
-                symbol=symbol,
-                session=s,
-                portfolio=pf,
-                positions=pos_list,
-                trades_today=trades_today,
-            )
-            if decision:
-                decisions.append(decision)
-                if decision.get("action") != "hold":
-                    trades_today += 1
+            async with semaphore:
+                return await coro
         except Exception as e:
             logger.error(f"Agent 分析 {symbol} 失败: {e}")
-            decisions.append({
+            return {
                 "symbol": symbol,
                 "action": "hold",
                 "reason": f"分析异常: {str(e)}",
                 "confidence": 0,
                 "error": True,
-            })
+            }
+
+    def finish(symbol: str, timings: Dict[str, float], started: float, decision: Optional[Dict[str, Any]]):
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Agent {session_id} {symbol} 耗时(ms): {timings}")
+        if decision:
+            decision["timings"] = timings
+        return decision
+
+    started = time.perf_counter()
+    timings = {sym: {} for sym in symbols}
+    if not batch:
+        async def analyze(symbol: str) -> Optional[Dict[str, Any]]:
+            symbol_started = time.perf_counter()
+            decision = await guarded(symbol, _analyze_and_decide(
+                symbol=symbol,
+                session=s,
+                portfolio=pf,
+                positions=pos_list,
+                budget=budget,
+                timings=timings[symbol],
+                market=(market or {}).get(symbol),
+                usage=usage,
+            ))
+            return finish(symbol, timings[symbol], symbol_started, decision)
+
+        results = await asyncio.gather(*(analyze(sym) for sym in symbols))
+    else:
+        # 1. 各标的并行准备行情与指标 (止损/止盈直接出结果)
+        prepared = await asyncio.gather(*(
+            guarded(sym, _prepare(sym, s, pos_list, budget, timings[sym], (market or {}).get(sym)))
+            for sym in symbols
+        ))
+        results = {sym: p for sym, p in zip(symbols, prepared) if "context" not in p}
+        contexts = [p["context"] for p in prepared if "context" in p]
+
+        # 2. 需要模型决策的标的合并调用
+        llm_started = time.perf_counter()
+        answers = await _decide_batch(contexts, _shared_prompt_fields(s, pf, pos_list, budget), usage)
+        llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+
+        # 3. 各标的分别风控，决策一次批量写入，再逐个执行 (autonomous 模式)
+        settled = [_settle(c, *answers[c["symbol"]], s, pf, budget) for c in contexts]
+        save_started = time.perf_counter()
+        try:
+            saved = await _save_decisions(sb, s, [d for d, _ in settled])
+        except Exception as e:
+            logger.error(f"Agent {session_id} 决策保存失败: {e}")
+            for _, reserved in settled:
+                if reserved:
+                    budget.release()
+            saved = [
+                {"symbol": c["symbol"], "action": "hold", "reason": f"分析异常: {str(e)}", "confidence": 0, "error": True}
+                for c in contexts
+            ]
+        else:
+            save_ms = round((time.perf_counter() - save_started) * 1000, 1)
+            saved = await asyncio.gather(*(
+                guarded(c["symbol"], _execute_if_autonomous(d, s, pf, timings[c["symbol"]]))
+                for c, d in zip(contexts, saved)
+            ))
+            for c in contexts:
+                timings[c["symbol"]]["save"] = save_ms
+        for c, decision in zip(contexts, saved):
+            timings[c["symbol"]]["llm"] = llm_ms
+            results[c["symbol"]] = decision
+        results = [finish(sym, timings[sym], started, results[sym]) for sym in symbols]
+
+    decisions = [d for d in results if d]
+    logger.info(f"Agent {session_id} 模型调用累计 ({'batch' if batch else 'single'}): {dict(usage)}")
 
     # 更新会话
-    sb.table("agent_sessions").update({
+    await run_io(sb.table("agent_sessions").update({
         "last_check_at": datetime.now(timezone.utc).isoformat(),
         "total_decisions": (s.get("total_decisions") or 0) + len(decisions),
-    }).eq("id", session_id).execute()
+    }).eq("id", session_id).execute)
 
     return decisions
 
 
+def _load_check_state(session_id: int) -> Dict[str, Any]:
+    """一次检查所需的会话、组合、持仓和今日交易数 (同步，在 IO 线程池中执行)；会话不可用时不再继续查询"""
+    sb = get_supabase()
+    session = sb.table("agent_sessions").select("*").eq("id", session_id).single().execute().data
+    state = {"session": session, "portfolio": None, "positions": [], "trades_today": 0}
+    if not session or session["status"] != "running":
+        return state
+
+    portfolio = sb.table("portfolios").select("*").eq("id", session["portfolio_id"]).single().execute().data
+    if not portfolio:
+        return state
+    state["portfolio"] = portfolio
+    state["positions"] = sb.table("positions").select("*").eq("portfolio_id", portfolio["id"]).execute().data or []
+
+    # 今日交易数
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    today_trades = sb.table("agent_decisions").select("id", count="exact").eq("session_id", session_id).gte("created_at", today).neq("action", "hold").execute()
+    state["trades_today"] = len(today_trades.data) if today_trades.data else 0
+    return state
+
+
 async def _analyze_and_decide(
     symbol: str,
     session: dict,
     portfolio: dict,
     positions: list,
-    trades_today: int,
+    budget: "TradeBudget",
+    timings: Dict[str, float],
+    market: Optional[Tuple[Dict, pd.DataFrame]] = None,
+    usage: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """对单个标的进行分析并决策，各阶段耗时写入 timings (毫秒)"""
+    prepared = await _prepare(symbol, session, positions, budget, timings, market)
+    if "context" not in prepared:
+        return prepared
+    ctx = prepared["context"]
+
+    # 4. 调用 DeepSeek 决策
+    prompt = AGENT_DECISION_PROMPT.format(
+        symbol=symbol,
+        market_data=ctx["market_desc"],
+        tech_analysis=ctx["tech_desc"],
+        principles=DECISION_PRINCIPLES,
+        **_shared_prompt_fields(session, portfolio, positions, budget),
+    )
+    with _stage(timings, "llm"):
+        decision, raw = await _decide_single(symbol, prompt, usage if usage is not None else _llm_stats["single"])
+    return await _finalize(ctx, decision, raw, session, portfolio, budget, timings)
+
+
+async def _prepare(
+    symbol: str,
+    session: dict,
+    positions: list,
+    budget: "TradeBudget",
+    timings: Dict[str, float],
+    market: Optional[Tuple[Dict, pd.DataFrame]] = None,
 ) -> Dict[str, Any]:
-    """对单个标的进行分析并决策"""
+    """行情、指标与止损/止盈检查；需要模型决策时返回 {"context": ...}，否则返回最终决策"""
     sb = get_supabase()
     is_crypto = "/" in symbol
 
     # 1. 获取行情
-    if is_crypto:
-        quote = get_crypto_price(symbol)
-        df = get_crypto_history(symbol, "1d", 100)
-    else:
-        quote = get_stock_quote(symbol)
-        df = get_stock_history(symbol, "6mo")
+    with _stage(timings, "market"):
+        quote, df = market if market is not None else await fetch_market(symbol)
 
     if "error" in quote or df.empty:
         return {"symbol": symbol, "action": "hold", "reason": "无法获取行情", "confidence": 0}
@@ -174,23 +351,19 @@ async def _analyze_and_decide(
         return {"symbol": symbol, "action": "hold", "reason": "价格异常", "confidence": 0}
 
     # 2. 技术指标
-    indicators = calculate_indicators(df)
-    trend = predict_trend(df)
+    with _stage(timings, "indicators"):
+        cache = get_indicator_cache().get(f"crypto:binance:{symbol}" if is_crypto else f"stock:{symbol}", "1d", df)
+        indicators, trend = await run_io(lambda: (calculate_indicators(df, cache), predict_trend(df, cache=cache)))
 
     # 3. 检查止损/止盈
     current_pos = next((p for p in positions if p["symbol"] == symbol), None)
     forced_action = _check_stop_loss_take_profit(current_pos, price, session)
     if forced_action:
+        # 止损/止盈是保护性操作，不受交易次数上限约束，但计入当日次数
+        budget.force()
         forced_action["market_snapshot"] = _compact_snapshot(quote, trend)
-        return await _save_decision(sb, session, forced_action)
-
-    # 4. 调用 DeepSeek 决策
-    pos_desc = "无持仓"
-    if positions:
-        pos_desc = "\n".join([
-            f"- {p['symbol']}: {p['quantity']}股, 成本{p['avg_cost']:.2f}, 现价{p.get('current_price', 0):.2f}, 浮盈{p.get('unrealized_pnl', 0):.2f}"
-            for p in positions
-        ])
+        with _stage(timings, "save"):
+            return await _save_decision(sb, session, forced_action)
 
     market_desc = (
         f"价格: {price}, 涨跌幅: {quote.get('change_pct', 0):.2f}%, "
@@ -201,61 +374,197 @@ async def _analyze_and_decide(
     for sig in trend.get("signals", []):
         tech_desc += f"\n  - {sig['name']} ({sig['type']})"
 
-    prompt = AGENT_DECISION_PROMPT.format(
-        symbol=symbol,
-        positions=pos_desc,
-        portfolio_value=f"{portfolio['current_value']:.0f}",
-        cash_balance=f"{portfolio['cash_balance']:.0f}",
-        total_pnl=f"{portfolio['total_pnl']:.0f}",
-        total_pnl_pct=f"{portfolio['total_pnl_pct']:.2f}",
-        market_data=market_desc,
-        tech_analysis=tech_desc,
-        max_position_pct=session.get("max_position_pct", 0.15) * 100,
-        stop_loss_pct=session.get("stop_loss_pct", 0.05) * 100,
-        take_profit_pct=session.get("take_profit_pct", 0.15) * 100,
-        risk_tolerance=session.get("risk_tolerance", "medium"),
-        strategy_preference=session.get("strategy_preference", "balanced"),
-        trades_today=trades_today,
-        max_trades_per_day=session.get("max_trades_per_day", 5),
-    )
+    return {"context": {
+        "symbol": symbol, "quote": quote, "trend": trend, "price": price, "position": current_pos,
+        "market_desc": market_desc, "tech_desc": tech_desc,
+    }}
 
+
+def _shared_prompt_fields(session: dict, portfolio: dict, positions: list, budget: "TradeBudget") -> Dict[str, Any]:
+    """单标的与合并决策提示词共用的组合、持仓与风控参数"""
+    pos_desc = "无持仓"
+    if positions:
+        pos_desc = "\n".join([
+            f"- {p['symbol']}: {p['quantity']}股, 成本{p['avg_cost']:.2f}, 现价{p.get('current_price', 0):.2f}, 浮盈{p.get('unrealized_pnl', 0):.2f}"
+            for p in positions
+        ])
+    return {
+        "positions": pos_desc,
+        "portfolio_value": f"{portfolio['current_value']:.0f}",
+        "cash_balance": f"{portfolio['cash_balance']:.0f}",
+        "total_pnl": f"{portfolio['total_pnl']:.0f}",
+        "total_pnl_pct": f"{portfolio['total_pnl_pct']:.2f}",
+        "max_position_pct": session.get("max_position_pct", 0.15) * 100,
+        "stop_loss_pct": session.get("stop_loss_pct", 0.05) * 100,
+        "take_profit_pct": session.get("take_profit_pct", 0.15) * 100,
+        "risk_tolerance": session.get("risk_tolerance", "medium"),
+        "strategy_preference": session.get("strategy_preference", "balanced"),
+        "trades_today": budget.used,
+        "max_trades_per_day": budget.limit,
+    }
+
+
+async def _ask(prompt: str, max_tokens: int, usage: Dict[str, float]) -> str:
+    """调用模型并累计 token 与耗时"""
+    messages = [
+        {"role": "system", "content": AGENT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+    start = time.perf_counter()
+    try:
+        raw, tokens = await deepseek_service._request_deepseek(messages, temperature=0.1, max_tokens=max_tokens)
+    finally:
+        usage["calls"] += 1
+        usage["llm_ms"] += round((time.perf_counter() - start) * 1000, 1)
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        usage[key] += (tokens or {}).get(key) or 0
+    return raw
+
+
+async def _decide_single(symbol: str, prompt: str, usage: Dict[str, float]) -> Tuple[dict, str]:
+    """单个标的的模型决策，返回 (决策, 模型原始回复)"""
     try:
-        messages = [
-            {"role": "system", "content": "你是一个专业的 AI 量化交易 Agent。严格按要求的 JSON 格式输出决策。"},
-            {"role": "user", "content": prompt},
-        ]
-        raw = await deepseek_service._call_deepseek(messages, temperature=0.1, max_tokens=500)
-
-        # 解析 JSON
-        decision = _parse_decision(raw, symbol)
+        raw = await _ask(prompt, 500, usage)
+        return _parse_decision(raw, symbol), raw
     except Exception as e:
         logger.error(f"Agent DeepSeek 决策失败 {symbol}: {e}")
-        decision = {
+        return {
             "action": "hold",
             "symbol": symbol,
             "confidence": 0,
             "quantity": 0,
             "reason": f"AI 决策异常: {str(e)}",
             "risk_note": "系统异常，暂停操作",
-        }
+        }, ""
 
-    # 5. 风控二次校验
-    decision = _risk_check(decision, portfolio, session, current_pos, price)
+
+async def _decide_batch(
+    contexts: List[Dict[str, Any]], shared: Dict[str, Any], usage: Dict[str, float],
+) -> Dict[str, Tuple[dict, str]]:
+    """
+    按 AGENT_BATCH_SIZE 分组，每组一次模型调用，返回 {symbol: (决策, 该标的的原始回复)}
+    回复无法解析或缺少某个标的时，这些标的改为逐个调用
+    """
+    size = max(1, settings.AGENT_BATCH_SIZE)
+    groups = [contexts[i:i + size] for i in range(0, len(contexts), size)]
+
+    async def run_group(group: List[Dict[str, Any]]) -> Dict[str, Tuple[dict, str]]:
+        answers: Dict[str, Tuple[dict, str]] = {}
+        if len(group) > 1:
+            sections = "\n\n".join(
+                AGENT_BATCH_SECTION.format(symbol=c["symbol"], market_data=c["market_desc"], tech_analysis=c["tech_desc"])
+                for c in group
+            )
+            prompt = AGENT_BATCH_PROMPT.format(
+                count=len(group), sections=sections, principles=DECISION_PRINCIPLES, **shared,
+            )
+            try:
+                raw = await _ask(prompt, min(settings.DEEPSEEK_MAX_TOKENS, 300 * len(group)), usage)
+                answers = _parse_batch_decisions(raw, [c["symbol"] for c in group])
+            except Exception as e:
+                logger.warning(f"Agent 合并决策失败，改为逐个调用: {e}")
+
+        missing = [c for c in group if c["symbol"] not in answers]
+        if missing and len(group) > 1:
+            usage["fallbacks"] += len(missing)
+        singles = await asyncio.gather(*(
+            _decide_single(c["symbol"], AGENT_DECISION_PROMPT.format(
+                symbol=c["symbol"], market_data=c["market_desc"], tech_analysis=c["tech_desc"],
+                principles=DECISION_PRINCIPLES, **shared,
+            ), usage)
+            for c in missing
+        ))
+        answers.update({c["symbol"]: answer for c, answer in zip(missing, singles)})
+        return answers
+
+    answers: Dict[str, Tuple[dict, str]] = {}
+    for group_answers in await asyncio.gather(*(run_group(g) for g in groups)):
+        answers.update(group_answers)
+    return answers
+
+
+async def _finalize(
+    ctx: Dict[str, Any],
+    decision: dict,
+    raw: str,
+    session: dict,
+    portfolio: dict,
+    budget: "TradeBudget",
+    timings: Dict[str, float],
+) -> Dict[str, Any]:
+    """风控、预占交易次数、保存决策，autonomous 模式下执行"""
+    decision, reserved = _settle(ctx, decision, raw, session, portfolio, budget)
 
     # 6. 保存决策
+    try:
+        with _stage(timings, "save"):
+            saved = await _save_decision(get_supabase(), session, decision)
+    except Exception:
+        if reserved:
+            budget.release()
+        raise
+    return await _execute_if_autonomous(saved, session, portfolio, timings)
+
+
+def _settle(
+    ctx: Dict[str, Any], decision: dict, raw: str, session: dict, portfolio: dict, budget: "TradeBudget",
+) -> Tuple[dict, bool]:
+    """风控二次校验、预占当日交易次数并补全待保存的字段，返回 (决策, 是否预占了次数)"""
+    price = ctx["price"]
+
+    # 5. 风控二次校验 + 预占当日交易次数 (其他标的可能同时在分析)
+    decision = _risk_check(decision, portfolio, session, ctx["position"], price)
+    reserved = decision["action"] in ("buy", "sell") and budget.reserve()
+    if decision["action"] in ("buy", "sell") and not reserved:
+        decision["action"] = "hold"
+        decision["quantity"] = 0
+        decision["reason"] = f"今日交易次数已达上限 ({budget.limit})，本次不交易"
+
     decision["price"] = price
-    decision["market_snapshot"] = _compact_snapshot(quote, trend)
-    decision["ai_analysis"] = raw if "raw" in dir() else ""
+    decision["market_snapshot"] = _compact_snapshot(ctx["quote"], ctx["trend"])
+    decision["ai_analysis"] = raw
+    return decision, reserved
 
-    saved = await _save_decision(sb, session, decision)
 
-    # 7. autonomous 模式自动执行
+async def _execute_if_autonomous(saved: dict, session: dict, portfolio: dict, timings: Dict[str, float]) -> dict:
+    # 7. autonomous 模式自动执行 (同一组合的成交串行，避免并发读写现金余额)
     if session["mode"] == "autonomous" and saved.get("action") in ("buy", "sell") and saved.get("status") == "pending":
-        saved = await execute_decision(saved["id"])
-
+        with _stage(timings, "execute"):
+            async with _portfolio_locks[portfolio["id"]]:
+                saved = await execute_decision(saved["id"])
     return saved
 
 
+class TradeBudget:
+    """一次检查内各标的共享的当日交易次数额度；预占在事件循环内同步完成，并发的标的不会超额"""
+
+    def __init__(self, used: int, limit: int):
+        self.used = used
+        self.limit = limit
+
+    def reserve(self) -> bool:
+        if self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+    def release(self):
+        self.used -= 1
+
+    def force(self):
+        self.used += 1
+
+
+@contextmanager
+def _stage(timings: Dict[str, float], name: str):
+    """记录一个阶段的耗时 (毫秒)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
 def _check_stop_loss_take_profit(position, price, session):
     """检查是否触发止损/止盈"""
     if not position or position["quantity"] <= 0:
@@ -326,6 +635,41 @@ def _parse_decision(raw: str, symbol: str) -> dict:
         }
 
 
+def _parse_batch_decisions(raw: str, symbols: List[str]) -> Dict[str, Tuple[dict, str]]:
+    """
+    解析合并决策的 JSON 数组，每个元素单独经 _parse_decision 校验
+    只收录请求中的标的且 action 合法的元素；整体不是数组时抛出 ValueError
+    """
+    text = raw.strip()
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0].strip()
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0].strip()
+    items = json.loads(text)
+    if isinstance(items, dict):
+        items = items.get("decisions")
+    if not isinstance(items, list):
+        raise ValueError("合并决策回复不是 JSON 数组")
+
+    answers: Dict[str, Tuple[dict, str]] = {}
+    for item in items:
+        if not isinstance(item, dict) or item.get("symbol") not in symbols or item["symbol"] in answers:
+            continue
+        item_raw = json.dumps(item, ensure_ascii=False)
+        try:
+            decision = _parse_decision(item_raw, item["symbol"])
+        except (TypeError, ValueError):
+            continue
+        if decision["action"] in ("buy", "sell", "hold"):
+            answers[item["symbol"]] = (decision, item_raw)
+    return answers
+
+
+def get_llm_stats() -> Dict[str, Dict[str, float]]:
+    """各决策方式累计的模型调用、token 与耗时"""
+    return {mode: dict(stats) for mode, stats in _llm_stats.items()}
+
+
 def _risk_check(decision: dict, portfolio: dict, session: dict, position, price: float) -> dict:
     """风控二次校验"""
     action = decision["action"]
@@ -374,6 +718,25 @@ def _compact_snapshot(quote: dict, trend: dict) -> dict:
 
 async def _save_decision(sb, session, decision: dict) -> dict:
     """保存决策到数据库"""
+    return (await _save_decisions(sb, session, [decision]))[0]
+
+
+async def _save_decisions(sb, session, decisions: List[dict]) -> List[dict]:
+    """多条决策一次写入，返回顺序与传入一致"""
+    if not decisions:
+        return []
+    records = [_decision_record(session, d) for d in decisions]
+    result = await run_io(sb.table("agent_decisions").insert(records).execute)
+    rows = result.data if result.data and len(result.data) == len(records) else records
+    saved = []
+    for decision, row in zip(decisions, rows):
+        row["action_display"] = decision["action"]
+        logger.info(f"Agent 决策: {decision['action']} {decision.get('symbol')} (置信度={decision.get('confidence', 0):.0%})")
+        saved.append(row)
+    return saved
+
+
+def _decision_record(session, decision: dict) -> dict:
     action = decision["action"]
     if action in ("stop_loss", "take_profit"):
         db_action = "sell"
@@ -389,7 +752,7 @@ async def _save_decision(sb, session, decision: dict) -> dict:
     qty = decision.get("quantity", 0)
     price = decision.get("price", 0)
 
-    record = {
+    return {
         "session_id": session["id"],
         "symbol": decision.get("symbol", ""),
         "action": db_action if db_action in ("buy", "sell", "hold") else action,
@@ -403,18 +766,15 @@ async def _save_decision(sb, session, decision: dict) -> dict:
         "status": status,
     }
 
-    result = sb.table("agent_decisions").insert(record).execute()
-    saved = result.data[0] if result.data else record
-    saved["action_display"] = action
-    logger.info(f"Agent 决策: {action} {decision.get('symbol')} (置信度={decision.get('confidence', 0):.0%})")
-    return saved
-
 
 async def execute_decision(decision_id: int) -> dict:
     """执行一条决策（买入/卖出）"""
     sb = get_supabase()
 
-    dec = sb.table("agent_decisions").select("*, agent_sessions(*)").eq("id", decision_id).single().execute()
+    def set_status(fields: Dict[str, Any]):
+        return run_io(sb.table("agent_decisions").update(fields).eq("id", decision_id).execute)
+
+    dec = await run_io(sb.table("agent_decisions").select("*, agent_sessions(*)").eq("id", decision_id).single().execute)
     if not dec.data:
         return {"error": "决策不存在"}
 
@@ -426,127 +786,41 @@ async def execute_decision(decision_id: int) -> dict:
         return {"error": f"决策状态为 {d['status']}，无法执行"}
 
     if action == "hold":
-        sb.table("agent_decisions").update({"status": "executed"}).eq("id", decision_id).execute()
+        await set_status({"status": "executed"})
         return {**d, "status": "executed"}
 
     if action not in ("buy", "sell"):
-        sb.table("agent_decisions").update({"status": "executed"}).eq("id", decision_id).execute()
+        await set_status({"status": "executed"})
         return {**d, "status": "executed"}
 
     portfolio_id = session.get("portfolio_id")
     if not portfolio_id:
         return {"error": "无法找到关联组合"}
 
-    portfolio = sb.table("portfolios").select("*").eq("id", portfolio_id).single().execute()
-    if not portfolio.data:
-        return {"error": "组合不存在"}
-    pf = portfolio.data
-
     price = d.get("price", 0)
     qty = d.get("quantity", 0)
     symbol = d["symbol"]
 
     if price <= 0 or qty <= 0:
-        sb.table("agent_decisions").update({"status": "rejected", "reviewed_at": datetime.now(timezone.utc).isoformat()}).eq("id", decision_id).execute()
+        await set_status({"status": "rejected", "reviewed_at": datetime.now(timezone.utc).isoformat()})
         return {**d, "status": "rejected", "reason": "价格或数量无效"}
 
-    commission = price * qty * settings.COMMISSION_RATE
-    total_amount = price * qty
-
-    if action == "buy":
-        if pf["cash_balance"] < total_amount + commission:
-            sb.table("agent_decisions").update({"status": "rejected"}).eq("id", decision_id).execute()
-            return {**d, "status": "rejected", "reason": "资金不足"}
-
-        new_cash = pf["cash_balance"] - total_amount - commission
-
-        existing = sb.table("positions").select("*").eq("portfolio_id", pf["id"]).eq("symbol", symbol).execute()
-        if existing.data:
-            pos = existing.data[0]
-            new_qty = pos["quantity"] + qty
-            new_avg = (pos["avg_cost"] * pos["quantity"] + price * qty) / new_qty
-            sb.table("positions").update({
-                "quantity": new_qty, "avg_cost": round(new_avg, 4),
-                "current_price": price, "market_value": round(new_qty * price, 2),
-                "unrealized_pnl": round(new_qty * (price - new_avg), 2),
-                "stop_loss": calculate_stop_loss(price, pct=session.get("stop_loss_pct")),
-                "take_profit": calculate_take_profit(price, pct=session.get("take_profit_pct")),
-            }).eq("id", pos["id"]).execute()
-        else:
-            asset_type = "crypto" if "/" in symbol else "stock"
-            sb.table("positions").insert({
-                "portfolio_id": pf["id"], "symbol": symbol, "asset_type": asset_type,
-                "quantity": qty, "avg_cost": price, "current_price": price,
-                "market_value": round(qty * price, 2),
-                "stop_loss": calculate_stop_loss(price, pct=session.get("stop_loss_pct")),
-                "take_profit": calculate_take_profit(price, pct=session.get("take_profit_pct")),
-            }).execute()
-
-        sb.table("portfolios").update({
-            "cash_balance": round(new_cash, 2),
-            "current_value": round(new_cash + total_amount, 2),
-        }).eq("id", pf["id"]).execute()
-
-    elif action == "sell":
-        existing = sb.table("positions").select("*").eq("portfolio_id", pf["id"]).eq("symbol", symbol).execute()
-        if not existing.data:
-            sb.table("agent_decisions").update({"status": "rejected"}).eq("id", decision_id).execute()
-            return {**d, "status": "rejected", "reason": "无持仓"}
-
-        pos = existing.data[0]
-        sell_qty = min(qty, pos["quantity"])
-        pnl = (price - pos["avg_cost"]) * sell_qty - commission
-        new_cash = pf["cash_balance"] + price * sell_qty - commission
-
-        remaining = pos["quantity"] - sell_qty
-        if remaining <= 0:
-            sb.table("positions").delete().eq("id", pos["id"]).execute()
-        else:
-            sb.table("positions").update({
-                "quantity": remaining, "current_price": price,
-                "market_value": round(remaining * price, 2),
-            }).eq("id", pos["id"]).execute()
-
-        all_pos = sb.table("positions").select("market_value").eq("portfolio_id", pf["id"]).execute()
-        pos_value = sum(p["market_value"] or 0 for p in (all_pos.data or []))
-        new_value = new_cash + pos_value
-        total_pnl = new_value - pf["initial_capital"]
-
-        sb.table("portfolios").update({
-            "cash_balance": round(new_cash, 2),
-            "current_value": round(new_value, 2),
-            "total_pnl": round(total_pnl, 2),
-            "total_pnl_pct": round(total_pnl / pf["initial_capital"] * 100, 2),
-        }).eq("id", pf["id"]).execute()
-
-    # 记录交易
-    trade = sb.table("trades").insert({
-        "portfolio_id": pf["id"], "symbol": symbol,
-        "direction": action, "quantity": qty if action == "buy" else sell_qty,
-        "price": price, "total_amount": round(total_amount, 2),
-        "commission": round(commission, 2), "status": "filled",
-        "pnl": round(pnl, 2) if action == "sell" else None,
-        "note": f"[AI Agent] {d.get('reason', '')}",
-    }).execute()
-
-    trade_id = trade.data[0]["id"] if trade.data else None
-
-    # 更新决策状态
-    sb.table("agent_decisions").update({
-        "status": "executed",
-        "trade_id": trade_id,
-        "executed_at": datetime.now(timezone.utc).isoformat(),
-    }).eq("id", decision_id).execute()
-
-    # 更新会话统计
-    is_win = action == "sell" and pnl > 0
-    is_lose = action == "sell" and pnl <= 0
-    sb.table("agent_sessions").update({
-        "total_trades": (session.get("total_trades") or 0) + 1,
-        "total_pnl": (session.get("total_pnl") or 0) + (pnl if action == "sell" else 0),
-        "win_trades": (session.get("win_trades") or 0) + (1 if is_win else 0),
-        "lose_trades": (session.get("lose_trades") or 0) + (1 if is_lose else 0),
-    }).eq("id", session["id"]).execute()
+    # 持仓、组合、成交记录、决策状态与会话统计由数据库函数一次事务写入
+    try:
+        trade = await run_io(
+            apply_trade,
+            portfolio_id, symbol, action, qty, price,
+            commission_rate=settings.COMMISSION_RATE,
+            stop_loss=calculate_stop_loss(price, pct=session.get("stop_loss_pct")) if action == "buy" else None,
+            take_profit=calculate_take_profit(price, pct=session.get("take_profit_pct")) if action == "buy" else None,
+            note=f"[AI Agent] {d.get('reason', '')}",
+            allow_partial=True,
+            decision_id=decision_id,
+        )
+    except TradeRejected as e:
+        await set_status({"status": "rejected"})
+        return {**d, "status": "rejected", "reason": str(e)}
+    trade_id = trade.get("id")
 
     logger.info(f"Agent 交易执行: {action} {symbol} x{qty} @{price}")
     return {**d, "status": "executed", "trade_id": trade_id}
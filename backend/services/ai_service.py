@@ -9,9 +9,10 @@ import pandas as pd
 from typing import Dict, Any, List, Optional
 from core.logger import logger
 from services.deepseek_service import is_deepseek_configured
+from services import indicators as ind
 
 
-def predict_trend(df: pd.DataFrame, horizon: int = 5) -> Dict[str, Any]:
+def predict_trend(df: pd.DataFrame, horizon: int = 5, cache: Optional[Dict] = None) -> Dict[str, Any]:
     """
     综合趋势预测，融合多种信号:
     1. 均线趋势
@@ -19,38 +20,34 @@ def predict_trend(df: pd.DataFrame, horizon: int = 5) -> Dict[str, Any]:
     3. MACD 状态
     4. 成交量趋势
     5. 动量分析
+    cache: 同一份 K 线共享的指标缓存 (与 calculate_indicators 共用)
     """
     if df.empty or len(df) < 30:
         return {"error": "数据不足，至少需要30根K线"}
 
-    close = df["close"] if "close" in df.columns else df["Close"]
-    volume = df["volume"] if "volume" in df.columns else df["Volume"]
+    close = ind.close(df, cache)
 
     signals: List[Dict] = []
     bull_score = 0
     bear_score = 0
 
     # 1. 均线趋势
-    ma5 = close.rolling(5).mean()
-    ma20 = close.rolling(20).mean()
-    ma60 = close.rolling(60).mean() if len(close) >= 60 else ma20
+    ma5 = ind.sma(df, cache, 5)
+    ma20 = ind.sma(df, cache, 20)
+    ma60 = ind.sma(df, cache, 60) if len(close) >= 60 else ma20
 
-    if ma5.iloc[-1] > ma20.iloc[-1] > ma60.iloc[-1]:
+    if ma5[-1] > ma20[-1] > ma60[-1]:
         bull_score += 25
         signals.append({"name": "均线多头排列", "type": "bullish", "weight": 25})
-    elif ma5.iloc[-1] < ma20.iloc[-1] < ma60.iloc[-1]:
+    elif ma5[-1] < ma20[-1] < ma60[-1]:
         bear_score += 25
         signals.append({"name": "均线空头排列", "type": "bearish", "weight": 25})
     else:
         signals.append({"name": "均线交织", "type": "neutral", "weight": 0})
 
     # 2. RSI
-    delta = close.diff()
-    gain = delta.where(delta > 0, 0.0).rolling(14).mean()
-    loss = (-delta.where(delta < 0, 0.0)).rolling(14).mean()
-    rs = gain / loss.replace(0, np.nan)
-    rsi = 100 - 100 / (1 + rs)
-    rsi_val = float(rsi.iloc[-1]) if not np.isnan(rsi.iloc[-1]) else 50
+    rsi = ind.rsi(df, cache, 14)
+    rsi_val = float(rsi[-1]) if not np.isnan(rsi[-1]) else 50
 
     if rsi_val < 30:
         bull_score += 20
@@ -66,19 +63,15 @@ def predict_trend(df: pd.DataFrame, horizon: int = 5) -> Dict[str, Any]:
         signals.append({"name": f"RSI偏强({rsi_val:.0f})", "type": "bullish", "weight": 5})
 
     # 3. MACD
-    ema12 = close.ewm(span=12, adjust=False).mean()
-    ema26 = close.ewm(span=26, adjust=False).mean()
-    macd_line = ema12 - ema26
-    signal_line = macd_line.ewm(span=9, adjust=False).mean()
-    hist = macd_line - signal_line
+    _, _, hist = ind.macd(df, cache)
 
-    if hist.iloc[-1] > 0 and hist.iloc[-2] <= 0:
+    if hist[-1] > 0 and hist[-2] <= 0:
         bull_score += 20
         signals.append({"name": "MACD金叉", "type": "bullish", "weight": 20})
-    elif hist.iloc[-1] < 0 and hist.iloc[-2] >= 0:
+    elif hist[-1] < 0 and hist[-2] >= 0:
         bear_score += 20
         signals.append({"name": "MACD死叉", "type": "bearish", "weight": 20})
-    elif hist.iloc[-1] > hist.iloc[-2]:
+    elif hist[-1] > hist[-2]:
         bull_score += 10
         signals.append({"name": "MACD柱放大", "type": "bullish", "weight": 10})
     else:
@@ -86,10 +79,10 @@ def predict_trend(df: pd.DataFrame, horizon: int = 5) -> Dict[str, Any]:
         signals.append({"name": "MACD柱缩小", "type": "bearish", "weight": 10})
 
     # 4. 成交量趋势
-    vol_ma5 = volume.rolling(5).mean()
-    vol_ma20 = volume.rolling(20).mean()
-    if vol_ma5.iloc[-1] > vol_ma20.iloc[-1] * 1.5:
-        if close.iloc[-1] > close.iloc[-2]:
+    vol_ma5 = ind.sma(df, cache, 5, "volume")
+    vol_ma20 = ind.sma(df, cache, 20, "volume")
+    if vol_ma5[-1] > vol_ma20[-1] * 1.5:
+        if close[-1] > close[-2]:
             bull_score += 15
             signals.append({"name": "放量上涨", "type": "bullish", "weight": 15})
         else:
@@ -99,7 +92,7 @@ def predict_trend(df: pd.DataFrame, horizon: int = 5) -> Dict[str, Any]:
         signals.append({"name": "成交量正常", "type": "neutral", "weight": 0})
 
     # 5. 动量 (5日涨跌幅)
-    mom = (close.iloc[-1] / close.iloc[-5] - 1) * 100
+    mom = (close[-1] / close[-5] - 1) * 100
     if mom > 3:
         bull_score += 15
         signals.append({"name": f"5日动量强({mom:.1f}%)", "type": "bullish", "weight": 15})
@@ -125,7 +118,7 @@ def predict_trend(df: pd.DataFrame, horizon: int = 5) -> Dict[str, Any]:
         signal = "观望"
 
     # 简单线性回归预测
-    recent = close.values[-20:]
+    recent = close[-20:]
     x = np.arange(len(recent))
     slope, intercept = np.polyfit(x, recent, 1)
     predicted_prices = [round(float(slope * (len(recent) + i) + intercept), 2) for i in range(horizon)]
@@ -137,7 +130,7 @@ def predict_trend(df: pd.DataFrame, horizon: int = 5) -> Dict[str, Any]:
         "bull_score": bull_score,
         "bear_score": bear_score,
         "signals": signals,
-        "current_price": round(float(close.iloc[-1]), 2),
+        "current_price": round(float(close[-1]), 2),
         "predicted_prices": predicted_prices,
         "prediction_horizon": horizon,
         "analysis_summary": _generate_summary(trend, confidence, signals),
@@ -0,0 +1,363 @@
+"""
+告警引擎 - 在内存中评估 alerts 表里生效的告警，触发后批量写回 is_triggered / triggered_at
+
+- 按 (标的, 指标, 方向) 建索引，阈值升序存放在 NumPy 数组中:
+  "高于" 类告警总是从最小阈值开始被穿越，"低于" 类从最大阈值开始，
+  每个新报价只需一次二分查找，取出被穿越的那一段即可，不遍历其余告警
+- 告警只触发一次: 触发后从索引中移出 (数组两端的游标前移)，并等待批量写回
+- 指标与告警类型:
+    price_above / price_below  报价 price 高于 / 低于阈值
+    change_pct                 涨跌幅 (%)，阈值为正时涨幅达到即触发，为负时跌幅达到即触发
+    volume_spike               最新日线成交量 / 前 20 根均量 达到阈值倍数
+    drawdown                   相对近一年最高价的回撤 (%) 达到阈值
+    strategy_signal / risk_warning  由对应事件调用 on_signal 触发
+- 后台任务定期拉取有告警的标的的报价 (走报价缓存，与页面请求共用)，
+  有成交量 / 回撤告警的标的再按较长间隔读取日线；
+  已在实时行情流上的加密货币不再拉取，由 market_stream 推送时直接调用 on_quote
+- 多个进程同时运行时写回带 is_triggered=false 条件，同一告警只记一次
+"""
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import get_settings
+from core.logger import logger
+from database import get_supabase
+from services.executors import run_io
+from services.market_data import get_multiple_crypto_quotes, get_multiple_quotes
+from services.market_service import fetch_daily_history
+from services.market_stream import get_market_stream
+
+PAGE_SIZE = 1000  # Supabase 单次查询的行数上限
+VOLUME_WINDOW = 20
+DRAWDOWN_WINDOW = 252
+
+THRESHOLD_TYPES = {"price_above", "price_below", "change_pct", "volume_spike", "drawdown"}
+SIGNAL_TYPES = {"strategy_signal", "risk_warning"}
+
+# 告警类型 -> (指标, 是否为 "高于" 方向)；change_pct 的方向由阈值正负决定
+_METRICS = {
+    "price_above": ("price", True),
+    "price_below": ("price", False),
+    "volume_spike": ("volume_ratio", True),
+    "drawdown": ("drawdown", True),
+}
+
+
+def _metric(alert: Dict[str, Any]) -> Tuple[str, bool, float]:
+    value = float(alert["condition_value"])
+    if alert["alert_type"] == "change_pct":
+        return "change_pct", value >= 0, value
+    if alert["alert_type"] == "drawdown":
+        return "drawdown", True, abs(value)
+    metric, above = _METRICS[alert["alert_type"]]
+    return metric, above, value
+
+
+class _Book:
+    """同一标的、同一指标、同一方向的阈值 (升序)，[lo, hi) 之外的已触发"""
+
+    def __init__(self, above: bool):
+        self.above = above
+        self.values = np.empty(0)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lo = self.hi = 0
+        self._pending: List[Tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return self.hi - self.lo + len(self._pending)
+
+    def add(self, value: float, alert_id: int):
+        self._pending.append((value, alert_id))
+
+    def _merge(self):
+        values = np.concatenate([self.values[self.lo:self.hi], [v for v, _ in self._pending]])
+        ids = np.concatenate([self.ids[self.lo:self.hi], np.array([i for _, i in self._pending], dtype=np.int64)])
+        order = np.argsort(values, kind="stable")
+        self.values, self.ids = values[order], ids[order]
+        self.lo, self.hi = 0, len(values)
+        self._pending.clear()
+
+    def cross(self, x: float) -> np.ndarray:
+        """取出被 x 穿越的告警 id"""
+        if self._pending:
+            self._merge()
+        if self.above:
+            k = self.lo + int(np.searchsorted(self.values[self.lo:self.hi], x, side="right"))
+            crossed, self.lo = self.ids[self.lo:k], k
+        else:
+            k = self.lo + int(np.searchsorted(self.values[self.lo:self.hi], x, side="left"))
+            crossed, self.hi = self.ids[k:self.hi], k
+        return crossed
+
+
+def _bar_metrics(df: pd.DataFrame) -> Dict[str, float]:
+    """日线的成交量放大倍数和回撤 (%)"""
+    close = df["close"].to_numpy(dtype=float)
+    high = df["high"].to_numpy(dtype=float)[-DRAWDOWN_WINDOW:]
+    volume = df["volume"].to_numpy(dtype=float)
+    metrics = {}
+    peak = np.nanmax(high) if len(high) else np.nan
+    if peak > 0:
+        metrics["drawdown"] = float((peak - close[-1]) / peak * 100)
+        metrics["peak"] = float(peak)
+    if len(volume) > VOLUME_WINDOW:
+        base = np.nanmean(volume[-VOLUME_WINDOW - 1:-1])
+        if base > 0:
+            metrics["volume_ratio"] = float(volume[-1] / base)
+    return metrics
+
+
+class AlertEngine:
+    """进程内告警引擎，由 main.lifespan 启停"""
+
+    def __init__(self, poll_interval: float = 10, bar_interval: float = 300, flush_interval: float = 2,
+                 refresh_interval: float = 300):
+        self.poll_interval = poll_interval
+        self.bar_interval = bar_interval
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.stats = {"ticks": 0, "triggered": 0, "written": 0, "write_errors": 0, "tick_us": 0.0}
+        self._alerts: Dict[int, Dict[str, Any]] = {}
+        self._books: Dict[Tuple[str, str, bool], _Book] = {}
+        self._signals: Dict[Tuple[str, str], Set[int]] = defaultdict(set)
+        self._peaks: Dict[str, float] = {}
+        self._pending: Dict[int, str] = {}  # 已触发待写回: id -> triggered_at
+        self._tasks: List[asyncio.Task] = []
+
+    # ---------- 索引 ----------
+
+    def load(self, alerts: Iterable[Dict[str, Any]]):
+        """用生效的告警重建索引 (尚未写回的已触发告警不会重新加入)"""
+        self._alerts.clear()
+        self._books.clear()
+        self._signals.clear()
+        for alert in alerts:
+            if alert["id"] not in self._pending:
+                self.add(alert)
+
+    def add(self, alert: Dict[str, Any]):
+        if not alert.get("symbol") or not alert.get("is_active", True) or alert.get("is_triggered"):
+            return
+        alert_type = alert["alert_type"]
+        if alert_type in THRESHOLD_TYPES:
+            if alert.get("condition_value") is None:
+                return
+            metric, above, value = _metric(alert)
+            book = self._books.get((alert["symbol"], metric, above))
+            if book is None:
+                book = self._books[(alert["symbol"], metric, above)] = _Book(above)
+            book.add(value, alert["id"])
+        elif alert_type in SIGNAL_TYPES:
+            self._signals[(alert["symbol"], alert_type)].add(alert["id"])
+        else:
+            return
+        self._alerts[alert["id"]] = {k: alert.get(k) for k in ("id", "user_id", "symbol", "alert_type", "condition_value", "message")}
+
+    def remove(self, alert_id: int):
+        """删除或停用告警；数组中的条目在被穿越时跳过"""
+        alert = self._alerts.pop(alert_id, None)
+        if alert is not None and alert["alert_type"] in SIGNAL_TYPES:
+            self._signals[(alert["symbol"], alert["alert_type"])].discard(alert_id)
+
+    def symbols(self) -> Dict[str, Set[str]]:
+        """有告警的标的 -> 所需的指标"""
+        result: Dict[str, Set[str]] = defaultdict(set)
+        for (symbol, metric, _), book in self._books.items():
+            if len(book):
+                result[symbol].add(metric)
+        return result
+
+    # ---------- 评估 ----------
+
+    def _fire(self, ids: Iterable[int], value: Optional[float]) -> List[Dict[str, Any]]:
+        now = datetime.now(timezone.utc).isoformat()
+        fired = []
+        for alert_id in ids:
+            alert = self._alerts.pop(int(alert_id), None)
+            if alert is None:  # 已删除 / 停用
+                continue
+            self._pending[alert["id"]] = now
+            fired.append({**alert, "value": value, "triggered_at": now})
+        self.stats["triggered"] += len(fired)
+        return fired
+
+    def _check(self, symbol: str, metric: str, value: Optional[float]) -> List[Dict[str, Any]]:
+        if value is None or value != value:  # None / NaN
+            return []
+        fired = []
+        for above in (True, False):
+            book = self._books.get((symbol, metric, above))
+            if book is not None:
+                fired += self._fire(book.cross(value), value)
+        return fired
+
+    def on_quote(self, quote: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """新报价: 检查价格、涨跌幅和 (已知最高价时的) 回撤，返回本次触发的告警"""
+        started = time.perf_counter()
+        symbol, price = quote.get("symbol"), quote.get("price")
+        fired = []
+        if symbol and price and "error" not in quote:
+            price = float(price)
+            fired += self._check(symbol, "price", price)
+            if quote.get("change_pct") is not None:
+                fired += self._check(symbol, "change_pct", float(quote["change_pct"]))
+            peak = self._peaks.get(symbol)
+            if peak:
+                fired += self._check(symbol, "drawdown", (peak - price) / peak * 100)
+        self.stats["ticks"] += 1
+        self.stats["tick_us"] = round((time.perf_counter() - started) * 1e6, 1)
+        return fired
+
+    def on_bars(self, symbol: str, df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """日线更新: 检查成交量放大和回撤"""
+        if df is None or df.empty:
+            return []
+        metrics = _bar_metrics(df)
+        if "peak" in metrics:
+            self._peaks[symbol] = metrics["peak"]
+        return self._check(symbol, "volume_ratio", metrics.get("volume_ratio")) + \
+            self._check(symbol, "drawdown", metrics.get("drawdown"))
+
+    def on_signal(self, symbol: str, alert_type: str) -> List[Dict[str, Any]]:
+        """策略信号 / 风险预警事件: 触发该标的上对应类型的全部告警"""
+        ids = self._signals.pop((symbol, alert_type), set())
+        return self._fire(ids, None)
+
+    # ---------- 写回 ----------
+
+    def _write(self, pending: Dict[int, str]):
+        by_time: Dict[str, List[int]] = defaultdict(list)
+        for alert_id, triggered_at in pending.items():
+            by_time[triggered_at[:19]].append(alert_id)  # 同一秒内触发的合并为一次更新
+        sb = get_supabase()
+        for triggered_at, ids in by_time.items():
+            for i in range(0, len(ids), PAGE_SIZE):
+                (
+                    sb.table("alerts")
+                    .update({"is_triggered": True, "triggered_at": triggered_at + "+00:00"})
+                    .in_("id", ids[i:i + PAGE_SIZE])
+                    .eq("is_triggered", False)
+                    .execute()
+                )
+
+    async def flush(self) -> int:
+        """把已触发的告警批量写回数据库，返回写回条数"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        try:
+            await run_io(self._write, pending)
+        except Exception as e:
+            self._pending.update(pending)  # 下次重试
+            self.stats["write_errors"] += 1
+            logger.error(f"告警写回失败 ({len(pending)} 条): {e}")
+            return 0
+        self.stats["written"] += len(pending)
+        return len(pending)
+
+    # ---------- 后台任务 ----------
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run())]
+            logger.info(f"告警引擎已启动 (行情间隔={self.poll_interval}s)")
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+
+    async def refresh(self):
+        self.load(await run_io(_load_active_alerts))
+        logger.info(f"告警引擎载入 {len(self._alerts)} 条告警")
+
+    async def _run(self):
+        due = {"refresh": 0.0, "poll": 0.0, "bars": 0.0}
+        while True:
+            now = time.monotonic()
+            try:
+                if now >= due["refresh"]:
+                    due["refresh"] = now + self.refresh_interval
+                    await self.refresh()
+                if now >= due["poll"]:
+                    due["poll"] = now + self.poll_interval
+                    bars = now >= due["bars"]
+                    if bars:
+                        due["bars"] = now + self.bar_interval
+                    await self.poll(bars=bars)
+                await self.flush()
+            except Exception as e:
+                logger.error(f"告警引擎运行失败: {e}")
+            await asyncio.sleep(min(self.poll_interval, self.flush_interval))
+
+    async def poll(self, bars: bool = False):
+        """拉取有告警的标的的报价 (bars=True 时同时读取日线)"""
+        wanted = self.symbols()
+        if not wanted:
+            return
+        stream = get_market_stream()
+        crypto = [s for s in wanted if "/" in s and not stream.is_live(s)]  # 行情流上的标的已由推送评估
+        stocks = [s for s in wanted if "/" not in s]
+        quotes = []
+        if crypto:
+            quotes += await get_multiple_crypto_quotes(crypto)
+        if stocks:
+            quotes += await get_multiple_quotes(stocks)
+        for quote in quotes:
+            self.on_quote(quote)
+
+        if bars:
+            for symbol, metrics in wanted.items():
+                if metrics & {"volume_ratio", "drawdown"}:
+                    self.on_bars(symbol, await fetch_daily_history(symbol, days=DRAWDOWN_WINDOW, period="1y"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "active": len(self._alerts),
+            "symbols": len({s for s, _, _ in self._books}),
+            "pending_writes": len(self._pending),
+        }
+
+
+def _load_active_alerts() -> List[Dict[str, Any]]:
+    sb = get_supabase()
+    alerts, start = [], 0
+    while True:
+        page = (
+            sb.table("alerts")
+            .select("id, user_id, symbol, alert_type, condition_value, message")
+            .eq("is_active", True)
+            .eq("is_triggered", False)
+            .order("id")
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        ).data or []
+        alerts.extend(page)
+        if len(page) < PAGE_SIZE:
+            return alerts
+        start += PAGE_SIZE
+
+
+_engine: Optional[AlertEngine] = None
+
+
+def get_alert_engine() -> AlertEngine:
+    global _engine
+    if _engine is None:
+        settings = get_settings()
+        _engine = AlertEngine(
+            poll_interval=settings.ALERT_POLL_INTERVAL,
+            bar_interval=settings.ALERT_BAR_INTERVAL,
+            flush_interval=settings.ALERT_FLUSH_INTERVAL,
+            refresh_interval=settings.ALERT_REFRESH_INTERVAL,
+        )
+    return _engine
@@ -1,186 +1,187 @@
 """
 回测引擎 - 支持多种内置策略的回测
+
+信号生成器统一返回 SignalSeries: 与 K 线等长的 int8 数组 (1=买入, -1=卖出, 0=持有)，
+全部基于整列数组运算；交易理由只在实际成交的 K 线上按需生成。
+传入 (字段, 标的) 两级列的宽表时，同一套生成器输出 时间 × 标的 的二维信号 (见 portfolio_backtest)。
+指标统一取自 services.indicators，参数寻优时多组参数共享同一份指标缓存。
 """
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, List, Tuple
+from dataclasses import dataclass
+from typing import Dict, Any, List, Tuple, Callable, Optional
 from datetime import datetime
 from core.logger import logger
+from services import indicators as ind
+
+BUY = 1
+SELL = -1
+HOLD = 0
+
+
+@dataclass
+class SignalSeries:
+    """策略信号序列"""
+    signals: np.ndarray  # int8, 与 df 等长, 下标 0 恒为 HOLD
+    reason: Callable[[int], str]  # 按 K 线下标生成交易理由 (仅对成交 K 线调用)
+    # 依赖持仓状态的策略保留原始买入/卖出条件，截取区间时从空仓重新落实 (交叉类策略为 None)
+    entries: Optional[np.ndarray] = None
+    exits: Optional[np.ndarray] = None
+
+    def window(self, start: int, end: int) -> "SignalSeries":
+        """截取 [start, end) 区间，账户在 start 空仓: 不继承区间之前的持仓状态"""
+        if self.entries is None:
+            signals = self.signals[start:end]
+        else:
+            # 多取前一根占位 (_resolve_position 不在下标 0 下单)，让区间第一根也能开仓
+            pad = 1 if start > 0 else 0
+            signals = _resolve_position(self.entries[start - pad:end], self.exits[start - pad:end])[pad:]
+        return SignalSeries(signals, lambda i: self.reason(i + start))
+
+
+def _crossover(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """a 上穿 / 下穿 b 的布尔数组 (含 NaN 的 K 线不产生交叉)"""
+    up = np.zeros(a.shape, dtype=bool)
+    down = np.zeros(a.shape, dtype=bool)
+    up[1:] = (a[1:] > b[1:]) & (a[:-1] <= b[:-1])
+    down[1:] = (a[1:] < b[1:]) & (a[:-1] >= b[:-1])
+    return up, down
+
+
+def _cross_signals(up: np.ndarray, down: np.ndarray) -> np.ndarray:
+    return up.astype(np.int8) - down.astype(np.int8)
+
+
+def _resolve_position(entries: np.ndarray, exits: np.ndarray) -> np.ndarray:
+    """落实"空仓才买、持仓才卖"的状态约束，只遍历一次候选 K 线"""
+    if entries.ndim == 2:
+        return _resolve_position_2d(entries, exits)
+    signals = np.zeros(len(entries), dtype=np.int8)
+    holding = False
+    for i in np.flatnonzero(entries[1:] | exits[1:]) + 1:
+        if not holding and entries[i]:
+            signals[i] = BUY
+            holding = True
+        elif holding and exits[i]:
+            signals[i] = SELL
+            holding = False
+    return signals
+
+
+def _resolve_position_2d(entries: np.ndarray, exits: np.ndarray) -> np.ndarray:
+    """多标的 (时间 × 标的) 版本: 按时间推进，每步对所有标的同时更新持仓状态"""
+    signals = np.zeros(entries.shape, dtype=np.int8)
+    holding = np.zeros(entries.shape[1], dtype=bool)
+    for i in np.flatnonzero((entries[1:] | exits[1:]).any(axis=1)) + 1:
+        buy = ~holding & entries[i]
+        sell = holding & exits[i]
+        signals[i] = buy.astype(np.int8) - sell.astype(np.int8)
+        holding = (holding | buy) & ~sell
+    return signals
 
 
-def _ma_cross_signals(df: pd.DataFrame, params: Dict) -> List[Tuple[str, str]]:
+def _ma_cross_signals(df: pd.DataFrame, params: Dict, cache: Optional[Dict] = None) -> SignalSeries:
     """均线交叉策略"""
     fast = params.get("fast_period", 5)
     slow = params.get("slow_period", 20)
-    close = df["close"] if "close" in df.columns else df["Close"]
-    ma_fast = close.rolling(fast).mean()
-    ma_slow = close.rolling(slow).mean()
-
-    signals = []
-    position = 0
-    for i in range(1, len(df)):
-        if np.isnan(ma_fast.iloc[i]) or np.isnan(ma_slow.iloc[i]):
-            signals.append(("hold", "数据不足"))
-            continue
-        if ma_fast.iloc[i] > ma_slow.iloc[i] and ma_fast.iloc[i - 1] <= ma_slow.iloc[i - 1]:
-            signals.append(("buy", f"MA{fast}上穿MA{slow}"))
-            position = 1
-        elif ma_fast.iloc[i] < ma_slow.iloc[i] and ma_fast.iloc[i - 1] >= ma_slow.iloc[i - 1]:
-            signals.append(("sell", f"MA{fast}下穿MA{slow}"))
-            position = 0
-        else:
-            signals.append(("hold", ""))
-    return signals
+    ma_fast = ind.sma(df, cache, fast)
+    ma_slow = ind.sma(df, cache, slow)
+    signals = _cross_signals(*_crossover(ma_fast, ma_slow))
+
+    def reason(i: int) -> str:
+        return f"MA{fast}上穿MA{slow}" if signals[i] == BUY else f"MA{fast}下穿MA{slow}"
 
+    return SignalSeries(signals, reason)
 
-def _rsi_signals(df: pd.DataFrame, params: Dict) -> List[Tuple[str, str]]:
+
+def _rsi_signals(df: pd.DataFrame, params: Dict, cache: Optional[Dict] = None) -> SignalSeries:
     """RSI 策略"""
     period = params.get("period", 14)
     overbought = params.get("overbought", 70)
     oversold = params.get("oversold", 30)
-    close = df["close"] if "close" in df.columns else df["Close"]
-    delta = close.diff()
-    gain = delta.where(delta > 0, 0.0).rolling(period).mean()
-    loss = (-delta.where(delta < 0, 0.0)).rolling(period).mean()
-    rs = gain / loss.replace(0, np.nan)
-    rsi = 100 - 100 / (1 + rs)
-
-    signals = []
-    position = 0
-    for i in range(1, len(df)):
-        val = rsi.iloc[i]
-        if np.isnan(val):
-            signals.append(("hold", ""))
-            continue
-        if val < oversold and position == 0:
-            signals.append(("buy", f"RSI={val:.1f}<{oversold}超卖"))
-            position = 1
-        elif val > overbought and position == 1:
-            signals.append(("sell", f"RSI={val:.1f}>{overbought}超买"))
-            position = 0
-        else:
-            signals.append(("hold", ""))
-    return signals
+    rsi = ind.rsi(df, cache, period)
+    entries, exits = rsi < oversold, rsi > overbought
+
+    def reason(i: int) -> str:
+        if entries[i]:
+            return f"RSI={rsi[i]:.1f}<{oversold}超卖"
+        return f"RSI={rsi[i]:.1f}>{overbought}超买"
 
+    return SignalSeries(_resolve_position(entries, exits), reason, entries, exits)
 
-def _macd_signals(df: pd.DataFrame, params: Dict) -> List[Tuple[str, str]]:
+
+def _macd_signals(df: pd.DataFrame, params: Dict, cache: Optional[Dict] = None) -> SignalSeries:
     """MACD 策略"""
     fast = params.get("fast_period", 12)
     slow = params.get("slow_period", 26)
     signal_period = params.get("signal_period", 9)
-    close = df["close"] if "close" in df.columns else df["Close"]
-    ema_fast = close.ewm(span=fast, adjust=False).mean()
-    ema_slow = close.ewm(span=slow, adjust=False).mean()
-    macd_line = ema_fast - ema_slow
-    signal_line = macd_line.ewm(span=signal_period, adjust=False).mean()
-
-    signals = []
-    position = 0
-    for i in range(1, len(df)):
-        if np.isnan(macd_line.iloc[i]):
-            signals.append(("hold", ""))
-            continue
-        if macd_line.iloc[i] > signal_line.iloc[i] and macd_line.iloc[i - 1] <= signal_line.iloc[i - 1]:
-            signals.append(("buy", "MACD金叉"))
-            position = 1
-        elif macd_line.iloc[i] < signal_line.iloc[i] and macd_line.iloc[i - 1] >= signal_line.iloc[i - 1]:
-            signals.append(("sell", "MACD死叉"))
-            position = 0
-        else:
-            signals.append(("hold", ""))
-    return signals
+    macd_line, signal_line, _ = ind.macd(df, cache, fast, slow, signal_period)
+    signals = _cross_signals(*_crossover(macd_line, signal_line))
+
+    def reason(i: int) -> str:
+        return "MACD金叉" if signals[i] == BUY else "MACD死叉"
 
+    return SignalSeries(signals, reason)
 
-def _bollinger_signals(df: pd.DataFrame, params: Dict) -> List[Tuple[str, str]]:
+
+def _bollinger_signals(df: pd.DataFrame, params: Dict, cache: Optional[Dict] = None) -> SignalSeries:
     """布林带策略"""
     period = params.get("period", 20)
     num_std = params.get("num_std", 2)
-    close = df["close"] if "close" in df.columns else df["Close"]
-    ma = close.rolling(period).mean()
-    std = close.rolling(period).std()
-    upper = ma + num_std * std
-    lower = ma - num_std * std
-
-    signals = []
-    position = 0
-    for i in range(1, len(df)):
-        if np.isnan(upper.iloc[i]):
-            signals.append(("hold", ""))
-            continue
-        p = close.iloc[i]
-        if p < lower.iloc[i] and position == 0:
-            signals.append(("buy", f"价格({p:.2f})触及下轨({lower.iloc[i]:.2f})"))
-            position = 1
-        elif p > upper.iloc[i] and position == 1:
-            signals.append(("sell", f"价格({p:.2f})触及上轨({upper.iloc[i]:.2f})"))
-            position = 0
-        else:
-            signals.append(("hold", ""))
-    return signals
+    upper, _, lower = ind.bollinger(df, cache, period, num_std)
+    p = ind.close(df, cache)
+    entries, exits = p < lower, p > upper
+
+    def reason(i: int) -> str:
+        if entries[i]:
+            return f"价格({p[i]:.2f})触及下轨({lower[i]:.2f})"
+        return f"价格({p[i]:.2f})触及上轨({upper[i]:.2f})"
 
+    return SignalSeries(_resolve_position(entries, exits), reason, entries, exits)
 
-def _dual_thrust_signals(df: pd.DataFrame, params: Dict) -> List[Tuple[str, str]]:
+
+def _dual_thrust_signals(df: pd.DataFrame, params: Dict, cache: Optional[Dict] = None) -> SignalSeries:
     """Dual Thrust 策略"""
     n = params.get("lookback", 5)
     k1 = params.get("k1", 0.5)
     k2 = params.get("k2", 0.5)
-    close = df["close"] if "close" in df.columns else df["Close"]
-    high = df["high"] if "high" in df.columns else df["High"]
-    low = df["low"] if "low" in df.columns else df["Low"]
-    open_ = df["open"] if "open" in df.columns else df["Open"]
-
-    signals = []
-    position = 0
-    for i in range(n, len(df)):
-        hh = high.iloc[i - n:i].max()
-        ll = low.iloc[i - n:i].min()
-        hc = close.iloc[i - n:i].max()
-        lc = close.iloc[i - n:i].min()
-        rng = max(hh - lc, hc - ll)
-        upper = open_.iloc[i] + k1 * rng
-        lower = open_.iloc[i] - k2 * rng
-
-        if close.iloc[i] > upper and position == 0:
-            signals.append(("buy", f"突破上轨{upper:.2f}"))
-            position = 1
-        elif close.iloc[i] < lower and position == 1:
-            signals.append(("sell", f"跌破下轨{lower:.2f}"))
-            position = 0
-        else:
-            signals.append(("hold", ""))
 
-    padding = [("hold", "")] * n
-    return padding[1:] + signals  # skip first since we compare from index 1
+    # 前 n 根 K 线 (不含当根) 的极值, 不足 n 根时为 NaN 不产生信号
+    def compute_range():
+        hh = ind.rolling(df, cache, "high", n, "max", shift=1)
+        ll = ind.rolling(df, cache, "low", n, "min", shift=1)
+        hc = ind.rolling(df, cache, "close", n, "max", shift=1)
+        lc = ind.rolling(df, cache, "close", n, "min", shift=1)
+        return np.maximum(hh - lc, hc - ll)
+
+    rng = ind.memo(cache, ("dual_thrust_range", n), compute_range)
+    o = ind.values(df, cache, "open")
+    upper = o + k1 * rng
+    lower = o - k2 * rng
+    c = ind.close(df, cache)
+    entries, exits = c > upper, c < lower
+
+    def reason(i: int) -> str:
+        return f"突破上轨{upper[i]:.2f}" if entries[i] else f"跌破下轨{lower[i]:.2f}"
+
+    return SignalSeries(_resolve_position(entries, exits), reason, entries, exits)
 
 
-def _turtle_signals(df: pd.DataFrame, params: Dict) -> List[Tuple[str, str]]:
+def _turtle_signals(df: pd.DataFrame, params: Dict, cache: Optional[Dict] = None) -> SignalSeries:
     """海龟交易策略"""
     entry_period = params.get("entry_period", 20)
     exit_period = params.get("exit_period", 10)
-    close = df["close"] if "close" in df.columns else df["Close"]
-    high = df["high"] if "high" in df.columns else df["High"]
-    low = df["low"] if "low" in df.columns else df["Low"]
-
-    signals = []
-    position = 0
-    for i in range(1, len(df)):
-        if i < entry_period:
-            signals.append(("hold", ""))
-            continue
-        entry_high = high.iloc[i - entry_period:i].max()
-        entry_low = low.iloc[i - entry_period:i].min()
-        exit_low = low.iloc[max(0, i - exit_period):i].min()
-        exit_high = high.iloc[max(0, i - exit_period):i].max()
-
-        if close.iloc[i] > entry_high and position == 0:
-            signals.append(("buy", f"突破{entry_period}日高点{entry_high:.2f}"))
-            position = 1
-        elif close.iloc[i] < exit_low and position == 1:
-            signals.append(("sell", f"跌破{exit_period}日低点{exit_low:.2f}"))
-            position = 0
-        else:
-            signals.append(("hold", ""))
-    return signals
+    entry_high = ind.rolling(df, cache, "high", entry_period, "max", shift=1)
+    exit_low = ind.rolling(df, cache, "low", exit_period, "min", shift=1, min_periods=1)
+    c = ind.close(df, cache)
+    entries, exits = c > entry_high, c < exit_low
+
+    def reason(i: int) -> str:
+        if entries[i]:
+            return f"突破{entry_period}日高点{entry_high[i]:.2f}"
+        return f"跌破{exit_period}日低点{exit_low[i]:.2f}"
+
+    return SignalSeries(_resolve_position(entries, exits), reason, entries, exits)
 
 
 STRATEGY_GENERATORS = {
@@ -193,64 +194,50 @@ STRATEGY_GENERATORS = {
 }
 
 
-def run_backtest(
-    df: pd.DataFrame,
-    strategy_type: str,
-    params: Dict[str, Any],
-    initial_capital: float = 1_000_000,
-    commission_rate: float = 0.001,
-    slippage: float = 0.001,
-) -> Dict[str, Any]:
-    """执行回测，返回详细结果"""
-    if strategy_type not in STRATEGY_GENERATORS:
-        return {"error": f"不支持的策略类型: {strategy_type}"}
-
-    if len(df) < 30:
-        return {"error": "数据不足，至少需要30条K线"}
-
-    close = df["close"] if "close" in df.columns else df["Close"]
-    dates = [str(d)[:10] for d in df.index]
+def _simulate_fills(
+    close: np.ndarray,
+    series: SignalSeries,
+    dates: List[str],
+    initial_capital: float,
+    commission_rate: float,
+    slippage: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+    """只在信号 K 线上撮合成交，返回成交下标、成交后的现金/持仓以及交易明细"""
+    fill_idx, fill_cash, fill_qty = [], [], []
+    trades: List[Dict[str, Any]] = []
+    cash = initial_capital
+    position_qty = 0
 
-    signals = STRATEGY_GENERATORS[strategy_type](df, params)
-    if len(signals) < len(df) - 1:
-        signals = signals + [("hold", "")] * (len(df) - 1 - len(signals))
+    signals = series.signals
+    for idx in np.flatnonzero(signals):
+        sig = signals[idx]
+        price = float(close[idx])
 
-    cash = initial_capital
-    position_qty = 0.0
-    equity_curve = [{"date": dates[0], "value": initial_capital}]
-    trades = []
-    peak = initial_capital
-    max_dd = 0.0
-    max_dd_duration = 0
-    dd_start = 0
-
-    for i, (sig, reason) in enumerate(signals):
-        idx = i + 1
-        price = float(close.iloc[idx])
-        slip_price = price * (1 + slippage) if sig == "buy" else price * (1 - slippage)
-
-        if sig == "buy" and position_qty == 0:
+        if sig == BUY and position_qty == 0:
+            slip_price = price * (1 + slippage)
             qty = int(cash * 0.95 / (slip_price * (1 + commission_rate)))
-            if qty > 0:
-                cost = qty * slip_price
-                comm = cost * commission_rate
-                cash -= cost + comm
-                position_qty = qty
-                trades.append({
-                    "date": dates[idx],
-                    "direction": "buy",
-                    "price": round(slip_price, 2),
-                    "quantity": qty,
-                    "amount": round(cost, 2),
-                    "commission": round(comm, 2),
-                    "pnl": None,
-                    "reason": reason,
-                })
-
-        elif sig == "sell" and position_qty > 0:
+            if qty <= 0:
+                continue
+            cost = qty * slip_price
+            comm = cost * commission_rate
+            cash -= cost + comm
+            position_qty = qty
+            trades.append({
+                "date": dates[idx],
+                "direction": "buy",
+                "price": round(slip_price, 2),
+                "quantity": qty,
+                "amount": round(cost, 2),
+                "commission": round(comm, 2),
+                "pnl": None,
+                "reason": series.reason(idx),
+            })
+
+        elif sig == SELL and position_qty > 0:
+            slip_price = price * (1 - slippage)
             revenue = position_qty * slip_price
             comm = revenue * commission_rate
-            pnl = revenue - comm - trades[-1]["amount"] - trades[-1]["commission"] if trades else 0
+            pnl = revenue - comm - trades[-1]["amount"] - trades[-1]["commission"]
             cash += revenue - comm
             trades.append({
                 "date": dates[idx],
@@ -260,44 +247,154 @@ def run_backtest(
                 "amount": round(revenue, 2),
                 "commission": round(comm, 2),
                 "pnl": round(pnl, 2),
-                "reason": reason,
+                "reason": series.reason(idx),
             })
             position_qty = 0
 
-        total_value = cash + position_qty * price
-        equity_curve.append({"date": dates[idx], "value": round(total_value, 2)})
+        else:
+            continue
+
+        fill_idx.append(idx)
+        fill_cash.append(cash)
+        fill_qty.append(position_qty)
+
+    return (
+        np.asarray(fill_idx, dtype=np.int64),
+        np.asarray(fill_cash, dtype=np.float64),
+        np.asarray(fill_qty, dtype=np.float64),
+        trades,
+    )
+
+
+def _forward_fill(n: int, fill_idx: np.ndarray, fill_values: np.ndarray, initial: float) -> np.ndarray:
+    """把成交时点的状态值前向填充到每根 K 线"""
+    seg = np.searchsorted(fill_idx, np.arange(n), side="right")
+    return np.concatenate(([initial], fill_values))[seg]
+
+
+def _max_drawdown(equity: np.ndarray) -> Tuple[float, int]:
+    """最大回撤及其持续 K 线数 (从前一个新高到最深点)"""
+    running_max = np.maximum.accumulate(equity)
+    drawdown = (running_max - equity) / running_max
+    worst = int(np.argmax(drawdown))
+    if drawdown[worst] <= 0:
+        return 0.0, 0
+    new_peak = np.empty(len(equity), dtype=bool)
+    new_peak[0] = True
+    new_peak[1:] = equity[1:] > running_max[:-1]
+    peak_idx = np.maximum.accumulate(np.where(new_peak, np.arange(len(equity)), 0))
+    return float(drawdown[worst]), worst - int(peak_idx[worst])
+
+
+def _sharpe_ratio(values: np.ndarray) -> float:
+    """日收益率年化夏普 (简化: 无风险利率为 0)"""
+    if len(values) < 3:
+        return 0
+    returns = values[1:] / values[:-1] - 1
+    std = returns.std(ddof=1)
+    return float(returns.mean() / std * np.sqrt(252)) if std > 0 else 0
+
+
+def _bar_days(index: pd.Index) -> np.ndarray:
+    """K 线日期 (datetime64[D])，带时区的索引按当地日期计"""
+    if isinstance(index, pd.DatetimeIndex):
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        return index.values.astype("datetime64[D]")
+    return np.array([str(d)[:10] for d in index], dtype="datetime64[D]")
+
+
+def _monthly_returns(values: np.ndarray, days: np.ndarray) -> List[Dict[str, Any]]:
+    """按自然月取月末权益计算月度收益"""
+    months = days.astype("datetime64[M]")
+    month_end = np.flatnonzero(np.append(months[1:] != months[:-1], True))
+    month_values = values[month_end]
+    returns = month_values[1:] / month_values[:-1] - 1
+    labels = np.datetime_as_string(months[month_end[1:]], unit="M")
+    return [
+        {"month": str(m), "return": r}
+        for m, r in zip(labels.tolist(), np.round(returns * 100, 2).tolist())
+    ]
 
-        if total_value > peak:
-            peak = total_value
-            dd_start = idx
-        dd = (peak - total_value) / peak
-        if dd > max_dd:
-            max_dd = dd
-            max_dd_duration = idx - dd_start
+
+def run_backtest(
+    df: pd.DataFrame,
+    strategy_type: str,
+    params: Dict[str, Any],
+    initial_capital: float = 1_000_000,
+    commission_rate: float = 0.001,
+    slippage: float = 0.001,
+    cache: Optional[Dict] = None,
+    include_curves: bool = True,
+    window: Optional[Tuple[int, int]] = None,
+) -> Dict[str, Any]:
+    """
+    执行回测，返回详细结果
+
+    cache: 同一份 K 线多次回测 (参数寻优) 时共享的指标缓存
+    include_curves: False 时只返回标量指标，省去权益/回撤曲线、月度收益和交易明细
+    window: (start, end) K 线下标区间。指标和原始买卖条件仍在整段 K 线上计算 (无需重新预热)，
+            账户从 start 空仓开始，持仓约束在区间内重新落实，用于滚动窗口回测
+    """
+    if strategy_type not in STRATEGY_GENERATORS:
+        return {"error": f"不支持的策略类型: {strategy_type}"}
+
+    if len(df) < 30:
+        return {"error": "数据不足，至少需要30条K线"}
+
+    close = ind.close(df, cache)
+    bar_days = ind.memo(cache, ("bar_days",), lambda: _bar_days(df.index))
+    dates = ind.memo(cache, ("dates",), lambda: np.datetime_as_string(bar_days, unit="D").tolist())
+    index = df.index
+
+    series = ind.memo(
+        cache, ("signals", strategy_type, repr(sorted(params.items()))),
+        lambda: STRATEGY_GENERATORS[strategy_type](df, params, cache),
+    )
+    if window is not None:
+        start, end = window
+        if end - start < 2:
+            return {"error": "回测区间至少需要2条K线"}
+        series = series.window(start, end)
+        close, bar_days, dates, index = close[start:end], bar_days[start:end], dates[start:end], index[start:end]
+    n = len(close)
+
+    fill_idx, fill_cash, fill_qty, trades = _simulate_fills(
+        close, series, dates, initial_capital, commission_rate, slippage
+    )
+
+    # 现金/持仓只在成交点变化, 前向填充后整列计算权益
+    cash_arr = _forward_fill(n, fill_idx, fill_cash, initial_capital)
+    qty_arr = _forward_fill(n, fill_idx, fill_qty, 0.0)
+    equity = cash_arr + qty_arr * close
+    max_dd, max_dd_duration = _max_drawdown(equity)
+
+    values = np.round(equity, 2)
+    cash = float(cash_arr[-1])
+    position_qty = float(qty_arr[-1])
 
     # 如果回测结束时还有持仓，按最后价格平仓
     if position_qty > 0:
-        last_price = float(close.iloc[-1])
+        last_price = float(close[-1])
         revenue = position_qty * last_price
         comm = revenue * commission_rate
-        pnl = revenue - comm - trades[-1]["amount"] - trades[-1].get("commission", 0) if trades else 0
+        pnl = revenue - comm - trades[-1]["amount"] - trades[-1].get("commission", 0)
         cash += revenue - comm
         trades.append({
             "date": dates[-1],
             "direction": "sell",
             "price": round(last_price, 2),
-            "quantity": position_qty,
+            "quantity": trades[-1]["quantity"],
             "amount": round(revenue, 2),
             "commission": round(comm, 2),
             "pnl": round(pnl, 2),
             "reason": "回测结束平仓",
         })
-        position_qty = 0
-        equity_curve[-1]["value"] = round(cash, 2)
+        values[-1] = round(cash, 2)
 
     final_value = cash
     total_return = (final_value - initial_capital) / initial_capital
-    days = max((df.index[-1] - df.index[0]).days, 1)
+    days = max((index[-1] - index[0]).days, 1)
     annual_return = (1 + total_return) ** (365 / days) - 1
 
     sell_trades = [t for t in trades if t["direction"] == "sell" and t["pnl"] is not None]
@@ -306,28 +403,9 @@ def run_backtest(
     total_wins = sum(t["pnl"] for t in winning)
     total_losses = abs(sum(t["pnl"] for t in losing)) or 1
 
-    # Sharpe ratio (简化：使用日收益率)
-    values = [e["value"] for e in equity_curve]
-    returns = pd.Series(values).pct_change().dropna()
-    sharpe = float(returns.mean() / returns.std() * np.sqrt(252)) if returns.std() > 0 else 0
-
-    # Monthly returns
-    eq_df = pd.DataFrame(equity_curve)
-    eq_df["date"] = pd.to_datetime(eq_df["date"])
-    eq_df.set_index("date", inplace=True)
-    monthly = eq_df["value"].resample("ME").last().pct_change().dropna()
-    monthly_returns = [{"month": str(d)[:7], "return": round(float(v) * 100, 2)} for d, v in monthly.items()]
-
-    # Drawdown curve
-    eq_series = pd.Series(values)
-    running_max = eq_series.cummax()
-    drawdown = (running_max - eq_series) / running_max
-    drawdown_curve = [
-        {"date": equity_curve[i]["date"], "drawdown": round(float(drawdown.iloc[i]) * 100, 2)}
-        for i in range(len(drawdown))
-    ]
+    sharpe = _sharpe_ratio(values)
 
-    return {
+    result = {
         "total_return": round(total_return * 100, 2),
         "annual_return": round(annual_return * 100, 2),
         "sharpe_ratio": round(sharpe, 2),
@@ -342,9 +420,15 @@ def run_backtest(
         "avg_loss": round(total_losses / max(len(losing), 1), 2),
         "best_trade": round(max((t["pnl"] for t in sell_trades), default=0), 2),
         "worst_trade": round(min((t["pnl"] for t in sell_trades), default=0), 2),
-        "equity_curve": equity_curve,
-        "trades": trades,
-        "monthly_returns": monthly_returns,
-        "drawdown_curve": drawdown_curve,
         "final_value": round(final_value, 2),
     }
+    if not include_curves:
+        return result
+
+    running_max = np.maximum.accumulate(values)
+    drawdown = np.round((running_max - values) / running_max * 100, 2)
+    result["equity_curve"] = [{"date": d, "value": v} for d, v in zip(dates, values.tolist())]
+    result["trades"] = trades
+    result["monthly_returns"] = _monthly_returns(values, bar_days)
+    result["drawdown_curve"] = [{"date": d, "drawdown": v} for d, v in zip(dates, drawdown.tolist())]
+    return result
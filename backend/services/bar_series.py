@@ -0,0 +1,178 @@
+"""
+K 线序列 - 定长 NumPy 数组存放的 OHLCV，全系统统一的列结构
+
+- 统一结构: 无时区 datetime64[ns] 时间戳 + 小写 open / high / low / close / volume (float64)；
+  数据源 (ccxt 列表、yfinance 首字母大写的 DataFrame、本地仓库记录) 只在进入时转换一次，
+  之后的指标、回测、告警都按小写列名读取，不再判断大小写
+- 时间戳和各字段分别连续存放，取单列、切片 (series[-100:]) 都是视图，不复制数据
+- to_pandas() 直接以这些数组构造 DataFrame (不复制)，与序列共享内存
+- 最多保留最近 capacity 根，追加 O(1) 均摊: 数组写满时换一块新数组，已取出的视图不受影响；
+  push 同一时间戳时原地替换最后一根 (未走完的 K 线)，持有视图的一方会看到变化，需要固定快照时先 copy()
+"""
+from typing import Any, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ("open", "high", "low", "close", "volume")
+MIN_BUFFER = 16
+
+
+class BarSeries:
+    """定长 K 线序列 (切片得到的是只读视图)"""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._ts = np.empty(0, dtype="datetime64[ns]")
+        self._values = np.empty((len(FIELDS), 0))
+        self._start = self._end = 0
+        self._readonly = False
+
+    # ---------- 构造 ----------
+
+    @classmethod
+    def from_arrays(cls, ts: np.ndarray, values: np.ndarray, capacity: Optional[int] = None,
+                    readonly: bool = False) -> "BarSeries":
+        """由时间戳数组和 (字段 × K 线) 数组构造，不复制；超过 capacity 时只保留最近的部分"""
+        series = cls(capacity or max(len(ts), 1))
+        keep = min(len(ts), series.capacity)
+        series._ts = ts[len(ts) - keep:]
+        series._values = values[:, len(ts) - keep:]
+        series._end = keep
+        series._readonly = readonly
+        return series
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, capacity: Optional[int] = None) -> "BarSeries":
+        """任意大小写列名的 OHLCV DataFrame (以时间为索引)，其余列忽略"""
+        names = {str(c).lower(): c for c in df.columns}
+        missing = [f for f in FIELDS if f not in names]
+        if missing:
+            raise ValueError(f"K 线缺少字段: {', '.join(missing)}")
+        index = pd.DatetimeIndex(df.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        values = np.empty((len(FIELDS), len(df)))
+        for i, f in enumerate(FIELDS):
+            values[i] = df[names[f]].to_numpy(dtype=np.float64)
+        return cls.from_arrays(index.as_unit("ns").to_numpy(), values, capacity)
+
+    @classmethod
+    def from_ohlcv(cls, rows: Sequence[Sequence[float]], capacity: Optional[int] = None) -> "BarSeries":
+        """ccxt fetch_ohlcv 的 [毫秒时间戳, open, high, low, close, volume] 列表"""
+        arr = np.asarray(rows, dtype=np.float64).reshape(-1, len(FIELDS) + 1)
+        ts = arr[:, 0].astype(np.int64).astype("datetime64[ms]").astype("datetime64[ns]")
+        return cls.from_arrays(ts, np.ascontiguousarray(arr[:, 1:].T), capacity)
+
+    @classmethod
+    def from_records(cls, bars: np.ndarray, capacity: Optional[int] = None) -> "BarSeries":
+        """bar_store 的结构化数组 (ts 为纳秒整数)"""
+        values = np.empty((len(FIELDS), len(bars)))
+        for i, f in enumerate(FIELDS):
+            values[i] = bars[f]
+        return cls.from_arrays(np.array(bars["ts"]).view("datetime64[ns]"), values, capacity)
+
+    # ---------- 读取 ----------
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def ts(self) -> np.ndarray:
+        return self._ts[self._start:self._end]
+
+    @property
+    def values(self) -> np.ndarray:
+        """字段 × K 线 的二维视图，行顺序同 FIELDS"""
+        return self._values[:, self._start:self._end]
+
+    def column(self, name: str) -> np.ndarray:
+        return self._values[FIELDS.index(name), self._start:self._end]
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.column("open")
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.column("high")
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.column("low")
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.column("close")
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.column("volume")
+
+    @property
+    def last_ts(self) -> Optional[np.datetime64]:
+        return self._ts[self._end - 1] if len(self) else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.ts.nbytes + self.values.nbytes
+
+    def __getitem__(self, key: slice) -> "BarSeries":
+        if not isinstance(key, slice):
+            raise TypeError("BarSeries 只支持切片")
+        return BarSeries.from_arrays(self.ts[key], self.values[:, key], readonly=True)
+
+    def tail(self, n: int) -> "BarSeries":
+        return self[max(len(self) - n, 0):]
+
+    def copy(self) -> "BarSeries":
+        return BarSeries.from_arrays(self.ts.copy(), self.values.copy(), self.capacity)
+
+    def to_pandas(self) -> pd.DataFrame:
+        """与 K 线共享内存的 DataFrame (索引名 timestamp，列为 FIELDS)"""
+        return pd.DataFrame(
+            self.values.T,
+            index=pd.DatetimeIndex(self.ts, copy=False, name="timestamp"),
+            columns=list(FIELDS),
+            copy=False,
+        )
+
+    # ---------- 追加 ----------
+
+    def push(self, ts: Any, open_: float, high: float, low: float, close: float, volume: float) -> bool:
+        """追加新 K 线或替换同一时间戳的最后一根，早于最后一根的忽略；返回是否写入"""
+        if self._readonly:
+            raise ValueError("切片视图只读")
+        ts = np.datetime64(ts, "ns")
+        last = self.last_ts
+        if last is not None and ts < last:
+            return False
+        if last is None or ts > last:
+            if self._end == len(self._ts):
+                self._reserve()
+            self._end += 1
+            if len(self) > self.capacity:
+                self._start += 1
+        self._ts[self._end - 1] = ts
+        self._values[:, self._end - 1] = (open_, high, low, close, volume)
+        return True
+
+    def extend(self, rows: Iterable[Sequence[Any]]):
+        for row in rows:
+            self.push(*row)
+
+    def _reserve(self):
+        """数组写满: 把最近 capacity - 1 根复制到一块新数组 (不覆盖旧数组，已取出的视图保持不变)"""
+        keep = min(len(self), self.capacity - 1)
+        size = min(max(2 * (keep + 1), MIN_BUFFER), 2 * self.capacity)
+        ts = np.empty(size, dtype="datetime64[ns]")
+        values = np.empty((len(FIELDS), size))
+        ts[:keep] = self._ts[self._end - keep:self._end]
+        values[:, :keep] = self._values[:, self._end - keep:self._end]
+        self._ts, self._values, self._start, self._end = ts, values, 0, keep
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """任意来源的 OHLCV DataFrame 转为统一结构 (小写列名、无时区 timestamp 索引)"""
+    return BarSeries.from_frame(df).to_pandas()
+
@@ -0,0 +1,208 @@
+"""
+本地 K 线存储 - 按 (symbol, timeframe, source) 持久化 OHLCV
+
+- 每个键一个 NumPy 结构化数组文件 (.npy)，读取时内存映射，区间查询用二分查找切片
+- 旁挂 .json 元数据记录已覆盖的起始时间和最近刷新时间
+- 数据过期时只向数据源请求缺失的尾部 (含最后一根可能未走完的 K 线) 并合并写回；
+  首次访问或请求的起点早于已覆盖区间时才整段下载
+- 写入先写临时文件再原子替换，读者不会看到写了一半的文件
+"""
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import get_settings
+from core.logger import logger
+from services.bar_series import BarSeries
+
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),  # K 线开始时间, 纳秒 (无时区)
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+FIELDS = BAR_DTYPE.names[1:]
+
+_UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400, "M": 30 * 86400}
+
+# fetch(since): since 为 None 时整段下载，否则下载 since (含) 之后的 K 线
+Fetcher = Callable[[Optional[pd.Timestamp]], pd.DataFrame]
+
+
+def timeframe_seconds(timeframe: str) -> int:
+    """K 线周期秒数: 1m / 15m / 1h / 4h / 1d / 1w / 1M"""
+    m = re.fullmatch(r"(\d+)([mhdwM])", timeframe)
+    if not m:
+        raise ValueError(f"不支持的K线周期: {timeframe}")
+    return int(m.group(1)) * _UNIT_SECONDS[m.group(2)]
+
+
+class BarStore:
+    """磁盘 K 线仓库，线程安全 (同一个键的刷新串行执行，避免重复下载)"""
+
+    def __init__(self, root: str, max_age: float = 300):
+        self.root = Path(root)
+        self.max_age = max_age
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "bars_fetched": 0, "errors": 0}
+        self._locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    # ---------- 文件 ----------
+
+    def _path(self, symbol: str, timeframe: str, source: str) -> Path:
+        name = re.sub(r"[^0-9A-Za-z.\-]", "_", symbol)
+        return self.root / source / timeframe / f"{name}.npy"
+
+    def _lock(self, key: Tuple[str, str, str]) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _load(self, path: Path) -> Optional[np.ndarray]:
+        if not path.exists():
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def _load_meta(self, path: Path) -> Dict:
+        try:
+            return json.loads(path.with_suffix(".json").read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, path: Path, bars: np.ndarray, meta: Dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, bars)
+        os.replace(tmp, path)
+        self._save_meta(path, meta)
+
+    def _save_meta(self, path: Path, meta: Dict):
+        tmp = path.with_name(path.name + f".{os.getpid()}.json.tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, path.with_suffix(".json"))
+
+    # ---------- 读写 ----------
+
+    @staticmethod
+    def _to_records(df: pd.DataFrame) -> np.ndarray:
+        series = BarSeries.from_frame(df)
+        bars = np.empty(len(series), dtype=BAR_DTYPE)
+        bars["ts"] = series.ts.view(np.int64)
+        for f in FIELDS:
+            bars[f] = series.column(f)
+        bars = bars[np.argsort(bars["ts"], kind="stable")]
+        # 同一时间戳保留最后一条
+        keep = np.append(bars["ts"][1:] != bars["ts"][:-1], True)
+        return bars[keep]
+
+    def read(
+        self,
+        symbol: str,
+        timeframe: str,
+        source: str,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+    ) -> pd.DataFrame:
+        """区间查询 (只读本地, 不访问网络)，返回统一结构的 DataFrame (见 services.bar_series)"""
+        bars = self._load(self._path(symbol, timeframe, source))
+        if bars is None or len(bars) == 0:
+            return BarSeries().to_pandas()
+        ts = bars["ts"]
+        lo = 0 if start is None else int(np.searchsorted(ts, pd.Timestamp(start).value, side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, pd.Timestamp(end).value, side="right"))
+        return BarSeries.from_records(bars[lo:hi]).to_pandas()
+
+    def merge(self, symbol: str, timeframe: str, source: str, df: pd.DataFrame, meta: Optional[Dict] = None) -> int:
+        """把新 K 线合并进仓库 (时间重叠的部分以新数据为准)，返回新增的 K 线数"""
+        path = self._path(symbol, timeframe, source)
+        new = self._to_records(df)
+        old = self._load(path)
+        meta = {**self._load_meta(path), **(meta or {})}
+        if old is None or len(old) == 0:
+            merged, added = new, len(new)
+        elif len(new) == 0:
+            merged, added = np.array(old), 0
+        else:
+            first, last = new["ts"][0], new["ts"][-1]
+            head = old[old["ts"] < first]
+            tail = old[old["ts"] > last]
+            merged = np.concatenate([head, new, tail])
+            added = len(merged) - len(old)
+        self._save(path, merged, meta)
+        return added
+
+    def get(
+        self,
+        symbol: str,
+        timeframe: str,
+        source: str,
+        start: pd.Timestamp,
+        fetch: Fetcher,
+        max_age: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """
+        读取 start 之后的 K 线，必要时通过 fetch 补齐:
+        - 已覆盖且未过期: 直接读本地 (hit)
+        - 已覆盖但过期: 只下载最后一根 K 线之后的尾部 (refresh)
+        - 未覆盖: 整段下载 (miss)
+        数据源出错时退回本地已有数据。
+        """
+        key = (symbol, timeframe, source)
+        path = self._path(*key)
+        max_age = min(self.max_age, timeframe_seconds(timeframe)) if max_age is None else max_age
+        start_ns = pd.Timestamp(start).value
+
+        with self._lock(key):
+            meta = self._load_meta(path)
+            bars = self._load(path)
+            covered = bars is not None and len(bars) > 0 and meta.get("covered_from", start_ns + 1) <= start_ns
+
+            if covered and time.time() - meta.get("refreshed_at", 0) < max_age:
+                self.stats["hits"] += 1
+                return self.read(*key, start=start)
+
+            since = pd.Timestamp(int(bars["ts"][-1])) if covered else None
+            try:
+                df = fetch(since)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"K线下载失败 {source}:{symbol} {timeframe}: {e}")
+                return self.read(*key, start=start)
+
+            now = time.time()
+            if covered:
+                self.stats["refreshes"] += 1
+                update = {"refreshed_at": now}
+            else:
+                self.stats["misses"] += 1
+                update = {"refreshed_at": now, "covered_from": min(start_ns, meta.get("covered_from", start_ns))}
+            if df is not None and not df.empty:
+                self.stats["bars_fetched"] += len(df)
+                self.merge(*key, df, update)
+            elif bars is not None:
+                self._save_meta(path, {**meta, **update})
+            return self.read(*key, start=start)
+
+    def get_stats(self) -> Dict:
+        total = self.stats["hits"] + self.stats["misses"] + self.stats["refreshes"]
+        return {**self.stats, "hit_rate": round(self.stats["hits"] / total, 4) if total else 0.0, "root": str(self.root)}
+
+
+_store: Optional[BarStore] = None
+
+
+def get_bar_store() -> BarStore:
+    global _store
+    if _store is None:
+        settings = get_settings()
+        _store = BarStore(settings.BAR_STORE_DIR, max_age=settings.BAR_STORE_MAX_AGE)
+    return _store
@@ -2,9 +2,10 @@ from services.brokers.base import BaseBroker, OrderResult, BalanceInfo
 from services.brokers.crypto_broker import CryptoBroker
 from services.brokers.stock_broker import THSBroker, StockBrokerStub
 from services.brokers.factory import get_broker
+from services.brokers.pool import BrokerPool, get_broker_pool
 
 __all__ = [
     "BaseBroker", "OrderResult", "BalanceInfo",
     "CryptoBroker", "THSBroker", "StockBrokerStub",
-    "get_broker",
+    "get_broker", "BrokerPool", "get_broker_pool",
 ]
@@ -1,6 +1,7 @@
 """
 Broker 抽象基类 — 所有交易所/券商适配器的统一接口
 """
+import asyncio
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Any
@@ -64,6 +65,14 @@ class BaseBroker(ABC):
         """撤单"""
         ...
 
+    async def place_orders(self, orders: List[Dict[str, Any]]) -> List[OrderResult]:
+        """批量下单 (orders 为 place_order 参数字典)，默认逐笔并发提交"""
+        return list(await asyncio.gather(*(self.place_order(**o) for o in orders)))
+
+    async def cancel_orders(self, order_ids: List[str], symbol: str = "") -> List[bool]:
+        """批量撤单，默认逐笔并发提交"""
+        return list(await asyncio.gather(*(self.cancel_order(i, symbol) for i in order_ids)))
+
     @abstractmethod
     async def get_order(self, order_id: str, symbol: str = "") -> OrderResult:
         """查询订单状态"""
@@ -74,6 +83,14 @@ class BaseBroker(ABC):
         """查询未成交订单"""
         ...
 
+    async def warm_up(self):
+        """放入连接池时预热 (加载市场信息等)，默认无操作"""
+        pass
+
+    async def health_check(self) -> bool:
+        """连接池定期调用，返回 False 时实例被移出重建"""
+        return await self.connect()
+
     async def close(self):
         """关闭连接"""
         pass
@@ -62,6 +62,21 @@ class CryptoBroker(BaseBroker):
             logger.error(f"[{self.display_name}] 连接失败: {e}")
             return False
 
+    async def warm_up(self):
+        await self._exchange.load_markets()
+
+    async def health_check(self) -> bool:
+        # 优先用公开接口，不占用账户的私有接口频率
+        try:
+            if self._exchange.has.get("fetchTime"):
+                await self._exchange.fetch_time()
+            else:
+                await self._exchange.fetch_balance()
+            return True
+        except Exception as e:
+            logger.warning(f"[{self.display_name}] 健康检查失败: {e}")
+            return False
+
     async def get_balance(self) -> BalanceInfo:
         try:
             bal = await self._exchange.fetch_balance()
@@ -45,7 +45,7 @@ def create_broker(
 
 
 async def get_broker(broker_account_id: int) -> BaseBroker:
-    """从数据库加载 Broker 配置并创建实例"""
+    """从数据库加载 Broker 配置并创建新实例 (用完需 close；路由中用 BrokerPool 复用连接)"""
     sb = get_supabase()
     result = sb.table("broker_accounts").select("*").eq("id", broker_account_id).single().execute()
     if not result.data:
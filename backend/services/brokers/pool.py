@@ -0,0 +1,200 @@
+"""
+Broker 连接池 - 按交易账户复用已连接的 Broker 实例，下单不再每次重建交易所客户端、重新加载市场
+
+- 实例按账户 id 缓存；账户的类型、凭证或配置变化 (指纹不同) 时自动重建
+- 交易所客户端绑定事件循环，循环变化时重建 (同 market_data._get_async_exchange)
+- 新实例先预热 (加载市场 / 连接本地客户端)，并发请求共用同一次预热
+- 后台任务定期关闭空闲超过 idle_ttl 秒的实例，并对其余空闲实例做健康检查，失败即移出
+- 被替换的实例等正在进行的操作结束后再关闭
+
+用法:
+    async with get_broker_pool().lease(account) as broker:
+        await broker.place_order(...)
+"""
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from config import get_settings
+from core.logger import logger
+from services.brokers.base import BaseBroker
+from services.brokers.factory import create_broker
+
+# 决定 Broker 实例的账户字段，任一变化都要重建
+ACCOUNT_FIELDS = ("broker_type", "api_key", "api_secret", "passphrase", "is_testnet", "extra_config")
+
+
+def fingerprint(account: Dict[str, Any]) -> str:
+    raw = json.dumps([account.get(k) for k in ACCOUNT_FIELDS], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _Entry:
+    def __init__(self, broker: BaseBroker, fingerprint: str, loop: asyncio.AbstractEventLoop):
+        self.broker = broker
+        self.fingerprint = fingerprint
+        self.loop = loop
+        self.ready = loop.create_task(broker.warm_up())
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.retired = False
+
+
+class BrokerPool:
+    """进程内 Broker 池，维护任务由 main.lifespan 启停"""
+
+    def __init__(self, idle_ttl: float = 600, check_interval: float = 60, maxsize: int = 256):
+        self.idle_ttl = idle_ttl
+        self.check_interval = check_interval
+        self.maxsize = maxsize
+        self.stats = {"hits": 0, "misses": 0, "rebuilds": 0, "evictions": 0, "health_failures": 0, "warm_up_errors": 0}
+        self._entries: Dict[int, _Entry] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()  # 后台关闭任务 (保留引用，避免执行中被回收)
+
+    # ---------- 取用 ----------
+
+    def _acquire(self, account: Dict[str, Any]) -> _Entry:
+        """取出或创建账户的实例 (同步完成，不会与并发请求重复创建)"""
+        loop = asyncio.get_running_loop()
+        key, fp = account["id"], fingerprint(account)
+        entry = self._entries.get(key)
+        if entry is not None and entry.fingerprint == fp and entry.loop is loop:
+            self.stats["hits"] += 1
+            return entry
+
+        if entry is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["rebuilds"] += 1
+            logger.info(f"交易账户 {key} 配置已变化，重建连接")
+            self.invalidate(key)
+        broker = create_broker(
+            broker_type=account["broker_type"],
+            api_key=account["api_key"],
+            api_secret=account["api_secret"],
+            passphrase=account.get("passphrase") or "",
+            testnet=account.get("is_testnet", False),
+            extra_config=account.get("extra_config"),
+        )
+        entry = self._entries[key] = _Entry(broker, fp, loop)
+        while len(self._entries) > self.maxsize:
+            idle = [k for k, e in self._entries.items() if e.in_use == 0 and e is not entry]
+            if not idle:
+                break
+            self.invalidate(min(idle, key=lambda k: self._entries[k].last_used))
+            self.stats["evictions"] += 1
+        return entry
+
+    @asynccontextmanager
+    async def lease(self, account: Dict[str, Any]) -> AsyncIterator[BaseBroker]:
+        """借出账户的 Broker 实例 (account 为 broker_accounts 记录)，调用方不要 close()"""
+        entry = self._acquire(account)
+        entry.in_use += 1
+        try:
+            try:
+                await asyncio.shield(entry.ready)
+            except Exception as e:
+                # 预热失败不影响本次操作 (操作本身会给出错误)，下次取用时重建
+                self.stats["warm_up_errors"] += 1
+                logger.warning(f"交易账户 {account['id']} 预热失败: {e}")
+                self.invalidate(account["id"])
+            yield entry.broker
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            if entry.retired and entry.in_use == 0:
+                await self._close(entry)
+
+    # ---------- 移出 ----------
+
+    def invalidate(self, account_id: int):
+        """账户被修改或删除后调用；正在使用的实例在操作结束后关闭"""
+        entry = self._entries.pop(account_id, None)
+        if entry is None:
+            return
+        entry.retired = True
+        if entry.in_use == 0:
+            task = asyncio.ensure_future(self._close(entry))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def _close(self, entry: _Entry):
+        if entry.loop is not asyncio.get_running_loop():
+            return  # 其他事件循环上的客户端无法在这里关闭，直接丢弃
+        entry.ready.cancel()
+        try:
+            await entry.broker.close()
+        except Exception as e:
+            logger.warning(f"关闭 Broker 连接失败: {e}")
+
+    # ---------- 维护 ----------
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        entries = list(self._entries.values())
+        self._entries.clear()
+        await asyncio.gather(*self._closing, *(self._close(e) for e in entries if e.in_use == 0))
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.error(f"Broker 连接池维护失败: {e}")
+
+    async def maintain(self):
+        """关闭空闲过久的实例，对其余空闲实例做健康检查"""
+        now = time.monotonic()
+        loop = asyncio.get_running_loop()
+        checks = {}
+        for key, entry in list(self._entries.items()):
+            if entry.in_use or entry.loop is not loop or not entry.ready.done():
+                continue
+            if now - entry.last_used > self.idle_ttl:
+                self.invalidate(key)
+                self.stats["evictions"] += 1
+            else:
+                checks[key] = entry
+
+        async def check(entry: _Entry) -> bool:
+            try:
+                return await asyncio.wait_for(entry.broker.health_check(), self.check_interval)
+            except Exception:
+                return False
+
+        results = await asyncio.gather(*(check(e) for e in checks.values()))
+        for (key, entry), ok in zip(checks.items(), results):
+            if not ok and self._entries.get(key) is entry:
+                logger.warning(f"交易账户 {key} 健康检查失败，移出连接池")
+                self.stats["health_failures"] += 1
+                self.invalidate(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "size": len(self._entries), "in_use": sum(e.in_use > 0 for e in self._entries.values())}
+
+
+_pool: Optional[BrokerPool] = None
+
+
+def get_broker_pool() -> BrokerPool:
+    global _pool
+    if _pool is None:
+        settings = get_settings()
+        _pool = BrokerPool(
+            idle_ttl=settings.BROKER_POOL_IDLE_TTL,
+            check_interval=settings.BROKER_POOL_CHECK_INTERVAL,
+            maxsize=settings.BROKER_POOL_SIZE,
+        )
+    return _pool
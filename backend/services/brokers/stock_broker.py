@@ -17,6 +17,8 @@ import httpx
 from services.brokers.base import BaseBroker, OrderResult, BalanceInfo
 from core.logger import logger
 
+GATEWAY_BATCH_SIZE = 50  # 网关批量接口单次上限 (tools/ths_gateway.py 的 MAX_BATCH)
+
 
 # ================================================================
 # 同花顺适配器
@@ -38,6 +40,9 @@ class THSBroker(BaseBroker):
     gateway 模式需要:
       1. 用户在 Windows 机器上运行 ths_gateway.py (见 tools/ths_gateway.py)
       2. 配置 gateway_url 指向该机器
+
+    gateway 模式下所有请求共用一个长连接客户端；单笔委托查询走网关的 /entrusts/{id}，
+    今日委托按变更序号增量同步 (旧版网关没有这些接口时退回全量查询)
     """
 
     broker_type = "stock_ths"
@@ -54,7 +59,28 @@ class THSBroker(BaseBroker):
         self._exe_path = exe_path
         self._gateway_url = gateway_url.rstrip("/")
         self._trader = None
-        self._loop = asyncio.get_event_loop()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+        self._entrusts: Dict[str, Dict[str, Any]] = {}  # 委托号 -> 委托 (增量同步)
+        self._entrust_seq = 0
+        self._entrust_day = ""
+
+    def _http(self) -> httpx.AsyncClient:
+        """网关长连接客户端 (绑定当前事件循环)"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self._gateway_url,
+                timeout=15,
+                limits=httpx.Limits(max_connections=8, keepalive_expiry=60),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def close(self):
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
 
     # ---- 连接 ----
 
@@ -89,17 +115,26 @@ class THSBroker(BaseBroker):
 
     async def _connect_gateway(self) -> bool:
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.get(f"{self._gateway_url}/ping")
-                if resp.status_code == 200:
-                    logger.info(f"[同花顺-gateway] 连接成功: {self._gateway_url}")
-                    return True
-                logger.error(f"[同花顺-gateway] 连接失败: HTTP {resp.status_code}")
-                return False
+            resp = await self._http().get("/ping", timeout=10)
+            if resp.status_code == 200:
+                logger.info(f"[同花顺-gateway] 连接成功: {self._gateway_url}")
+                return True
+            logger.error(f"[同花顺-gateway] 连接失败: HTTP {resp.status_code}")
+            return False
         except Exception as e:
             logger.error(f"[同花顺-gateway] 连接失败: {e}")
             return False
 
+    async def warm_up(self):
+        # local 模式需先连接客户端才能查询和下单
+        if self._mode == "local" and self._trader is None:
+            await self._connect_local()
+
+    async def health_check(self) -> bool:
+        if self._mode == "local":
+            return self._trader is not None
+        return await self._connect_gateway()
+
     # ---- 查询余额 ----
 
     async def get_balance(self) -> BalanceInfo:
@@ -144,20 +179,19 @@ class THSBroker(BaseBroker):
 
     async def _balance_gateway(self) -> BalanceInfo:
         try:
-            async with httpx.AsyncClient(timeout=15) as client:
-                resp = await client.get(f"{self._gateway_url}/balance")
-                data = resp.json()
-
-                if not data.get("success"):
-                    return BalanceInfo(raw=data)
-
-                d = data.get("data", {})
-                return BalanceInfo(
-                    total_equity=d.get("total_equity", 0),
-                    available_balance=d.get("available_balance", 0),
-                    positions=d.get("positions", []),
-                    raw=d,
-                )
+            resp = await self._http().get("/balance")
+            data = resp.json()
+
+            if not data.get("success"):
+                return BalanceInfo(raw=data)
+
+            d = data.get("data", {})
+            return BalanceInfo(
+                total_equity=d.get("total_equity", 0),
+                available_balance=d.get("available_balance", 0),
+                positions=d.get("positions", []),
+                raw=d,
+            )
         except Exception as e:
             logger.error(f"[同花顺-gateway] 查询余额失败: {e}")
             return BalanceInfo(raw={"error": str(e)})
@@ -220,32 +254,70 @@ class THSBroker(BaseBroker):
 
     async def _order_gateway(self, symbol, side, quantity, order_type, price) -> OrderResult:
         try:
-            async with httpx.AsyncClient(timeout=15) as client:
-                resp = await client.post(f"{self._gateway_url}/order", json={
-                    "symbol": symbol,
-                    "side": side,
-                    "quantity": int(quantity),
-                    "order_type": order_type,
-                    "price": price,
-                })
-                data = resp.json()
-
-                if data.get("success"):
-                    d = data.get("data", {})
-                    return OrderResult(
-                        success=True,
-                        order_id=str(d.get("entrust_no", "")),
-                        symbol=symbol,
-                        side=side,
-                        quantity=int(quantity),
-                        price=price or 0,
-                        status="submitted",
-                        raw=d,
-                    )
-                return OrderResult(success=False, symbol=symbol, side=side, error=data.get("message", "网关下单失败"))
+            resp = await self._http().post("/order", json={
+                "symbol": symbol,
+                "side": side,
+                "quantity": int(quantity),
+                "order_type": order_type,
+                "price": price,
+            })
+            data = resp.json()
+
+            if data.get("success"):
+                d = data.get("data", {})
+                return OrderResult(
+                    success=True,
+                    order_id=str(d.get("entrust_no", "")),
+                    symbol=symbol,
+                    side=side,
+                    quantity=int(quantity),
+                    price=price or 0,
+                    status="submitted",
+                    raw=d,
+                )
+            return OrderResult(success=False, symbol=symbol, side=side, error=data.get("message", "网关下单失败"))
         except Exception as e:
             return OrderResult(success=False, symbol=symbol, side=side, error=f"网关请求失败: {e}")
 
+    async def place_orders(self, orders: List[Dict[str, Any]]) -> List[OrderResult]:
+        if self._mode != "gateway":
+            return [await self.place_order(**o) for o in orders]  # 客户端界面操作只能逐笔进行
+        payload = [
+            {"symbol": o["symbol"], "side": o["side"], "quantity": int(o["quantity"]), "price": o.get("price")}
+            for o in orders
+        ]
+        replies = await self._post_batch("/orders", "orders", payload)
+        if replies is None:  # 旧版网关没有批量接口
+            return await super().place_orders(orders)
+        return [
+            OrderResult(
+                success=True, order_id=str(r.get("entrust_no", "")), symbol=o["symbol"], side=o["side"],
+                quantity=o["quantity"], price=o["price"] or 0, status="submitted", raw=r,
+            ) if r.get("success") else OrderResult(
+                success=False, symbol=o["symbol"], side=o["side"], error=r.get("message", "网关下单失败"),
+            )
+            for o, r in zip(payload, replies)
+        ]
+
+    async def _post_batch(self, path: str, field: str, items: list) -> Optional[List[Dict[str, Any]]]:
+        """按网关上限分批提交，返回逐笔结果；网关不支持批量接口时返回 None"""
+        replies = []
+        for i in range(0, len(items), GATEWAY_BATCH_SIZE):
+            chunk = items[i:i + GATEWAY_BATCH_SIZE]
+            try:
+                resp = await self._http().post(path, json={field: chunk})
+                if resp.status_code == 404:
+                    return None
+                data = resp.json()
+                if data.get("success"):
+                    replies.extend(data.get("data", []))
+                    continue
+                error = data.get("message", "网关请求失败")
+            except Exception as e:
+                error = f"网关请求失败: {e}"
+            replies.extend({"success": False, "message": error} for _ in chunk)
+        return replies
+
     # ---- 撤单 ----
 
     async def cancel_order(self, order_id: str, symbol: str = "") -> bool:
@@ -268,30 +340,51 @@ class THSBroker(BaseBroker):
 
     async def _cancel_gateway(self, order_id: str) -> bool:
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.post(f"{self._gateway_url}/cancel", json={"entrust_no": order_id})
-                return resp.json().get("success", False)
+            resp = await self._http().post("/cancel", json={"entrust_no": order_id}, timeout=10)
+            return resp.json().get("success", False)
         except Exception:
             return False
 
+    async def cancel_orders(self, order_ids: List[str], symbol: str = "") -> List[bool]:
+        if self._mode != "gateway":
+            return [await self.cancel_order(i, symbol) for i in order_ids]
+        replies = await self._post_batch("/cancels", "entrust_nos", list(order_ids))
+        if replies is None:
+            return await super().cancel_orders(order_ids, symbol)
+        return [bool(r.get("success")) for r in replies]
+
     # ---- 查询订单 ----
 
     async def get_order(self, order_id: str, symbol: str = "") -> OrderResult:
-        entrusts = await self._get_today_entrusts()
-        for e in entrusts:
-            if str(e.get("entrust_no", "")) == order_id:
-                return OrderResult(
-                    success=True,
-                    order_id=order_id,
-                    symbol=e.get("symbol", symbol),
-                    side="buy" if "买" in e.get("操作", e.get("direction", "")) else "sell",
-                    quantity=float(e.get("委托数量", e.get("quantity", 0))),
-                    filled_quantity=float(e.get("成交数量", e.get("filled_quantity", 0))),
-                    filled_price=float(e.get("成交均价", e.get("filled_price", 0))),
-                    status=e.get("status", e.get("备注", "unknown")),
-                    raw=e,
-                )
-        return OrderResult(success=False, error=f"未找到委托号 {order_id}")
+        if self._mode == "gateway":
+            e = await self._get_entrust_gateway(order_id)
+        else:
+            e = next((e for e in await self._get_today_entrusts() if str(e.get("entrust_no", "")) == order_id), None)
+        if e is None:
+            return OrderResult(success=False, error=f"未找到委托号 {order_id}")
+        return OrderResult(
+            success=True,
+            order_id=order_id,
+            symbol=e.get("symbol", symbol),
+            side="buy" if "买" in e.get("操作", e.get("direction", "")) else "sell",
+            quantity=float(e.get("委托数量", e.get("quantity", 0))),
+            filled_quantity=float(e.get("成交数量", e.get("filled_quantity", 0))),
+            filled_price=float(e.get("成交均价", e.get("filled_price", 0))),
+            status=e.get("status", e.get("备注", "unknown")),
+            raw=e,
+        )
+
+    async def _get_entrust_gateway(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """网关按委托号查询单笔委托 (网关侧有索引)，旧版网关退回增量同步后查本地"""
+        try:
+            resp = await self._http().get(f"/entrusts/{order_id}", timeout=10)
+            if resp.status_code != 404:
+                data = resp.json()
+                return data.get("data") if data.get("success") else None
+        except Exception:
+            return None
+        await self._get_today_entrusts()
+        return self._entrusts.get(order_id)
 
     async def get_open_orders(self, symbol: str = "") -> List[OrderResult]:
         entrusts = await self._get_today_entrusts()
@@ -316,6 +409,10 @@ class THSBroker(BaseBroker):
             ))
         return open_orders
 
+    async def _fetch_entrusts(self, since: int):
+        resp = await self._http().get("/entrusts", params={"since": since}, timeout=10)
+        return resp.json().get("data", [])
+
     async def _get_today_entrusts(self) -> list:
         if self._mode == "local" and self._trader:
             try:
@@ -324,12 +421,21 @@ class THSBroker(BaseBroker):
                 return []
         elif self._mode == "gateway":
             try:
-                async with httpx.AsyncClient(timeout=10) as client:
-                    resp = await client.get(f"{self._gateway_url}/entrusts")
-                    data = resp.json()
-                    return data.get("data", [])
+                data = await self._fetch_entrusts(self._entrust_seq)
+                if self._entrust_seq and isinstance(data, dict) and (data.get("seq", 0) < self._entrust_seq or data.get("day") != self._entrust_day):
+                    # 网关重启或跨日: 序号不再连续，重新全量同步
+                    self._entrusts.clear()
+                    data = await self._fetch_entrusts(0)
             except Exception:
-                return []
+                return list(self._entrusts.values())
+            if isinstance(data, dict):  # 增量: 只有变化的委托
+                self._entrust_seq, self._entrust_day = data.get("seq", 0), data.get("day", "")
+                data = data.get("entrusts", [])
+            else:  # 旧版网关返回全量列表
+                self._entrusts.clear()
+            for e in data:
+                self._entrusts[str(e.get("entrust_no", ""))] = e
+            return list(self._entrusts.values())
         return []
 
 
@@ -362,3 +468,6 @@ class StockBrokerStub(BaseBroker):
 
     async def get_open_orders(self, symbol="") -> List[OrderResult]:
         return []
+
+    async def health_check(self) -> bool:
+        return True
@@ -4,13 +4,20 @@ DeepSeek 大模型服务
 - 生成专业分析报告
 - 智能问答
 - 策略解读
+
+HTTP 客户端在应用启动时创建并复用 (HTTP/2 长连接)，避免每次调用重新握手；
+问答和报告另有流式版本，逐段返回模型输出。
+报告、回测解读、策略推荐的回复按提示词缓存 (见 services.llm_cache)，问答不缓存。
 """
+import asyncio
+import importlib.util
 import json
 import httpx
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 
 from config import get_settings
 from core.logger import logger
+from services.llm_cache import bar_ttl, get_llm_cache, prompt_key
 
 settings = get_settings()
 
@@ -29,44 +36,156 @@ SYSTEM_PROMPT = """你是一位资深量化投资分析师，拥有 CFA 和 FRM
 - 格式清晰，使用分点或分段"""
 
 
-async def _call_deepseek(
-    messages: List[Dict[str, str]],
-    temperature: Optional[float] = None,
-    max_tokens: Optional[int] = None,
-) -> str:
-    """调用 DeepSeek API"""
+COMPLETIONS_PATH = "/v1/chat/completions"
+
+# (客户端, 所属事件循环)：httpx 连接池绑定创建它的事件循环
+_client: Optional[Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = None
+
+
+def _new_client() -> httpx.AsyncClient:
+    http2 = importlib.util.find_spec("h2") is not None  # 未安装 h2 时退回 HTTP/1.1 keep-alive
+    return httpx.AsyncClient(
+        base_url=settings.DEEPSEEK_BASE_URL,
+        headers={"Authorization": f"Bearer {settings.DEEPSEEK_API_KEY}"},
+        http2=http2,
+        timeout=httpx.Timeout(settings.DEEPSEEK_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=settings.DEEPSEEK_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.DEEPSEEK_MAX_CONNECTIONS,
+            keepalive_expiry=300,
+        ),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """当前事件循环上的共享客户端 (未在启动时创建则按需创建)"""
+    global _client
+    loop = asyncio.get_running_loop()
+    if _client is None or _client[1] is not loop:
+        _client = (_new_client(), loop)
+    return _client[0]
+
+
+async def open_client():
+    """应用启动时创建连接池"""
+    get_client()
+
+
+async def close_client():
+    """应用关闭时释放连接池"""
+    global _client
+    if _client is not None and _client[1] is asyncio.get_running_loop():
+        await _client[0].aclose()
+    _client = None
+
+
+def _payload(messages: List[Dict[str, str]], temperature: Optional[float], max_tokens: Optional[int],
+             stream: bool) -> Dict[str, Any]:
     if not settings.DEEPSEEK_API_KEY:
         raise ValueError("未配置 DEEPSEEK_API_KEY，请在 .env 文件中设置")
-
-    url = f"{settings.DEEPSEEK_BASE_URL}/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {settings.DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "model": settings.DEEPSEEK_MODEL,
         "messages": messages,
         "temperature": temperature or settings.DEEPSEEK_TEMPERATURE,
         "max_tokens": max_tokens or settings.DEEPSEEK_MAX_TOKENS,
-        "stream": False,
+        "stream": stream,
     }
+    if stream:
+        payload["stream_options"] = {"include_usage": True}
+    return payload
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        resp = await client.post(url, headers=headers, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-        content = data["choices"][0]["message"]["content"]
-        logger.info(f"DeepSeek 调用成功, tokens: {data.get('usage', {})}")
-        return content
 
+async def _request_deepseek(
+    messages: List[Dict[str, str]],
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """调用 DeepSeek API，返回 (回复, usage)"""
+    payload = _payload(messages, temperature, max_tokens, stream=False)
+    resp = await get_client().post(COMPLETIONS_PATH, json=payload)
+    resp.raise_for_status()
+    data = resp.json()
+    content = data["choices"][0]["message"]["content"]
+    usage = data.get("usage", {})
+    logger.info(f"DeepSeek 调用成功, tokens: {usage}")
+    return content, usage
 
-async def chat(user_message: str, context: Optional[str] = None) -> str:
-    """与 DeepSeek 对话（通用问答）"""
+
+async def _call_deepseek(
+    messages: List[Dict[str, str]],
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """调用 DeepSeek API"""
+    content, _ = await _request_deepseek(messages, temperature, max_tokens)
+    return content
+
+
+def _cache_key(messages: List[Dict[str, str]], temperature: Optional[float], max_tokens: Optional[int]) -> str:
+    return prompt_key(
+        messages, settings.DEEPSEEK_MODEL,
+        temperature or settings.DEEPSEEK_TEMPERATURE, max_tokens or settings.DEEPSEEK_MAX_TOKENS,
+    )
+
+
+async def _cached_call(
+    messages: List[Dict[str, str]],
+    ttl: float,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """相同提示词在 ttl 秒内复用回复"""
+    if not settings.DEEPSEEK_CACHE_ENABLED:
+        return await _call_deepseek(messages, temperature, max_tokens)
+    return await get_llm_cache().fetch(
+        _cache_key(messages, temperature, max_tokens), ttl,
+        lambda: _request_deepseek(messages, temperature, max_tokens),
+    )
+
+
+async def _stream_deepseek(
+    messages: List[Dict[str, str]],
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    usage: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    """流式调用 DeepSeek API，逐段产出模型输出的文本；传入 usage 字典时写入本次用量"""
+    payload = _payload(messages, temperature, max_tokens, stream=True)
+    async with get_client().stream("POST", COMPLETIONS_PATH, json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("usage"):
+                if usage is not None:
+                    usage.update(chunk["usage"])
+                logger.info(f"DeepSeek 流式调用完成, tokens: {chunk['usage']}")
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
+
+def _chat_messages(user_message: str, context: Optional[str] = None) -> List[Dict[str, str]]:
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
     if context:
         messages.append({"role": "system", "content": f"当前市场数据上下文:\n{context}"})
     messages.append({"role": "user", "content": user_message})
-    return await _call_deepseek(messages)
+    return messages
+
+
+async def chat(user_message: str, context: Optional[str] = None) -> str:
+    """与 DeepSeek 对话（通用问答）"""
+    return await _call_deepseek(_chat_messages(user_message, context))
+
+
+def chat_stream(user_message: str, context: Optional[str] = None) -> AsyncIterator[str]:
+    """与 DeepSeek 对话（流式）"""
+    return _stream_deepseek(_chat_messages(user_message, context))
 
 
 async def generate_analysis_report(
@@ -75,12 +194,51 @@ async def generate_analysis_report(
     indicators: Dict[str, Any],
     trend_result: Dict[str, Any],
     risk_metrics: Optional[Dict[str, Any]] = None,
+    timeframe: str = "1d",
 ) -> str:
-    """生成深度分析报告"""
+    """生成深度分析报告 (timeframe 为数据所用 K 线周期，决定缓存有效期)"""
+    messages = _report_messages(symbol, market_data, indicators, trend_result, risk_metrics)
+    return await _cached_call(messages, bar_ttl(timeframe), max_tokens=4096)
+
+
+async def generate_analysis_report_stream(
+    symbol: str,
+    market_data: Dict[str, Any],
+    indicators: Dict[str, Any],
+    trend_result: Dict[str, Any],
+    risk_metrics: Optional[Dict[str, Any]] = None,
+    timeframe: str = "1d",
+) -> AsyncIterator[str]:
+    """生成深度分析报告（流式）；缓存命中时一次返回全文，完整生成的报告写入缓存"""
+    messages = _report_messages(symbol, market_data, indicators, trend_result, risk_metrics)
+    if not settings.DEEPSEEK_CACHE_ENABLED:
+        async for text in _stream_deepseek(messages, max_tokens=4096):
+            yield text
+        return
+
+    cache, key = get_llm_cache(), _cache_key(messages, None, 4096)
+    cached = await cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts, usage = [], {}
+    async for text in _stream_deepseek(messages, max_tokens=4096, usage=usage):
+        parts.append(text)
+        yield text
+    await cache.put(key, "".join(parts), usage, bar_ttl(timeframe))
+
+
+def _report_messages(
+    symbol: str,
+    market_data: Dict[str, Any],
+    indicators: Dict[str, Any],
+    trend_result: Dict[str, Any],
+    risk_metrics: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, str]]:
     # 构建数据摘要供 DeepSeek 分析
     data_summary = _build_data_summary(symbol, market_data, indicators, trend_result, risk_metrics)
 
-    messages = [
+    return [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": f"""请对 {symbol} 生成一份专业的投资分析报告。
 
@@ -112,7 +270,6 @@ async def generate_analysis_report(
 ### 六、风险提示
 投资风险提醒。"""},
     ]
-    return await _call_deepseek(messages, max_tokens=4096)
 
 
 async def interpret_backtest(
@@ -149,7 +306,8 @@ async def interpret_backtest(
 3. 这个策略适合什么市场环境？
 4. 实盘使用需要注意什么？"""},
     ]
-    return await _call_deepseek(messages)
+    # 回测结果只由输入决定，按最长有效期缓存
+    return await _cached_call(messages, settings.DEEPSEEK_CACHE_TTL)
 
 
 async def generate_strategy_suggestion(
@@ -178,7 +336,7 @@ async def generate_strategy_suggestion(
 请推荐 1-2 个最适合当前行情的策略，并给出推荐的参数值和理由。
 用 JSON 格式输出推荐，包含 strategy_type, params, reason 字段。"""},
     ]
-    return await _call_deepseek(messages, temperature=0.2)
+    return await _cached_call(messages, bar_ttl("1d"), temperature=0.2)
 
 
 def _build_data_summary(
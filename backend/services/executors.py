@@ -0,0 +1,58 @@
+"""
+共享执行器 - 让阻塞调用离开事件循环
+
+- IO 线程池: yfinance / 磁盘 K 线仓库等阻塞 IO，以及轻量的 pandas 计算；线程数有上限
+- 进程池: 回测、参数寻优等 CPU 密集任务
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from config import get_settings
+
+settings = get_settings()
+
+POOL_WORKERS = os.cpu_count() or 2
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=settings.IO_POOL_WORKERS, thread_name_prefix="market-io")
+    return _io_pool
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+    return _process_pool
+
+
+async def run_io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """在 IO 线程池中执行阻塞函数 (沿用调用方的 contextvars，如请求级查询统计)"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_io_pool(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """在进程池中执行 CPU 密集函数 (fn 和参数需可 pickle)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_executors():
+    global _io_pool, _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
@@ -0,0 +1,443 @@
+"""
+技术指标库 - calculate_indicators / predict_trend / 回测策略共用同一套实现
+
+- 向量化函数以 (df, cache, 参数) 为入参，同一份 K 线上按 (指标, 参数) 记忆化，cache 为 None 时直接计算；
+  传入 (字段, 标的) 两级列的宽表时按列计算，返回 时间 × 标的 的二维数组
+- IndicatorCache: 按 (symbol, timeframe) + K 线指纹复用整份缓存，同一批 K 线上的多次请求只计算一次
+- IndicatorState: 新 K 线到达时增量更新 (滚动和、EMA、RSI 平均涨跌幅)，每根 K 线 O(1)，不重算全部历史
+"""
+import copy
+import math
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import get_settings
+
+
+# ---------- 向量化指标 ----------
+
+def column(df: pd.DataFrame, name: str) -> pd.Series:
+    """读取 OHLCV 列 (K 线统一为小写列名，见 services.bar_series)"""
+    return df[name]
+
+
+def memo(cache: Optional[Dict], key: Tuple, compute: Callable[[], Any]) -> Any:
+    """同一份 K 线上按键共享计算结果 (cache 为 None 时直接计算)"""
+    if cache is None:
+        return compute()
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+
+def values(df: pd.DataFrame, cache: Optional[Dict], col: str) -> np.ndarray:
+    """原始列的 float64 数组"""
+    return memo(cache, (col,), lambda: column(df, col).to_numpy(dtype=np.float64))
+
+
+def close(df: pd.DataFrame, cache: Optional[Dict]) -> np.ndarray:
+    return values(df, cache, "close")
+
+
+def rolling(df: pd.DataFrame, cache: Optional[Dict], col: str, window: int, how: str, shift: int = 0,
+            min_periods: Optional[int] = None) -> np.ndarray:
+    """滚动统计量 (mean/std/max/min)，可选整体后移 shift 根 K 线"""
+    def compute():
+        s = getattr(column(df, col).rolling(window, min_periods=min_periods), how)()
+        return (s.shift(shift) if shift else s).to_numpy()
+    return memo(cache, ("rolling", col, window, how, shift, min_periods), compute)
+
+
+def sma(df: pd.DataFrame, cache: Optional[Dict], window: int, col: str = "close") -> np.ndarray:
+    return rolling(df, cache, col, window, "mean")
+
+
+def _ewm(arr: np.ndarray, **kwargs) -> np.ndarray:
+    frame = pd.DataFrame(arr) if arr.ndim == 2 else pd.Series(arr)
+    return frame.ewm(adjust=False, **kwargs).mean().to_numpy()
+
+
+def ema(df: pd.DataFrame, cache: Optional[Dict], span: int) -> np.ndarray:
+    """收盘价 EMA (adjust=False，首根 K 线为初值)"""
+    return memo(cache, ("ema", span), lambda: column(df, "close").ewm(span=span, adjust=False).mean().to_numpy())
+
+
+def rsi(df: pd.DataFrame, cache: Optional[Dict], period: int = 14, wilder: bool = False) -> np.ndarray:
+    """
+    RSI；默认用 period 日涨跌幅简单平均，wilder=True 时用 Wilder 平滑
+    (前 period 个涨跌幅的简单平均作初值，之后按 1/period 递推)
+    """
+    def compute():
+        c = column(df, "close")
+        delta = c.diff()
+        gain = delta.where(delta > 0, 0.0)
+        loss = -delta.where(delta < 0, 0.0)
+        if wilder:
+            gain, loss = _wilder(gain, period), _wilder(loss, period)
+        else:
+            gain, loss = gain.rolling(period).mean(), loss.rolling(period).mean()
+        rs = gain / loss.replace(0, np.nan)
+        return (100 - 100 / (1 + rs)).to_numpy()
+    return memo(cache, ("rsi_wilder" if wilder else "rsi", period), compute)
+
+
+def _wilder(s, period: int):
+    out = s * np.nan
+    if len(s) <= period:
+        return out
+    seeded = s.iloc[period:].copy()
+    seeded.iloc[0] = s.iloc[1:period + 1].mean()
+    out.iloc[period:] = seeded.ewm(alpha=1 / period, adjust=False).mean()
+    return out
+
+
+def macd(df: pd.DataFrame, cache: Optional[Dict], fast: int = 12, slow: int = 26,
+         signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD 线、信号线、柱"""
+    line = memo(cache, ("macd", fast, slow), lambda: ema(df, cache, fast) - ema(df, cache, slow))
+    signal_line = memo(cache, ("macd_signal", fast, slow, signal), lambda: _ewm(line, span=signal))
+    hist = memo(cache, ("macd_hist", fast, slow, signal), lambda: line - signal_line)
+    return line, signal_line, hist
+
+
+def bollinger(df: pd.DataFrame, cache: Optional[Dict], period: int = 20,
+              num_std: float = 2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """布林带上轨、中轨、下轨"""
+    ma = rolling(df, cache, "close", period, "mean")
+    std = rolling(df, cache, "close", period, "std")
+    return ma + num_std * std, ma, ma - num_std * std
+
+
+def kdj(df: pd.DataFrame, cache: Optional[Dict], n: int = 9,
+        com: float = 2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """KDJ (RSV 取 n 日高低点，K/D 按 com 平滑)"""
+    def compute():
+        low_n = rolling(df, cache, "low", n, "min")
+        high_n = rolling(df, cache, "high", n, "max")
+        span = high_n - low_n
+        rsv = (close(df, cache) - low_n) / np.where(span == 0, np.nan, span) * 100
+        k = _ewm(rsv, com=com)
+        d = _ewm(k, com=com)
+        return k, d, 3 * k - 2 * d
+    return memo(cache, ("kdj", n, com), compute)
+
+
+# ---------- 按 (symbol, timeframe) 复用 ----------
+
+def frame_fingerprint(df: pd.DataFrame) -> Tuple:
+    """K 线指纹: 长度、首尾时间、最后一根的收盘价和成交量 (未走完的 K 线更新后指纹随之变化)"""
+    if df.empty:
+        return (0,)
+    return (len(df), df.index[0], df.index[-1], float(df["close"].iloc[-1]), float(df["volume"].iloc[-1]))
+
+
+class IndicatorCache:
+    """每份 K 线一个指标缓存字典，LRU 淘汰；线程安全 (同一键并发计算至多重复一次，结果相同)"""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._frames: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, timeframe: str, df: pd.DataFrame) -> Dict:
+        """返回该 K 线的指标缓存字典，交给 calculate_indicators / predict_trend 等共用"""
+        key = (symbol, timeframe, frame_fingerprint(df))
+        with self._lock:
+            cache = self._frames.get(key)
+            if cache is not None:
+                self._frames.move_to_end(key)
+                self.stats["hits"] += 1
+                return cache
+            self.stats["misses"] += 1
+            cache = self._frames[key] = {}
+            while len(self._frames) > self.maxsize:
+                self._frames.popitem(last=False)
+                self.stats["evictions"] += 1
+            return cache
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._frames),
+            "hit_rate": round(self.stats["hits"] / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[IndicatorCache] = None
+
+
+def get_indicator_cache() -> IndicatorCache:
+    global _cache
+    if _cache is None:
+        _cache = IndicatorCache(maxsize=get_settings().INDICATOR_CACHE_SIZE)
+    return _cache
+
+
+# ---------- 增量计算 ----------
+
+class RollingWindow:
+    """定长窗口的滚动和 / 平方和，窗口内有 NaN 或未满时结果为 NaN (与 pandas rolling 一致)"""
+
+    RESYNC_EVERY = 4096  # 定期用窗口内原始值重算，消除浮点累计误差
+
+    def __init__(self, window: int):
+        self.window = window
+        self.items: deque = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.nans = 0
+        self._pushes = 0
+
+    def push(self, x: float):
+        self.items.append(x)
+        self._add(x, 1)
+        if len(self.items) > self.window:
+            self._add(self.items.popleft(), -1)
+        self._pushes += 1
+        if self._pushes % self.RESYNC_EVERY == 0:
+            finite = [v for v in self.items if v == v]
+            self.total = math.fsum(finite)
+            self.total_sq = math.fsum(v * v for v in finite)
+
+    def clone(self) -> "RollingWindow":
+        other = copy.copy(self)
+        other.items = deque(self.items)
+        return other
+
+    def _add(self, x: float, sign: int):
+        if x != x:
+            self.nans += sign
+        else:
+            self.total += sign * x
+            self.total_sq += sign * x * x
+
+    def _ready(self) -> bool:
+        return len(self.items) == self.window and self.nans == 0
+
+    def mean(self) -> float:
+        return self.total / self.window if self._ready() else math.nan
+
+    def std(self) -> float:
+        """样本标准差 (ddof=1)"""
+        if not self._ready() or self.window < 2:
+            return math.nan
+        var = (self.total_sq - self.total * self.total / self.window) / (self.window - 1)
+        return math.sqrt(max(var, 0.0))
+
+
+class RollingExtreme:
+    """滚动最大 / 最小值，单调队列，均摊 O(1)"""
+
+    def __init__(self, window: int, how: str = "max"):
+        self.window = window
+        self.better = (lambda a, b: a >= b) if how == "max" else (lambda a, b: a <= b)
+        self.queue: deque = deque()  # (下标, 值)，值单调
+        self.nan_idx: deque = deque()
+        self.count = 0
+
+    def push(self, x: float):
+        i = self.count
+        self.count += 1
+        if x != x:
+            self.nan_idx.append(i)
+        else:
+            while self.queue and self.better(x, self.queue[-1][1]):
+                self.queue.pop()
+            self.queue.append((i, x))
+        lo = i - self.window + 1
+        while self.queue and self.queue[0][0] < lo:
+            self.queue.popleft()
+        while self.nan_idx and self.nan_idx[0] < lo:
+            self.nan_idx.popleft()
+
+    def clone(self) -> "RollingExtreme":
+        other = copy.copy(self)
+        other.queue, other.nan_idx = deque(self.queue), deque(self.nan_idx)
+        return other
+
+    def value(self) -> float:
+        if self.count < self.window or self.nan_idx or not self.queue:
+            return math.nan
+        return self.queue[0][1]
+
+
+class EMAState:
+    """EMA 递推状态，逐位复现 pandas ewm(adjust=False) (含 NaN 跳过时的权重衰减)"""
+
+    def __init__(self, span: Optional[float] = None, alpha: Optional[float] = None, com: Optional[float] = None):
+        if alpha is None:
+            alpha = 2 / (span + 1) if span is not None else 1 / (1 + com)
+        self.alpha = alpha
+        self.value = math.nan
+        self._old_wt = 1.0
+
+    def push(self, x: float) -> float:
+        if self.value != self.value:
+            if x == x:
+                self.value = x
+                self._old_wt = 1.0
+            return self.value
+        self._old_wt *= 1 - self.alpha
+        if x == x:
+            if self.value != x:
+                self.value = (self._old_wt * self.value + self.alpha * x) / (self._old_wt + self.alpha)
+            self._old_wt = 1.0
+        return self.value
+
+    def clone(self) -> "EMAState":
+        return copy.copy(self)
+
+
+class RSIState:
+    """RSI 递推状态: 默认为 period 日涨跌幅的滚动和，wilder=True 时保存 Wilder 平均涨跌幅"""
+
+    def __init__(self, period: int = 14, wilder: bool = False):
+        self.period = period
+        self.wilder = wilder
+        self.prev_close = math.nan
+        self.count = 0
+        if wilder:
+            self.avg_gain = math.nan
+            self.avg_loss = math.nan
+            self._seed_gain = 0.0
+            self._seed_loss = 0.0
+        else:
+            self.gains = RollingWindow(period)
+            self.losses = RollingWindow(period)
+
+    def push(self, price: float) -> float:
+        delta = price - self.prev_close
+        # 与 pandas 一致: 首根 K 线的涨跌幅 (NaN) 记为 0
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        self.prev_close = price
+        self.count += 1
+        if not self.wilder:
+            self.gains.push(gain)
+            self.losses.push(loss)
+            return self._rsi(self.gains.mean(), self.losses.mean())
+
+        n = self.count - 1  # 已有的有效涨跌幅个数
+        if 1 <= n <= self.period:
+            self._seed_gain += gain
+            self._seed_loss += loss
+            if n == self.period:
+                self.avg_gain = self._seed_gain / self.period
+                self.avg_loss = self._seed_loss / self.period
+        elif n > self.period:
+            a = 1 / self.period
+            self.avg_gain = self.avg_gain + a * (gain - self.avg_gain)
+            self.avg_loss = self.avg_loss + a * (loss - self.avg_loss)
+        return self._rsi(self.avg_gain, self.avg_loss)
+
+    def clone(self) -> "RSIState":
+        other = copy.copy(self)
+        if not self.wilder:
+            other.gains, other.losses = self.gains.clone(), self.losses.clone()
+        return other
+
+    @staticmethod
+    def _rsi(avg_gain: float, avg_loss: float) -> float:
+        if avg_loss != avg_loss or avg_gain != avg_gain or avg_loss == 0:
+            return math.nan
+        return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+class IndicatorState:
+    """
+    calculate_indicators 全部指标的最新值，随新 K 线增量更新:
+    from_frame() 回放一次历史作为种子，此后 update() 每根 K 线 O(1)；
+    同一时间戳再次 update (未走完的 K 线) 时替换最后一根而不是追加
+    """
+
+    MA_WINDOWS = (5, 10, 20, 60)
+
+    def __init__(self):
+        self.ma = {w: RollingWindow(w) for w in self.MA_WINDOWS}
+        self.vol_ma = {w: RollingWindow(w) for w in (5, 10)}
+        self.rsi14 = RSIState(14)
+        self.ema12, self.ema26, self.macd_signal = EMAState(span=12), EMAState(span=26), EMAState(span=9)
+        self.low9, self.high9 = RollingExtreme(9, "min"), RollingExtreme(9, "max")
+        self.k, self.d = EMAState(com=2), EMAState(com=2)
+        self.last_ts = None
+        self.latest: Dict[str, float] = {}
+        self._before_last: Optional["IndicatorState"] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "IndicatorState":
+        state = cls()
+        cols = [column(df, c).to_numpy(dtype=np.float64) for c in ("high", "low", "close", "volume")]
+        rows = list(zip(df.index, *cols))
+        for row in rows[:-1]:
+            state._push(*row)
+        if rows:
+            state.update(*rows[-1])
+        return state
+
+    def update(self, ts, high: float, low: float, close: float, volume: float) -> Dict[str, float]:
+        if self.last_ts is not None and ts == self.last_ts and self._before_last is not None:
+            self._restore(self._before_last)
+        self._before_last = self._snapshot()
+        return self._push(ts, high, low, close, volume)
+
+    def _push(self, ts, high: float, low: float, close: float, volume: float) -> Dict[str, float]:
+        self.last_ts = ts
+        for w in self.ma.values():
+            w.push(close)
+        for w in self.vol_ma.values():
+            w.push(volume)
+        ma20, std20 = self.ma[20].mean(), self.ma[20].std()
+        rsi14 = self.rsi14.push(close)
+        line = self.ema12.push(close) - self.ema26.push(close)
+        signal = self.macd_signal.push(line)
+        self.low9.push(low)
+        self.high9.push(high)
+        low_n, span = self.low9.value(), self.high9.value() - self.low9.value()
+        rsv = (close - low_n) / span * 100 if span == span and span != 0 else math.nan
+        k = self.k.push(rsv)
+        d = self.d.push(k)
+
+        self.latest = {
+            **{f"ma{w}": self.ma[w].mean() for w in self.MA_WINDOWS},
+            "rsi14": rsi14,
+            "macd": line,
+            "macd_signal": signal,
+            "macd_hist": line - signal,
+            "boll_upper": ma20 + 2 * std20,
+            "boll_middle": ma20,
+            "boll_lower": ma20 - 2 * std20,
+            "kdj_k": k,
+            "kdj_d": d,
+            "kdj_j": 3 * k - 2 * d,
+            "vol_ma5": self.vol_ma[5].mean(),
+            "vol_ma10": self.vol_ma[10].mean(),
+            "close": close,
+            "volume": volume,
+        }
+        return self.latest
+
+    def _snapshot(self) -> "IndicatorState":
+        """追加新 K 线前的状态副本 (只含定长窗口，代价与历史长度无关)"""
+        saved = copy.copy(self)
+        for name, value in vars(self).items():
+            if name != "_before_last":
+                setattr(saved, name, _clone(value))
+        saved._before_last = None
+        return saved
+
+    def _restore(self, saved: "IndicatorState"):
+        for name, value in vars(saved).items():
+            if name != "_before_last":
+                setattr(self, name, _clone(value))
+
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    return value.clone() if hasattr(value, "clone") else value
@@ -0,0 +1,193 @@
+"""
+大模型回复缓存 - 相同输入不重复调用 DeepSeek
+
+- 键为 (规范化后的 messages, 模型, temperature, max_tokens) 的 SHA-256
+  规范化: 去掉首尾空白，连续空白合并为一个空格
+- TTL 由调用方按数据新鲜度给出: 基于 K 线的提示词在 K 线刷新后失效 (见 bar_ttl)
+- 进程内 LRU；配置 DEEPSEEK_CACHE_DIR 后同时写入磁盘 (每个键一个 JSON 文件)，重启或多进程可复用
+- single-flight: 相同提示词同时只发出一个请求，其余调用方等待同一结果
+- 统计命中率以及按 usage.total_tokens 累计的节省 token 数
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import get_settings
+from core.logger import logger
+from services.bar_store import timeframe_seconds
+from services.executors import run_io
+
+# call() -> (回复文本, usage)
+Caller = Callable[[], Awaitable[Tuple[str, Dict[str, Any]]]]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def prompt_key(messages: List[Dict[str, str]], model: str, temperature: float, max_tokens: int) -> str:
+    normalized = [[m["role"], _WHITESPACE.sub(" ", m["content"]).strip()] for m in messages]
+    raw = json.dumps([model, temperature, max_tokens, normalized], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def bar_ttl(timeframe: str = "1d") -> float:
+    """基于 K 线数据的回复有效期: 不超过一根 K 线周期，也不超过 K 线存储的刷新间隔"""
+    settings = get_settings()
+    return min(timeframe_seconds(timeframe), settings.BAR_STORE_MAX_AGE, settings.DEEPSEEK_CACHE_TTL)
+
+
+class LLMCache:
+    """回复缓存 (内存 LRU + 可选磁盘)，内存部分线程安全"""
+
+    def __init__(self, maxsize: int = 256, disk_dir: Optional[str] = None):
+        self.maxsize = maxsize
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.stats = {
+            "hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "errors": 0,
+            "tokens_saved": 0, "tokens_spent": 0,
+        }
+        # key -> (回复, 消耗 token 数, 过期时间 time.time())
+        self._entries: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    # ---------- 内存 ----------
+
+    def lookup(self, key: str) -> Optional[str]:
+        """读取内存中未过期的回复，命中计入节省的 token"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            content, tokens, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            self.stats["tokens_saved"] += tokens
+            return content
+
+    def _remember(self, key: str, content: str, tokens: int, expires_at: float):
+        with self._lock:
+            self._entries[key] = (content, tokens, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    # ---------- 磁盘 ----------
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_read(self, key: str) -> Optional[Tuple[str, int, float]]:
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() >= entry["expires_at"]:
+            return None
+        return entry["content"], entry["tokens"], entry["expires_at"]
+
+    def _disk_write(self, key: str, content: str, tokens: int, expires_at: float):
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"content": content, "tokens": tokens, "expires_at": expires_at}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"DeepSeek 缓存写入失败: {e}")
+
+    # ---------- 读写 ----------
+
+    async def get(self, key: str) -> Optional[str]:
+        """内存未命中时读磁盘，磁盘命中回填内存"""
+        content = self.lookup(key)
+        if content is not None or self.disk_dir is None:
+            return content
+        entry = await run_io(self._disk_read, key)
+        if entry is None:
+            return None
+        self._remember(key, *entry)
+        with self._lock:
+            self.stats["disk_hits"] += 1
+            self.stats["tokens_saved"] += entry[1]
+        return entry[0]
+
+    async def put(self, key: str, content: str, usage: Dict[str, Any], ttl: float) -> int:
+        """写入回复，返回本次消耗的 token 数"""
+        tokens = int((usage or {}).get("total_tokens") or 0)
+        expires_at = time.time() + ttl
+        self._remember(key, content, tokens, expires_at)
+        with self._lock:
+            self.stats["tokens_spent"] += tokens
+        if self.disk_dir is not None:
+            await run_io(self._disk_write, key, content, tokens, expires_at)
+        return tokens
+
+    async def fetch(self, key: str, ttl: float, call: Caller) -> str:
+        """读取缓存，未命中时调用 call 并写入；相同键的并发调用共用一次请求"""
+        content = await self.get(key)
+        if content is not None:
+            return content
+
+        loop = asyncio.get_running_loop()
+        future = self._inflight.get(key)
+        if future is not None and future.get_loop() is loop:
+            content, tokens = await asyncio.shield(future)
+            with self._lock:
+                self.stats["coalesced"] += 1
+                self.stats["tokens_saved"] += tokens
+            return content
+
+        future = self._inflight[key] = loop.create_future()
+        self.stats["misses"] += 1
+        try:
+            content, usage = await call()
+        except BaseException as e:
+            self.stats["errors"] += 1
+            # 发起请求的一方被取消时，等待者收到普通异常而不是被连带取消
+            future.set_exception(RuntimeError("DeepSeek 请求已取消") if isinstance(e, asyncio.CancelledError) else e)
+            future.exception()  # 无等待者时不再告警
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        tokens = await self.put(key, content, usage, ttl)
+        future.set_result((content, tokens))
+        return content
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        served = self.stats["hits"] + self.stats["disk_hits"] + self.stats["coalesced"]
+        total = served + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_rate": round(served / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = LLMCache(maxsize=settings.DEEPSEEK_CACHE_SIZE, disk_dir=settings.DEEPSEEK_CACHE_DIR or None)
+    return _cache
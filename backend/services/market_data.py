@@ -2,13 +2,25 @@
 市场数据服务 - 统一的市场数据获取接口
 支持 A股(yfinance) 和 加密货币(ccxt)
 """
+import asyncio
+import re
+
 import yfinance as yf
 import ccxt
+import ccxt.async_support as ccxt_async
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Set
+from config import get_settings
 from core.logger import logger
+from services.bar_store import get_bar_store, timeframe_seconds
+from services.bar_series import BarSeries, normalize_frame
+from services.quote_cache import get_quote_cache
+from services.executors import run_io
+from services import indicators as ind
+
+settings = get_settings()
 
 STOCK_SYMBOLS = {
     "沪深300": "000300.SS",
@@ -32,6 +44,8 @@ TOP_CRYPTO = [
 ]
 
 _exchanges: Dict[str, Any] = {}
+# 异步交易所实例绑定创建时的事件循环: name -> (exchange, loop)
+_async_exchanges: Dict[str, Any] = {}
 
 
 def _get_exchange(name: str = "binance"):
@@ -43,56 +57,153 @@ def _get_exchange(name: str = "binance"):
     return _exchanges[name]
 
 
+def _get_async_exchange(name: str = "binance"):
+    loop = asyncio.get_running_loop()
+    entry = _async_exchanges.get(name)
+    if entry is None or entry[1] is not loop:
+        cls = getattr(ccxt_async, name, None)
+        if cls is None:
+            raise ValueError(f"不支持的交易所: {name}")
+        ex = cls({"enableRateLimit": True, "timeout": int(settings.QUOTE_SYMBOL_TIMEOUT * 1000)})
+        entry = _async_exchanges[name] = (ex, loop)
+    return entry[0]
+
+
+async def close_async_exchanges():
+    """关闭当前事件循环上创建的异步交易所连接 (应用关闭时调用)"""
+    loop = asyncio.get_running_loop()
+    for name, (ex, ex_loop) in list(_async_exchanges.items()):
+        if ex_loop is loop:
+            try:
+                await ex.close()
+            except Exception as e:
+                logger.warning(f"关闭交易所连接失败 {name}: {e}")
+        _async_exchanges.pop(name, None)
+
+
 # ------------------------------------------------------------------
 # 股票
 # ------------------------------------------------------------------
 
 def get_stock_quote(symbol: str) -> Dict:
+    return get_quote_cache().get("stock", symbol, lambda: _fetch_stock_quote(symbol))
+
+
+def _stock_quote_from_history(symbol: str, hist: pd.DataFrame) -> Dict:
+    """由最近几日的日线 (统一结构，见 bar_series) 生成报价"""
+    if hist.empty:
+        return {"error": "无数据"}
+    latest = hist.iloc[-1]
+    prev = hist.iloc[-2] if len(hist) > 1 else latest
+    change = float(latest["close"] - prev["close"])
+    change_pct = change / float(prev["close"]) * 100
+    return {
+        "symbol": symbol,
+        "price": round(float(latest["close"]), 2),
+        "open": round(float(latest["open"]), 2),
+        "high": round(float(latest["high"]), 2),
+        "low": round(float(latest["low"]), 2),
+        "volume": int(latest["volume"]),
+        "change": round(change, 2),
+        "change_pct": round(change_pct, 2),
+        "timestamp": latest.name.isoformat(),
+    }
+
+
+def _fetch_stock_quote(symbol: str) -> Dict:
     try:
         ticker = yf.Ticker(symbol)
-        hist = ticker.history(period="5d")
-        if hist.empty:
-            return {"error": "无数据"}
-        latest = hist.iloc[-1]
-        prev = hist.iloc[-2] if len(hist) > 1 else latest
-        change = float(latest["Close"] - prev["Close"])
-        change_pct = change / float(prev["Close"]) * 100
-        return {
-            "symbol": symbol,
-            "price": round(float(latest["Close"]), 2),
-            "open": round(float(latest["Open"]), 2),
-            "high": round(float(latest["High"]), 2),
-            "low": round(float(latest["Low"]), 2),
-            "volume": int(latest["Volume"]),
-            "change": round(change, 2),
-            "change_pct": round(change_pct, 2),
-            "timestamp": latest.name.isoformat(),
-        }
+        return _stock_quote_from_history(symbol, normalize_frame(ticker.history(period="5d")))
     except Exception as e:
         logger.error(f"获取股票报价失败 {symbol}: {e}")
         return {"error": str(e)}
 
 
+def _period_start(period: str) -> pd.Timestamp:
+    """yfinance period (5d / 6mo / 1y / ytd / max) 对应的起始日期"""
+    today = pd.Timestamp.now().normalize()
+    if period == "max":
+        return pd.Timestamp("1970-01-01")
+    if period == "ytd":
+        return today.replace(month=1, day=1)
+    m = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if not m:
+        raise ValueError(f"不支持的数据周期: {period}")
+    n = int(m.group(1))
+    offset = {
+        "d": pd.DateOffset(days=n), "wk": pd.DateOffset(weeks=n),
+        "mo": pd.DateOffset(months=n), "y": pd.DateOffset(years=n),
+    }[m.group(2)]
+    return today - offset
+
+
+def _download_stock_history(symbol: str, period: str, since: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    """从 yfinance 下载日线: since 为空时按 period 整段下载，否则只下载 since 之后的部分"""
+    ticker = yf.Ticker(symbol)
+    if since is None:
+        df = ticker.history(period=period)
+    else:
+        df = ticker.history(start=since.strftime("%Y-%m-%d"))
+    return normalize_frame(df)
+
+
 def get_stock_history(symbol: str, period: str = "1y") -> pd.DataFrame:
     try:
-        ticker = yf.Ticker(symbol)
-        df = ticker.history(period=period)
-        df.index = df.index.tz_localize(None) if df.index.tz else df.index
+        if not settings.BAR_STORE_ENABLED:
+            return _download_stock_history(symbol, period)
+        df = get_bar_store().get(
+            symbol, "1d", "yfinance", _period_start(period),
+            lambda since: _download_stock_history(symbol, period, since),
+        )
         return df
     except Exception as e:
         logger.error(f"获取股票历史失败 {symbol}: {e}")
         return pd.DataFrame()
 
 
-def get_multiple_quotes(symbols: Optional[List[str]] = None) -> List[Dict]:
+def _download_stock_quotes(symbols: List[str]) -> Dict[str, Dict]:
+    """yfinance 多标的一次下载 (线程数受限, 每个标的单独超时)，返回成功的报价"""
+    data = yf.download(
+        symbols, period="5d", group_by="ticker", progress=False,
+        threads=min(settings.QUOTE_BATCH_CONCURRENCY, len(symbols)),
+        timeout=settings.QUOTE_SYMBOL_TIMEOUT,
+    )
+    quotes = {}
+    if data is None or data.empty:
+        return quotes
+    available = set(data.columns.get_level_values(0))
+    for sym in symbols:
+        if sym not in available:
+            continue
+        # 多市场混合下载时按日期并集对齐, 休市日为 NaN
+        q = _stock_quote_from_history(sym, normalize_frame(data[sym]).dropna(subset=["close"]))
+        if "error" not in q:
+            quotes[sym] = q
+    return quotes
+
+
+async def get_multiple_quotes(symbols: Optional[List[str]] = None) -> List[Dict]:
+    """批量报价: 先读缓存，缺失的标的合并为一次多标的下载"""
     if symbols is None:
         symbols = list(STOCK_SYMBOLS.values())
+    cache = get_quote_cache()
+    quotes = {s: q for s in symbols if (q := cache.peek("stock", s)) is not None}
+    missing = [s for s in dict.fromkeys(symbols) if s not in quotes]
+    if missing:
+        try:
+            fetched = await run_io(_download_stock_quotes, missing)
+        except Exception as e:
+            logger.error(f"批量获取股票报价失败: {e}")
+            fetched = {}
+        for sym, q in fetched.items():
+            cache.put("stock", sym, q)
+        quotes.update(fetched)
+
     results = []
     for sym in symbols:
-        q = get_stock_quote(sym)
-        if "error" not in q:
-            name = next((k for k, v in STOCK_SYMBOLS.items() if v == sym), sym)
-            q["name"] = name
+        if sym in quotes:
+            q = dict(quotes[sym])
+            q["name"] = next((k for k, v in STOCK_SYMBOLS.items() if v == sym), sym)
             results.append(q)
     return results
 
@@ -102,18 +213,25 @@ def get_multiple_quotes(symbols: Optional[List[str]] = None) -> List[Dict]:
 # ------------------------------------------------------------------
 
 def get_crypto_price(symbol: str = "BTC/USDT", exchange: str = "binance") -> Dict:
+    return get_quote_cache().get("crypto", f"{exchange}:{symbol}", lambda: _fetch_crypto_price(symbol, exchange))
+
+
+def _crypto_quote(symbol: str, ticker: Dict) -> Dict:
+    return {
+        "symbol": symbol,
+        "price": ticker.get("last", 0),
+        "high": ticker.get("high", 0),
+        "low": ticker.get("low", 0),
+        "volume": ticker.get("baseVolume", 0),
+        "change_pct": ticker.get("percentage", 0),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+def _fetch_crypto_price(symbol: str, exchange: str) -> Dict:
     try:
         ex = _get_exchange(exchange)
-        ticker = ex.fetch_ticker(symbol)
-        return {
-            "symbol": symbol,
-            "price": ticker.get("last", 0),
-            "high": ticker.get("high", 0),
-            "low": ticker.get("low", 0),
-            "volume": ticker.get("baseVolume", 0),
-            "change_pct": ticker.get("percentage", 0),
-            "timestamp": datetime.utcnow().isoformat(),
-        }
+        return _crypto_quote(symbol, ex.fetch_ticker(symbol))
     except Exception as e:
         logger.error(f"获取加密货币价格失败 {symbol}: {e}")
         return {"error": str(e)}
@@ -126,88 +244,162 @@ def get_crypto_history(
     exchange: str = "binance",
 ) -> pd.DataFrame:
     try:
-        ex = _get_exchange(exchange)
-        ohlcv = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-        df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
-        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-        df.set_index("timestamp", inplace=True)
-        return df
+        if not settings.BAR_STORE_ENABLED:
+            return _download_crypto_history(symbol, timeframe, limit, exchange)
+        df = get_bar_store().get(
+            symbol, timeframe, exchange, _crypto_history_start(timeframe, limit),
+            lambda since: _download_crypto_history(symbol, timeframe, limit, exchange, since),
+        )
+        return df.tail(limit)
     except Exception as e:
         logger.error(f"获取加密货币历史失败 {symbol}: {e}")
         return pd.DataFrame()
 
 
-def get_multiple_crypto_quotes(symbols: Optional[List[str]] = None) -> List[Dict]:
+def _crypto_history_start(timeframe: str, limit: int) -> pd.Timestamp:
+    """最近 limit 根 K 线的起始时间 (UTC, 无时区)"""
+    return pd.Timestamp.utcnow().tz_localize(None) - pd.Timedelta(seconds=limit * timeframe_seconds(timeframe))
+
+
+def _ohlcv_frame(ohlcv: List[List]) -> pd.DataFrame:
+    return BarSeries.from_ohlcv(ohlcv).to_pandas()
+
+
+def _download_crypto_history(
+    symbol: str,
+    timeframe: str,
+    limit: int,
+    exchange: str,
+    since: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    """从交易所下载 K 线: since 为空时取最近 limit 根，否则分页补齐 since 之后的全部 K 线"""
+    ex = _get_exchange(exchange)
+    if since is None:
+        ohlcv = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+    else:
+        ohlcv = []
+        cursor = since.value // 1_000_000
+        while True:
+            page = ex.fetch_ohlcv(symbol, timeframe=timeframe, since=cursor, limit=1000)
+            ohlcv.extend(page)
+            if len(page) < 1000 or page[-1][0] < cursor:
+                break
+            cursor = page[-1][0] + 1
+    return _ohlcv_frame(ohlcv)
+
+
+async def _fetch_crypto_tickers(symbols: List[str], exchange: str) -> Dict[str, Dict]:
+    """fetch_tickers 一次取回多个标的；不支持或失败时按有限并发逐个获取，每个标的单独超时"""
+    ex = _get_async_exchange(exchange)
+    tickers: Dict[str, Dict] = {}
+    if ex.has.get("fetchTickers"):
+        try:
+            tickers = await asyncio.wait_for(ex.fetch_tickers(symbols), settings.QUOTE_SYMBOL_TIMEOUT * 2)
+        except Exception as e:
+            logger.warning(f"批量获取行情失败, 改为逐个获取: {e}")
+
+    semaphore = asyncio.Semaphore(settings.QUOTE_BATCH_CONCURRENCY)
+
+    async def fetch_one(symbol: str) -> Optional[Dict]:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(ex.fetch_ticker(symbol), settings.QUOTE_SYMBOL_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"获取加密货币价格失败 {symbol}: {e!r}")
+                return None
+
+    rest = [s for s in symbols if s not in tickers]
+    for symbol, ticker in zip(rest, await asyncio.gather(*(fetch_one(s) for s in rest))):
+        if ticker:
+            tickers[symbol] = ticker
+    return tickers
+
+
+async def get_multiple_crypto_quotes(symbols: Optional[List[str]] = None, exchange: str = "binance") -> List[Dict]:
+    """批量报价: 先读缓存，缺失的标的合并为一次 fetch_tickers"""
     if symbols is None:
         symbols = TOP_CRYPTO
-    results = []
-    for sym in symbols:
-        q = get_crypto_price(sym)
-        if "error" not in q:
-            results.append(q)
-    return results
+    cache = get_quote_cache()
+    quotes = {s: q for s in symbols if (q := cache.peek("crypto", f"{exchange}:{s}")) is not None}
+    missing = [s for s in dict.fromkeys(symbols) if s not in quotes]
+    if missing:
+        try:
+            tickers = await _fetch_crypto_tickers(missing, exchange)
+        except Exception as e:
+            logger.error(f"批量获取加密货币价格失败: {e}")
+            tickers = {}
+        for sym, ticker in tickers.items():
+            q = quotes[sym] = _crypto_quote(sym, ticker)
+            cache.put("crypto", f"{exchange}:{sym}", q)
+    return [dict(quotes[s]) for s in symbols if s in quotes]
+
+
+async def get_crypto_markets(exchange: str = "binance") -> Set[str]:
+    """交易所支持的交易对 (ccxt 在连接上缓存，只在首次调用时请求交易所)"""
+    return set(await _get_async_exchange(exchange).load_markets())
 
 
 # ------------------------------------------------------------------
 # 技术指标计算 (统一接口)
 # ------------------------------------------------------------------
 
-def calculate_indicators(df: pd.DataFrame) -> Dict[str, Any]:
-    """对一个 OHLCV DataFrame 计算全量技术指标"""
-    if df.empty or len(df) < 20:
-        return {}
-
-    close = df["close"] if "close" in df.columns else df["Close"]
-    high = df["high"] if "high" in df.columns else df["High"]
-    low = df["low"] if "low" in df.columns else df["Low"]
-    volume = df["volume"] if "volume" in df.columns else df["Volume"]
-
-    result: Dict[str, Any] = {}
+def indicator_arrays(df: pd.DataFrame, cache: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+    """全量技术指标的数组版本 (与 K 线等长，未满窗口处为 NaN)"""
+    result: Dict[str, np.ndarray] = {}
 
     # MA
     for w in [5, 10, 20, 60]:
-        result[f"ma{w}"] = close.rolling(window=w).mean().tolist()
+        result[f"ma{w}"] = ind.sma(df, cache, w)
 
     # RSI
-    delta = close.diff()
-    gain = delta.where(delta > 0, 0.0).rolling(14).mean()
-    loss = (-delta.where(delta < 0, 0.0)).rolling(14).mean()
-    rs = gain / loss.replace(0, np.nan)
-    result["rsi14"] = (100 - 100 / (1 + rs)).tolist()
+    result["rsi14"] = ind.rsi(df, cache, 14)
 
     # MACD
-    ema12 = close.ewm(span=12, adjust=False).mean()
-    ema26 = close.ewm(span=26, adjust=False).mean()
-    macd_line = ema12 - ema26
-    signal_line = macd_line.ewm(span=9, adjust=False).mean()
-    result["macd"] = macd_line.tolist()
-    result["macd_signal"] = signal_line.tolist()
-    result["macd_hist"] = (macd_line - signal_line).tolist()
+    result["macd"], result["macd_signal"], result["macd_hist"] = ind.macd(df, cache)
 
     # Bollinger Bands
-    ma20 = close.rolling(20).mean()
-    std20 = close.rolling(20).std()
-    result["boll_upper"] = (ma20 + 2 * std20).tolist()
-    result["boll_middle"] = ma20.tolist()
-    result["boll_lower"] = (ma20 - 2 * std20).tolist()
+    result["boll_upper"], result["boll_middle"], result["boll_lower"] = ind.bollinger(df, cache, 20, 2)
 
     # KDJ
-    low_n = low.rolling(9).min()
-    high_n = high.rolling(9).max()
-    rsv = (close - low_n) / (high_n - low_n).replace(0, np.nan) * 100
-    k = rsv.ewm(com=2, adjust=False).mean()
-    d = k.ewm(com=2, adjust=False).mean()
-    j = 3 * k - 2 * d
-    result["kdj_k"] = k.tolist()
-    result["kdj_d"] = d.tolist()
-    result["kdj_j"] = j.tolist()
+    result["kdj_k"], result["kdj_d"], result["kdj_j"] = ind.kdj(df, cache)
 
     # Volume MA
-    result["vol_ma5"] = volume.rolling(5).mean().tolist()
-    result["vol_ma10"] = volume.rolling(10).mean().tolist()
+    result["vol_ma5"] = ind.sma(df, cache, 5, "volume")
+    result["vol_ma10"] = ind.sma(df, cache, 10, "volume")
+    return result
 
-    result["dates"] = [str(d)[:10] for d in df.index]
-    result["closes"] = close.tolist()
-    result["volumes"] = volume.tolist()
 
+def calculate_indicators(df: pd.DataFrame, cache: Optional[Dict] = None) -> Dict[str, Any]:
+    """对一个 OHLCV DataFrame 计算全量技术指标 (cache: 同一份 K 线共享的指标缓存，见 services.indicators)"""
+    if df.empty or len(df) < 20:
+        return {}
+
+    result: Dict[str, Any] = {k: v.tolist() for k, v in indicator_arrays(df, cache).items()}
+    result["dates"] = [str(d)[:10] for d in df.index]
+    result["closes"] = ind.close(df, cache).tolist()
+    result["volumes"] = ind.column(df, "volume").tolist()
     return result
+
+
+def candle_columns(
+    df: pd.DataFrame,
+    cache: Optional[Dict] = None,
+    date_chars: int = 10,
+    volume_decimals: Optional[int] = None,
+) -> Dict[str, Any]:
+    """K 线按字段输出数组 (整列运算)：价格保留 2 位小数，成交量 volume_decimals 为 None 时取整"""
+    columns: Dict[str, Any] = {"date": df.index.astype(str).str.slice(0, date_chars).tolist()}
+    for f in ("open", "high", "low", "close"):
+        columns[f] = np.round(ind.values(df, cache, f), 2)
+    volume = ind.values(df, cache, "volume")
+    columns["volume"] = (
+        np.nan_to_num(volume).astype(np.int64) if volume_decimals is None else np.round(volume, volume_decimals)
+    )
+    return columns
+
+
+def candle_rows(columns: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """列式 K 线转为逐根的字典列表"""
+    keys = list(columns)
+    values = [v if isinstance(v, list) else v.tolist() for v in columns.values()]
+    return [dict(zip(keys, row)) for row in zip(*values)]
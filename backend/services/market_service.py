@@ -0,0 +1,156 @@
+"""
+异步行情服务 - 路由统一 await 这里的函数，慢的上游调用不会卡住事件循环
+
+- 加密货币: 原生 ccxt.async_support；同一事件循环内相同的请求合并为一次上游调用
+- 股票: yfinance 在有上限的 IO 线程池中执行 (报价缓存自带线程级的请求合并)
+- 本地 K 线仓库的读写在 IO 线程池中执行；加密货币缺失的 K 线由事件循环上的异步客户端补齐
+- 已在实时行情流 (market_stream) 上的加密货币，报价和 K 线直接从内存返回
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import pandas as pd
+
+from config import get_settings
+from core.logger import logger
+from services.bar_store import get_bar_store
+from services.executors import run_io
+from services.quote_cache import get_quote_cache
+from services.market_stream import get_market_stream
+from services.market_data import (
+    get_stock_quote, get_stock_history,
+    _get_async_exchange, _crypto_quote, _crypto_history_start, _ohlcv_frame,
+)
+
+settings = get_settings()
+
+HISTORY_TIMEOUT = 60  # 单次 K 线补齐的最长等待 (秒)
+
+_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+_background: Set[asyncio.Task] = set()  # 后台刷新任务 (保留引用，避免执行中被回收)
+
+
+async def _single_flight(key: Tuple[str, str], factory: Callable[[], Awaitable[Any]]) -> Any:
+    """同一键同时只执行一次 factory，其余调用方等待同一结果 (调用方取消不影响其他等待者)"""
+    task = _inflight.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key, None) if _inflight.get(key) is t else None)
+    return await asyncio.shield(task)
+
+
+# ------------------------------------------------------------------
+# 股票
+# ------------------------------------------------------------------
+
+async def fetch_stock_quote(symbol: str) -> Dict:
+    return await run_io(get_stock_quote, symbol)
+
+
+async def fetch_stock_history(symbol: str, period: str = "1y") -> pd.DataFrame:
+    return await run_io(get_stock_history, symbol, period)
+
+
+# ------------------------------------------------------------------
+# 加密货币
+# ------------------------------------------------------------------
+
+async def fetch_crypto_price(symbol: str = "BTC/USDT", exchange: str = "binance") -> Dict:
+    live = get_market_stream().quote(symbol, exchange)
+    if live is not None:
+        return live
+    cache = get_quote_cache()
+    key = f"{exchange}:{symbol}"
+
+    async def load() -> Dict:
+        try:
+            ticker = await _get_async_exchange(exchange).fetch_ticker(symbol)
+        except Exception as e:
+            logger.error(f"获取加密货币价格失败 {symbol}: {e}")
+            return {"error": str(e)}
+        quote = _crypto_quote(symbol, ticker)
+        cache.put("crypto", key, quote)
+        return quote
+
+    value, state = cache.lookup("crypto", key)
+    if state == "fresh":
+        return value
+    if state == "stale":
+        # 先返回旧报价, 后台刷新
+        if ("crypto", key) not in _inflight:
+            task = asyncio.ensure_future(_single_flight(("crypto", key), load))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+        return value
+    return dict(await _single_flight(("crypto", key), load))
+
+
+async def _download_crypto_history(
+    symbol: str,
+    timeframe: str,
+    limit: int,
+    exchange: str,
+    since: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    """异步下载 K 线: since 为空时取最近 limit 根，否则分页补齐 since 之后的全部 K 线"""
+    ex = _get_async_exchange(exchange)
+    if since is None:
+        return _ohlcv_frame(await ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit))
+    ohlcv = []
+    cursor = since.value // 1_000_000
+    while True:
+        page = await ex.fetch_ohlcv(symbol, timeframe=timeframe, since=cursor, limit=1000)
+        ohlcv.extend(page)
+        if len(page) < 1000 or page[-1][0] < cursor:
+            break
+        cursor = page[-1][0] + 1
+    return _ohlcv_frame(ohlcv)
+
+
+async def fetch_crypto_history(
+    symbol: str = "BTC/USDT",
+    timeframe: str = "1d",
+    limit: int = 200,
+    exchange: str = "binance",
+) -> pd.DataFrame:
+    stream = get_market_stream()
+    live = stream.history(symbol, timeframe, limit, exchange)
+    if live is not None:
+        return live
+    try:
+        if not settings.BAR_STORE_ENABLED:
+            df = await _download_crypto_history(symbol, timeframe, limit, exchange)
+        else:
+            loop = asyncio.get_running_loop()
+
+            def fetch(since: Optional[pd.Timestamp]) -> pd.DataFrame:
+                # 在 IO 线程中被仓库回调: 把下载交回事件循环上的异步客户端执行
+                coro = _download_crypto_history(symbol, timeframe, limit, exchange, since)
+                return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout=HISTORY_TIMEOUT)
+
+            df = await run_io(
+                get_bar_store().get, symbol, timeframe, exchange, _crypto_history_start(timeframe, limit), fetch,
+            )
+        stream.seed(symbol, timeframe, exchange, df)
+        return df.tail(limit)
+    except Exception as e:
+        logger.error(f"获取加密货币历史失败 {symbol}: {e}")
+        return pd.DataFrame()
+
+
+# ------------------------------------------------------------------
+# 通用
+# ------------------------------------------------------------------
+
+async def fetch_quote(symbol: str, asset_type: str = "stock") -> Dict:
+    if asset_type == "crypto":
+        return await fetch_crypto_price(symbol)
+    return await fetch_stock_quote(symbol)
+
+
+async def fetch_daily_history(symbol: str, days: int = 1000, period: str = "5y") -> pd.DataFrame:
+    """日线历史: 含 "/" 的按加密货币处理 (取最近 days 根)，否则按股票处理 (取 period)"""
+    if "/" in symbol:
+        return await fetch_crypto_history(symbol, "1d", days)
+    return await fetch_stock_history(symbol, period)
@@ -0,0 +1,345 @@
+"""
+加密货币实时行情流 - 通过交易所 WebSocket (ccxt.pro) 订阅 ticker 和 K 线，最新行情保存在内存中
+
+- 每个 (标的, 周期) 一个定长 BarSeries，保存最近 MARKET_STREAM_BARS 根 K 线 (NumPy，追加 O(1) 均摊)，
+  未走完的 K 线随推送原地更新
+- 标的在流上持续更新 (最近 MARKET_STREAM_STALE 秒内收到过推送) 时:
+    fetch_crypto_price 直接返回最新 ticker；ticker 同时写入报价缓存，批量报价和同步接口一并命中
+    fetch_crypto_history 在缓冲区够长且与历史连续时直接切片返回，不再请求交易所
+- 缓冲区由 fetch_crypto_history 的结果补齐更早的历史 (seed)；断线造成缺口后等待下一次补齐
+- 每根 K 线增量更新 IndicatorState；报价 / K 线监听者 (告警引擎、推送) 在事件循环上同步回调
+- LocalFeed 为本地替身 (测试或离线时由调用方推送行情)，接口与 ccxt.pro 相同
+"""
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import ccxt.pro as ccxtpro
+import numpy as np
+import pandas as pd
+
+from config import get_settings
+from core.logger import logger
+from services.bar_series import BarSeries
+from services.bar_store import timeframe_seconds
+from services.indicators import IndicatorState
+from services.market_data import _crypto_quote
+from services.quote_cache import get_quote_cache
+
+RETRY_DELAY = 5  # 订阅出错后重试的等待 (秒)
+
+QuoteListener = Callable[[Dict[str, Any]], Any]
+BarListener = Callable[[str, str, Dict[str, float]], Any]
+
+
+class BarRing:
+    """一个 (标的, 周期) 的实时 K 线 (BarSeries，最多 capacity 根)，并记录是否与历史衔接"""
+
+    def __init__(self, capacity: int, step_ms: int):
+        self.capacity = capacity
+        self.step = np.timedelta64(step_ms, "ms")
+        self.bars = BarSeries(capacity)
+        self.contiguous = False  # 已与历史衔接且推送没有缺口
+
+    @property
+    def size(self) -> int:
+        return len(self.bars)
+
+    def push(self, row: Sequence[float]) -> bool:
+        """ccxt K 线 [毫秒时间戳, open, high, low, close, volume]: 追加或更新最后一根，早于最后一根的忽略"""
+        ts = np.datetime64(int(row[0]), "ms")
+        last = self.bars.last_ts
+        if not self.bars.push(ts, *row[1:6]):
+            return False
+        if last is not None and ts - last > self.step:
+            self.contiguous = False  # 断线期间漏掉了 K 线
+        return True
+
+    def seed(self, history: BarSeries):
+        """用历史 K 线补齐更早的部分 (时间戳相同时以推送为准)；历史之后的推送没有缺口即标记为连续"""
+        if len(history) == 0:
+            return
+        ts = np.concatenate((history.ts, self.bars.ts))
+        values = np.concatenate((history.values, self.bars.values), axis=1)
+        # 倒序后 unique 取每个时间戳最后出现的一行，即推送的那一行
+        _, idx = np.unique(ts[::-1], return_index=True)
+        keep = len(ts) - 1 - idx
+        ts, values = ts[keep], values[:, keep]
+        live = ts[ts >= history.ts[-1]]
+        self.contiguous = bool(np.all(np.diff(live) <= self.step))
+        self.bars = BarSeries.from_arrays(ts, values, self.capacity)
+
+    def frame(self, limit: Optional[int] = None) -> pd.DataFrame:
+        """最近 limit 根 K 线的 DataFrame (副本: 最后一根会随推送原地更新)"""
+        bars = self.bars if limit is None else self.bars.tail(limit)
+        return bars.copy().to_pandas()
+
+
+class _Series:
+    def __init__(self, capacity: int, timeframe: str):
+        self.ring = BarRing(capacity, timeframe_seconds(timeframe) * 1000)
+        self.indicators: Optional[IndicatorState] = None
+        self.updated_at = 0.0
+
+
+class ExchangeFeed:
+    """ccxt.pro WebSocket 行情 (在事件循环上创建，同一连接复用全部订阅)"""
+
+    def __init__(self, exchange: str):
+        cls = getattr(ccxtpro, exchange, None)
+        if cls is None:
+            raise ValueError(f"不支持的交易所: {exchange}")
+        self.client = cls({"enableRateLimit": True})
+
+    async def watch_ticker(self, symbol: str) -> Dict[str, Any]:
+        return await self.client.watch_ticker(symbol)
+
+    async def watch_ohlcv(self, symbol: str, timeframe: str) -> List[List[float]]:
+        return await self.client.watch_ohlcv(symbol, timeframe)
+
+    async def unwatch(self, symbol: str, timeframe: Optional[str]):
+        """退订 (交易所不支持时只停止读取)"""
+        try:
+            if timeframe is None:
+                await self.client.un_watch_ticker(symbol)
+            else:
+                await self.client.un_watch_ohlcv(symbol, timeframe)
+        except Exception as e:
+            logger.debug(f"退订实时行情 {symbol} {timeframe or 'ticker'} 失败: {e}")
+
+    async def close(self):
+        await self.client.close()
+
+
+class LocalFeed:
+    """本地替身: push_ticker / push_kline 推入的行情按顺序交给订阅方"""
+
+    def __init__(self):
+        self._queues: Dict[Tuple[str, Optional[str]], asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    def push_ticker(self, symbol: str, ticker: Dict[str, Any]):
+        self._queues[(symbol, None)].put_nowait(ticker)
+
+    def push_kline(self, symbol: str, timeframe: str, *rows: Sequence[float]):
+        self._queues[(symbol, timeframe)].put_nowait([list(r) for r in rows])
+
+    async def watch_ticker(self, symbol: str) -> Dict[str, Any]:
+        return await self._queues[(symbol, None)].get()
+
+    async def watch_ohlcv(self, symbol: str, timeframe: str) -> List[List[float]]:
+        return await self._queues[(symbol, timeframe)].get()
+
+    async def unwatch(self, symbol: str, timeframe: Optional[str]):
+        self._queues.pop((symbol, timeframe), None)
+
+    async def close(self):
+        pass
+
+
+class MarketStream:
+    """单个交易所的行情流，由 main.lifespan 启停；未启动时各查询都返回 None，调用方照常走 REST"""
+
+    def __init__(
+        self,
+        exchange: str = "binance",
+        timeframes: Iterable[str] = ("1m",),
+        capacity: int = 1000,
+        stale_after: float = 30,
+        feed: Any = None,
+    ):
+        self.exchange = exchange
+        self.timeframes = tuple(timeframes)
+        self.capacity = capacity
+        self.stale_after = stale_after
+        self.feed = feed
+        self.running = False
+        self.stats = {"tickers": 0, "bars": 0, "gaps": 0, "quote_hits": 0, "history_hits": 0,
+                      "history_misses": 0, "errors": 0}
+        self._quotes: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._tasks: Dict[Tuple[str, Optional[str]], asyncio.Task] = {}
+        self._unwatching: Set[asyncio.Task] = set()
+        self._quote_listeners: List[QuoteListener] = []
+        self._bar_listeners: List[BarListener] = []
+
+    # ---------- 订阅 ----------
+
+    def start(self, symbols: Iterable[str] = ()):
+        if self.feed is None:
+            self.feed = ExchangeFeed(self.exchange)
+        self.running = True
+        self.subscribe(symbols)
+
+    def subscribe(self, symbols: Iterable[str]):
+        """订阅标的的 ticker 和各周期 K 线 (已订阅的忽略)，需在 start() 之后调用"""
+        for symbol in symbols:
+            if (symbol, None) in self._tasks:
+                continue
+            self._tasks[(symbol, None)] = asyncio.create_task(self._watch(symbol, None))
+            for tf in self.timeframes:
+                self._series[(symbol, tf)] = _Series(self.capacity, tf)
+                self._tasks[(symbol, tf)] = asyncio.create_task(self._watch(symbol, tf))
+            logger.info(f"订阅实时行情 {self.exchange}:{symbol}")
+
+    def unsubscribe(self, symbols: Iterable[str]):
+        """退订标的: 停止订阅任务并丢弃其报价和 K 线缓冲"""
+        for symbol in symbols:
+            task = self._tasks.pop((symbol, None), None)
+            if task is None:
+                continue
+            task.cancel()
+            self._unwatch(symbol, None)
+            self._quotes.pop(symbol, None)
+            for tf in self.timeframes:
+                self._tasks.pop((symbol, tf)).cancel()
+                self._series.pop((symbol, tf), None)
+                self._unwatch(symbol, tf)
+            logger.info(f"退订实时行情 {self.exchange}:{symbol}")
+
+    def _unwatch(self, symbol: str, timeframe: Optional[str]):
+        unwatch = getattr(self.feed, "unwatch", None)
+        if unwatch is not None:
+            task = asyncio.ensure_future(unwatch(symbol, timeframe))
+            self._unwatching.add(task)
+            task.add_done_callback(self._unwatching.discard)
+
+    def subscribed(self, symbol: str) -> bool:
+        return (symbol, None) in self._tasks
+
+    async def stop(self):
+        self.running = False
+        tasks = [*self._tasks.values(), *self._unwatching]
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.feed is not None:
+            try:
+                await self.feed.close()
+            except Exception as e:
+                logger.warning(f"关闭行情流失败: {e}")
+
+    async def _watch(self, symbol: str, timeframe: Optional[str]):
+        while True:
+            try:
+                if timeframe is None:
+                    self.on_ticker(symbol, await self.feed.watch_ticker(symbol))
+                else:
+                    self.on_klines(symbol, timeframe, await self.feed.watch_ohlcv(symbol, timeframe))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"实时行情 {symbol} {timeframe or 'ticker'} 订阅出错, {RETRY_DELAY}s 后重试: {e}")
+                await asyncio.sleep(RETRY_DELAY)
+
+    # ---------- 推送处理 ----------
+
+    def on_ticker(self, symbol: str, ticker: Dict[str, Any]):
+        quote = _crypto_quote(symbol, ticker)
+        self._quotes[symbol] = (quote, time.monotonic())
+        get_quote_cache().put("crypto", f"{self.exchange}:{symbol}", quote)
+        self.stats["tickers"] += 1
+        for listener in self._quote_listeners:
+            self._notify(listener, dict(quote))
+
+    def on_klines(self, symbol: str, timeframe: str, rows: List[List[float]]):
+        series = self._series.get((symbol, timeframe))
+        if series is None:
+            return
+        ring = series.ring
+        for row in rows:
+            was_contiguous = ring.contiguous
+            if not ring.push(row):
+                continue
+            self.stats["bars"] += 1
+            if was_contiguous and not ring.contiguous:
+                self.stats["gaps"] += 1
+            if series.indicators is None:
+                series.indicators = IndicatorState()
+            series.indicators.update(pd.Timestamp(int(row[0]), unit="ms"), row[2], row[3], row[4], row[5])
+        series.updated_at = time.monotonic()
+        if series.indicators is not None:
+            for listener in self._bar_listeners:
+                self._notify(listener, symbol, timeframe, dict(series.indicators.latest))
+
+    def _notify(self, listener: Callable, *args):
+        try:
+            listener(*args)
+        except Exception as e:
+            logger.error(f"实时行情监听者出错: {e}")
+
+    def add_quote_listener(self, listener: QuoteListener):
+        self._quote_listeners.append(listener)
+
+    def add_bar_listener(self, listener: BarListener):
+        self._bar_listeners.append(listener)
+
+    # ---------- 查询 ----------
+
+    def _fresh(self, updated_at: float) -> bool:
+        return time.monotonic() - updated_at < self.stale_after
+
+    def is_live(self, symbol: str, exchange: str = "binance") -> bool:
+        entry = self._quotes.get(symbol)
+        return exchange == self.exchange and entry is not None and self._fresh(entry[1])
+
+    def quote(self, symbol: str, exchange: str = "binance") -> Optional[Dict[str, Any]]:
+        """流上最新的报价 (副本)；未订阅或已断流时返回 None"""
+        if not self.is_live(symbol, exchange):
+            return None
+        self.stats["quote_hits"] += 1
+        return dict(self._quotes[symbol][0])
+
+    def history(self, symbol: str, timeframe: str, limit: int, exchange: str = "binance") -> Optional[pd.DataFrame]:
+        """最近 limit 根 K 线；缓冲区不够长、与历史不连续或已断流时返回 None"""
+        series = self._series.get((symbol, timeframe))
+        if exchange != self.exchange or series is None:
+            return None
+        ring = series.ring
+        if not (ring.contiguous and ring.size >= limit and self._fresh(series.updated_at)):
+            self.stats["history_misses"] += 1
+            return None
+        self.stats["history_hits"] += 1
+        return ring.frame(limit)
+
+    def seed(self, symbol: str, timeframe: str, exchange: str, df: pd.DataFrame):
+        """用 REST / 本地仓库取回的 K 线补齐缓冲区，并据此重建指标状态"""
+        series = self._series.get((symbol, timeframe))
+        if exchange != self.exchange or series is None or df.empty or series.ring.contiguous:
+            return
+        series.ring.seed(BarSeries.from_frame(df))
+        series.indicators = IndicatorState.from_frame(series.ring.frame())
+
+    def indicators(self, symbol: str, timeframe: str) -> Optional[Dict[str, float]]:
+        series = self._series.get((symbol, timeframe))
+        if series is None or series.indicators is None:
+            return None
+        return dict(series.indicators.latest)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "exchange": self.exchange,
+            "symbols": sum(1 for _, tf in self._tasks if tf is None),
+            "live": sum(1 for s in self._quotes if self.is_live(s, self.exchange)),
+            "bars_resident": sum(s.ring.size for s in self._series.values()),
+            "bytes": sum(s.ring.bars.nbytes for s in self._series.values()),
+        }
+
+
+_stream: Optional[MarketStream] = None
+
+
+def get_market_stream() -> MarketStream:
+    global _stream
+    if _stream is None:
+        settings = get_settings()
+        _stream = MarketStream(
+            exchange=settings.MARKET_STREAM_EXCHANGE,
+            timeframes=settings.MARKET_STREAM_TIMEFRAMES,
+            capacity=settings.MARKET_STREAM_BARS,
+            stale_after=settings.MARKET_STREAM_STALE,
+        )
+    return _stream
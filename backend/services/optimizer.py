@@ -0,0 +1,300 @@
+"""
+策略参数寻优 (网格搜索)
+
+- K 线只下载一次，整张参数网格在同一份数据上回测
+- 参数组合切块后提交到进程池并行评估；同一块内的组合共享指标缓存
+  (例如 ma_cross 的每个均线窗口只计算一次)
+- 每完成一块即更新任务进度和排行，可随时取消，可通过 SSE 推送部分结果
+"""
+import asyncio
+import itertools
+import math
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+from services.backtest_engine import run_backtest, STRATEGY_GENERATORS
+from services.executors import get_process_pool, shutdown_executors, POOL_WORKERS
+from core.logger import logger
+
+MAX_COMBINATIONS = 5000
+JOB_TTL_SECONDS = 3600
+
+SORTABLE_METRICS = {
+    "total_return", "annual_return", "sharpe_ratio", "max_drawdown", "max_drawdown_duration",
+    "win_rate", "profit_factor", "total_trades", "final_value",
+}
+# 越小越好的指标，其余指标按降序排名
+ASCENDING_METRICS = {"max_drawdown", "max_drawdown_duration"}
+
+_jobs: Dict[str, "OptimizationJob"] = {}
+
+
+def shutdown_process_pool():
+    """取消进行中的寻优任务并关闭共享执行器 (应用关闭时调用)"""
+    for job in _jobs.values():
+        job.cancel()
+    shutdown_executors()
+
+
+# ------------------------------------------------------------------
+# 参数网格
+# ------------------------------------------------------------------
+
+def _range_count(name: str, spec: Dict[str, Any]) -> int:
+    """{"start", "stop", "step"} 闭区间的取值个数 (不展开)"""
+    start, stop, step = spec.get("start"), spec.get("stop"), spec.get("step", 1)
+    numeric = all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) for v in (start, stop, step))
+    if not numeric or step <= 0:
+        raise ValueError(f"参数 {name} 的区间定义无效: {spec}")
+    return max(int(math.floor((stop - start) / step + 1e-9)) + 1, 0)
+
+
+def _axis_length(name: str, spec: Any) -> int:
+    if isinstance(spec, dict):
+        return _range_count(name, spec)
+    if isinstance(spec, (list, tuple)):
+        return len(spec)
+    return 1
+
+
+def _expand_values(name: str, spec: Any) -> List[Any]:
+    """参数取值: 列表, 单值, 或 {"start", "stop", "step"} 闭区间"""
+    if isinstance(spec, dict):
+        start, step = spec["start"], spec.get("step", 1)
+        values = [start + i * step for i in range(_range_count(name, spec))]
+        if all(isinstance(v, int) for v in (start, spec["stop"], step)):
+            return values
+        return [round(v, 10) for v in values]
+    if isinstance(spec, (list, tuple)):
+        return list(spec)
+    return [spec]
+
+
+def expand_grid(
+    param_grid: Dict[str, Any],
+    fixed_params: Optional[Dict[str, Any]] = None,
+    limit: int = MAX_COMBINATIONS,
+) -> List[Dict[str, Any]]:
+    """
+    展开参数网格为参数组合列表，自动跳过 fast_period >= slow_period 之类的无效组合
+    先按各轴取值个数之积检查组合数，超过 limit 时直接拒绝，不构造任何取值
+    """
+    names = list(param_grid)
+    size = math.prod(_axis_length(n, param_grid[n]) for n in names)
+    if size > limit:
+        raise ValueError(f"参数组合过多: {size} > {limit}")
+    axes = [_expand_values(n, param_grid[n]) for n in names]
+    combos = []
+    for values in itertools.product(*axes):
+        params = {**(fixed_params or {}), **dict(zip(names, values))}
+        if "fast_period" in params and "slow_period" in params and params["fast_period"] >= params["slow_period"]:
+            continue
+        combos.append(params)
+    return combos
+
+
+# ------------------------------------------------------------------
+# 进程池任务 (模块级函数，需可 pickle)
+# ------------------------------------------------------------------
+
+def _evaluate_chunk(
+    df: pd.DataFrame,
+    strategy_type: str,
+    combos: List[Dict[str, Any]],
+    initial_capital: float,
+    commission_rate: float,
+    slippage: float,
+) -> List[Dict[str, Any]]:
+    cache: Dict = {}
+    rows = []
+    for params in combos:
+        try:
+            r = run_backtest(
+                df, strategy_type, params,
+                initial_capital=initial_capital,
+                commission_rate=commission_rate,
+                slippage=slippage,
+                cache=cache,
+                include_curves=False,
+            )
+        except Exception as e:
+            r = {"error": str(e)}
+        rows.append({"params": params, **r})
+    return rows
+
+
+# ------------------------------------------------------------------
+# 寻优任务
+# ------------------------------------------------------------------
+
+class OptimizationJob:
+    """一次网格寻优任务，保存进度和已完成的结果"""
+
+    def __init__(self, user_id: Any, strategy_type: str, symbol: str, combos: List[Dict[str, Any]], sort_by: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.user_id = user_id
+        self.strategy_type = strategy_type
+        self.symbol = symbol
+        self.combos = combos
+        self.sort_by = sort_by
+        self.status = "running"  # running / done / cancelled / error
+        self.error = ""
+        self.results: List[Dict[str, Any]] = []
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._futures: List[Future] = []
+        self._task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def total(self) -> int:
+        return len(self.combos)
+
+    @property
+    def completed(self) -> int:
+        return len(self.results)
+
+    @property
+    def finished(self) -> bool:
+        return self.status != "running"
+
+    def _notify(self):
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    async def wait_for_update(self, seen: int, timeout: float = 15.0):
+        """等待新结果或任务结束 (超时返回, 便于推送心跳)"""
+        event = self._changed
+        if self.completed != seen or self.finished:
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def cancel(self) -> bool:
+        if self.finished:
+            return False
+        for f in self._futures:
+            f.cancel()
+        self._finish("cancelled")
+        logger.info(f"参数寻优已取消: {self.id} ({self.completed}/{self.total})")
+        return True
+
+    def _finish(self, status: str, error: str = ""):
+        if self.finished:
+            return
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self._notify()
+
+    def ranking(self, top_n: Optional[int] = None, sort_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按指标排名 (出错的组合排在最后)；top_n 为 None 时返回全部，0 时不返回"""
+        key = sort_by or self.sort_by
+        valid = [r for r in self.results if "error" not in r and r.get(key) is not None]
+        ranked = sorted(valid, key=lambda r: r[key], reverse=key not in ASCENDING_METRICS)
+        ranked += [r for r in self.results if "error" in r or r.get(key) is None]
+        rows = ranked if top_n is None else ranked[:top_n]
+        return [{"rank": i + 1, **r} for i, r in enumerate(rows)]
+
+    def summary(self, top_n: Optional[int] = 50) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "strategy_type": self.strategy_type,
+            "symbol": self.symbol,
+            "status": self.status,
+            "error": self.error,
+            "total": self.total,
+            "completed": self.completed,
+            "progress": round(self.completed / self.total * 100, 1) if self.total else 100.0,
+            "sort_by": self.sort_by,
+            "elapsed": round((self.finished_at or time.time()) - self.created_at, 2),
+            "results": self.ranking(top_n),
+        }
+
+
+def _chunk_size(total: int, workers: int) -> int:
+    # 块越大共享的指标越多，块越小部分结果返回越及时
+    return max(1, min(50, math.ceil(total / (workers * 4))))
+
+
+async def _run_job(
+    job: OptimizationJob,
+    df: pd.DataFrame,
+    initial_capital: float,
+    commission_rate: float,
+    slippage: float,
+):
+    pool = get_process_pool()
+    size = _chunk_size(job.total, POOL_WORKERS)
+    try:
+        job._futures = [
+            pool.submit(
+                _evaluate_chunk, df, job.strategy_type, job.combos[i:i + size],
+                initial_capital, commission_rate, slippage,
+            )
+            for i in range(0, job.total, size)
+        ]
+        for fut in asyncio.as_completed([asyncio.wrap_future(f) for f in job._futures]):
+            if job.finished:
+                break
+            try:
+                rows = await fut
+            except asyncio.CancelledError:
+                if job.finished:
+                    break
+                raise
+            job.results.extend(rows)
+            job._notify()
+        job._finish("done")
+        logger.info(f"参数寻优完成: {job.strategy_type} on {job.symbol}, {job.completed} 组, 耗时 {time.time() - job.created_at:.1f}s")
+    except Exception as e:
+        logger.error(f"参数寻优失败 {job.id}: {e}")
+        job._finish("error", str(e))
+
+
+def start_optimization(
+    user_id: Any,
+    df: pd.DataFrame,
+    strategy_type: str,
+    symbol: str,
+    param_grid: Dict[str, Any],
+    fixed_params: Optional[Dict[str, Any]] = None,
+    initial_capital: float = 1_000_000,
+    commission_rate: float = 0.001,
+    slippage: float = 0.001,
+    sort_by: str = "sharpe_ratio",
+) -> OptimizationJob:
+    """创建并在后台启动寻优任务 (需在事件循环中调用)"""
+    if strategy_type not in STRATEGY_GENERATORS:
+        raise ValueError(f"不支持的策略类型: {strategy_type}")
+    if sort_by not in SORTABLE_METRICS:
+        raise ValueError(f"不支持的排序指标: {sort_by}")
+    combos = expand_grid(param_grid, fixed_params)
+    if not combos:
+        raise ValueError("参数网格为空")
+
+    _cleanup_jobs()
+    job = OptimizationJob(user_id, strategy_type, symbol, combos, sort_by)
+    _jobs[job.id] = job
+    job._task = asyncio.create_task(_run_job(job, df, initial_capital, commission_rate, slippage))
+    logger.info(f"参数寻优开始: {strategy_type} on {symbol}, {len(combos)} 组参数")
+    return job
+
+
+def get_job(job_id: str, user_id: Any = None) -> Optional[OptimizationJob]:
+    job = _jobs.get(job_id)
+    if job is None or (user_id is not None and job.user_id != user_id):
+        return None
+    return job
+
+
+def _cleanup_jobs():
+    now = time.time()
+    for job_id in [j.id for j in _jobs.values() if j.finished and now - j.finished_at > JOB_TTL_SECONDS]:
+        _jobs.pop(job_id, None)
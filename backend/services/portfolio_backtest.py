@@ -0,0 +1,257 @@
+"""
+多标的组合回测
+
+- 多个 OHLCV 按统一日历 (日期并集) 对齐成 时间 × 标的 的二维数组
+- 复用 STRATEGY_GENERATORS，对所有标的一次性整列生成信号
+- 每个标的一个资金子账户 (sleeve)，按"成交点乘法收益"模型整列计算权益；
+  支持等权 / 自定义权重分配和定期再平衡
+
+与单标的 run_backtest 的差异:
+- 按资金比例持仓 (允许零股)，不做整数股取整
+- 某标的停牌/休市的 K 线用前收盘价补齐用于估值和指标，但不允许在这些 K 线上成交
+"""
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.backtest_engine import (
+    STRATEGY_GENERATORS, BUY, SELL,
+    _resolve_position, _max_drawdown, _sharpe_ratio, _monthly_returns, _bar_days,
+)
+from core.logger import logger
+
+FIELDS = ("open", "high", "low", "close", "volume")
+REBALANCE_PERIODS = {"none": None, "weekly": "W", "monthly": "M", "quarterly": "Q"}
+MAX_SYMBOLS = 500
+
+
+def align_frames(frames: Dict[str, pd.DataFrame]) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    按日期并集对齐多个 OHLCV，返回 (字段, 标的) 两级列的宽表和可交易掩码 (时间 × 标的)
+
+    上市前的 K 线保持 NaN；上市后缺失的 K 线 (停牌/休市) 用前收盘价补齐，成交量记 0。
+    """
+    symbols = list(frames)
+    normalized = []
+    for sym in symbols:
+        df = frames[sym]
+        normalized.append(df[~df.index.duplicated(keep="last")])
+
+    index = normalized[0].index
+    for df in normalized[1:]:
+        if not index.equals(df.index):
+            index = index.union(df.index)
+    index = index.sort_values()
+
+    t, n = len(index), len(symbols)
+    data = np.full((len(FIELDS), t, n), np.nan)
+    for j, df in enumerate(normalized):
+        rows = index.get_indexer(df.index)
+        data[:, rows, j] = df[list(FIELDS)].to_numpy(dtype=np.float64).T
+
+    close = data[FIELDS.index("close")]
+    tradable = ~np.isnan(close)
+    # 前向填充收盘价: 每个位置取最近一根有效 K 线
+    last_valid = np.maximum.accumulate(np.where(tradable, np.arange(t)[:, None], 0), axis=0)
+    filled = close[last_valid, np.arange(n)]
+    for k, f in enumerate(FIELDS):
+        if f == "volume":
+            data[k][~tradable] = 0.0
+        else:
+            data[k] = np.where(tradable, data[k], filled)
+
+    columns = pd.MultiIndex.from_product([FIELDS, symbols])
+    panel = pd.DataFrame(data.transpose(1, 0, 2).reshape(t, -1), index=index, columns=columns)
+    return panel, tradable
+
+
+def _period_ends(bar_days: np.ndarray, period: str) -> np.ndarray:
+    """每个再平衡周期最后一根 K 线的下标 (不含整段回测的最后一根)"""
+    if period == "W":
+        # 1970-01-01 是周四, 平移后按周一起算
+        keys = (bar_days.astype(np.int64) + 3) // 7
+    else:
+        keys = bar_days.astype("datetime64[M]").astype(np.int64)
+        if period == "Q":
+            keys = keys // 3
+    return np.flatnonzero(keys[1:] != keys[:-1])
+
+
+def _sleeve_growth(
+    close: np.ndarray,
+    signals: np.ndarray,
+    position_pct: float,
+    commission_rate: float,
+    slippage: float,
+) -> Dict[str, np.ndarray]:
+    """
+    每个子账户的净值增长指数 G (初值 1)
+
+    入场时 position_pct 的资金按含滑点和手续费的成本价买入，其余留作现金；
+    一笔完整交易的净值乘数只取决于入场/出场价格，因此整列累乘即可得到净值。
+    """
+    t, n = close.shape
+    entries = signals == BUY
+    exits = signals == SELL
+    held = np.cumsum(signals, axis=0, dtype=np.int16) > 0
+
+    rows = np.arange(t)[:, None]
+    cols = np.arange(n)[None, :]
+    last_entry = np.maximum.accumulate(np.where(entries, rows, 0), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        basis = (close * (1 + slippage) * (1 + commission_rate))[last_entry, cols]
+        mark = (1 - position_pct) + position_pct * close / basis
+        exit_mark = (1 - position_pct) + position_pct * close * (1 - slippage) * (1 - commission_rate) / basis
+        # 回测结束时仍持仓: 按最后收盘价扣手续费平仓
+        final_mark = (1 - position_pct) + position_pct * close[-1] * (1 - commission_rate) / basis[-1]
+
+    trip = np.where(exits, exit_mark, 1.0)
+    trip[-1] = np.where(held[-1], final_mark, trip[-1])
+    closed = np.cumprod(trip, axis=0)
+    growth = closed * np.where(held, mark, 1.0)
+    growth[-1] = closed[-1]
+
+    invested = np.where(held, position_pct * close / basis / mark, 0.0)
+    trips = exits.copy()
+    trips[-1] |= held[-1]
+    return {"growth": growth, "invested": invested, "trip": trip, "trips": trips, "held": held}
+
+
+def _allocate(
+    growth: np.ndarray,
+    invested: np.ndarray,
+    weights: np.ndarray,
+    initial_capital: float,
+    rebalance_idx: np.ndarray,
+    cost_rate: float,
+) -> np.ndarray:
+    """按权重分配资金并在再平衡点重置各子账户，返回 时间 × 标的 的子账户权益"""
+    t = growth.shape[0]
+    sleeves = np.empty_like(growth)
+    start_values = initial_capital * weights
+    prev = 0
+    for end in list(rebalance_idx) + [t - 1]:
+        seg = slice(prev, end + 1)
+        sleeves[seg] = start_values * (growth[seg] / growth[prev])
+        if end < t - 1:
+            total = sleeves[end].sum()
+            target = total * weights
+            # 只有持仓部分的增减需要真实交易, 现金划转不计成本
+            cost = float((np.abs(target - sleeves[end]) * invested[end]).sum() * cost_rate)
+            start_values = (total - cost) * weights
+            sleeves[end] = start_values
+        prev = end
+    return sleeves
+
+
+def run_portfolio_backtest(
+    frames: Dict[str, pd.DataFrame],
+    strategy_type: str,
+    params: Dict[str, Any],
+    initial_capital: float = 1_000_000,
+    commission_rate: float = 0.001,
+    slippage: float = 0.001,
+    weights: Optional[Dict[str, float]] = None,
+    rebalance: str = "none",
+    position_pct: float = 0.95,
+    include_symbol_curves: bool = True,
+) -> Dict[str, Any]:
+    """执行多标的组合回测"""
+    if strategy_type not in STRATEGY_GENERATORS:
+        return {"error": f"不支持的策略类型: {strategy_type}"}
+    if rebalance not in REBALANCE_PERIODS:
+        return {"error": f"不支持的再平衡周期: {rebalance}，支持: {list(REBALANCE_PERIODS)}"}
+    frames = {s: df for s, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return {"error": "无可用数据"}
+    if len(frames) > MAX_SYMBOLS:
+        return {"error": f"标的数量过多: {len(frames)} > {MAX_SYMBOLS}"}
+
+    panel, tradable = align_frames(frames)
+    if len(panel) < 30:
+        return {"error": "数据不足，至少需要30条K线"}
+    symbols = list(frames)
+
+    w = np.array([(weights or {}).get(s, 0.0 if weights else 1.0) for s in symbols], dtype=np.float64)
+    if w.sum() <= 0:
+        return {"error": "权重之和必须大于 0"}
+    w = w / w.sum()
+
+    series = STRATEGY_GENERATORS[strategy_type](panel, params)
+    if series.entries is not None:
+        entries, exits = series.entries, series.exits
+    else:
+        entries, exits = series.signals == BUY, series.signals == SELL
+    signals = _resolve_position(entries & tradable, exits & tradable)
+
+    close = panel["close"].to_numpy(dtype=np.float64)
+    sleeve = _sleeve_growth(close, signals, position_pct, commission_rate, slippage)
+
+    bar_days = _bar_days(panel.index)
+    period = REBALANCE_PERIODS[rebalance]
+    rebalance_idx = _period_ends(bar_days, period) if period else np.array([], dtype=np.int64)
+    sleeves = _allocate(
+        sleeve["growth"], sleeve["invested"], w, initial_capital,
+        rebalance_idx, commission_rate + slippage,
+    )
+    equity = sleeves.sum(axis=1)
+
+    max_dd, max_dd_duration = _max_drawdown(equity)
+    values = np.round(equity, 2)
+    final_value = float(equity[-1])
+    total_return = final_value / initial_capital - 1
+    days = max(int((bar_days[-1] - bar_days[0]).astype(np.int64)), 1)
+    annual_return = (1 + total_return) ** (365 / days) - 1
+
+    # 各标的策略表现 (按子账户净值指数, 不受再平衡资金流影响)
+    growth = sleeve["growth"]
+    peak = np.maximum.accumulate(growth, axis=0)
+    symbol_dd = ((peak - growth) / peak).max(axis=0)
+    trips = sleeve["trips"]
+    trade_counts = trips.sum(axis=0)
+    win_counts = (trips & (sleeve["trip"] > 1)).sum(axis=0)
+    listed = tradable.sum(axis=0)
+
+    symbol_stats = [
+        {
+            "symbol": sym,
+            "weight": round(float(w[j]) * 100, 2),
+            "bars": int(listed[j]),
+            "total_return": round(float(growth[-1, j] - 1) * 100, 2),
+            "max_drawdown": round(float(symbol_dd[j]) * 100, 2),
+            "total_trades": int(trade_counts[j]),
+            "win_rate": round(float(win_counts[j]) / max(int(trade_counts[j]), 1) * 100, 2),
+            "final_value": round(float(sleeves[-1, j]), 2),
+        }
+        for j, sym in enumerate(symbols)
+    ]
+
+    dates = np.datetime_as_string(bar_days, unit="D").tolist()
+    running_max = np.maximum.accumulate(values)
+    drawdown = np.round((running_max - values) / running_max * 100, 2)
+
+    result = {
+        "symbols": symbols,
+        "strategy_type": strategy_type,
+        "rebalance": rebalance,
+        "total_return": round(total_return * 100, 2),
+        "annual_return": round(annual_return * 100, 2),
+        "sharpe_ratio": round(_sharpe_ratio(values), 2),
+        "max_drawdown": round(max_dd * 100, 2),
+        "max_drawdown_duration": max_dd_duration,
+        "total_trades": int(trade_counts.sum()),
+        "rebalance_count": len(rebalance_idx),
+        "final_value": round(final_value, 2),
+        "equity_curve": [{"date": d, "value": v} for d, v in zip(dates, values.tolist())],
+        "drawdown_curve": [{"date": d, "drawdown": v} for d, v in zip(dates, drawdown.tolist())],
+        "monthly_returns": _monthly_returns(values, bar_days),
+        "symbol_stats": symbol_stats,
+    }
+    if include_symbol_curves:
+        result["symbol_equity"] = {
+            "dates": dates,
+            "values": dict(zip(symbols, np.round(sleeves, 2).T.tolist())),
+        }
+    logger.info(f"组合回测完成: {strategy_type} x {len(symbols)} 标的, {len(dates)} 根K线, return={result['total_return']}%")
+    return result
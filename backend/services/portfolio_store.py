@@ -0,0 +1,184 @@
+"""
+组合 / 持仓 / 成交的数据访问
+
+- 组合列表连同持仓一次查询 (PostgREST 外键嵌入)，不再按组合逐个查持仓
+- 成交通过数据库函数 apply_trade 在一个事务、一次请求内完成:
+  持仓、组合现金与市值、成交记录，以及 Agent 决策状态与会话统计
+  (函数定义见 supabase/migrations/20261017000000_apply_trade.sql)
+- 数据库尚未创建该函数时退回逐条请求的实现，语义相同但没有事务保护
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+from core.logger import logger
+from database import get_supabase
+
+
+class TradeRejected(Exception):
+    """成交被拒绝 (资金或持仓不足等)，message 为给用户看的原因"""
+
+
+_REASONS = {
+    "invalid_trade": "价格或数量无效",
+    "portfolio_not_found": "组合不存在",
+    "no_position": "无持仓",
+    "insufficient_position": "持仓不足",
+    "insufficient_cash": "资金不足",
+}
+
+_rpc_available = True
+
+
+def list_portfolios_with_positions(user_id: int) -> List[Dict[str, Any]]:
+    """用户的全部组合，每个组合带 positions 列表"""
+    result = (
+        get_supabase().table("portfolios")
+        .select("*, positions(*)")
+        .eq("user_id", user_id)
+        .order("created_at", desc=True)
+        .execute()
+    )
+    return result.data or []
+
+
+def apply_trade(
+    portfolio_id: int,
+    symbol: str,
+    direction: str,
+    quantity: float,
+    price: float,
+    commission_rate: float,
+    stop_loss: Optional[float] = None,
+    take_profit: Optional[float] = None,
+    note: Optional[str] = None,
+    allow_partial: bool = False,
+    decision_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    成交一笔模拟交易，返回 trades 记录
+    allow_partial: 卖出数量超过持仓时按持仓数量成交 (否则拒绝)
+    decision_id: Agent 决策 id，同时把决策标记为已执行并累计会话统计
+    拒绝时抛出 TradeRejected
+    """
+    global _rpc_available
+    params = {
+        "p_portfolio_id": portfolio_id,
+        "p_symbol": symbol,
+        "p_direction": direction,
+        "p_quantity": quantity,
+        "p_price": price,
+        "p_commission_rate": commission_rate,
+        "p_stop_loss": stop_loss,
+        "p_take_profit": take_profit,
+        "p_note": note,
+        "p_allow_partial": allow_partial,
+        "p_decision_id": decision_id,
+    }
+    if _rpc_available:
+        try:
+            return get_supabase().rpc("apply_trade", params).execute().data
+        except APIError as e:
+            if e.message in _REASONS:
+                raise TradeRejected(_REASONS[e.message]) from None
+            if e.code != "PGRST202":  # PGRST202: 函数不存在
+                raise
+            _rpc_available = False
+            logger.warning("数据库未创建 apply_trade 函数，成交改为逐条请求 (无事务保护)")
+    return _apply_trade_sequential(**params)
+
+
+def _apply_trade_sequential(
+    p_portfolio_id, p_symbol, p_direction, p_quantity, p_price, p_commission_rate,
+    p_stop_loss=None, p_take_profit=None, p_note=None, p_allow_partial=False, p_decision_id=None,
+) -> Dict[str, Any]:
+    """apply_trade 函数的逐条请求版本"""
+    sb = get_supabase()
+    if p_direction not in ("buy", "sell") or p_quantity <= 0 or p_price <= 0:
+        raise TradeRejected(_REASONS["invalid_trade"])
+    pf = (sb.table("portfolios").select("*").eq("id", p_portfolio_id).execute().data or [None])[0]
+    if pf is None:
+        raise TradeRejected(_REASONS["portfolio_not_found"])
+    pos = (sb.table("positions").select("*").eq("portfolio_id", p_portfolio_id).eq("symbol", p_symbol).execute().data or [None])[0]
+
+    qty, pnl = p_quantity, None
+    if p_direction == "sell":
+        if pos is None or pos["quantity"] <= 0:
+            raise TradeRejected(_REASONS["no_position"])
+        if pos["quantity"] < qty:
+            if not p_allow_partial:
+                raise TradeRejected(_REASONS["insufficient_position"])
+            qty = pos["quantity"]
+
+    amount = p_price * qty
+    commission = amount * p_commission_rate
+
+    if p_direction == "buy":
+        if pf["cash_balance"] < amount + commission:
+            raise TradeRejected(_REASONS["insufficient_cash"])
+        cash = pf["cash_balance"] - amount - commission
+        if pos is None:
+            sb.table("positions").insert({
+                "portfolio_id": p_portfolio_id, "symbol": p_symbol,
+                "asset_type": "crypto" if "/" in p_symbol else "stock",
+                "quantity": qty, "avg_cost": p_price, "current_price": p_price,
+                "market_value": round(qty * p_price, 2), "unrealized_pnl": 0, "unrealized_pnl_pct": 0,
+                "stop_loss": p_stop_loss, "take_profit": p_take_profit,
+            }).execute()
+        else:
+            new_qty = pos["quantity"] + qty
+            avg = (pos["avg_cost"] * pos["quantity"] + p_price * qty) / new_qty
+            update = {
+                "quantity": new_qty, "avg_cost": round(avg, 4), "current_price": p_price,
+                "market_value": round(new_qty * p_price, 2),
+                "unrealized_pnl": round(new_qty * (p_price - avg), 2),
+                "unrealized_pnl_pct": round((p_price - avg) / avg * 100, 2) if avg > 0 else 0,
+            }
+            if p_stop_loss is not None:
+                update["stop_loss"] = p_stop_loss
+            if p_take_profit is not None:
+                update["take_profit"] = p_take_profit
+            sb.table("positions").update(update).eq("id", pos["id"]).execute()
+    else:
+        pnl = (p_price - pos["avg_cost"]) * qty - commission
+        cash = pf["cash_balance"] + amount - commission
+        new_qty = pos["quantity"] - qty
+        if new_qty <= 0:
+            sb.table("positions").delete().eq("id", pos["id"]).execute()
+        else:
+            sb.table("positions").update({
+                "quantity": new_qty, "current_price": p_price,
+                "market_value": round(new_qty * p_price, 2),
+                "unrealized_pnl": round(new_qty * (p_price - pos["avg_cost"]), 2),
+            }).eq("id", pos["id"]).execute()
+
+    remaining = sb.table("positions").select("market_value").eq("portfolio_id", p_portfolio_id).execute().data or []
+    value = cash + sum(p["market_value"] or 0 for p in remaining)
+    initial = pf["initial_capital"]
+    sb.table("portfolios").update({
+        "cash_balance": round(cash, 2),
+        "current_value": round(value, 2),
+        "total_pnl": round(value - initial, 2),
+        "total_pnl_pct": round((value - initial) / initial * 100, 2) if initial > 0 else 0,
+    }).eq("id", p_portfolio_id).execute()
+
+    trade = sb.table("trades").insert({
+        "portfolio_id": p_portfolio_id, "symbol": p_symbol, "direction": p_direction,
+        "quantity": qty, "price": p_price, "total_amount": round(amount, 2),
+        "commission": round(commission, 2), "status": "filled",
+        "pnl": round(pnl, 2) if pnl is not None else None, "note": p_note,
+    }).execute().data[0]
+
+    if p_decision_id is not None:
+        decision = sb.table("agent_decisions").update({
+            "status": "executed", "trade_id": trade["id"], "executed_at": datetime.now(timezone.utc).isoformat(),
+        }).eq("id", p_decision_id).execute().data[0]
+        session = sb.table("agent_sessions").select("*").eq("id", decision["session_id"]).execute().data[0]
+        sb.table("agent_sessions").update({
+            "total_trades": (session.get("total_trades") or 0) + 1,
+            "total_pnl": (session.get("total_pnl") or 0) + (pnl or 0),
+            "win_trades": (session.get("win_trades") or 0) + (1 if pnl is not None and pnl > 0 else 0),
+            "lose_trades": (session.get("lose_trades") or 0) + (1 if pnl is not None and pnl <= 0 else 0),
+        }).eq("id", session["id"]).execute()
+    return trade
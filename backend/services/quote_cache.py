@@ -0,0 +1,170 @@
+"""
+实时报价缓存 - 进程内 TTL + LRU，合并并发的相同请求
+
+- 按资产类别设置 TTL (股票报价变化慢，加密货币快)
+- single-flight: 同一键同时只有一个上游请求，其余调用方等待同一结果
+- 容量满时淘汰最久未使用的键
+- stale-while-revalidate: 过期不久的报价先直接返回，同时在后台刷新
+- 上游返回错误 ({"error": ...}) 时不缓存
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import get_settings
+from core.logger import logger
+
+Loader = Callable[[], Dict[str, Any]]
+
+
+class QuoteCache:
+    """线程安全的报价缓存"""
+
+    def __init__(
+        self,
+        ttl: Dict[str, float],
+        maxsize: int = 1024,
+        stale_seconds: float = 0,
+        wait_timeout: float = 30,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_seconds = stale_seconds
+        self.wait_timeout = wait_timeout
+        self.stats = {"hits": 0, "misses": 0, "stale_hits": 0, "coalesced": 0, "evictions": 0, "errors": 0}
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._refresher: Optional[ThreadPoolExecutor] = None
+
+    def get(self, asset_class: str, key: str, loader: Loader) -> Dict[str, Any]:
+        """读取报价；缓存未命中时调用 loader，返回值为副本，调用方可放心修改"""
+        k = (asset_class, key)
+        ttl = self.ttl.get(asset_class, 0)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is not None:
+                value, fetched_at = entry
+                age = time.monotonic() - fetched_at
+                if age < ttl:
+                    self._entries.move_to_end(k)
+                    self.stats["hits"] += 1
+                    return dict(value)
+                if age < ttl + self.stale_seconds:
+                    self._entries.move_to_end(k)
+                    self.stats["stale_hits"] += 1
+                    if k not in self._inflight:
+                        self._inflight[k] = Future()
+                        self._background().submit(self._load, k, loader)
+                    return dict(value)
+
+            future = self._inflight.get(k)
+            leader = future is None
+            if leader:
+                future = self._inflight[k] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            self._load(k, loader)
+        try:
+            return dict(future.result(timeout=self.wait_timeout))
+        except Exception as e:
+            return {"error": str(e)}
+
+    def peek(self, asset_class: str, key: str) -> Optional[Dict[str, Any]]:
+        """只读未过期的缓存 (不触发上游请求)，未命中返回 None"""
+        k = (asset_class, key)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is None or time.monotonic() - entry[1] >= self.ttl.get(asset_class, 0):
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(k)
+            self.stats["hits"] += 1
+            return dict(entry[0])
+
+    def lookup(self, asset_class: str, key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """不触发上游请求的查询 (供异步调用方自行合并请求)，返回 (报价副本, fresh / stale / miss)"""
+        k = (asset_class, key)
+        ttl = self.ttl.get(asset_class, 0)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is not None:
+                age = time.monotonic() - entry[1]
+                if age < ttl + self.stale_seconds:
+                    self._entries.move_to_end(k)
+                    state = "fresh" if age < ttl else "stale"
+                    self.stats["hits" if state == "fresh" else "stale_hits"] += 1
+                    return dict(entry[0]), state
+            self.stats["misses"] += 1
+            return None, "miss"
+
+    def put(self, asset_class: str, key: str, value: Dict[str, Any]):
+        """写入批量接口取回的报价"""
+        with self._lock:
+            self._store((asset_class, key), value)
+
+    def _store(self, k: Tuple[str, str], value: Dict[str, Any]):
+        self._entries[k] = (dict(value), time.monotonic())
+        self._entries.move_to_end(k)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _load(self, k: Tuple[str, str], loader: Loader):
+        """调用上游并唤醒所有等待者 (同一键的 Future 在 _inflight 中登记)"""
+        try:
+            value = loader()
+        except Exception as e:
+            logger.error(f"报价加载失败 {k[1]}: {e}")
+            value = {"error": str(e)}
+        with self._lock:
+            future = self._inflight.pop(k)
+            if "error" in value:
+                self.stats["errors"] += 1
+            else:
+                self._store(k, value)
+        future.set_result(value)
+
+    def _background(self) -> ThreadPoolExecutor:
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix="quote-refresh")
+        return self._refresher
+
+    def invalidate(self, asset_class: Optional[str] = None, key: Optional[str] = None):
+        with self._lock:
+            if asset_class is None:
+                self._entries.clear()
+            elif key is not None:
+                self._entries.pop((asset_class, key), None)
+            else:
+                for k in [k for k in self._entries if k[0] == asset_class]:
+                    del self._entries[k]
+
+    def get_stats(self) -> Dict[str, Any]:
+        served = self.stats["hits"] + self.stats["stale_hits"] + self.stats["coalesced"]
+        total = served + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_rate": round(served / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[QuoteCache] = None
+
+
+def get_quote_cache() -> QuoteCache:
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = QuoteCache(
+            ttl={"stock": settings.QUOTE_TTL_STOCK, "crypto": settings.QUOTE_TTL_CRYPTO},
+            maxsize=settings.QUOTE_CACHE_SIZE,
+            stale_seconds=settings.QUOTE_STALE_SECONDS,
+        )
+    return _cache
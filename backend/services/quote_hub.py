@@ -0,0 +1,269 @@
+"""
+行情推送中心 - WebSocket 客户端按标的订阅，同一份上游行情只获取一次，再以差量分发给全部订阅者
+
+- 上游与客户端数量无关:
+    已在实时行情流上的加密货币直接由 market_stream 推送 (客户端订阅时自动加入行情流)
+    其余标的由后台任务每 QUOTE_HUB_POLL_INTERVAL 秒批量拉取一次 (走报价缓存)，
+    日线指标在新订阅时及每 QUOTE_HUB_BAR_INTERVAL 秒重算一次
+- 每个标的记录上一次发布的字段，只发布变化的字段 (价格、涨跌幅与最新指标值，扁平结构)
+- 订阅前校验标的: 加密货币须为交易所上存在的交易对 (市场列表加载失败时只允许主流币种和配置的标的)；
+  由推送中心加入行情流的标的在最后一个订阅者离开时退订，MARKET_STREAM_SYMBOLS 配置的标的保持订阅
+- 背压: 订阅者发送较慢时，同一标的尚未发出的差量就地合并 (只保留最新值)，积压量不超过订阅的标的数；
+  单次发送超过 QUOTE_HUB_SEND_TIMEOUT 秒的连接由路由断开
+"""
+import asyncio
+import math
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from config import get_settings
+from core.logger import logger
+from services.executors import run_io
+from services.indicators import IndicatorState
+from services.market_data import TOP_CRYPTO, get_crypto_markets, get_multiple_crypto_quotes, get_multiple_quotes
+from services.market_service import fetch_crypto_history, fetch_daily_history
+from services.market_stream import get_market_stream
+
+QUOTE_FIELDS = ("price", "change", "change_pct", "high", "low", "volume", "timestamp")
+INDICATOR_DAYS = 250  # 计算日线指标读取的 K 线数
+STOCK_SYMBOL = re.compile(r"^[A-Za-z0-9^][A-Za-z0-9.\-=^]{0,19}$")  # 股票 / 指数代码 (如 AAPL、600519.SS、^GSPC)
+
+
+def _clean(value: Any) -> Any:
+    """NaN 转为 None (JSON 不支持 NaN)，浮点保留 4 位小数"""
+    if isinstance(value, float):
+        return None if math.isnan(value) else round(value, 4)
+    return value
+
+
+def _quote_fields(quote: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _clean(quote[k]) for k in QUOTE_FIELDS if k in quote}
+
+
+def _indicator_fields(latest: Dict[str, float], timeframe: str) -> Dict[str, Any]:
+    fields = {k: _clean(float(v)) for k, v in latest.items() if k not in ("close", "volume")}
+    fields["timeframe"] = timeframe
+    return fields
+
+
+def _daily_indicators(df: pd.DataFrame) -> Dict[str, float]:
+    return IndicatorState.from_frame(df).latest if not df.empty else {}
+
+
+class Subscriber:
+    """一个 WebSocket 连接: 订阅的标的和尚未发出的差量 (按标的合并)"""
+
+    def __init__(self, hub: "QuoteHub"):
+        self.hub = hub
+        self.symbols: Set[str] = set()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._ready = asyncio.Event()
+
+    def offer(self, symbol: str, diff: Dict[str, Any]):
+        pending = self._pending.get(symbol)
+        if pending is None:
+            self._pending[symbol] = dict(diff)
+        else:
+            pending.update(diff)
+            self.hub.stats["conflated"] += 1
+        self._ready.set()
+
+    async def next_batch(self) -> Dict[str, Dict[str, Any]]:
+        """等待并取出全部待发送的差量 {标的: 变化的字段}"""
+        await self._ready.wait()
+        self._ready.clear()
+        batch, self._pending = self._pending, {}
+        return batch
+
+
+class QuoteHub:
+    """进程内推送中心，后台任务由 main.lifespan 启停"""
+
+    def __init__(self, poll_interval: float = 5, bar_interval: float = 300, send_timeout: float = 10):
+        self.poll_interval = poll_interval
+        self.bar_interval = bar_interval
+        self.send_timeout = send_timeout
+        self.stats = {"published": 0, "deliveries": 0, "conflated": 0, "polls": 0, "slow_disconnects": 0}
+        self._subs: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._need_indicators: Set[str] = set()
+        self._streamed: Set[str] = set()  # 由推送中心加入行情流的标的
+        self._task: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+    # ---------- 订阅 ----------
+
+    def connect(self) -> Subscriber:
+        return Subscriber(self)
+
+    async def validate(self, symbols: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """按是否可订阅拆分为 (有效, 无效) 两组"""
+        symbols = list(dict.fromkeys(symbols))
+        crypto = [s for s in symbols if "/" in s]
+        markets: Set[str] = set()
+        if crypto:
+            try:
+                markets = await get_crypto_markets(get_market_stream().exchange)
+            except Exception as e:
+                logger.warning(f"加载交易对列表失败, 只允许已知币种: {e}")
+                markets = set(TOP_CRYPTO) | set(get_settings().MARKET_STREAM_SYMBOLS)
+        valid, invalid = [], []
+        for s in symbols:
+            ok = s in markets if "/" in s else bool(STOCK_SYMBOL.match(s))
+            (valid if ok else invalid).append(s)
+        return valid, invalid
+
+    def subscribe(self, sub: Subscriber, symbols: Iterable[str]):
+        """订阅标的 (调用方先经 validate 过滤)，已有最新值的立即放入待发送 (作为快照)"""
+        stream = get_market_stream()
+        for symbol in symbols:
+            if symbol in sub.symbols:
+                continue
+            sub.symbols.add(symbol)
+            first = not self._subs[symbol]
+            self._subs[symbol].add(sub)
+            if symbol in self._state:
+                sub.offer(symbol, self._state[symbol])
+            if not first:
+                continue
+            if "/" in symbol and stream.running:
+                if not stream.subscribed(symbol):
+                    stream.subscribe([symbol])
+                    self._streamed.add(symbol)
+                    self._spawn(self._seed_stream(symbol))
+            else:
+                self._need_indicators.add(symbol)
+
+    def unsubscribe(self, sub: Subscriber, symbols: Iterable[str]):
+        for symbol in list(symbols):
+            sub.symbols.discard(symbol)
+            subs = self._subs.get(symbol)
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                del self._subs[symbol]
+                self._state.pop(symbol, None)
+                self._need_indicators.discard(symbol)
+                if symbol in self._streamed:
+                    self._streamed.discard(symbol)
+                    get_market_stream().unsubscribe([symbol])
+
+    def disconnect(self, sub: Subscriber):
+        self.unsubscribe(sub, sub.symbols)
+
+    def symbols(self) -> List[str]:
+        return list(self._subs)
+
+    # ---------- 发布 ----------
+
+    def publish(self, symbol: str, values: Dict[str, Any]):
+        """与上一次发布的值比较，只把变化的字段分发给该标的的订阅者"""
+        subs = self._subs.get(symbol)
+        if not subs:
+            return
+        state = self._state.setdefault(symbol, {})
+        diff = {k: v for k, v in values.items() if state.get(k, ...) != v}
+        if not diff:
+            return
+        state.update(diff)
+        self.stats["published"] += 1
+        self.stats["deliveries"] += len(subs)
+        for sub in subs:
+            sub.offer(symbol, diff)
+
+    def _on_stream_quote(self, quote: Dict[str, Any]):
+        self.publish(quote["symbol"], _quote_fields(quote))
+
+    def _on_stream_bar(self, symbol: str, timeframe: str, latest: Dict[str, float]):
+        if timeframe == get_market_stream().timeframes[0]:
+            self.publish(symbol, _indicator_fields(latest, timeframe))
+
+    # ---------- 上游 ----------
+
+    def start(self):
+        if self._task is None:
+            stream = get_market_stream()
+            stream.add_quote_listener(self._on_stream_quote)
+            stream.add_bar_listener(self._on_stream_bar)
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"行情推送已启动 (拉取间隔={self.poll_interval}s)")
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._background] if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _seed_stream(self, symbol: str):
+        """新加入行情流的标的先补齐历史 K 线，指标从第一根推送起即有效"""
+        stream = get_market_stream()
+        await fetch_crypto_history(symbol, stream.timeframes[0], stream.capacity, stream.exchange)
+
+    async def _run(self):
+        next_bars = time.monotonic() + self.bar_interval
+        while True:
+            try:
+                if time.monotonic() >= next_bars:
+                    next_bars = time.monotonic() + self.bar_interval
+                    self._need_indicators.update(self.symbols())
+                await self.poll()
+            except Exception as e:
+                logger.error(f"行情推送拉取失败: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def poll(self):
+        """拉取不在行情流上的标的报价 (每个标的一次，与订阅者数量无关)，并补算待更新的日线指标"""
+        stream = get_market_stream()
+        polled = [s for s in self._subs if not stream.is_live(s)]
+        if not polled:
+            return
+        self.stats["polls"] += 1
+        crypto = [s for s in polled if "/" in s]
+        stocks = [s for s in polled if "/" not in s]
+        quotes = []
+        if crypto:
+            quotes += await get_multiple_crypto_quotes(crypto)
+        if stocks:
+            quotes += await get_multiple_quotes(stocks)
+        for quote in quotes:
+            self.publish(quote["symbol"], _quote_fields(quote))
+
+        for symbol in [s for s in polled if s in self._need_indicators]:
+            self._need_indicators.discard(symbol)
+            df = await fetch_daily_history(symbol, days=INDICATOR_DAYS, period="1y")
+            latest = await run_io(_daily_indicators, df)
+            if latest:
+                self.publish(symbol, _indicator_fields(latest, "1d"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "symbols": len(self._subs),
+            "subscribers": len({sub for subs in self._subs.values() for sub in subs}),
+        }
+
+
+_hub: Optional[QuoteHub] = None
+
+
+def get_quote_hub() -> QuoteHub:
+    global _hub
+    if _hub is None:
+        settings = get_settings()
+        _hub = QuoteHub(
+            poll_interval=settings.QUOTE_HUB_POLL_INTERVAL,
+            bar_interval=settings.QUOTE_HUB_BAR_INTERVAL,
+            send_timeout=settings.QUOTE_HUB_SEND_TIMEOUT,
+        )
+    return _hub
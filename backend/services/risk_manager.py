@@ -4,15 +4,19 @@
 - 止损/止盈检查
 - 回撤监控
 - 风险评分
+- 批量风险指标 (收益率矩阵 时间 × 标的，一次向量化计算全部标的)
 """
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Sequence
 from config import get_settings
 from core.logger import logger
 
 settings = get_settings()
 
+TRADING_DAYS = 252
+HORIZONS = (20, 60, 252)  # 近 1 个月 / 1 个季度 / 1 年
+
 
 def check_position_size(
     portfolio_value: float,
@@ -68,37 +72,158 @@ def calculate_risk_metrics(equity_curve: List[float]) -> Dict[str, Any]:
     """基于权益曲线计算风险指标"""
     if len(equity_curve) < 2:
         return {}
-    series = pd.Series(equity_curve)
-    returns = series.pct_change().dropna()
+    curve = np.asarray(equity_curve, dtype=np.float64)
+    return risk_summary(batch_risk_metrics(curve[1:] / curve[:-1] - 1, min_obs=1))
+
+
+def returns_matrix(closes: Dict[str, pd.Series]) -> pd.DataFrame:
+    """各标的收盘价 -> 收益率矩阵 (时间 × 标的)
+
+    先在各自的日历上求收益再按时间并集对齐，休市 / 停牌处为 NaN，
+    不会因为对齐把假期前后的收益吞掉 (如股票与加密货币混排)
+    """
+    return pd.DataFrame({s: c.pct_change(fill_method=None).iloc[1:] for s, c in closes.items()})
+
+
+def batch_risk_metrics(
+    returns,
+    window: Optional[int] = None,
+    periods: int = TRADING_DAYS,
+    level: float = 0.95,
+    min_obs: int = 2,
+) -> Dict[str, np.ndarray]:
+    """收益率矩阵 (时间 × 标的) 上一次算出所有标的的风险指标
+
+    - NaN / inf 视为缺失，每个标的只用自己的有效观测
+    - window: 每个标的只取最近 window 个有效观测 (而不是最近 window 行，日历不同的标的口径一致)
+    - 返回 {指标: 长度为标的数的数组}，均为小数；有效观测少于 min_obs 的标的为 NaN
+    """
+    r = np.asarray(returns, dtype=np.float64)
+    if r.ndim == 1:
+        r = r[:, None]
+    valid = np.isfinite(r)
+    if window:
+        valid &= np.cumsum(valid[::-1], axis=0)[::-1] <= window
+    if len(r):
+        first = int(valid.any(axis=1).argmax())  # 窗口之前的行不参与计算
+        r, valid = r[first:], valid[first:]
+    x = np.where(valid, r, 0.0)
+    n = valid.sum(axis=0)
+    neg = valid & (x < 0)
+    n_neg = neg.sum(axis=0)
+    annual = np.sqrt(periods)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = x.sum(axis=0) / n
+        std = np.sqrt((np.where(valid, x - mean, 0.0) ** 2).sum(axis=0) / (n - 1))
+        neg_mean = np.where(neg, x, 0.0).sum(axis=0) / n_neg
+        downside = np.sqrt((np.where(neg, x - neg_mean, 0.0) ** 2).sum(axis=0) / (n_neg - 1))
+
+        # VaR: 与 np.percentile 相同的线性插值，缺失值排序后在末尾
+        ordered = np.sort(np.where(valid, x, np.nan), axis=0)
+        pos = np.clip((1 - level) * (n - 1), 0, None)
+        lo = np.floor(pos).astype(np.int64)[None, :]
+        hi = np.ceil(pos).astype(np.int64)[None, :]
+        low = np.take_along_axis(ordered, lo, axis=0)[0]
+        var = low + (pos - lo[0]) * (np.take_along_axis(ordered, hi, axis=0)[0] - low)
+        tail = ordered <= var
+        cvar = np.where(tail, ordered, 0.0).sum(axis=0) / tail.sum(axis=0)
+
+        equity = np.cumprod(1 + x, axis=0)
+        drawdown = 1 - equity / np.maximum(np.maximum.accumulate(equity, axis=0), 1.0)
+        win = (x > 0).sum(axis=0)
+
+        result = {
+            "observations": n,
+            "volatility": std * annual,
+            "sharpe_ratio": np.where(std > 0, mean / std * annual, 0.0),
+            "sortino_ratio": np.where(downside > 0, mean / downside * annual, 0.0),
+            "max_drawdown": drawdown.max(axis=0, initial=0.0),
+            "current_drawdown": drawdown[-1] if len(drawdown) else np.zeros(len(n)),
+            "var_95": var,
+            "cvar_95": cvar,
+            "total_return": equity[-1] - 1 if len(equity) else np.zeros(len(n)),
+            "win_days": win,
+            "lose_days": n_neg,
+            "daily_win_rate": win / n,
+        }
+    short = n < min_obs
+    for key, values in result.items():
+        if values.dtype.kind == "f":
+            values[short] = np.nan
+    return result
+
+
+def horizon_risk_metrics(
+    returns,
+    horizons: Sequence[int] = HORIZONS,
+    periods: int = TRADING_DAYS,
+) -> Dict[int, Dict[str, np.ndarray]]:
+    """多个回看窗口 (默认 20 / 60 / 252 个有效观测) 的批量风险指标"""
+    return {h: batch_risk_metrics(returns, window=h, periods=periods) for h in horizons}
+
+
+def rolling_risk_metrics(
+    returns,
+    window: int = 20,
+    periods: int = TRADING_DAYS,
+    min_obs: Optional[int] = None,
+) -> Dict[str, np.ndarray]:
+    """滚动波动率 / 夏普 / 索提诺序列 (时间 × 标的)
+
+    按行滚动 (累加和相减，O(时间 × 标的))，窗口内有效观测少于 min_obs (默认 window // 2)
+    或当行缺失的位置为 NaN
+    """
+    r = np.asarray(returns, dtype=np.float64)
+    if r.ndim == 1:
+        r = r[:, None]
+    valid = np.isfinite(r)
+    x = np.where(valid, r, 0.0)
+    neg = np.minimum(x, 0.0)
 
-    peak = series.cummax()
-    drawdown = (peak - series) / peak
-    max_dd = float(drawdown.max())
+    def rolling_sum(a):
+        c = np.cumsum(a, axis=0)
+        c[window:] = c[window:] - c[:-window]
+        return c
 
-    vol = float(returns.std() * np.sqrt(252))
-    sharpe = float(returns.mean() / returns.std() * np.sqrt(252)) if returns.std() > 0 else 0
+    n = rolling_sum(valid.astype(np.float64))
+    n_neg = rolling_sum((neg < 0).astype(np.float64))
+    s, sq = rolling_sum(x), rolling_sum(x * x)
+    ns, nsq = rolling_sum(neg), rolling_sum(neg * neg)
+    annual = np.sqrt(periods)
 
-    neg_returns = returns[returns < 0]
-    sortino = float(returns.mean() / neg_returns.std() * np.sqrt(252)) if len(neg_returns) > 0 and neg_returns.std() > 0 else 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = s / n
+        std = np.sqrt(np.maximum(sq - s * mean, 0.0) / (n - 1))
+        downside = np.sqrt(np.maximum(nsq - ns * ns / n_neg, 0.0) / (n_neg - 1))
+        result = {
+            "volatility": std * annual,
+            "sharpe_ratio": np.where(std > 0, mean / std * annual, 0.0),
+            "sortino_ratio": np.where(downside > 0, mean / downside * annual, 0.0),
+        }
+    hidden = ~valid | (n < max(min_obs or window // 2, 2))
+    for values in result.values():
+        values[hidden] = np.nan
+    return result
 
-    # VaR (95%)
-    var_95 = float(np.percentile(returns, 5))
 
-    # CVaR (95%)
-    cvar_95 = float(returns[returns <= var_95].mean()) if len(returns[returns <= var_95]) > 0 else var_95
+def risk_summary(metrics: Dict[str, np.ndarray], i: int = 0) -> Dict[str, Any]:
+    """批量结果中第 i 个标的 -> calculate_risk_metrics 的格式 (百分比，保留两位)"""
+    def pct(key):
+        return round(float(metrics[key][i]) * 100, 2)
 
     return {
-        "volatility": round(vol * 100, 2),
-        "sharpe_ratio": round(sharpe, 2),
-        "sortino_ratio": round(sortino, 2),
-        "max_drawdown": round(max_dd * 100, 2),
-        "current_drawdown": round(float(drawdown.iloc[-1]) * 100, 2),
-        "var_95": round(var_95 * 100, 2),
-        "cvar_95": round(cvar_95 * 100, 2),
-        "total_return": round(float((series.iloc[-1] / series.iloc[0] - 1) * 100), 2),
-        "win_days": int((returns > 0).sum()),
-        "lose_days": int((returns < 0).sum()),
-        "daily_win_rate": round(float((returns > 0).sum() / len(returns) * 100), 2),
+        "volatility": pct("volatility"),
+        "sharpe_ratio": round(float(metrics["sharpe_ratio"][i]), 2),
+        "sortino_ratio": round(float(metrics["sortino_ratio"][i]), 2),
+        "max_drawdown": pct("max_drawdown"),
+        "current_drawdown": pct("current_drawdown"),
+        "var_95": pct("var_95"),
+        "cvar_95": pct("cvar_95"),
+        "total_return": pct("total_return"),
+        "win_days": int(metrics["win_days"][i]),
+        "lose_days": int(metrics["lose_days"][i]),
+        "daily_win_rate": pct("daily_win_rate"),
     }
 
 
@@ -0,0 +1,90 @@
+"""
+已登录用户缓存 - get_current_user 不必每个请求都查 users 表
+
+- 键为 (用户 id, token 的 iat)，短 TTL + 容量上限 (LRU)
+- 修改资料 / 密码时 invalidate(user_id) 清掉该用户的全部条目，
+  并记下时间: 此前签发的 token 中携带的用户信息不再直接采用
+- AUTH_TOKEN_CLAIMS 开启时 token 自带 username / email / is_active，
+  大部分请求完全不访问数据库 (见 core.security.create_access_token)；
+  失效时间只记在本进程内存中 (重启丢失、多 worker 不共享)，其他进程签发前的旧 token 信息在过期前仍会被采用，
+  因此该模式只适用于单进程部署
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import get_settings
+
+Key = Tuple[int, int]
+
+
+class UserCache:
+    """线程安全的用户缓存"""
+
+    def __init__(self, ttl: float = 60, maxsize: int = 4096):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stats = {"hits": 0, "misses": 0, "claims": 0, "evictions": 0, "invalidations": 0}
+        self._entries: "OrderedDict[Key, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._invalidated_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, iat: int) -> Optional[Dict[str, Any]]:
+        """读取未过期的用户，返回副本；未命中返回 None (计入 misses)"""
+        key = (user_id, iat)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, user_id: int, iat: int, user: Dict[str, Any]):
+        with self._lock:
+            self._entries[(user_id, iat)] = (dict(user), time.monotonic() + self.ttl)
+            self._entries.move_to_end((user_id, iat))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def claims_valid(self, user_id: int, iat: int) -> bool:
+        """token 中的用户信息是否签发于最近一次资料变更之后"""
+        with self._lock:
+            valid = iat >= self._invalidated_at.get(user_id, 0)
+            if valid:
+                self.stats["claims"] += 1
+            return valid
+
+    def invalidate(self, user_id: int):
+        """用户资料或密码变更后调用"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+            # 同一秒内签发的新 token 也要生效，按整秒记录
+            self._invalidated_at[user_id] = int(time.time())
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        served = self.stats["hits"] + self.stats["claims"]
+        total = served + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_rate": round(served / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[UserCache] = None
+
+
+def get_user_cache() -> UserCache:
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = UserCache(ttl=settings.USER_CACHE_TTL, maxsize=settings.USER_CACHE_SIZE)
+    return _cache
@@ -0,0 +1,197 @@
+"""
+滚动窗口 (Walk-Forward) 回测
+
+- 在第 N 个训练窗口上网格寻优，用最优参数回测紧随其后的测试窗口，逐窗口向前滚动
+- K 线只加载一次；所有参数组合的指标先在整段 K 线上计算一次，
+  各窗口通过 run_backtest(window=...) 直接切片复用，不再逐窗口切 DataFrame 重算
+- 窗口分块提交到参数寻优共用的进程池并行执行
+- 输出每个窗口的训练/测试指标和拼接后的样本外权益曲线
+"""
+import asyncio
+import math
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.backtest_engine import (
+    run_backtest, STRATEGY_GENERATORS, _max_drawdown, _sharpe_ratio, _bar_days,
+)
+from services.optimizer import expand_grid, SORTABLE_METRICS, ASCENDING_METRICS
+from services.executors import get_process_pool, run_io, POOL_WORKERS
+from core.logger import logger
+
+MIN_WINDOW_BARS = 20
+MAX_WINDOWS = 200
+
+
+def build_windows(n: int, train_size: int, test_size: int, anchored: bool = False) -> List[Tuple[int, int, int, int]]:
+    """
+    生成 (train_start, train_end, test_start, test_end) 下标区间 (左闭右开)
+
+    测试窗口首尾相接、互不重叠；anchored=True 时训练窗口起点固定为 0 (扩张窗口)。
+    """
+    windows = []
+    test_start = train_size
+    while test_start + MIN_WINDOW_BARS <= n:
+        test_end = min(test_start + test_size, n)
+        train_start = 0 if anchored else test_start - train_size
+        windows.append((train_start, test_start, test_start, test_end))
+        test_start = test_end
+    return windows
+
+
+def _best_params(
+    df: pd.DataFrame,
+    strategy_type: str,
+    combos: List[Dict[str, Any]],
+    window: Tuple[int, int],
+    cache: Dict,
+    sort_by: str,
+    backtest_kwargs: Dict[str, Any],
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """训练窗口上的网格寻优，返回最优参数及其训练指标"""
+    best, best_result = None, {}
+    reverse = sort_by not in ASCENDING_METRICS
+    for params in combos:
+        r = run_backtest(df, strategy_type, params, cache=cache, include_curves=False, window=window, **backtest_kwargs)
+        if "error" in r:
+            continue
+        if best is None or (r[sort_by] > best_result[sort_by] if reverse else r[sort_by] < best_result[sort_by]):
+            best, best_result = params, r
+    return best, best_result
+
+
+def _evaluate_windows(
+    df: pd.DataFrame,
+    strategy_type: str,
+    combos: List[Dict[str, Any]],
+    windows: List[Tuple[int, Tuple[int, int, int, int]]],
+    cache: Dict,
+    sort_by: str,
+    backtest_kwargs: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """进程池任务: 依次评估一组窗口 (同一块内共享信号缓存)"""
+    rows = []
+    for number, (train_start, train_end, test_start, test_end) in windows:
+        row = {"window": number, "train_bars": train_end - train_start, "test_bars": test_end - test_start}
+        params, train = _best_params(df, strategy_type, combos, (train_start, train_end), cache, sort_by, backtest_kwargs)
+        if params is None:
+            rows.append({**row, "error": "训练窗口内所有参数组合均回测失败"})
+            continue
+        test = run_backtest(df, strategy_type, params, cache=cache, window=(test_start, test_end), **backtest_kwargs)
+        if "error" in test:
+            rows.append({**row, "params": params, "error": test["error"]})
+            continue
+        rows.append({
+            **row,
+            "params": params,
+            "train": train,
+            "test": {k: v for k, v in test.items() if not isinstance(v, list)},
+            "test_equity": [e["value"] for e in test["equity_curve"]],
+        })
+    return rows
+
+
+def _precompute_indicators(df: pd.DataFrame, strategy_type: str, combos: List[Dict[str, Any]]) -> Dict:
+    """在整段 K 线上为所有参数组合计算一次指标 (只保留可 pickle 的数组，信号由各进程自行缓存)"""
+    cache: Dict = {}
+    for params in combos:
+        STRATEGY_GENERATORS[strategy_type](df, params, cache)
+    return cache
+
+
+def _stitch(rows: List[Dict[str, Any]], dates: List[str], windows: List[Tuple[int, int, int, int]],
+            initial_capital: float) -> List[Dict[str, Any]]:
+    """按测试窗口顺序首尾衔接样本外权益: 每个窗口的权益按上一窗口的期末资金缩放"""
+    curve = []
+    capital = initial_capital
+    for row, (_, _, test_start, test_end) in zip(rows, windows):
+        values = row.pop("test_equity", None)
+        if values is None:
+            continue
+        scale = capital / initial_capital
+        curve.extend(
+            {"date": d, "value": round(v * scale, 2)}
+            for d, v in zip(dates[test_start:test_end], values)
+        )
+        capital = values[-1] * scale
+    return curve
+
+
+async def run_walk_forward(
+    df: pd.DataFrame,
+    strategy_type: str,
+    param_grid: Dict[str, Any],
+    train_size: int,
+    test_size: int,
+    fixed_params: Optional[Dict[str, Any]] = None,
+    anchored: bool = False,
+    initial_capital: float = 1_000_000,
+    commission_rate: float = 0.001,
+    slippage: float = 0.001,
+    sort_by: str = "sharpe_ratio",
+) -> Dict[str, Any]:
+    """执行滚动窗口回测 (需在事件循环中调用)，参数非法时抛出 ValueError"""
+    if strategy_type not in STRATEGY_GENERATORS:
+        raise ValueError(f"不支持的策略类型: {strategy_type}")
+    if sort_by not in SORTABLE_METRICS:
+        raise ValueError(f"不支持的排序指标: {sort_by}")
+    if train_size < 30 or test_size < MIN_WINDOW_BARS:
+        raise ValueError(f"训练窗口至少30条K线，测试窗口至少{MIN_WINDOW_BARS}条K线")
+    combos = expand_grid(param_grid, fixed_params)
+    if not combos:
+        raise ValueError("参数网格为空")
+    windows = build_windows(len(df), train_size, test_size, anchored)
+    if not windows:
+        raise ValueError(f"数据不足: {len(df)} 条K线不足以划分训练/测试窗口")
+    if len(windows) > MAX_WINDOWS:
+        raise ValueError(f"窗口数量过多: {len(windows)} > {MAX_WINDOWS}")
+
+    cache = await run_io(_precompute_indicators, df, strategy_type, combos)
+    backtest_kwargs = {"initial_capital": initial_capital, "commission_rate": commission_rate, "slippage": slippage}
+
+    numbered = list(enumerate(windows, start=1))
+    size = max(1, math.ceil(len(numbered) / POOL_WORKERS))
+    pool = get_process_pool()
+    futures = [
+        asyncio.wrap_future(pool.submit(
+            _evaluate_windows, df, strategy_type, combos, numbered[i:i + size], cache, sort_by, backtest_kwargs,
+        ))
+        for i in range(0, len(numbered), size)
+    ]
+    rows = [row for chunk in await asyncio.gather(*futures) for row in chunk]
+
+    dates = np.datetime_as_string(_bar_days(df.index), unit="D").tolist()
+    equity_curve = _stitch(rows, dates, windows, initial_capital)
+
+    result: Dict[str, Any] = {
+        "strategy_type": strategy_type,
+        "sort_by": sort_by,
+        "anchored": anchored,
+        "train_size": train_size,
+        "test_size": test_size,
+        "combinations": len(combos),
+        "windows": [
+            {**row, "train_period": [dates[w[0]], dates[w[1] - 1]], "test_period": [dates[w[2]], dates[w[3] - 1]]}
+            for row, w in zip(rows, windows)
+        ],
+        "equity_curve": equity_curve,
+    }
+    if equity_curve:
+        values = np.array([e["value"] for e in equity_curve])
+        max_dd, max_dd_duration = _max_drawdown(values)
+        tested = [r for r in rows if "test" in r]
+        result.update({
+            "oos_total_return": round((values[-1] / initial_capital - 1) * 100, 2),
+            "oos_sharpe_ratio": round(_sharpe_ratio(values), 2),
+            "oos_max_drawdown": round(max_dd * 100, 2),
+            "oos_max_drawdown_duration": max_dd_duration,
+            "profitable_windows": sum(1 for r in tested if r["test"]["total_return"] > 0),
+            "tested_windows": len(tested),
+        })
+    logger.info(
+        f"滚动窗口回测完成: {strategy_type}, {len(windows)} 个窗口 x {len(combos)} 组参数, "
+        f"样本外收益={result.get('oos_total_return')}%"
+    )
+    return result
@@ -21,22 +21,59 @@ api.interceptors.response.use(
   }
 )
 
+// 读取 SSE 流 (text/event-stream)，每个事件回调 onEvent(event, data)
+async function streamEvents(url, { method = 'GET', body, onEvent }) {
+  const headers = { Accept: 'text/event-stream' }
+  const token = localStorage.getItem('token')
+  if (token) headers.Authorization = `Bearer ${token}`
+  if (body) headers['Content-Type'] = 'application/json'
+  const res = await fetch(`/api/v1${url}`, { method, headers, body: body && JSON.stringify(body) })
+  if (!res.ok) throw new Error(`HTTP ${res.status}`)
+  if (!res.headers.get('content-type')?.includes('text/event-stream')) {
+    // 未配置等情况仍返回普通 JSON
+    const data = await res.json()
+    if (!data.success) throw new Error(data.message)
+    return
+  }
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader()
+  let buffer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += value
+    let sep
+    while ((sep = buffer.indexOf('\n\n')) >= 0) {
+      const block = buffer.slice(0, sep)
+      buffer = buffer.slice(sep + 2)
+      let event = 'message', data = ''
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7)
+        else if (line.startsWith('data: ')) data += line.slice(6)
+      }
+      if (event === 'error') throw new Error(JSON.parse(data).message)
+      onEvent(event, JSON.parse(data))
+    }
+  }
+}
+
 export default {
   // Auth
   register: (data) => api.post('/auth/register', data),
   login: (data) => api.post('/auth/login', data),
   getMe: () => api.get('/auth/me'),
+  updateMe: (data) => api.put('/auth/me', data),
+  changePassword: (data) => api.put('/auth/password', data),
 
   // Stocks
   getStockQuote: (symbol) => api.get(`/stocks/quote/${symbol}`),
-  getStockHistory: (symbol, period = '6mo') => api.get(`/stocks/history/${symbol}?period=${period}`),
+  getStockHistory: (symbol, period = '6mo') => api.get(`/stocks/history/${symbol}?period=${period}&layout=columns`),
   getStockBatch: () => api.get('/stocks/batch'),
   getStockSymbols: () => api.get('/stocks/symbols'),
 
   // Crypto
   getCryptoPrice: (symbol) => api.get(`/crypto/price/${symbol}`),
   getCryptoHistory: (symbol, timeframe = '1d', limit = 200) =>
-    api.get(`/crypto/history/${symbol}?timeframe=${timeframe}&limit=${limit}`),
+    api.get(`/crypto/history/${symbol}?timeframe=${timeframe}&limit=${limit}&layout=columns`),
   getCryptoBatch: () => api.get('/crypto/batch'),
   getCryptoSymbols: () => api.get('/crypto/symbols'),
 
@@ -50,6 +87,9 @@ export default {
   getDeepseekStatus: () => api.get('/analysis/deepseek/status'),
   deepseekChat: (data) => api.post('/analysis/deepseek/chat', data),
   getDeepseekReport: (symbol, asset = 'stock') => api.get(`/analysis/deepseek/report/${symbol}?asset_type=${asset}`),
+  streamDeepseekChat: (data, onEvent) => streamEvents('/analysis/deepseek/chat', { method: 'POST', body: data, onEvent }),
+  streamDeepseekReport: (symbol, asset, onEvent) =>
+    streamEvents(`/analysis/deepseek/report/${symbol}?asset_type=${asset}`, { onEvent }),
   deepseekInterpretBacktest: (data) => api.post('/analysis/deepseek/interpret-backtest', data),
   getDeepseekStrategySuggest: (symbol, asset = 'stock', pref = '') =>
     api.get(`/analysis/deepseek/strategy-suggest/${symbol}?asset_type=${asset}&preference=${pref}`),
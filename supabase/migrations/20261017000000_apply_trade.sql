@@ -0,0 +1,134 @@
+-- 模拟交易成交: 持仓、组合、成交记录 (以及 Agent 决策与会话统计) 在一个事务内更新
+-- 后端通过 supabase.rpc("apply_trade", ...) 调用，见 backend/services/portfolio_store.py
+
+create or replace function public.apply_trade(
+    p_portfolio_id bigint,
+    p_symbol text,
+    p_direction text,
+    p_quantity double precision,
+    p_price double precision,
+    p_commission_rate double precision,
+    p_stop_loss double precision default null,
+    p_take_profit double precision default null,
+    p_note text default null,
+    p_allow_partial boolean default false,
+    p_decision_id bigint default null
+) returns jsonb
+language plpgsql
+as $$
+declare
+    pf public.portfolios%rowtype;
+    pos public.positions%rowtype;
+    v_qty double precision := p_quantity;
+    v_amount double precision;
+    v_commission double precision;
+    v_new_qty double precision;
+    v_avg double precision;
+    v_cash double precision;
+    v_value double precision;
+    v_pnl double precision;
+    v_trade public.trades%rowtype;
+begin
+    if p_direction not in ('buy', 'sell') or p_quantity <= 0 or p_price <= 0 then
+        raise exception 'invalid_trade';
+    end if;
+
+    select * into pf from public.portfolios where id = p_portfolio_id for update;
+    if not found then
+        raise exception 'portfolio_not_found';
+    end if;
+    select * into pos from public.positions
+        where portfolio_id = p_portfolio_id and symbol = p_symbol for update;
+
+    if p_direction = 'sell' then
+        if pos.id is null or pos.quantity <= 0 then
+            raise exception 'no_position';
+        end if;
+        if pos.quantity < v_qty then
+            if not p_allow_partial then
+                raise exception 'insufficient_position';
+            end if;
+            v_qty := pos.quantity;
+        end if;
+    end if;
+
+    v_amount := p_price * v_qty;
+    v_commission := v_amount * p_commission_rate;
+
+    if p_direction = 'buy' then
+        if pf.cash_balance < v_amount + v_commission then
+            raise exception 'insufficient_cash';
+        end if;
+        v_cash := pf.cash_balance - v_amount - v_commission;
+        if pos.id is null then
+            insert into public.positions (
+                portfolio_id, symbol, asset_type, quantity, avg_cost, current_price, market_value,
+                unrealized_pnl, unrealized_pnl_pct, stop_loss, take_profit
+            ) values (
+                p_portfolio_id, p_symbol, case when position('/' in p_symbol) > 0 then 'crypto' else 'stock' end,
+                v_qty, p_price, p_price, round((v_qty * p_price)::numeric, 2), 0, 0, p_stop_loss, p_take_profit
+            );
+        else
+            v_new_qty := pos.quantity + v_qty;
+            v_avg := (pos.avg_cost * pos.quantity + p_price * v_qty) / v_new_qty;
+            update public.positions set
+                quantity = v_new_qty,
+                avg_cost = round(v_avg::numeric, 4),
+                current_price = p_price,
+                market_value = round((v_new_qty * p_price)::numeric, 2),
+                unrealized_pnl = round((v_new_qty * (p_price - v_avg))::numeric, 2),
+                unrealized_pnl_pct = case when v_avg > 0 then round(((p_price - v_avg) / v_avg * 100)::numeric, 2) else 0 end,
+                stop_loss = coalesce(p_stop_loss, stop_loss),
+                take_profit = coalesce(p_take_profit, take_profit)
+            where id = pos.id;
+        end if;
+    else
+        v_pnl := (p_price - pos.avg_cost) * v_qty - v_commission;
+        v_cash := pf.cash_balance + v_amount - v_commission;
+        v_new_qty := pos.quantity - v_qty;
+        if v_new_qty <= 0 then
+            delete from public.positions where id = pos.id;
+        else
+            update public.positions set
+                quantity = v_new_qty,
+                current_price = p_price,
+                market_value = round((v_new_qty * p_price)::numeric, 2),
+                unrealized_pnl = round((v_new_qty * (p_price - pos.avg_cost))::numeric, 2)
+            where id = pos.id;
+        end if;
+    end if;
+
+    -- 组合市值 = 现金 + 持仓市值
+    select v_cash + coalesce(sum(market_value), 0) into v_value
+        from public.positions where portfolio_id = p_portfolio_id;
+    update public.portfolios set
+        cash_balance = round(v_cash::numeric, 2),
+        current_value = round(v_value::numeric, 2),
+        total_pnl = round((v_value - initial_capital)::numeric, 2),
+        total_pnl_pct = case when initial_capital > 0
+            then round(((v_value - initial_capital) / initial_capital * 100)::numeric, 2) else 0 end
+    where id = p_portfolio_id;
+
+    insert into public.trades (
+        portfolio_id, symbol, direction, quantity, price, total_amount, commission, status, pnl, note
+    ) values (
+        p_portfolio_id, p_symbol, p_direction, v_qty, p_price, round(v_amount::numeric, 2),
+        round(v_commission::numeric, 2), 'filled', round(v_pnl::numeric, 2), p_note
+    ) returning * into v_trade;
+
+    if p_decision_id is not null then
+        update public.agent_decisions set
+            status = 'executed', trade_id = v_trade.id, executed_at = now()
+        where id = p_decision_id;
+        update public.agent_sessions s set
+            total_trades = coalesce(s.total_trades, 0) + 1,
+            total_pnl = coalesce(s.total_pnl, 0) + coalesce(v_pnl, 0),
+            win_trades = coalesce(s.win_trades, 0) + (case when v_pnl > 0 then 1 else 0 end),
+            lose_trades = coalesce(s.lose_trades, 0) + (case when v_pnl <= 0 then 1 else 0 end)
+        from public.agent_decisions d
+        where d.id = p_decision_id and s.id = d.session_id;
+    end if;
+
+    return to_jsonb(v_trade);
+end;
+$$;
@@ -0,0 +1,142 @@
+"""
+Agent 定时调度测试 (数据库和行情均替换为内存实现)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import services.agent_scheduler as sched
+
+NOW = datetime(2026, 1, 5, 12, 0, tzinfo=timezone.utc)
+
+
+def _session(sid, symbols, minutes_ago=None, interval=30):
+    last = None if minutes_ago is None else (NOW - timedelta(minutes=minutes_ago)).isoformat()
+    return {"id": sid, "symbols": symbols, "check_interval_minutes": interval, "last_check_at": last}
+
+
+@pytest.fixture
+def env(monkeypatch):
+    state = {"sessions": [], "claimed": [], "fetches": [], "checks": [], "active": 0, "peak": 0, "lose": set()}
+
+    def claim(session, now):
+        if session["id"] in state["lose"]:
+            return False
+        state["claimed"].append(session["id"])
+        return True
+
+    async def fetch_market(symbol):
+        state["fetches"].append(symbol)
+        return {"price": 1.0}, None
+
+    async def run_check(session_id, market=None):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["checks"].append((session_id, market))
+        state["active"] -= 1
+        return []
+
+    monkeypatch.setattr(sched, "_load_running_sessions", lambda: list(state["sessions"]))
+    monkeypatch.setattr(sched, "_claim", claim)
+    monkeypatch.setattr(sched, "fetch_market", fetch_market)
+    monkeypatch.setattr(sched, "run_agent_check", run_check)
+    return state
+
+
+async def _drain(scheduler):
+    while scheduler._running:
+        await asyncio.gather(*scheduler._running.values())
+
+
+def test_runs_only_due_sessions_with_jitter(env, monkeypatch):
+    monkeypatch.setattr(sched.random, "uniform", lambda lo, hi: hi)  # 取最大延后: 30 分钟 * 0.1
+    env["sessions"] = [
+        _session(1, ["AAPL"], minutes_ago=None),  # 从未运行
+        _session(2, ["AAPL"], minutes_ago=10),  # 未到期
+        _session(3, ["AAPL"], minutes_ago=34),  # 已过 间隔 + 延后
+        _session(4, ["AAPL"], minutes_ago=32),  # 已过间隔，但仍在延后期内
+    ]
+    scheduler = sched.AgentScheduler(concurrency=2, jitter=0.1)
+
+    async def scenario():
+        started = await scheduler.tick(NOW)
+        await _drain(scheduler)
+        return started
+
+    assert asyncio.run(scenario()) == [1, 3]
+
+
+def test_sessions_share_one_fetch_per_symbol(env):
+    env["sessions"] = [_session(i, ["BTC/USDT"]) for i in range(1, 201)] + [_session(500, ["BTC/USDT", "AAPL"])]
+    scheduler = sched.AgentScheduler(concurrency=8)
+
+    async def scenario():
+        await scheduler.tick(NOW)
+        await _drain(scheduler)
+
+    asyncio.run(scenario())
+    assert sorted(env["fetches"]) == ["AAPL", "BTC/USDT"]
+    assert len(env["checks"]) == 201
+    assert len({id(market) for _, market in env["checks"]}) == 1
+    assert env["peak"] <= 8
+
+
+def test_skips_in_flight_and_lost_claims(env):
+    env["sessions"] = [_session(1, ["AAPL"]), _session(2, ["AAPL"])]
+    env["lose"] = {2}
+    scheduler = sched.AgentScheduler()
+
+    async def scenario():
+        first = await scheduler.tick(NOW)
+        # 会话 1 仍在运行，不会重复启动
+        second = await scheduler.tick(NOW)
+        await _drain(scheduler)
+        return first, second
+
+    assert asyncio.run(scenario()) == ([1], [])
+    assert scheduler.get_stats()["lost_claims"] == 2
+    assert [sid for sid, _ in env["checks"]] == [1]
+
+
+def test_stop_cancels_running_checks(env):
+    env["sessions"] = [_session(1, ["AAPL"])]
+    scheduler = sched.AgentScheduler(tick_seconds=3600)
+
+    async def scenario():
+        scheduler.start()
+        await asyncio.sleep(0)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert scheduler.get_stats()["started"] is False
+    assert scheduler._running == {}
+
+
+def test_round_fetch_concurrency_is_bounded(env, monkeypatch):
+    monkeypatch.setattr(sched.get_settings(), "QUOTE_BATCH_CONCURRENCY", 4)
+    active = {"now": 0, "peak": 0}
+
+    async def fetch_market(symbol):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.001)
+        active["now"] -= 1
+        return {"price": 1.0}, None
+
+    monkeypatch.setattr(sched, "fetch_market", fetch_market)
+    env["sessions"] = [_session(1, [f"S{i}" for i in range(50)])]
+    scheduler = sched.AgentScheduler()
+
+    async def scenario():
+        await scheduler.tick(NOW)
+        await _drain(scheduler)
+
+    asyncio.run(scenario())
+    assert active["peak"] == 4
+    assert len(env["checks"][0][1]) == 50
@@ -0,0 +1,190 @@
+"""
+Agent 检查流程测试 (数据库 / 行情 / DeepSeek 均替换为内存实现)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+import json
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import services.agent_service as agent
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """只记录写入、按表返回固定数据的链式查询"""
+
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self.op, self.payload, self.one = "select", None, False
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def insert(self, record):
+        self.op, self.payload = "insert", record
+        return self
+
+    def update(self, values):
+        self.op, self.payload = "update", values
+        return self
+
+    def single(self):
+        self.one = True
+        return self
+
+    def __getattr__(self, name):  # eq / gte / neq / order / range 等过滤条件
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        if self.op == "insert":
+            self.db.inserts += 1
+            rows = []
+            for record in self.payload if isinstance(self.payload, list) else [self.payload]:
+                rows.append({**record, "id": len(self.db.inserted) + 1})
+                self.db.inserted.append(rows[-1])
+            return _Result(rows)
+        if self.op == "update":
+            return _Result([self.payload])
+        rows = self.db.tables.get(self.table, [])
+        return _Result(rows[0] if self.one else rows)
+
+
+class FakeSupabase:
+    def __init__(self, tables):
+        self.tables = tables
+        self.inserted = []
+        self.inserts = 0
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+def _history():
+    close = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, 100))
+    return pd.DataFrame(
+        {"open": close, "high": close + 1, "low": close - 1, "close": close, "volume": 1e6},
+        index=pd.date_range("2025-01-01", periods=100, freq="D"),
+    )
+
+
+@pytest.fixture
+def env(monkeypatch):
+    symbols = [f"S{i}/USDT" for i in range(8)]
+    db = FakeSupabase({
+        "agent_sessions": [{
+            "id": 1, "status": "running", "portfolio_id": 7, "mode": "approval", "symbols": symbols,
+            "max_trades_per_day": 3, "max_position_pct": 0.5,
+        }],
+        "portfolios": [{"id": 7, "current_value": 1e6, "cash_balance": 1e6, "total_pnl": 0, "total_pnl_pct": 0}],
+        "positions": [],
+        "agent_decisions": [{"id": 99}],  # 今日已有 1 笔交易
+    })
+    df = _history()
+
+    async def fetch_market(symbol):
+        return {"price": 100.0, "change_pct": 0.0, "volume": 1}, df
+
+    async def request_deepseek(messages, temperature=0.1, max_tokens=500):
+        await asyncio.sleep(0.1)
+        prompt = messages[-1]["content"]
+        db.prompts.append(prompt)
+        usage = {"prompt_tokens": len(prompt), "completion_tokens": 50, "total_tokens": len(prompt) + 50}
+        symbols = re.findall(r"### 标的: (\S+)", prompt)
+        if not symbols:  # 单标的提示词
+            symbol = prompt.split("## 标的: ")[1].split("\n")[0]
+            return json.dumps({"action": "buy", "symbol": symbol, "confidence": 0.9, "quantity": 10, "reason": "test"}), usage
+        if db.batch_reply is not None:
+            return db.batch_reply(symbols), usage
+        return json.dumps([
+            {"action": "buy", "symbol": s, "confidence": 0.9, "quantity": 10, "reason": "test"} for s in symbols
+        ]), usage
+
+    db.prompts, db.batch_reply = [], None
+    monkeypatch.setattr(agent, "get_supabase", lambda: db)
+    monkeypatch.setattr(agent, "fetch_market", fetch_market)
+    monkeypatch.setattr(agent, "_llm_stats", agent.defaultdict(agent._llm_stats.default_factory))
+    monkeypatch.setattr(agent.deepseek_service, "is_deepseek_configured", lambda: True)
+    monkeypatch.setattr(agent.deepseek_service, "_request_deepseek", request_deepseek)
+    monkeypatch.setattr(agent.settings, "AGENT_SYMBOL_CONCURRENCY", 8)
+    monkeypatch.setattr(agent.settings, "AGENT_BATCH_DECISIONS", False)
+    return db
+
+
+def test_symbols_run_concurrently_within_trade_budget(env):
+    start = time.perf_counter()
+    decisions = asyncio.run(agent.run_agent_check(1))
+    elapsed = time.perf_counter() - start
+
+    assert len(decisions) == 8
+    assert elapsed < 0.5  # 8 个标的各 0.1s 的模型调用并行执行
+    buys = [d for d in decisions if d["action"] == "buy"]
+    # 上限 3 笔，今日已有 1 笔，只能再成交 2 笔
+    assert len(buys) == 2
+    assert all("上限" in d["reason"] for d in decisions if d["action"] == "hold")
+    for d in decisions:
+        assert {"market", "indicators", "llm", "save", "total"} <= set(d["timings"])
+
+
+def test_trade_budget_reservation():
+    budget = agent.TradeBudget(used=1, limit=2)
+    assert budget.reserve() is True
+    assert budget.reserve() is False
+    budget.release()
+    assert budget.reserve() is True
+    budget.force()
+    assert budget.used == 3
+
+
+def test_batched_decisions_use_one_call(env, monkeypatch):
+    monkeypatch.setattr(agent.settings, "AGENT_BATCH_DECISIONS", True)
+    decisions = asyncio.run(agent.run_agent_check(1))
+
+    assert len(env.prompts) == 1
+    assert [d["symbol"] for d in decisions] == [f"S{i}/USDT" for i in range(8)]
+    assert len([d for d in decisions if d["action"] == "buy"]) == 2
+    assert all(d["timings"]["llm"] >= 100 for d in decisions)
+    assert env.inserts == 1  # 8 条决策一次写入
+    assert [d["id"] for d in decisions] == list(range(1, 9))
+    saved = [r for r in env.inserted if r["action"] == "buy"]
+    assert json.loads(saved[0]["ai_analysis"])["symbol"] == saved[0]["symbol"]
+
+
+def test_batched_prompt_uses_fewer_tokens(env, monkeypatch):
+    asyncio.run(agent.run_agent_check(1))
+    monkeypatch.setattr(agent.settings, "AGENT_BATCH_DECISIONS", True)
+    asyncio.run(agent.run_agent_check(1))
+
+    stats = agent.get_llm_stats()
+    assert (stats["single"]["calls"], stats["batch"]["calls"]) == (8, 1)
+    assert stats["batch"]["prompt_tokens"] < stats["single"]["prompt_tokens"] / 2
+
+
+def test_batch_falls_back_to_single_calls(env, monkeypatch):
+    monkeypatch.setattr(agent.settings, "AGENT_BATCH_DECISIONS", True)
+    # 只返回前 5 个标的，其中一个 action 非法
+    env.batch_reply = lambda symbols: json.dumps(
+        [{"action": "buy", "symbol": s, "confidence": 0.9, "quantity": 10} for s in symbols[:4]]
+        + [{"action": "short", "symbol": symbols[4]}]
+    )
+    decisions = asyncio.run(agent.run_agent_check(1))
+    assert len(decisions) == 8
+    assert len(env.prompts) == 1 + 4
+    assert agent.get_llm_stats()["batch"]["fallbacks"] == 4
+
+    env.prompts.clear()
+    env.batch_reply = lambda symbols: "抱歉，无法给出决策"
+    decisions = asyncio.run(agent.run_agent_check(1))
+    assert len(decisions) == 8
+    assert len(env.prompts) == 1 + 8
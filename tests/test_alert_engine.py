@@ -0,0 +1,168 @@
+"""
+告警引擎测试 (数据库替换为内存实现)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import services.alert_engine as alert_engine
+from services.alert_engine import AlertEngine
+
+
+def _alert(alert_id, alert_type, value, symbol="BTC/USDT"):
+    return {"id": alert_id, "user_id": 1, "symbol": symbol, "alert_type": alert_type,
+            "condition_value": value, "message": f"#{alert_id}"}
+
+
+def _ids(fired):
+    return sorted(a["id"] for a in fired)
+
+
+def test_only_crossed_thresholds_fire_once():
+    engine = AlertEngine()
+    engine.load([
+        _alert(1, "price_above", 100), _alert(2, "price_above", 110), _alert(3, "price_above", 120),
+        _alert(4, "price_below", 90), _alert(5, "price_below", 80),
+        _alert(6, "change_pct", 5), _alert(7, "change_pct", -5),
+        _alert(8, "price_above", 100, symbol="ETH/USDT"),
+    ])
+    assert _ids(engine.on_quote({"symbol": "BTC/USDT", "price": 95, "change_pct": 1})) == []
+    assert _ids(engine.on_quote({"symbol": "BTC/USDT", "price": 112, "change_pct": 6})) == [1, 2, 6]
+    assert _ids(engine.on_quote({"symbol": "BTC/USDT", "price": 115, "change_pct": 6})) == []  # 已触发的不再重复
+    assert _ids(engine.on_quote({"symbol": "BTC/USDT", "price": 85, "change_pct": -6})) == [4, 7]
+
+    engine.remove(5)
+    assert _ids(engine.on_quote({"symbol": "BTC/USDT", "price": 70})) == []
+    assert engine.get_stats()["active"] == 2  # #3 和 ETH 的 #8
+
+
+def test_bar_and_signal_alerts():
+    engine = AlertEngine()
+    engine.load([
+        _alert(1, "volume_spike", 3), _alert(2, "drawdown", 10), _alert(3, "drawdown", 30),
+        _alert(4, "strategy_signal", None), _alert(5, "risk_warning", None),
+    ])
+    close = np.r_[np.linspace(100, 200, 40), [170.0]]
+    df = pd.DataFrame({"close": close, "high": close, "volume": np.r_[np.full(40, 1e6), [5e6]]})
+    assert _ids(engine.on_bars("BTC/USDT", df)) == [1, 2]  # 回撤 15%，成交量 5 倍
+    assert _ids(engine.on_quote({"symbol": "BTC/USDT", "price": 130})) == [3]  # 按记录的最高价计算回撤
+    assert _ids(engine.on_signal("BTC/USDT", "strategy_signal")) == [4]
+    assert engine.on_signal("BTC/USDT", "strategy_signal") == []
+
+
+def test_100k_alerts_tick_under_a_millisecond():
+    rng = np.random.default_rng(0)
+    symbols = [f"S{i}/USDT" for i in range(1000)]
+    types = ["price_above", "price_below", "change_pct"]
+    engine = AlertEngine()
+    engine.load(
+        _alert(i, types[i % 3], float(rng.uniform(50, 150) if i % 3 < 2 else rng.uniform(-20, 20)), symbols[i % 1000])
+        for i in range(100_000)
+    )
+    assert engine.get_stats()["active"] == 100_000
+    for s in symbols:  # 首次评估时合并阈值数组
+        engine.on_quote({"symbol": s, "price": 100.0, "change_pct": 0.0})
+
+    durations = []
+    for i in range(5000):
+        quote = {"symbol": symbols[i % 1000], "price": 100 + float(rng.normal(0, 5)), "change_pct": float(rng.normal(0, 3))}
+        start = time.perf_counter()
+        engine.on_quote(quote)
+        durations.append(time.perf_counter() - start)
+    assert np.median(durations) < 1e-3
+    assert engine.get_stats()["triggered"] > 0
+
+
+class _Query:
+    def __init__(self, db):
+        self.db, self.call = db, {}
+
+    def update(self, values):
+        self.call["values"] = values
+        return self
+
+    def delete(self):
+        self.call["delete"] = True
+        return self
+
+    def in_(self, column, ids):
+        self.call["ids"] = list(ids)
+        return self
+
+    def eq(self, column, value):
+        self.call[column] = value
+        return self
+
+    def execute(self):
+        if self.db.fail:
+            raise RuntimeError("网络错误")
+        if self.call.get("delete"):
+            matched = [r for r in self.db.rows if r["id"] == self.call["id"] and r["user_id"] == self.call["user_id"]]
+            return SimpleNamespace(data=matched)
+        self.db.updates.append(self.call)
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.updates, self.fail, self.rows = [], False, []
+
+    def table(self, name):
+        assert name == "alerts"
+        return _Query(self)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeSupabase()
+    monkeypatch.setattr(alert_engine, "get_supabase", lambda: fake)
+    return fake
+
+
+def test_triggers_are_written_in_batches(db):
+    engine = AlertEngine()
+    engine.load(_alert(i, "price_above", float(i)) for i in range(500))
+    assert len(engine.on_quote({"symbol": "BTC/USDT", "price": 1000})) == 500
+
+    db.fail = True
+    assert asyncio.run(engine.flush()) == 0
+    assert engine.get_stats()["pending_writes"] == 500
+    engine.load(_alert(i, "price_above", float(i)) for i in range(500))  # 尚未写回的不会重新加入
+    assert engine.get_stats()["active"] == 0
+
+    db.fail = False
+    assert asyncio.run(engine.flush()) == 500
+    assert len(db.updates) == 1
+    update = db.updates[0]
+    assert len(update["ids"]) == 500 and update["is_triggered"] is False
+    assert update["values"]["is_triggered"] is True
+
+
+def test_delete_route_only_removes_own_alerts(monkeypatch, db):
+    from fastapi.testclient import TestClient
+    from main import app
+    import routers.alerts as alerts
+    from routers.auth import get_current_user
+
+    engine = AlertEngine()
+    engine.load([_alert(1, "price_above", 100.0)])
+    db.rows = [{"id": 1, "user_id": 1}]
+    monkeypatch.setattr(alerts, "get_supabase", lambda: db)
+    monkeypatch.setattr(alerts, "get_alert_engine", lambda: engine)
+    app.dependency_overrides[get_current_user] = lambda: {"id": 2}
+    try:
+        client = TestClient(app)
+        client.delete("/api/v1/alerts/1")
+        assert engine.get_stats()["active"] == 1  # 别人的告警不受影响
+        app.dependency_overrides[get_current_user] = lambda: {"id": 1}
+        client.delete("/api/v1/alerts/1")
+        assert engine.get_stats()["active"] == 0
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
@@ -115,3 +115,12 @@ def test_live_trade_requires_confirmation():
     if response.status_code == 200:
         assert data["success"] is False
         assert "确认" in data.get("message", "")
+
+
+def test_optimize_requires_login():
+    response = client.post("/api/v1/backtest/optimize", json={
+        "strategy_type": "ma_cross",
+        "symbol": "000300.SS",
+        "param_grid": {"fast_period": [5, 10], "slow_period": [20, 30]},
+    })
+    assert response.status_code == 401
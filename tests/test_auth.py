@@ -0,0 +1,127 @@
+"""
+登录用户缓存测试 (users 表替换为内存实现)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from main import app
+from core.security import create_access_token, hash_password
+import routers.auth as auth
+from services.user_cache import UserCache
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Users:
+    def __init__(self, db):
+        self.db, self.op, self.payload, self.filters = db, "select", None, {}
+
+    def select(self, *args):
+        return self
+
+    def update(self, values):
+        self.op, self.payload = "update", values
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def execute(self):
+        rows = [u for u in self.db.users if all(u.get(k) == v for k, v in self.filters.items())]
+        if self.op == "update":
+            for u in rows:
+                u.update(self.payload)
+        else:
+            self.db.selects += 1
+        return _Result([dict(u) for u in rows])
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.users = [{
+            "id": 1, "username": "alice", "email": "a@example.com", "is_active": True,
+            "hashed_password": hash_password("old-pass"), "preferences": {}, "created_at": "2026-01-01",
+        }]
+        self.selects = 0
+
+    def table(self, name):
+        assert name == "users"
+        return _Users(self)
+
+
+@pytest.fixture
+def env(monkeypatch):
+    db = FakeSupabase()
+    cache = UserCache(ttl=60, maxsize=16)
+    monkeypatch.setattr(auth, "get_supabase", lambda: db)
+    monkeypatch.setattr(auth, "get_user_cache", lambda: cache)
+    monkeypatch.setattr(auth.settings, "AUTH_TOKEN_CLAIMS", False)
+    db.cache = cache
+    return db
+
+
+def _headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_user_is_cached_per_token(env):
+    client = TestClient(app)
+    token = create_access_token({"sub": "1"})
+    for _ in range(3):
+        assert client.get("/api/v1/auth/me", headers=_headers(token)).json()["data"]["username"] == "alice"
+    assert env.selects == 1
+    stats = env.cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+def test_profile_change_invalidates(env):
+    client = TestClient(app)
+    headers = _headers(create_access_token({"sub": "1"}))
+    client.get("/api/v1/auth/me", headers=headers)
+
+    response = client.put("/api/v1/auth/me", json={"preferences": {"theme": "dark"}}, headers=headers)
+    assert response.json()["success"] is True
+    me = client.get("/api/v1/auth/me", headers=headers).json()["data"]
+    assert me["preferences"] == {"theme": "dark"}
+    assert env.cache.get_stats()["invalidations"] == 1
+
+    assert client.put(
+        "/api/v1/auth/password", json={"old_password": "wrong", "new_password": "x"}, headers=headers,
+    ).status_code == 400
+    response = client.put("/api/v1/auth/password", json={"old_password": "old-pass", "new_password": "new-pass"}, headers=headers)
+    assert response.json()["message"] == "密码已修改"
+    assert client.post("/api/v1/auth/login", json={"username": "alice", "password": "new-pass"}).json()["success"]
+
+
+def _request(token):
+    return Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+
+def test_token_claims_skip_database(env, monkeypatch):
+    monkeypatch.setattr(auth.settings, "AUTH_TOKEN_CLAIMS", True)
+    data = TestClient(app).post("/api/v1/auth/login", json={"username": "alice", "password": "old-pass"}).json()["data"]
+    env.selects = 0
+
+    for _ in range(3):
+        user = asyncio.run(auth.get_current_user(_request(data["access_token"])))
+        assert user == {"id": 1, "username": "alice", "email": "a@example.com", "is_active": True}
+    assert env.selects == 0
+    assert env.cache.get_stats()["claims"] == 3
+
+    # 资料变更后，此前签发的 token 中的信息不再采用，改为查库
+    env.cache.invalidate(1)
+    env.cache._invalidated_at[1] += 1
+    user = asyncio.run(auth.get_current_user(_request(data["access_token"])))
+    assert "hashed_password" in user
+    assert env.selects == 1
@@ -0,0 +1,195 @@
+"""
+回测引擎测试 (离线, 使用合成 K 线)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from services.backtest_engine import STRATEGY_GENERATORS, BUY, SELL, run_backtest
+
+
+def _make_df(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n)))
+    volume = rng.integers(100_000, 1_000_000, n).astype(float)
+    return pd.DataFrame(
+        {"open": open_, "high": high, "low": low, "close": close, "volume": volume},
+        index=pd.date_range("2020-01-01", periods=n, freq="D"),
+    )
+
+
+@pytest.mark.parametrize("strategy_type", list(STRATEGY_GENERATORS))
+def test_signal_array_shape(strategy_type):
+    df = _make_df()
+    series = STRATEGY_GENERATORS[strategy_type](df, {})
+    assert series.signals.dtype == np.int8
+    assert len(series.signals) == len(df)
+    assert series.signals[0] == 0
+    assert set(np.unique(series.signals)) <= {-1, 0, 1}
+
+
+@pytest.mark.parametrize("strategy_type", ["rsi", "bollinger", "dual_thrust", "turtle"])
+def test_stateful_signals_alternate(strategy_type):
+    """空仓才买、持仓才卖: 非零信号必须买卖交替且以买入开始"""
+    series = STRATEGY_GENERATORS[strategy_type](_make_df(2000, seed=3), {})
+    trades = series.signals[series.signals != 0]
+    assert len(trades) > 0
+    assert trades[0] == BUY
+    assert np.all(trades[1:] != trades[:-1])
+
+
+def test_reason_only_for_trades():
+    series = STRATEGY_GENERATORS["ma_cross"](_make_df(), {"fast_period": 5, "slow_period": 20})
+    i = int(np.flatnonzero(series.signals == BUY)[0])
+    j = int(np.flatnonzero(series.signals == SELL)[0])
+    assert series.reason(i) == "MA5上穿MA20"
+    assert series.reason(j) == "MA5下穿MA20"
+
+
+def test_uppercase_columns():
+    """yfinance 返回首字母大写列名，进入时统一为小写 (见 bar_series)"""
+    from services.bar_series import normalize_frame
+    df = _make_df()
+    upper = df.rename(columns=str.capitalize)
+    a = run_backtest(df, "turtle", {})
+    b = run_backtest(normalize_frame(upper), "turtle", {})
+    assert a == b
+
+
+def test_max_drawdown_and_duration():
+    from services.backtest_engine import _max_drawdown
+    equity = np.array([100.0, 110.0, 99.0, 88.0, 95.0, 120.0, 108.0])
+    max_dd, duration = _max_drawdown(equity)
+    assert max_dd == pytest.approx(0.2)
+    assert duration == 2
+
+
+def test_result_curves_cover_every_bar():
+    df = _make_df(400)
+    result = run_backtest(df, "macd", {}, initial_capital=100_000)
+    assert len(result["equity_curve"]) == len(df)
+    assert len(result["drawdown_curve"]) == len(df)
+    assert result["equity_curve"][0] == {"date": "2020-01-01", "value": 100_000}
+    assert result["equity_curve"][-1]["value"] == result["final_value"]
+    assert all(m["month"].startswith("2020") or m["month"].startswith("2021") for m in result["monthly_returns"])
+
+
+def test_expand_grid_ranges_and_constraints():
+    from services.optimizer import expand_grid
+    combos = expand_grid(
+        {"fast_period": {"start": 5, "stop": 20, "step": 5}, "slow_period": [10, 20]},
+        fixed_params={"foo": 1},
+    )
+    assert {(c["fast_period"], c["slow_period"]) for c in combos} == {(5, 10), (5, 20), (10, 20), (15, 20)}
+    assert all(c["foo"] == 1 for c in combos)
+
+    start = time.perf_counter()
+    for grid in [{"a": {"start": 1, "stop": 3000}, "b": {"start": 1, "stop": 3000}}, {"a": {"start": 0, "stop": 1e9}}]:
+        with pytest.raises(ValueError, match="参数组合过多"):
+            expand_grid(grid)
+    assert time.perf_counter() - start < 0.1  # 按各轴个数之积拒绝，不展开
+    with pytest.raises(ValueError, match="区间定义无效"):
+        expand_grid({"a": {"start": 0, "stop": float("inf")}})
+
+
+def test_shared_cache_matches_fresh_run():
+    """寻优时共享指标缓存不影响回测结果"""
+    df = _make_df(600)
+    cache = {}
+    for fast, slow in [(5, 20), (10, 20), (5, 30)]:
+        params = {"fast_period": fast, "slow_period": slow}
+        shared = run_backtest(df, "ma_cross", params, cache=cache, include_curves=False)
+        fresh = run_backtest(df, "ma_cross", params)
+        assert shared.items() <= fresh.items()
+    assert ("rolling", "close", 20, "mean", 0, None) in cache
+
+
+@pytest.mark.parametrize("strategy_type", ["ma_cross", "rsi", "turtle"])
+def test_single_symbol_portfolio_matches_run_backtest(strategy_type):
+    """单标的组合 (零股) 与整数股的单标的回测交易次数一致、收益接近"""
+    from services.portfolio_backtest import run_portfolio_backtest
+    df = _make_df(600, seed=5)
+    single = run_backtest(df, strategy_type, {})
+    combined = run_portfolio_backtest({"A": df}, strategy_type, {})
+    assert combined["total_trades"] == single["total_trades"]
+    assert abs(combined["total_return"] - single["total_return"]) < 0.1
+
+
+def test_portfolio_alignment_and_rebalance():
+    from services.portfolio_backtest import run_portfolio_backtest
+    frames = {f"S{i}": _make_df(400, seed=i) for i in range(4)}
+    frames["S3"] = frames["S3"].iloc[100:]  # 晚上市的标的
+    result = run_portfolio_backtest(frames, "ma_cross", {}, weights={"S0": 2, "S1": 1, "S2": 1}, rebalance="monthly")
+    assert len(result["equity_curve"]) == 400
+    assert result["rebalance_count"] == 13
+    stats = {s["symbol"]: s for s in result["symbol_stats"]}
+    assert stats["S0"]["weight"] == 50.0 and stats["S3"]["weight"] == 0.0
+    assert stats["S3"]["bars"] == 300
+    curves = result["symbol_equity"]["values"]
+    total = sum(curves[s][-1] for s in frames)
+    assert abs(total - result["final_value"]) < 1
+
+
+def test_window_backtest_reuses_full_history_signals():
+    df = _make_df(600)
+    cache = {}
+    run_backtest(df, "ma_cross", {}, cache=cache)
+    part = run_backtest(df, "ma_cross", {}, cache=cache, window=(200, 400))
+    assert len(part["equity_curve"]) == 200
+    assert part["equity_curve"][0] == {"date": "2020-07-19", "value": 1_000_000}
+    assert all("2020-07-19" <= t["date"] <= "2021-02-03" for t in part["trades"])
+
+
+def test_walk_forward_windows_and_stitched_curve():
+    import asyncio
+    from services.walk_forward import build_windows, run_walk_forward
+    assert build_windows(500, 200, 100) == [(0, 200, 200, 300), (100, 300, 300, 400), (200, 400, 400, 500)]
+    assert build_windows(510, 200, 100, anchored=True)[-1] == (0, 400, 400, 500)
+
+    df = _make_df(700, seed=2)
+    result = asyncio.run(run_walk_forward(
+        df, "ma_cross", {"fast_period": [5, 10], "slow_period": [20, 40]}, train_size=300, test_size=100,
+    ))
+    assert [w["window"] for w in result["windows"]] == [1, 2, 3, 4]
+    assert len(result["equity_curve"]) == 400
+    assert result["equity_curve"][0]["date"] == result["windows"][0]["test_period"][0]
+    assert result["tested_windows"] == 4
+    # 拼接曲线的期末值 = 各测试窗口收益率连乘
+    growth = np.prod([w["test"]["final_value"] / 1_000_000 for w in result["windows"]])
+    assert abs(result["equity_curve"][-1]["value"] - 1_000_000 * growth) < 1
+
+
+@pytest.mark.parametrize("strategy_type", ["rsi", "bollinger"])
+def test_window_starts_flat_instead_of_inheriting_position(strategy_type):
+    """区间回测与截至区间末尾的 K 线上重新落实持仓约束的结果一致，首笔必为买入"""
+    df = _make_df(600, seed=3)
+    full = STRATEGY_GENERATORS[strategy_type](df, {}).signals
+    held = np.cumsum(full) > 0
+    start = int(np.flatnonzero(held[199:-200] & (full[200:-199] == 0))[0]) + 200  # 整段回测在 start 之前已持仓
+    end = start + 200
+
+    part = run_backtest(df, strategy_type, {}, cache={}, window=(start, end))
+    expected = STRATEGY_GENERATORS[strategy_type](df.iloc[:end], {}).window(start, end)
+    dates = df.index[start:end].strftime("%Y-%m-%d")
+    idx = np.flatnonzero(expected.signals)
+    assert [(t["date"], t["direction"]) for t in part["trades"]] == [
+        (dates[i], "buy" if expected.signals[i] == BUY else "sell") for i in idx
+    ]
+    assert part["trades"][0]["direction"] == "buy"
+
+
+def test_ranking_top_n_zero_returns_no_rows():
+    from services.optimizer import OptimizationJob
+    job = OptimizationJob(1, "ma_cross", "AAPL", [{}] * 3, "sharpe_ratio")
+    job.results = [{"params": {}, "sharpe_ratio": v} for v in (0.5, 1.5, 1.0)]
+    assert job.summary(top_n=0)["results"] == []
+    assert [r["sharpe_ratio"] for r in job.ranking()] == [1.5, 1.0, 0.5]
+    assert len(job.ranking(top_n=2)) == 2
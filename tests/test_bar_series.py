@@ -0,0 +1,63 @@
+"""
+K 线序列测试
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.bar_series import FIELDS, BarSeries, normalize_frame
+
+
+def _series(n=100, capacity=None):
+    ts = pd.date_range("2024-01-01", periods=n, freq="D").to_numpy()
+    close = np.arange(n, dtype=float)
+    return BarSeries.from_arrays(ts, np.vstack([close, close + 1, close - 1, close, np.full(n, 10.0)]), capacity)
+
+
+def test_slices_and_pandas_view_share_memory():
+    series = _series()
+    tail = series[-20:]
+    df = tail.to_pandas()
+    assert len(tail) == 20 and tail.close[0] == 80
+    assert np.shares_memory(tail.close, series.close)
+    assert np.shares_memory(df["close"].to_numpy(), series.values)
+    assert np.shares_memory(df.index.to_numpy(), series.ts)
+    assert list(df.columns) == list(FIELDS) and df.index.name == "timestamp"
+    assert series.nbytes == 100 * 8 * (1 + len(FIELDS))
+    with pytest.raises(ValueError):
+        tail.push(pd.Timestamp("2030-01-01"), 1, 1, 1, 1, 1)
+
+
+def test_push_keeps_capacity_and_old_views():
+    series = BarSeries(capacity=50)
+    for i in range(50):
+        series.push(pd.Timestamp("2024-01-01") + pd.Timedelta(minutes=i), i, i, i, i, 1)
+    view = series[:]
+    for i in range(50, 500):
+        series.push(pd.Timestamp("2024-01-01") + pd.Timedelta(minutes=i), i, i, i, i, 1)
+    assert len(series) == 50 and series.close[0] == 450 and series.close[-1] == 499
+    assert view.close[0] == 0 and view.close[-1] == 49  # 换数组后旧视图不变
+    assert len(series._ts) <= 100
+
+    last = series.last_ts
+    assert series.push(last, 1, 2, 0, 1.5, 9)  # 同一时间戳替换最后一根
+    assert not series.push(last - np.timedelta64(1, "h"), 1, 1, 1, 1, 1)
+    assert len(series) == 50 and series.close[-1] == 1.5
+
+
+def test_sources_normalize_to_one_schema():
+    index = pd.date_range("2024-01-01", periods=3, freq="D", tz="Asia/Shanghai", name="Date")
+    yf_frame = pd.DataFrame({"Open": [1, 2, 3], "High": [2, 3, 4], "Low": [0, 1, 2], "Close": [1.5, 2.5, 3.5],
+                             "Volume": [100, 200, 300], "Dividends": 0.0}, index=index)
+    df = normalize_frame(yf_frame)
+    assert list(df.columns) == list(FIELDS) and df.index.tz is None
+    assert df["close"].tolist() == [1.5, 2.5, 3.5] and df["volume"].dtype == np.float64
+
+    ms = [[1704067200000 + i * 60_000, 1, 2, 0, 1.5, 10] for i in range(3)]
+    crypto = BarSeries.from_ohlcv(ms).to_pandas()
+    assert crypto.index[0] == pd.Timestamp("2024-01-01") and crypto["high"].tolist() == [2, 2, 2]
+    assert BarSeries.from_ohlcv([]).to_pandas().empty
@@ -0,0 +1,82 @@
+"""
+本地 K 线存储测试 (离线, 使用假数据源)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import numpy as np
+import pandas as pd
+from services.bar_store import BarStore, timeframe_seconds
+
+
+def _bars(start, n, base=100.0):
+    index = pd.date_range(start, periods=n, freq="D")
+    close = base + np.arange(n, dtype=float)
+    return pd.DataFrame(
+        {"Open": close, "High": close + 1, "Low": close - 1, "Close": close, "Volume": np.full(n, 1000)},
+        index=index,
+    )
+
+
+class FakeSource:
+    def __init__(self, full):
+        self.full = full
+        self.calls = []
+
+    def __call__(self, since):
+        self.calls.append(since)
+        return self.full if since is None else self.full[self.full.index >= since]
+
+
+def test_timeframe_seconds():
+    assert timeframe_seconds("15m") == 900
+    assert timeframe_seconds("4h") == 4 * 3600
+    assert timeframe_seconds("1d") == 86400
+
+
+def test_miss_then_hit_then_tail_refresh(tmp_path):
+    store = BarStore(str(tmp_path), max_age=3600)
+    source = FakeSource(_bars("2024-01-01", 100))
+    start = pd.Timestamp("2024-01-01")
+
+    df = store.get("600519.SS", "1d", "yfinance", start, source)
+    assert len(df) == 100 and list(df.columns) == ["open", "high", "low", "close", "volume"]
+    assert source.calls == [None]
+
+    again = store.get("600519.SS", "1d", "yfinance", start, source)
+    assert len(source.calls) == 1
+    pd.testing.assert_frame_equal(df, again)
+
+    # 新增 5 根 K 线且最后一根被修正: 过期后只请求尾部
+    source.full = _bars("2024-01-01", 105, base=100.0)
+    source.full.iloc[99, source.full.columns.get_loc("Close")] = 999.0
+    refreshed = store.get("600519.SS", "1d", "yfinance", start, source, max_age=0)
+    assert source.calls[-1] == pd.Timestamp("2024-04-09")
+    assert len(refreshed) == 105
+    assert refreshed["close"].iloc[99] == 999.0
+    assert store.stats["hits"] == 1 and store.stats["misses"] == 1 and store.stats["refreshes"] == 1
+
+
+def test_range_query_and_earlier_start_is_a_miss(tmp_path):
+    store = BarStore(str(tmp_path))
+    source = FakeSource(_bars("2024-01-01", 60))
+    store.get("BTC/USDT", "1d", "binance", pd.Timestamp("2024-02-01"), source)
+    part = store.read("BTC/USDT", "1d", "binance", start="2024-02-10", end="2024-02-12")
+    assert list(part.index.strftime("%Y-%m-%d")) == ["2024-02-10", "2024-02-11", "2024-02-12"]
+
+    store.get("BTC/USDT", "1d", "binance", pd.Timestamp("2024-01-01"), source)
+    assert source.calls == [None, None]
+    assert store.stats["misses"] == 2
+
+
+def test_fetch_error_serves_local_data(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.get("ETH/USDT", "1h", "binance", pd.Timestamp("2024-01-01"), FakeSource(_bars("2024-01-01", 10)))
+
+    def broken(since):
+        raise ConnectionError("down")
+
+    df = store.get("ETH/USDT", "1h", "binance", pd.Timestamp("2024-01-01"), broken, max_age=0)
+    assert len(df) == 10
+    assert store.get_stats()["errors"] == 1
@@ -0,0 +1,115 @@
+"""
+Broker 连接池测试 (Broker 替换为内存实现)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+
+import pytest
+
+import services.brokers.pool as pool_mod
+from services.brokers.base import BaseBroker, BalanceInfo, OrderResult
+from services.brokers.pool import BrokerPool
+
+
+class FakeBroker(BaseBroker):
+    created = []
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.warmed = 0
+        self.closed = False
+        self.healthy = True
+        FakeBroker.created.append(self)
+
+    async def warm_up(self):
+        await asyncio.sleep(0.01)
+        self.warmed += 1
+
+    async def connect(self):
+        return self.healthy
+
+    async def get_balance(self):
+        return BalanceInfo()
+
+    async def place_order(self, symbol, side, quantity, order_type="market", price=None):
+        await asyncio.sleep(0.01)
+        return OrderResult(success=True, symbol=symbol)
+
+    async def cancel_order(self, order_id, symbol=""):
+        return True
+
+    async def get_order(self, order_id, symbol=""):
+        return OrderResult(success=True)
+
+    async def get_open_orders(self, symbol=""):
+        return []
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_brokers(monkeypatch):
+    FakeBroker.created = []
+    monkeypatch.setattr(pool_mod, "create_broker", lambda broker_type, api_key, **kwargs: FakeBroker(api_key))
+
+
+def _account(api_key="k1", account_id=1):
+    return {"id": account_id, "broker_type": "binance", "api_key": api_key, "api_secret": "s"}
+
+
+async def _order(pool, account):
+    async with pool.lease(account) as broker:
+        await broker.place_order("BTC/USDT", "buy", 1)
+        return broker
+
+
+def test_broker_is_reused_and_warmed_once():
+    pool = BrokerPool()
+
+    async def scenario():
+        return await asyncio.gather(*(_order(pool, _account()) for _ in range(5)))
+
+    brokers = asyncio.run(scenario())
+    assert len(FakeBroker.created) == 1
+    assert all(b is brokers[0] for b in brokers)
+    assert brokers[0].warmed == 1 and not brokers[0].closed
+    assert pool.get_stats()["hits"] == 4
+
+
+def test_credential_change_rebuilds_after_inflight_order():
+    pool = BrokerPool()
+
+    async def scenario():
+        old = await _order(pool, _account("k1"))
+        async with pool.lease(_account("k1")) as inflight:
+            new = await _order(pool, _account("k2"))
+            assert not inflight.closed  # 正在下单的旧实例等操作结束再关闭
+        await asyncio.sleep(0)
+        return old, new
+
+    old, new = asyncio.run(scenario())
+    assert old is not new and new.api_key == "k2"
+    assert old.closed and not new.closed
+    assert pool.get_stats()["rebuilds"] == 1
+
+
+def test_idle_eviction_and_health_check():
+    pool = BrokerPool(idle_ttl=0.05)
+
+    async def scenario():
+        stale = await _order(pool, _account(account_id=1))
+        await asyncio.sleep(0.1)
+        sick = await _order(pool, _account(account_id=2))
+        sick.healthy = False
+        await pool.maintain()
+        await asyncio.sleep(0)
+        return stale, sick
+
+    stale, sick = asyncio.run(scenario())
+    assert stale.closed and sick.closed
+    stats = pool.get_stats()
+    assert (stats["evictions"], stats["health_failures"], stats["size"]) == (1, 1, 0)
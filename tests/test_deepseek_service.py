@@ -0,0 +1,165 @@
+"""
+DeepSeek 客户端测试 (API 替换为 httpx.MockTransport)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+import services.deepseek_service as ds
+from services.llm_cache import LLMCache, prompt_key
+
+
+def _sse_body(pieces, fail_after=None):
+    lines = []
+    for i, text in enumerate(pieces):
+        if fail_after is not None and i == fail_after:
+            lines.append("data: {not json")
+            break
+        lines.append("data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": text}}]}))
+        lines.append("")
+    else:
+        lines.append("data: " + json.dumps({"choices": [], "usage": {"total_tokens": 42}}))
+        lines.append("")
+        lines.append("data: [DONE]")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    state = {"requests": [], "clients": 0, "fail_after": None}
+
+    async def handler(request):
+        await asyncio.sleep(0.01)  # 模拟网络往返，让并发请求有机会合并
+        payload = json.loads(request.content)
+        state["requests"].append((request, payload))
+        if payload["stream"]:
+            body = _sse_body(["## 结论", "\n看涨", "，注意风险"], state["fail_after"])
+            return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "回复"}}], "usage": {"total_tokens": 100}})
+
+    def new_client():
+        state["clients"] += 1
+        return httpx.AsyncClient(
+            base_url=ds.settings.DEEPSEEK_BASE_URL,
+            headers={"Authorization": f"Bearer {ds.settings.DEEPSEEK_API_KEY}"},
+            transport=httpx.MockTransport(handler),
+        )
+
+    monkeypatch.setattr(ds.settings, "DEEPSEEK_API_KEY", "sk-test")
+    monkeypatch.setattr(ds, "_new_client", new_client)
+    monkeypatch.setattr(ds, "_client", None)
+    state["cache"] = LLMCache(maxsize=8)
+    monkeypatch.setattr(ds, "get_llm_cache", lambda: state["cache"])
+    monkeypatch.setattr(ds.settings, "DEEPSEEK_CACHE_ENABLED", True)
+    return state
+
+
+def test_calls_share_one_client(fake_api):
+    async def scenario():
+        await ds.open_client()
+        replies = await asyncio.gather(*(ds.chat(f"问题{i}") for i in range(5)))
+        await ds.close_client()
+        return replies
+
+    assert asyncio.run(scenario()) == ["回复"] * 5
+    assert fake_api["clients"] == 1
+    request, payload = fake_api["requests"][0]
+    assert request.url.path == "/v1/chat/completions"
+    assert request.headers["authorization"] == "Bearer sk-test"
+    assert payload["stream"] is False
+    assert ds._client is None
+
+
+def test_stream_yields_deltas_in_order(fake_api):
+    async def scenario():
+        return [text async for text in ds.chat_stream("走势如何")]
+
+    assert asyncio.run(scenario()) == ["## 结论", "\n看涨", "，注意风险"]
+    assert fake_api["requests"][0][1]["stream"] is True
+
+
+def _events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_chat_route_streams_sse(fake_api):
+    response = TestClient(app).post(
+        "/api/v1/analysis/deepseek/chat", json={"message": "走势如何"},
+        headers={"Accept": "text/event-stream"},
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response)
+    assert [e for e, _ in events] == ["delta", "delta", "delta", "done"]
+    assert "".join(d["text"] for e, d in events if e == "delta") == "## 结论\n看涨，注意风险"
+    assert events[-1][1] == {"length": len("## 结论\n看涨，注意风险")}
+
+
+def test_chat_route_reports_stream_errors(fake_api):
+    fake_api["fail_after"] = 1
+    response = TestClient(app).post("/api/v1/analysis/deepseek/chat?stream=true", json={"message": "走势如何"})
+    events = _events(response)
+    assert [e for e, _ in events] == ["delta", "error"]
+
+
+BACKTEST = {"total_return": 12.5, "sharpe_ratio": 1.1, "max_drawdown": -8.0}
+
+
+def test_identical_prompts_are_cached_and_coalesced(fake_api):
+    async def scenario():
+        first = await asyncio.gather(*(ds.interpret_backtest("rsi", {"period": 14}, BACKTEST, "AAPL") for _ in range(3)))
+        again = await ds.interpret_backtest("rsi", {"period": 14}, BACKTEST, "AAPL")
+        other = await ds.interpret_backtest("rsi", {"period": 21}, BACKTEST, "AAPL")
+        return first + [again, other]
+
+    assert asyncio.run(scenario()) == ["回复"] * 5
+    assert len(fake_api["requests"]) == 2
+    stats = fake_api["cache"].get_stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (2, 2, 1)
+    assert stats["tokens_saved"] == 300
+    assert stats["hit_rate"] == 0.6
+
+
+def test_prompt_key_normalizes_whitespace():
+    a = [{"role": "user", "content": "RSI:  30\n\nMACD: 0.1 "}]
+    b = [{"role": "user", "content": "RSI: 30 MACD: 0.1"}]
+    assert prompt_key(a, "m", 0.3, 100) == prompt_key(b, "m", 0.3, 100)
+    assert prompt_key(a, "m", 0.3, 100) != prompt_key(a, "m", 0.2, 100)
+
+
+def test_disk_store_survives_restart(fake_api, tmp_path):
+    async def ask():
+        return await ds.generate_strategy_suggestion("AAPL", {"rsi": 40})
+
+    fake_api["cache"] = LLMCache(maxsize=8, disk_dir=str(tmp_path))
+    asyncio.run(ask())
+    fake_api["cache"] = LLMCache(maxsize=8, disk_dir=str(tmp_path))  # 模拟重启
+    assert asyncio.run(ask()) == "回复"
+    assert len(fake_api["requests"]) == 1
+    assert fake_api["cache"].get_stats()["disk_hits"] == 1
+
+
+def test_streamed_report_fills_cache(fake_api):
+    args = ("AAPL", {"price": 100}, {}, {"signal": "buy"}, None)
+
+    async def scenario():
+        streamed = [t async for t in ds.generate_analysis_report_stream(*args)]
+        cached = [t async for t in ds.generate_analysis_report_stream(*args)]
+        full = await ds.generate_analysis_report(*args)
+        return streamed, cached, full
+
+    streamed, cached, full = asyncio.run(scenario())
+    assert len(fake_api["requests"]) == 1
+    assert cached == [full] == ["".join(streamed)]
+    assert fake_api["cache"].get_stats()["tokens_saved"] == 84
@@ -0,0 +1,97 @@
+"""
+技术指标库测试 (离线, 使用合成 K 线)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import indicators as ind
+from services.indicators import IndicatorCache, IndicatorState
+from services.market_data import calculate_indicators
+from services.ai_service import predict_trend
+
+
+def _make_df(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    high = close * (1 + np.abs(rng.normal(0, 0.01, n)))
+    low = close * (1 - np.abs(rng.normal(0, 0.01, n)))
+    volume = rng.integers(100_000, 1_000_000, n).astype(float)
+    return pd.DataFrame(
+        {"open": close, "high": high, "low": low, "close": close, "volume": volume},
+        index=pd.date_range("2020-01-01", periods=n, freq="D"),
+    )
+
+
+def test_shared_cache_computes_once():
+    df = _make_df()
+    cache = {}
+    indicators = calculate_indicators(df, cache)
+    keys = set(cache)
+    trend = predict_trend(df, cache=cache)
+    # MA / RSI / MACD 全部复用，只新增 calculate_indicators 没有的 20 日成交量均线
+    assert set(cache) - keys == {("rolling", "volume", 20, "mean", 0, None)}
+    fresh = calculate_indicators(df)
+    for key, values in indicators.items():
+        np.testing.assert_array_equal(values, fresh[key])
+    assert trend == predict_trend(df)
+
+
+def test_indicator_cache_keyed_by_frame():
+    cache = IndicatorCache(maxsize=2)
+    df = _make_df()
+    first = cache.get("stock:AAPL", "1d", df)
+    assert cache.get("stock:AAPL", "1d", df.copy()) is first
+    # 最后一根 K 线变化 (未走完的 K 线) 视为新的一份数据
+    updated = df.copy()
+    updated.iloc[-1, updated.columns.get_loc("close")] += 1
+    assert cache.get("stock:AAPL", "1d", updated) is not first
+    cache.get("stock:MSFT", "1d", df)
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.get("stock:AAPL", "1d", df) is not first
+
+
+def test_incremental_state_matches_full_recompute():
+    df = _make_df(400, seed=3)
+    state = IndicatorState.from_frame(df.iloc[:300])
+    for ts, row in df.iloc[300:].iterrows():
+        latest = state.update(ts, row["high"], row["low"], row["close"], row["volume"])
+
+    full = calculate_indicators(df)
+    for key, value in latest.items():
+        if key in ("close", "volume"):
+            continue
+        assert value == pytest.approx(full[key][-1], rel=1e-9, abs=1e-9), key
+
+
+def test_incremental_state_replaces_unfinished_bar():
+    df = _make_df(120, seed=5)
+    state = IndicatorState.from_frame(df)
+    ts, last = df.index[-1], df.iloc[-1]
+    state.update(ts, last["high"] * 1.05, last["low"], last["close"] * 1.04, last["volume"] * 2)
+    latest = state.update(ts, last["high"], last["low"], last["close"], last["volume"])
+
+    full = calculate_indicators(df)
+    for key in ("ma20", "rsi14", "macd", "boll_upper", "kdj_j", "vol_ma10"):
+        assert latest[key] == pytest.approx(full[key][-1], rel=1e-9), key
+
+
+def test_wilder_rsi_incremental_matches_vectorized():
+    df = _make_df(200, seed=7)
+    expected = ind.rsi(df, None, 14, wilder=True)
+    assert np.isnan(expected[:14]).all()
+    state = ind.RSIState(14, wilder=True)
+    got = np.array([state.push(c) for c in df["close"]])
+    np.testing.assert_allclose(got[14:], expected[14:], rtol=1e-9)
+
+
+def test_ema_state_handles_missing_values():
+    data = [np.nan, np.nan, 3.0, np.nan, np.nan, 6.0, 7.0]
+    state = ind.EMAState(com=2)
+    got = [state.push(x) for x in data]
+    expected = pd.Series(data).ewm(com=2, adjust=False).mean().tolist()
+    np.testing.assert_allclose(got, expected, equal_nan=True)
@@ -0,0 +1,218 @@
+"""
+批量报价测试 (离线, 替换 yfinance / 交易所)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+import services.market_data as md
+from services.quote_cache import QuoteCache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    cache = QuoteCache(ttl={"stock": 60, "crypto": 60})
+    monkeypatch.setattr(md, "get_quote_cache", lambda: cache)
+    monkeypatch.setattr(md.settings, "QUOTE_SYMBOL_TIMEOUT", 0.2)
+    return cache
+
+
+class FakeExchange:
+    has = {"fetchTickers": True}
+
+    def __init__(self):
+        self.batch_calls = []
+        self.single_calls = []
+
+    async def fetch_tickers(self, symbols):
+        self.batch_calls.append(list(symbols))
+        # 模拟交易所不认识其中一个标的
+        return {s: {"last": 1.0, "percentage": 2.0} for s in symbols if s != "DOT/USDT"}
+
+    async def fetch_ticker(self, symbol):
+        self.single_calls.append(symbol)
+        await asyncio.sleep(10)  # 慢标的: 触发单标的超时
+
+
+def test_crypto_batch_uses_fetch_tickers_and_times_out_slow_symbol(monkeypatch, fresh_cache):
+    ex = FakeExchange()
+    monkeypatch.setattr(md, "_get_async_exchange", lambda name: ex)
+    symbols = ["BTC/USDT", "ETH/USDT", "DOT/USDT"]
+
+    quotes = asyncio.run(md.get_multiple_crypto_quotes(symbols))
+    assert [q["symbol"] for q in quotes] == ["BTC/USDT", "ETH/USDT"]
+    assert ex.batch_calls == [symbols]
+    assert ex.single_calls == ["DOT/USDT"]
+
+    # 第二次只请求缓存中缺失的标的
+    asyncio.run(md.get_multiple_crypto_quotes(symbols))
+    assert ex.batch_calls[-1] == ["DOT/USDT"]
+    assert fresh_cache.peek("crypto", "binance:BTC/USDT")["price"] == 1.0
+
+
+def test_stock_batch_uses_single_multi_ticker_download(monkeypatch):
+    calls = []
+
+    def fake_download(symbols, **kwargs):
+        calls.append((list(symbols), kwargs))
+        index = pd.date_range("2025-01-06", periods=3, freq="D")
+        frames = {}
+        for i, sym in enumerate(symbols):
+            if sym == "BAD":
+                continue
+            close = np.array([10.0, 11.0, np.nan]) + i  # 最后一天休市
+            frames[sym] = pd.DataFrame(
+                {"Open": close, "High": close, "Low": close, "Close": close, "Volume": [100, 200, np.nan]},
+                index=index,
+            )
+        return pd.concat(frames, axis=1)
+
+    monkeypatch.setattr(md.yf, "download", fake_download)
+    quotes = asyncio.run(md.get_multiple_quotes(["600519.SS", "BAD", "0700.HK"]))
+    assert len(calls) == 1
+    assert calls[0][1]["threads"] <= md.settings.QUOTE_BATCH_CONCURRENCY
+    assert [q["symbol"] for q in quotes] == ["600519.SS", "0700.HK"]
+    assert quotes[0]["name"] == "贵州茅台"
+    assert quotes[0]["price"] == 11.0 and quotes[0]["change"] == 1.0
+
+
+def test_blocking_stock_calls_do_not_block_event_loop(monkeypatch):
+    import time
+    import services.market_service as ms
+
+    def slow_quote(symbol):
+        time.sleep(0.2)
+        return {"symbol": symbol, "price": 1.0}
+
+    monkeypatch.setattr(ms, "get_stock_quote", slow_quote)
+
+    async def main():
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        beat = asyncio.ensure_future(heartbeat())
+        start = time.perf_counter()
+        quotes = await asyncio.gather(*(ms.fetch_stock_quote(f"S{i}") for i in range(10)))
+        elapsed = time.perf_counter() - start
+        beat.cancel()
+        return quotes, elapsed, ticks
+
+    quotes, elapsed, ticks = asyncio.run(main())
+    assert len(quotes) == 10
+    assert elapsed < 1.0  # 并行执行, 而非 10 x 0.2s
+    assert ticks >= 10  # 等待期间事件循环仍在运转
+
+
+def test_async_crypto_price_coalesces_identical_requests(monkeypatch):
+    import services.market_service as ms
+
+    class Exchange:
+        calls = 0
+
+        async def fetch_ticker(self, symbol):
+            Exchange.calls += 1
+            await asyncio.sleep(0.05)
+            return {"last": 42.0, "percentage": 1.0}
+
+    monkeypatch.setattr(ms, "_get_async_exchange", lambda name: Exchange())
+
+    async def main():
+        return await asyncio.gather(*(ms.fetch_crypto_price("BTC/USDT") for _ in range(50)))
+
+    quotes = asyncio.run(main())
+    assert Exchange.calls == 1
+    assert all(q["price"] == 42.0 for q in quotes)
+
+
+def test_backtest_route_runs_in_process_pool(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    import routers.backtest as bt
+
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 300)))
+    df = pd.DataFrame(
+        {"open": close, "high": close * 1.01, "low": close * 0.99, "close": close, "volume": 1e6},
+        index=pd.date_range("2024-01-01", periods=300, freq="D"),
+    )
+
+    async def fake_history(symbol, days=1000, period="5y"):
+        return df.copy()
+
+    monkeypatch.setattr(bt, "fetch_daily_history", fake_history)
+    response = TestClient(app).post("/api/v1/backtest/run/guest", json={
+        "strategy_type": "ma_cross", "symbol": "600519.SS",
+        "start_date": "2024-01-01", "end_date": "2024-12-31",
+    })
+    data = response.json()
+    assert data["success"] is True
+    assert len(data["data"]["equity_curve"]) == 300
+
+
+def _stock_frame(n=120):
+    rng = np.random.default_rng(1)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return pd.DataFrame(
+        {"open": close, "high": close * 1.01, "low": close * 0.99, "close": close, "volume": 1234567.0},
+        index=pd.date_range("2024-01-01", periods=n, freq="D", name="Date"),
+    )
+
+
+def test_history_rows_match_per_row_rounding(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    import routers.stocks as stocks
+
+    df = _stock_frame()
+
+    async def fake_history(symbol, period="6mo"):
+        return df.copy()
+
+    monkeypatch.setattr(stocks, "fetch_stock_history", fake_history)
+    data = TestClient(app).get("/api/v1/stocks/history/AAPL").json()["data"]
+    first = data["candles"][0]
+    assert first == {
+        "date": "2024-01-01",
+        "open": round(float(df["open"].iloc[0]), 2),
+        "high": round(float(df["high"].iloc[0]), 2),
+        "low": round(float(df["low"].iloc[0]), 2),
+        "close": round(float(df["close"].iloc[0]), 2),
+        "volume": 1234567,
+    }
+    assert len(data["candles"]) == 120
+    assert data["indicators"]["ma20"][:19] == [None] * 19
+
+
+def test_history_columnar_layout_and_negotiation(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    from core import responses
+    import routers.stocks as stocks
+
+    async def fake_history(symbol, period="6mo"):
+        return _stock_frame()
+
+    monkeypatch.setattr(stocks, "fetch_stock_history", fake_history)
+    client = TestClient(app)
+    response = client.get("/api/v1/stocks/history/AAPL?layout=columns")
+    data = response.json()["data"]
+    assert data["layout"] == "columns"
+    assert set(data["columns"]) == {"date", "open", "high", "low", "close", "volume"}
+    assert len(data["columns"]["close"]) == len(data["indicators"]["rsi14"]) == 120
+    assert data["indicators"]["ma5"][:4] == [None] * 4
+    assert "dates" not in data["indicators"]
+
+    # 未安装的编码退回 JSON
+    monkeypatch.setattr(responses, "msgpack", None)
+    response = client.get("/api/v1/stocks/history/AAPL?layout=columns", headers={"Accept": responses.MSGPACK})
+    assert response.headers["content-type"].startswith("application/json")
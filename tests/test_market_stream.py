@@ -0,0 +1,119 @@
+"""
+实时行情流测试 (交易所替换为 LocalFeed)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import services.market_service as market_service
+from services.bar_series import BarSeries
+from services.market_stream import BarRing, LocalFeed, MarketStream
+
+MINUTE = 60_000
+T0 = 1_700_000_000_000 // MINUTE * MINUTE
+
+
+def _bar(i, close=100.0):
+    return [T0 + i * MINUTE, close, close + 1, close - 1, close, 10.0]
+
+
+def _frame(rows):
+    rows = np.array(rows, dtype=float)
+    df = pd.DataFrame(rows[:, 1:], columns=["open", "high", "low", "close", "volume"],
+                      index=pd.to_datetime(rows[:, 0].astype(np.int64), unit="ms"))
+    df.index.name = "timestamp"
+    return df
+
+
+def test_ring_appends_updates_and_wraps():
+    ring = BarRing(4, MINUTE)
+    for i in range(6):
+        ring.push(_bar(i))
+    assert ring.push(_bar(5, close=105))  # 未走完的 K 线原地更新
+    assert not ring.push(_bar(1))
+    assert list(ring.bars.ts.astype("datetime64[ms]").astype(np.int64)) == [T0 + i * MINUTE for i in range(2, 6)]
+    assert list(ring.frame(2)["close"]) == [100, 105]
+
+
+def test_ring_seed_and_gap():
+    ring = BarRing(100, MINUTE)
+    ring.push(_bar(10, close=110))
+    ring.push(_bar(11))
+    ring.seed(BarSeries.from_ohlcv([_bar(i) for i in range(11)]))
+    assert ring.contiguous and ring.size == 12
+    assert ring.bars.close[10] == 110  # 时间戳相同时以推送为准
+
+    ring.push(_bar(15))  # 断线漏掉 12-14
+    assert not ring.contiguous
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    feed = LocalFeed()
+    s = MarketStream(timeframes=("1m",), capacity=50, feed=feed)
+    monkeypatch.setattr(market_service, "get_market_stream", lambda: s)
+    monkeypatch.setattr(market_service.settings, "BAR_STORE_ENABLED", False)
+    downloads = []
+
+    async def download(symbol, timeframe, limit, exchange, since=None):
+        downloads.append((symbol, timeframe, limit))
+        return _frame([_bar(i) for i in range(30)])
+
+    def no_rest(name="binance"):
+        raise AssertionError("行情流在线时不应请求交易所")
+
+    monkeypatch.setattr(market_service, "_download_crypto_history", download)
+    monkeypatch.setattr(market_service, "_get_async_exchange", no_rest)
+    return s, feed, downloads
+
+
+def test_prices_and_history_served_from_stream(stream):
+    s, feed, downloads = stream
+    heard = []
+    s.add_quote_listener(heard.append)
+
+    async def scenario():
+        s.start(["BTC/USDT"])
+        feed.push_ticker("BTC/USDT", {"last": 101.5, "percentage": 1.2})
+        feed.push_kline("BTC/USDT", "1m", _bar(29, close=101), _bar(30, close=101.5))
+        await asyncio.sleep(0.01)
+
+        quote = await market_service.fetch_crypto_price("BTC/USDT")
+        first = await market_service.fetch_crypto_history("BTC/USDT", "1m", 20)  # 尚未补齐历史, 走 REST 并补齐
+        second = await market_service.fetch_crypto_history("BTC/USDT", "1m", 20)
+        indicators = s.indicators("BTC/USDT", "1m")
+        await s.stop()
+        return quote, first, second, indicators
+
+    quote, first, second, indicators = asyncio.run(scenario())
+    assert quote["price"] == 101.5 and heard[0]["change_pct"] == 1.2
+    assert len(downloads) == 1
+    assert len(second) == 20 and second["close"].iloc[-2:].tolist() == [101, 101.5]
+    assert second.index[-1] == pd.Timestamp(T0 + 30 * MINUTE, unit="ms")
+    assert indicators["close"] == 101.5 and not np.isnan(indicators["ma20"])
+    assert s.get_stats()["history_hits"] == 1
+
+
+def test_history_falls_back_after_gap(stream):
+    s, feed, downloads = stream
+
+    async def scenario():
+        s.start(["BTC/USDT"])
+        feed.push_ticker("BTC/USDT", {"last": 100})
+        feed.push_kline("BTC/USDT", "1m", _bar(30))
+        await asyncio.sleep(0.01)
+        await market_service.fetch_crypto_history("BTC/USDT", "1m", 20)
+        feed.push_kline("BTC/USDT", "1m", _bar(40))
+        await asyncio.sleep(0.01)
+        await market_service.fetch_crypto_history("BTC/USDT", "1m", 20)
+        await s.stop()
+
+    asyncio.run(scenario())
+    assert len(downloads) == 2
+    assert s.get_stats()["gaps"] == 1
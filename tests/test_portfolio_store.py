@@ -0,0 +1,166 @@
+"""
+组合数据访问测试 (Supabase 替换为内存实现)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+import database
+import services.portfolio_store as store
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """支持 eq 过滤和增删改的内存表"""
+
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self.op, self.payload, self.filters, self.columns = "select", None, {}, "*"
+
+    def select(self, columns="*"):
+        self.columns = columns
+        return self
+
+    def insert(self, record):
+        self.op, self.payload = "insert", record
+        return self
+
+    def update(self, values):
+        self.op, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def execute(self):
+        self.db.requests += 1
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.op == "insert":
+            row = {**self.payload, "id": len(rows) + 1}
+            rows.append(row)
+            return _Result([row])
+        matched = [r for r in rows if all(r.get(k) == v for k, v in self.filters.items())]
+        if self.op == "update":
+            for r in matched:
+                r.update(self.payload)
+        elif self.op == "delete":
+            rows[:] = [r for r in rows if r not in matched]
+        elif self.columns == "*, positions(*)":
+            matched = [
+                {**r, "positions": [p for p in self.db.tables["positions"] if p["portfolio_id"] == r["id"]]}
+                for r in matched
+            ]
+        return _Result(matched)
+
+
+class _Rpc:
+    def __init__(self, db, params):
+        self.db, self.params = db, params
+
+    def execute(self):
+        self.db.requests += 1
+        self.db.rpc_calls.append(self.params)
+        if self.db.rpc_error:
+            raise APIError(self.db.rpc_error)
+        return _Result({"id": 1, "symbol": self.params["p_symbol"]})
+
+
+class FakeSupabase:
+    def __init__(self, tables):
+        self.tables = tables
+        self.requests = 0
+        self.rpc_calls = []
+        self.rpc_error = None
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        assert name == "apply_trade"
+        return _Rpc(self, params)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeSupabase({
+        "portfolios": [
+            {"id": 1, "user_id": 5, "cash_balance": 10000.0, "initial_capital": 10000.0, "current_value": 10000.0},
+            {"id": 2, "user_id": 5, "cash_balance": 500.0, "initial_capital": 500.0, "current_value": 500.0},
+        ],
+        "positions": [
+            {"id": 1, "portfolio_id": 1, "symbol": "AAPL", "quantity": 10, "avg_cost": 100.0, "market_value": 1000.0},
+        ],
+        "trades": [],
+        "agent_decisions": [{"id": 1, "session_id": 3, "status": "pending"}],
+        "agent_sessions": [{"id": 3, "total_trades": 0, "total_pnl": 0, "win_trades": 0, "lose_trades": 0}],
+    })
+    monkeypatch.setattr(store, "get_supabase", lambda: fake)
+    monkeypatch.setattr(store, "_rpc_available", True)
+    return fake
+
+
+def test_portfolios_and_positions_in_one_query(db):
+    portfolios = store.list_portfolios_with_positions(5)
+    assert db.requests == 1
+    assert [len(p["positions"]) for p in portfolios] == [1, 0]
+
+
+def test_trade_is_one_rpc(db):
+    trade = store.apply_trade(1, "AAPL", "buy", 5, 110.0, 0.001, decision_id=1)
+    assert trade["symbol"] == "AAPL"
+    assert db.requests == 1
+    assert db.rpc_calls[0]["p_decision_id"] == 1
+
+
+def test_rpc_errors_become_rejections(db):
+    db.rpc_error = {"code": "P0001", "message": "insufficient_cash"}
+    with pytest.raises(store.TradeRejected, match="资金不足"):
+        store.apply_trade(2, "AAPL", "buy", 100, 110.0, 0.001)
+
+
+def test_sequential_fallback_without_function(db):
+    db.rpc_error = {"code": "PGRST202", "message": "Could not find the function public.apply_trade"}
+    trade = store.apply_trade(1, "AAPL", "sell", 20, 120.0, 0.0, allow_partial=True, decision_id=1)
+    assert store._rpc_available is False
+    assert trade["quantity"] == 10 and trade["pnl"] == 200.0
+    assert db.tables["positions"] == []
+    portfolio = db.tables["portfolios"][0]
+    assert portfolio["cash_balance"] == 11200.0 and portfolio["total_pnl"] == 1200.0
+    assert db.tables["agent_decisions"][0]["status"] == "executed"
+    assert db.tables["agent_sessions"][0]["win_trades"] == 1
+
+    # 之后不再尝试调用数据库函数
+    store.apply_trade(1, "MSFT", "buy", 10, 100.0, 0.0)
+    assert len(db.rpc_calls) == 1
+    assert db.tables["portfolios"][0]["current_value"] == 11200.0
+    with pytest.raises(store.TradeRejected, match="无持仓"):
+        store.apply_trade(1, "TSLA", "sell", 1, 100.0, 0.0)
+
+
+def test_query_stats_follow_request_context():
+    session = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=[])))
+    database.instrument(session)
+    database.instrument(session)  # 重复挂载无副作用
+    before = database.get_db_stats()["queries"]
+
+    stats = database.start_query_stats()
+    for _ in range(3):
+        session.get("http://db.local/rest/v1/portfolios")
+    assert stats.queries == 3
+    assert database.get_db_stats()["queries"] == before + 3
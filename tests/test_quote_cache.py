@@ -0,0 +1,72 @@
+"""
+报价缓存测试
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.quote_cache import QuoteCache
+
+
+class SlowLoader:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return {"price": float(self.calls)}
+
+
+def test_ttl_and_copy_on_read():
+    cache = QuoteCache(ttl={"stock": 60})
+    loader = SlowLoader(0)
+    first = cache.get("stock", "600519.SS", loader)
+    first["name"] = "changed"
+    second = cache.get("stock", "600519.SS", loader)
+    assert loader.calls == 1
+    assert second == {"price": 1.0}
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    cache = QuoteCache(ttl={"crypto": 60})
+    loader = SlowLoader(0.1)
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda _: cache.get("crypto", "binance:BTC/USDT", loader), range(20)))
+    assert loader.calls == 1
+    assert all(r == {"price": 1.0} for r in results)
+    assert cache.stats["coalesced"] == 19
+
+
+def test_lru_eviction_and_errors_not_cached():
+    cache = QuoteCache(ttl={"stock": 60}, maxsize=2)
+    for sym in ("A", "B"):
+        cache.get("stock", sym, lambda: {"price": 1})
+    cache.get("stock", "A", lambda: {"price": 2})  # A 变为最近使用
+    cache.get("stock", "C", lambda: {"price": 3})
+    assert cache.get("stock", "A", lambda: {"price": 9}) == {"price": 1}
+    assert cache.get("stock", "B", lambda: {"price": 9}) == {"price": 9}
+    assert cache.stats["evictions"] >= 1
+
+    calls = []
+    for _ in range(2):
+        cache.get("stock", "BAD", lambda: calls.append(1) or {"error": "无数据"})
+    assert len(calls) == 2
+
+
+def test_stale_while_revalidate():
+    cache = QuoteCache(ttl={"crypto": 0.3}, stale_seconds=10)
+    loader = SlowLoader(0.05)
+    assert cache.get("crypto", "ETH", loader) == {"price": 1.0}
+    time.sleep(0.31)
+    start = time.perf_counter()
+    assert cache.get("crypto", "ETH", loader) == {"price": 1.0}  # 旧值立即返回
+    assert time.perf_counter() - start < 0.04
+    time.sleep(0.1)
+    assert cache.get("crypto", "ETH", loader) == {"price": 2.0}  # 后台已刷新
+    assert cache.stats["stale_hits"] == 1
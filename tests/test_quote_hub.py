@@ -0,0 +1,181 @@
+"""
+行情推送测试 (上游替换为内存实现)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import FastAPI, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+import services.quote_hub as quote_hub
+from core.security import create_access_token
+import routers.stream as stream_router
+from services.quote_hub import QuoteHub
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = {"crypto": [], "stock": [], "history": []}
+
+    async def crypto_quotes(symbols):
+        calls["crypto"].append(list(symbols))
+        return [{"symbol": s, "price": 100.0, "change_pct": 1.0} for s in symbols]
+
+    async def stock_quotes(symbols):
+        calls["stock"].append(list(symbols))
+        return [{"symbol": s, "price": 10.0, "change": 0.1, "change_pct": 1.0, "name": s} for s in symbols]
+
+    async def daily_history(symbol, days=1000, period="5y"):
+        calls["history"].append(symbol)
+        close = np.linspace(10, 20, 60)
+        return pd.DataFrame({"high": close, "low": close, "close": close, "volume": np.full(60, 1e6)},
+                            index=pd.date_range("2026-01-01", periods=60))
+
+    monkeypatch.setattr(quote_hub, "get_multiple_crypto_quotes", crypto_quotes)
+    monkeypatch.setattr(quote_hub, "get_multiple_quotes", stock_quotes)
+    monkeypatch.setattr(quote_hub, "fetch_daily_history", daily_history)
+    return calls
+
+
+def test_fan_out_sends_only_changed_fields():
+    hub = QuoteHub()
+
+    async def scenario():
+        subs = [hub.connect() for _ in range(100)]
+        for sub in subs:
+            hub.subscribe(sub, ["BTC/USDT"])
+        hub.publish("BTC/USDT", {"price": 100, "change_pct": 1})
+        first = [await sub.next_batch() for sub in subs]
+        hub.publish("BTC/USDT", {"price": 100, "change_pct": 1})  # 无变化不推送
+        hub.publish("BTC/USDT", {"price": 101, "change_pct": 1})
+        second = await subs[0].next_batch()
+        late = hub.connect()
+        hub.subscribe(late, ["BTC/USDT"])
+        return first, second, await late.next_batch()
+
+    first, second, snapshot = asyncio.run(scenario())
+    assert all(b == {"BTC/USDT": {"price": 100, "change_pct": 1}} for b in first)
+    assert second == {"BTC/USDT": {"price": 101}}
+    assert snapshot == {"BTC/USDT": {"price": 101, "change_pct": 1}}
+    assert hub.get_stats()["published"] == 2
+
+
+def test_slow_consumer_gets_conflated_latest_values():
+    hub = QuoteHub()
+
+    async def scenario():
+        sub = hub.connect()
+        hub.subscribe(sub, ["BTC/USDT", "ETH/USDT"])
+        for i in range(1000):
+            hub.publish("BTC/USDT", {"price": 100 + i, "rsi14": 50 + i % 2})
+        hub.publish("ETH/USDT", {"price": 5})
+        assert len(sub._pending) == 2  # 积压量不超过订阅的标的数
+        return await sub.next_batch()
+
+    batch = asyncio.run(scenario())
+    assert batch == {"BTC/USDT": {"price": 1099, "rsi14": 51}, "ETH/USDT": {"price": 5}}
+    assert hub.get_stats()["conflated"] == 999
+
+
+def test_poll_is_independent_of_subscriber_count(upstream):
+    hub = QuoteHub()
+
+    async def scenario():
+        subs = [hub.connect() for _ in range(50)]
+        for sub in subs:
+            hub.subscribe(sub, ["BTC/USDT", "600519.SS"])
+        await hub.poll()
+        await hub.poll()
+        return await subs[-1].next_batch()
+
+    batch = asyncio.run(scenario())
+    assert upstream["crypto"] == [["BTC/USDT"]] * 2 and upstream["stock"] == [["600519.SS"]] * 2
+    assert sorted(upstream["history"]) == ["600519.SS", "BTC/USDT"]  # 日线指标只在新订阅时计算一次
+    stock = batch["600519.SS"]
+    assert stock["price"] == 10.0 and stock["timeframe"] == "1d" and stock["ma20"] is not None
+    assert "name" not in stock
+
+
+@pytest.fixture
+def ws_app(monkeypatch):
+    import routers.auth as auth
+    hub = QuoteHub()
+    monkeypatch.setattr(stream_router, "get_quote_hub", lambda: hub)
+    monkeypatch.setattr(auth.settings, "AUTH_TOKEN_CLAIMS", True)
+
+    async def markets(exchange):
+        return {"BTC/USDT", "ETH/USDT"}
+
+    monkeypatch.setattr(quote_hub, "get_crypto_markets", markets)
+    app = FastAPI()
+    app.include_router(stream_router.router, prefix="/stream")
+    token = create_access_token({"sub": "999", "usr": {"username": "ws", "email": "ws@example.com", "is_active": True}})
+    return TestClient(app), hub, token
+
+
+def test_websocket_requires_token(ws_app):
+    client, hub, _ = ws_app
+    for url in ["/stream/quotes?symbols=BTC/USDT", "/stream/quotes?symbols=BTC/USDT&token=bad"]:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect(url):
+                pass
+        assert exc.value.code == 1008
+    assert hub.symbols() == []
+
+
+def test_websocket_subscribe_and_push(ws_app):
+    client, hub, token = ws_app
+
+    with client.websocket_connect(f"/stream/quotes?symbols=BTC/USDT,FOO/BAR&token={token}") as ws:
+        assert ws.receive_json() == {"type": "error", "message": "未知标的: FOO/BAR"}
+        deadline = time.monotonic() + 5
+        while "BTC/USDT" not in hub.symbols() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        ws.portal.call(hub.publish, "BTC/USDT", {"price": 100.5})
+        assert ws.receive_json() == {"type": "update", "quotes": {"BTC/USDT": {"price": 100.5}}}
+
+        ws.send_json({"action": "subscribe", "symbols": ["ETH/USDT"]})
+        ws.send_json({"action": "unsubscribe", "symbols": ["BTC/USDT"]})
+        ws.send_json({"action": "noop"})
+        assert ws.receive_json()["type"] == "error"  # 前两条按顺序处理完毕
+        assert hub.symbols() == ["ETH/USDT"]
+    deadline = time.monotonic() + 5
+    while hub.symbols() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert hub.get_stats()["subscribers"] == 0
+
+
+def test_stream_symbols_added_by_hub_are_released(monkeypatch):
+    from services.market_stream import LocalFeed, MarketStream
+    stream = MarketStream(timeframes=("1m",), feed=LocalFeed())
+    monkeypatch.setattr(quote_hub, "get_market_stream", lambda: stream)
+    hub = QuoteHub()
+
+    async def noop(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(quote_hub, "fetch_crypto_history", noop)
+
+    async def scenario():
+        stream.start(["BTC/USDT"])  # MARKET_STREAM_SYMBOLS 中的标的
+        a, b = hub.connect(), hub.connect()
+        hub.subscribe(a, ["BTC/USDT", "SOL/USDT"])
+        hub.subscribe(b, ["SOL/USDT"])
+        hub.disconnect(a)
+        during = stream.subscribed("SOL/USDT")
+        hub.disconnect(b)
+        await asyncio.sleep(0)
+        after = (stream.subscribed("SOL/USDT"), stream.subscribed("BTC/USDT"), stream.get_stats()["symbols"])
+        await stream.stop()
+        return during, after
+
+    during, after = asyncio.run(scenario())
+    assert during and after == (False, True, 1)
+    assert ("SOL/USDT", "1m") not in stream._series
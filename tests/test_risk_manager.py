@@ -0,0 +1,132 @@
+"""
+批量风险指标测试
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.risk_manager import (
+    batch_risk_metrics, calculate_risk_metrics, horizon_risk_metrics, returns_matrix, risk_summary,
+    rolling_risk_metrics,
+)
+
+
+def _closes(n, seed, freq="D"):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0.0005, 0.02, n))
+    return pd.Series(close, index=pd.date_range("2024-01-01", periods=n, freq=freq))
+
+
+def _reference(close: pd.Series) -> dict:
+    """逐标的的 pandas 写法 (原 calculate_risk_metrics 的口径)"""
+    r = close.pct_change().dropna()
+    neg = r[r < 0]
+    var = np.percentile(r, 5)
+    return {
+        "volatility": r.std() * np.sqrt(252),
+        "sharpe_ratio": r.mean() / r.std() * np.sqrt(252),
+        "sortino_ratio": r.mean() / neg.std() * np.sqrt(252),
+        "max_drawdown": ((close.cummax() - close) / close.cummax()).max(),
+        "var_95": var,
+        "cvar_95": r[r <= var].mean(),
+        "total_return": close.iloc[-1] / close.iloc[0] - 1,
+    }
+
+
+def test_matches_per_series_computation_on_misaligned_calendars():
+    crypto = _closes(300, 1)
+    stock = _closes(200, 2, freq="B")  # 周末无数据
+    late = _closes(80, 3)[40:]  # 上市较晚
+    returns = returns_matrix({"BTC/USDT": crypto, "AAPL": stock, "NEW": late})
+    assert returns.shape[1] == 3 and returns["AAPL"].isna().any()
+
+    metrics = batch_risk_metrics(returns)
+    for i, close in enumerate([crypto, stock, late]):
+        for key, expected in _reference(close).items():
+            assert np.isclose(metrics[key][i], expected), key
+    assert list(metrics["observations"]) == [299, 199, 39]
+
+    single = calculate_risk_metrics(stock.tolist())
+    assert single == risk_summary(metrics, 1)
+    assert calculate_risk_metrics([1.0]) == {}
+
+
+def test_horizons_use_last_valid_observations_and_rolling_matches_pandas():
+    stock = _closes(400, 4, freq="B")
+    crypto = _closes(560, 5)
+    returns = returns_matrix({"AAPL": stock, "ETH/USDT": crypto})
+
+    horizons = horizon_risk_metrics(returns)
+    for h, metrics in horizons.items():
+        assert list(metrics["observations"]) == [h, h]
+        for i, close in enumerate([stock, crypto]):
+            r = close.pct_change().dropna().iloc[-h:]
+            assert np.isclose(metrics["volatility"][i], r.std() * np.sqrt(252))
+            assert np.isclose(metrics["var_95"][i], np.percentile(r, 5))
+
+    rolling = rolling_risk_metrics(returns, window=60)
+    expected = returns.rolling(60, min_periods=30).std() * np.sqrt(252)
+    expected = expected.where(returns.notna())
+    assert np.allclose(rolling["volatility"], expected.to_numpy(), equal_nan=True)
+
+    short = batch_risk_metrics(np.array([[0.01, np.nan], [np.nan, np.nan], [0.02, 0.01]]))
+    assert np.isnan(short["volatility"][1]) and not np.isnan(short["volatility"][0])
+
+
+def test_screen_five_thousand_symbols():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0, 0.02, (252, 5000))
+    returns[rng.random(returns.shape) < 0.1] = np.nan
+
+    batch_risk_metrics(returns[:, :10])
+    start = time.perf_counter()
+    metrics = batch_risk_metrics(returns)
+    horizons = horizon_risk_metrics(returns)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 1.0
+    assert metrics["volatility"].shape == (5000,) and not np.isnan(horizons[20]["cvar_95"]).any()
+
+
+def test_risk_screen_route(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    import routers.analysis as analysis
+
+    frames = {"AAPL": _closes(250, 6, freq="B"), "MSFT": _closes(250, 7, freq="B")}
+
+    async def fake_df(symbol, asset_type, period="6mo", min_rows=30, long_period=False):
+        close = frames.get(symbol)
+        return None if close is None else close.to_frame("close")
+
+    monkeypatch.setattr(analysis, "_get_df", fake_df)
+    data = TestClient(app).get("/api/v1/analysis/risk", params={"symbols": "AAPL,MSFT,NONE"}).json()["data"]
+    assert data["skipped"] == ["NONE"]
+    aapl = data["results"]["AAPL"]
+    assert aapl["metrics"] == calculate_risk_metrics(frames["AAPL"].tolist())
+    assert set(aapl["horizons"]) == {"20", "60", "252"} and aapl["horizons"]["60"]["observations"] == 60
+    assert "score" in aapl["risk_score"]
+
+
+def test_single_symbol_route_with_rolling(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    import routers.analysis as analysis
+
+    close = _closes(120, 8, freq="B")
+
+    async def fake_df(symbol, asset_type, period="6mo", min_rows=30, long_period=False):
+        return close.to_frame("close")
+
+    monkeypatch.setattr(analysis, "_get_df", fake_df)
+    client = TestClient(app)
+    assert "rolling" not in client.get("/api/v1/analysis/risk/AAPL").json()["data"]
+    rolling = client.get("/api/v1/analysis/risk/AAPL", params={"rolling": 20}).json()["data"]["rolling"]
+    assert rolling["window"] == 20 and len(rolling["dates"]) == len(rolling["volatility"]) == 119
+    assert rolling["volatility"][0] is None
+    expected = close.pct_change().rolling(20, min_periods=10).std().iloc[-1] * np.sqrt(252)
+    assert np.isclose(rolling["volatility"][-1], expected, atol=1e-4)
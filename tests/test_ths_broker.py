@@ -0,0 +1,147 @@
+"""
+同花顺 gateway 模式测试 (网关替换为 httpx.MockTransport)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import services.brokers.stock_broker as stock_broker
+from services.brokers.stock_broker import THSBroker
+
+
+class FakeGateway:
+    """新版网关: 批量接口、单笔委托查询、增量委托列表；legacy=True 时只有旧接口"""
+
+    def __init__(self, legacy=False):
+        self.legacy = legacy
+        self.requests = []
+        self.clients = 0
+        self.entrusts = {}
+        self.versions = {}
+        self.seq = 0
+
+    def put(self, entrust_no, **fields):
+        self.seq += 1
+        self.entrusts[entrust_no] = {"entrust_no": entrust_no, "direction": "买入", "quantity": 100, **fields}
+        self.versions[entrust_no] = self.seq
+
+    def handler(self, request):
+        path = request.url.path
+        self.requests.append((request.method, path, dict(request.url.params)))
+        body = json.loads(request.content) if request.content else {}
+        if path == "/ping":
+            return httpx.Response(200, json={"success": True})
+        if path == "/order":
+            entrust_no = str(len(self.entrusts) + 1)
+            self.put(entrust_no, symbol=body["symbol"], status="已报")
+            return httpx.Response(200, json={"success": True, "data": {"entrust_no": entrust_no}})
+        if path == "/cancel":
+            return httpx.Response(200, json={"success": True})
+        if path == "/entrusts":
+            if self.legacy or "since" not in request.url.params:
+                return httpx.Response(200, json={"success": True, "data": list(self.entrusts.values())})
+            since = int(request.url.params["since"])
+            rows = [self.entrusts[k] for k, v in self.versions.items() if v > since]
+            return httpx.Response(200, json={"success": True, "data": {"seq": self.seq, "day": "2026-10-17", "entrusts": rows}})
+        if self.legacy:
+            return httpx.Response(404, text="Not Found")
+        if path == "/orders":
+            results = []
+            for o in body["orders"]:
+                entrust_no = str(len(self.entrusts) + 1)
+                self.put(entrust_no, symbol=o["symbol"], status="已报")
+                results.append({"success": True, "entrust_no": entrust_no})
+            return httpx.Response(200, json={"success": True, "data": results})
+        if path == "/cancels":
+            return httpx.Response(200, json={"success": True, "data": [
+                {"entrust_no": n, "success": n in self.entrusts} for n in body["entrust_nos"]
+            ]})
+        if path.startswith("/entrusts/"):
+            row = self.entrusts.get(path.rsplit("/", 1)[1])
+            return httpx.Response(200, json={"success": True, "data": row} if row else {"success": False})
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    gw = FakeGateway()
+    real = httpx.AsyncClient
+
+    def client(**kwargs):
+        gw.clients += 1
+        return real(transport=httpx.MockTransport(gw.handler), **kwargs)
+
+    monkeypatch.setattr(stock_broker.httpx, "AsyncClient", client)
+    return gw
+
+
+def _orders(n):
+    return [{"symbol": f"60000{i % 10}", "side": "buy", "quantity": 100, "price": 10.0} for i in range(n)]
+
+
+def test_requests_share_one_client(gateway):
+    broker = THSBroker(gateway_url="http://gw.local")
+
+    async def scenario():
+        assert await broker.connect()
+        order = await broker.place_order("600000", "buy", 100, price=10.0)
+        found = await broker.get_order(order.order_id)
+        await broker.close()
+        return order, found
+
+    order, found = asyncio.run(scenario())
+    assert gateway.clients == 1
+    assert found.success and found.order_id == order.order_id
+    assert gateway.requests[-1][1] == f"/entrusts/{order.order_id}"
+
+
+def test_batch_orders_and_cancels(gateway):
+    broker = THSBroker(gateway_url="http://gw.local")
+
+    async def scenario():
+        placed = await broker.place_orders(_orders(60))
+        cancelled = await broker.cancel_orders([p.order_id for p in placed[:3]] + ["999"])
+        return placed, cancelled
+
+    placed, cancelled = asyncio.run(scenario())
+    assert len(placed) == 60 and all(p.success for p in placed)
+    assert [path for _, path, _ in gateway.requests] == ["/orders", "/orders", "/cancels"]  # 按 50 笔分批
+    assert cancelled == [True, True, True, False]
+
+
+def test_entrusts_sync_incrementally(gateway):
+    broker = THSBroker(gateway_url="http://gw.local")
+    for i in range(5):
+        gateway.put(str(i), symbol="600000", status="已报")
+
+    async def scenario():
+        first = await broker.get_open_orders()
+        gateway.put("2", symbol="600000", status="已成")
+        second = await broker.get_open_orders()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert len(first) == 5 and len(second) == 4
+    assert gateway.requests[-1][2] == {"since": "5"}
+    assert broker._entrust_seq == 6
+
+
+def test_legacy_gateway_falls_back(gateway):
+    gateway.legacy = True
+    broker = THSBroker(gateway_url="http://gw.local")
+
+    async def scenario():
+        placed = await broker.place_orders(_orders(2))
+        found = await broker.get_order(placed[1].order_id)
+        return placed, found
+
+    placed, found = asyncio.run(scenario())
+    assert all(p.success for p in placed)
+    assert found.success and found.order_id == placed[1].order_id
+    assert [path for _, path, _ in gateway.requests].count("/order") == 2
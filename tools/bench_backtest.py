@@ -0,0 +1,142 @@
+"""
+回测引擎性能基准
+
+对比旧版逐 K 线循环模拟器 (每根 K 线 iloc 取价、追加 dict、再用 pandas 重建序列算指标)
+与当前数组化模拟器 run_backtest 的耗时。
+
+使用方法:
+  python tools/bench_backtest.py                  # 默认 10k / 100k / 1M 根 K 线
+  python tools/bench_backtest.py 10000 50000      # 自定义 K 线数量
+  python tools/bench_backtest.py --strategy rsi   # 指定策略 (默认 ma_cross)
+  python tools/bench_backtest.py --portfolio 500  # 组合回测: 500 个标的 x 5 年日线
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import numpy as np
+import pandas as pd
+
+from services.backtest_engine import STRATEGY_GENERATORS, BUY, SELL, run_backtest
+from services.portfolio_backtest import run_portfolio_backtest
+
+
+def make_bars(n: int, seed: int = 42, freq: str = "min") -> pd.DataFrame:
+    """生成 n 根随机游走 K 线 (默认分钟级)"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    open_ = close * (1 + rng.normal(0, 0.001, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.001, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.001, n)))
+    volume = rng.integers(1_000, 100_000, n).astype(float)
+    return pd.DataFrame(
+        {"open": open_, "high": high, "low": low, "close": close, "volume": volume},
+        index=pd.date_range("2020-01-01", periods=n, freq=freq),
+    )
+
+
+def legacy_run_backtest(df, strategy_type, params, initial_capital=1_000_000, commission_rate=0.001, slippage=0.001):
+    """旧版逐 K 线模拟器 (仅用于基准对比，信号生成与新版共用)"""
+    close = df["close"]
+    dates = [str(d)[:10] for d in df.index]
+    series = STRATEGY_GENERATORS[strategy_type](df, params)
+
+    cash = initial_capital
+    position_qty = 0.0
+    equity_curve = [{"date": dates[0], "value": initial_capital}]
+    trades = []
+    peak = initial_capital
+    max_dd = 0.0
+    max_dd_duration = 0
+    dd_start = 0
+
+    for idx in range(1, len(df)):
+        sig = series.signals[idx]
+        price = float(close.iloc[idx])
+        slip_price = price * (1 + slippage) if sig == BUY else price * (1 - slippage)
+        if sig == BUY and position_qty == 0:
+            qty = int(cash * 0.95 / (slip_price * (1 + commission_rate)))
+            if qty > 0:
+                cost = qty * slip_price
+                comm = cost * commission_rate
+                cash -= cost + comm
+                position_qty = qty
+                trades.append({"date": dates[idx], "direction": "buy", "amount": round(cost, 2),
+                               "commission": round(comm, 2), "pnl": None, "reason": series.reason(idx)})
+        elif sig == SELL and position_qty > 0:
+            revenue = position_qty * slip_price
+            comm = revenue * commission_rate
+            pnl = revenue - comm - trades[-1]["amount"] - trades[-1]["commission"]
+            cash += revenue - comm
+            trades.append({"date": dates[idx], "direction": "sell", "amount": round(revenue, 2),
+                           "commission": round(comm, 2), "pnl": round(pnl, 2), "reason": series.reason(idx)})
+            position_qty = 0
+
+        total_value = cash + position_qty * price
+        equity_curve.append({"date": dates[idx], "value": round(total_value, 2)})
+        if total_value > peak:
+            peak = total_value
+            dd_start = idx
+        dd = (peak - total_value) / peak
+        if dd > max_dd:
+            max_dd = dd
+            max_dd_duration = idx - dd_start
+
+    values = [e["value"] for e in equity_curve]
+    returns = pd.Series(values).pct_change().dropna()
+    sharpe = float(returns.mean() / returns.std() * np.sqrt(252)) if returns.std() > 0 else 0
+
+    eq_df = pd.DataFrame(equity_curve)
+    eq_df["date"] = pd.to_datetime(eq_df["date"])
+    eq_df.set_index("date", inplace=True)
+    monthly = eq_df["value"].resample("ME").last().pct_change().dropna()
+
+    eq_series = pd.Series(values)
+    running_max = eq_series.cummax()
+    drawdown = (running_max - eq_series) / running_max
+    drawdown_curve = [
+        {"date": equity_curve[i]["date"], "drawdown": round(float(drawdown.iloc[i]) * 100, 2)}
+        for i in range(len(drawdown))
+    ]
+    return {"sharpe_ratio": sharpe, "max_drawdown": max_dd, "max_drawdown_duration": max_dd_duration,
+            "monthly": len(monthly), "drawdown_curve": drawdown_curve, "trades": trades}
+
+
+def _timeit(fn, *args, repeat: int = 1) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回测引擎性能基准")
+    parser.add_argument("sizes", nargs="*", type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--strategy", default="ma_cross", choices=list(STRATEGY_GENERATORS))
+    parser.add_argument("--portfolio", type=int, default=0, help="组合回测的标的数量 (每个 5 年日线)")
+    args = parser.parse_args()
+
+    if args.portfolio:
+        frames = {f"S{i:03d}": make_bars(1250, seed=i, freq="B") for i in range(args.portfolio)}
+        for rebalance in ("none", "monthly"):
+            t = _timeit(run_portfolio_backtest, frames, args.strategy, {}, 1_000_000, 0.001, 0.001, None, rebalance)
+            print(f"组合回测 {args.strategy}: {args.portfolio} 标的 x 1250 根日线, 再平衡={rebalance}: {t:.3f}s")
+        return
+
+    print(f"策略: {args.strategy}")
+    print(f"{'K线数':>10} {'旧版循环':>12} {'数组模拟器':>12} {'加速比':>8}")
+    for n in args.sizes:
+        df = make_bars(n)
+        repeat = 3 if n <= 100_000 else 1
+        t_old = _timeit(legacy_run_backtest, df, args.strategy, {}, repeat=repeat)
+        t_new = _timeit(run_backtest, df, args.strategy, {}, repeat=repeat)
+        print(f"{n:>10,} {t_old:>11.3f}s {t_new:>11.3f}s {t_old / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
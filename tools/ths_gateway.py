@@ -19,7 +19,9 @@ import os
 import sys
 import json
 import logging
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, date
 from functools import wraps
 
 try:
@@ -43,8 +45,13 @@ HOST = os.environ.get("THS_HOST", "127.0.0.1")
 PORT = int(os.environ.get("THS_PORT", "19880"))
 API_KEY = os.environ.get("THS_API_KEY", "")
 EXE_PATH = os.environ.get("THS_EXE_PATH", "")
+# 委托列表刷新的最小间隔 (秒)，期间的查询直接读索引
+ENTRUST_REFRESH = float(os.environ.get("THS_ENTRUST_REFRESH", "1"))
+MAX_BATCH = 50
 
 trader = None
+# 客户端是界面自动化，不能并发操作
+trader_lock = threading.RLock()
 
 
 def init_trader():
@@ -59,6 +66,78 @@ def init_trader():
     log.info(f"连接成功! 总资产: {bal[0].get('总资产', 'N/A') if bal else 'N/A'}")
 
 
+def _normalize_entrust(e):
+    return {
+        "entrust_no": str(e.get("委托编号", e.get("合同编号", ""))),
+        "symbol": str(e.get("证券代码", "")),
+        "name": e.get("证券名称", ""),
+        "direction": e.get("操作", e.get("买卖标志", "")),
+        "price": float(e.get("委托价格", 0)),
+        "quantity": float(e.get("委托数量", 0)),
+        "filled_quantity": float(e.get("成交数量", 0)),
+        "filled_price": float(e.get("成交均价", e.get("成交价格", 0))),
+        "status": e.get("备注", e.get("状态说明", "")),
+        "time": e.get("委托时间", ""),
+    }
+
+
+class EntrustIndex:
+    """
+    今日委托索引: 委托号 -> 委托
+    - 距上次刷新不足 ENTRUST_REFRESH 秒时直接读索引，单笔查询 O(1)
+    - 刷新时只更新有变化的委托，并记录变更序号，客户端可用 since 只取增量
+    - 通过网关下的单立即写入索引，不必等下一次刷新
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.versions = {}  # 委托号 -> 最后一次变化的序号
+        self.seq = 0
+        self.day = date.today()
+        self.refreshed_at = 0.0
+        self.lock = threading.Lock()
+
+    def _put(self, row):
+        key = row["entrust_no"]
+        if key and self.rows.get(key) != row:
+            self.seq += 1
+            self.rows[key] = row
+            self.versions[key] = self.seq
+
+    def refresh(self, force=False):
+        """距上次刷新超过 ENTRUST_REFRESH 秒时从客户端拉取今日委托"""
+        with self.lock:
+            if date.today() != self.day:
+                self.rows.clear()
+                self.versions.clear()
+                self.day = date.today()
+                force = True
+            if not force and time.monotonic() - self.refreshed_at < ENTRUST_REFRESH:
+                return
+            with trader_lock:
+                data = trader.today_entrusts
+            for e in data:
+                self._put(_normalize_entrust(e))
+            self.refreshed_at = time.monotonic()
+
+    def add(self, row):
+        with self.lock:
+            self._put(row)
+
+    def get(self, entrust_no):
+        # 客户端上手动下的单最迟在下一次刷新后出现，查不到也不强制刷新 (避免反复操作界面)
+        self.refresh()
+        return self.rows.get(entrust_no)
+
+    def changed_since(self, since):
+        self.refresh()
+        with self.lock:
+            return self.seq, str(self.day), [self.rows[k] for k, v in self.versions.items() if v > since]
+
+
+entrust_index = EntrustIndex()
+
+
 def require_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -89,8 +168,9 @@ def ping():
 @require_auth
 def balance():
     try:
-        bal_list = trader.balance
-        pos_list = trader.position
+        with trader_lock:
+            bal_list = trader.balance
+            pos_list = trader.position
 
         bal = bal_list[0] if bal_list else {}
         total = float(bal.get("总资产", bal.get("资金余额", 0)))
@@ -123,92 +203,145 @@ def balance():
         return fail(str(e))
 
 
-@app.route("/order", methods=["POST"])
-@require_auth
-def order():
-    data = request.json
+def _place(data):
+    """下单，返回 (是否成功, 委托号或错误信息, 原始结果)"""
     symbol = data.get("symbol", "")
     side = data.get("side", "")
     quantity = int(data.get("quantity", 0))
     price = data.get("price")
 
     if not symbol or not side or quantity <= 0:
-        return fail("参数不完整: symbol, side, quantity 必填")
-
+        return False, "参数不完整: symbol, side, quantity 必填", None
     if not price:
-        return fail("A股必须指定价格 (限价单)")
-
+        return False, "A股必须指定价格 (限价单)", None
     if quantity % 100 != 0:
-        return fail(f"数量须为100的整数倍，当前: {quantity}")
+        return False, f"数量须为100的整数倍，当前: {quantity}", None
+    if side not in ("buy", "sell"):
+        return False, f"不支持的方向: {side}", None
 
     try:
-        if side == "buy":
-            result = trader.buy(symbol, price=float(price), amount=quantity)
-        elif side == "sell":
-            result = trader.sell(symbol, price=float(price), amount=quantity)
-        else:
-            return fail(f"不支持的方向: {side}")
-
-        entrust_no = ""
-        if isinstance(result, dict):
-            entrust_no = str(result.get("entrust_no", result.get("委托编号", "")))
-        elif isinstance(result, list) and result:
-            entrust_no = str(result[0].get("entrust_no", result[0].get("委托编号", "")))
-
-        log.info(f"下单成功: {side} {symbol} x{quantity} @{price} -> 委托号 {entrust_no}")
-        return ok({"entrust_no": entrust_no, "raw": result if isinstance(result, dict) else str(result)})
+        with trader_lock:
+            if side == "buy":
+                result = trader.buy(symbol, price=float(price), amount=quantity)
+            else:
+                result = trader.sell(symbol, price=float(price), amount=quantity)
     except Exception as e:
         log.error(f"下单失败: {e}")
-        return fail(str(e))
+        return False, str(e), None
+
+    entrust_no = ""
+    if isinstance(result, dict):
+        entrust_no = str(result.get("entrust_no", result.get("委托编号", "")))
+    elif isinstance(result, list) and result:
+        entrust_no = str(result[0].get("entrust_no", result[0].get("委托编号", "")))
+
+    entrust_index.add({
+        "entrust_no": entrust_no, "symbol": symbol, "name": "",
+        "direction": "买入" if side == "buy" else "卖出", "price": float(price), "quantity": float(quantity),
+        "filled_quantity": 0.0, "filled_price": 0.0, "status": "已报", "time": datetime.now().strftime("%H:%M:%S"),
+    })
+    log.info(f"下单成功: {side} {symbol} x{quantity} @{price} -> 委托号 {entrust_no}")
+    return True, entrust_no, result
+
+
+def _cancel(entrust_no):
+    """撤单，返回 (是否成功, 错误信息)"""
+    if not entrust_no:
+        return False, "entrust_no 必填"
+    try:
+        with trader_lock:
+            trader.cancel_entrust(entrust_no)
+    except Exception as e:
+        log.error(f"撤单失败: {e}")
+        return False, str(e)
+    log.info(f"撤单成功: {entrust_no}")
+    return True, ""
+
+
+def _batch(items):
+    if not isinstance(items, list) or not items:
+        return None, fail("请求体须包含非空列表")
+    if len(items) > MAX_BATCH:
+        return None, fail(f"单次最多 {MAX_BATCH} 笔")
+    return items, None
+
+
+@app.route("/order", methods=["POST"])
+@require_auth
+def order():
+    success, result, raw = _place(request.json or {})
+    if not success:
+        return fail(result)
+    return ok({"entrust_no": result, "raw": raw if isinstance(raw, dict) else str(raw)})
+
+
+@app.route("/orders", methods=["POST"])
+@require_auth
+def orders():
+    """批量下单 {orders: [{symbol, side, quantity, price}, ...]}，逐笔返回结果"""
+    items, error = _batch((request.json or {}).get("orders"))
+    if error:
+        return error
+    results = []
+    for data in items:
+        success, result, _ = _place(data)
+        results.append({"success": True, "entrust_no": result} if success else {"success": False, "message": result})
+    return ok(results)
 
 
 @app.route("/cancel", methods=["POST"])
 @require_auth
 def cancel():
-    data = request.json
-    entrust_no = data.get("entrust_no", "")
-    if not entrust_no:
-        return fail("entrust_no 必填")
+    success, message = _cancel((request.json or {}).get("entrust_no", ""))
+    return ok(message="撤单成功") if success else fail(message)
 
+
+@app.route("/cancels", methods=["POST"])
+@require_auth
+def cancels():
+    """批量撤单 {entrust_nos: [...]}，逐笔返回结果"""
+    items, error = _batch((request.json or {}).get("entrust_nos"))
+    if error:
+        return error
+    results = []
+    for entrust_no in items:
+        success, message = _cancel(str(entrust_no))
+        results.append({"entrust_no": str(entrust_no), "success": success, "message": message})
+    return ok(results)
+
+
+@app.route("/entrusts")
+@require_auth
+def entrusts():
+    """今日委托；带 since=<序号> 时只返回该序号之后有变化的委托及最新序号"""
     try:
-        trader.cancel_entrust(entrust_no)
-        log.info(f"撤单成功: {entrust_no}")
-        return ok(message="撤单成功")
+        since = request.args.get("since", type=int)
+        seq, day, rows = entrust_index.changed_since(since or 0)
+        if since is None:
+            return ok(rows)
+        return ok({"seq": seq, "day": day, "entrusts": rows})
     except Exception as e:
-        log.error(f"撤单失败: {e}")
+        log.error(f"查询委托失败: {e}")
         return fail(str(e))
 
 
-@app.route("/entrusts")
+@app.route("/entrusts/<entrust_no>")
 @require_auth
-def entrusts():
+def entrust(entrust_no):
     try:
-        data = trader.today_entrusts
-        result = []
-        for e in data:
-            result.append({
-                "entrust_no": str(e.get("委托编号", e.get("合同编号", ""))),
-                "symbol": str(e.get("证券代码", "")),
-                "name": e.get("证券名称", ""),
-                "direction": e.get("操作", e.get("买卖标志", "")),
-                "price": float(e.get("委托价格", 0)),
-                "quantity": float(e.get("委托数量", 0)),
-                "filled_quantity": float(e.get("成交数量", 0)),
-                "filled_price": float(e.get("成交均价", e.get("成交价格", 0))),
-                "status": e.get("备注", e.get("状态说明", "")),
-                "time": e.get("委托时间", ""),
-            })
-        return ok(result)
+        row = entrust_index.get(entrust_no)
     except Exception as e:
         log.error(f"查询委托失败: {e}")
         return fail(str(e))
+    return ok(row) if row else fail(f"未找到委托号 {entrust_no}")
 
 
 @app.route("/trades")
 @require_auth
 def trades():
     try:
-        data = trader.today_trades
+        with trader_lock:
+            data = trader.today_trades
         result = []
         for t in data:
             result.append({
@@ -237,8 +370,11 @@ if __name__ == "__main__":
     print("    GET  /ping     - 健康检查")
     print("    GET  /balance  - 查询余额持仓")
     print("    POST /order    - 下单 {symbol, side, quantity, price}")
+    print("    POST /orders   - 批量下单 {orders: [...]}")
     print("    POST /cancel   - 撤单 {entrust_no}")
-    print("    GET  /entrusts - 今日委托")
+    print("    POST /cancels  - 批量撤单 {entrust_nos: [...]}")
+    print("    GET  /entrusts - 今日委托 (?since=序号 只取增量)")
+    print("    GET  /entrusts/<委托号> - 单笔委托")
     print("    GET  /trades   - 今日成交")
     print("=" * 60)
 